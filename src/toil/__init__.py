@@ -21,6 +21,7 @@ import sys
 from subprocess import check_output
 
 from bd2k.util import memoize
+from six.moves import intern
 
 log = logging.getLogger(__name__)
 
@@ -67,6 +68,19 @@ def resolveEntryPoint(entryPoint):
         return entryPoint
 
 
+def internString(s):
+    """
+    Returns the canonical instance of the given string, allowing the many objects that hold an
+    equal string to share a single copy of it. Anything but an instance of str is returned as is.
+
+    >>> internString('a' * 3) is internString(''.join(['aa', 'a']))
+    True
+    >>> internString(None) is None
+    True
+    """
+    return intern(s) if type(s) is str else s
+
+
 @memoize
 def physicalMemory():
     """
@@ -103,6 +103,22 @@ class AbstractBatchSystem(object):
         """
         raise NotImplementedError()
 
+    def issueBatchJobs(self, jobNodes):
+        """
+        Issues the given jobs to the batch system in one go, as if by calling
+        :meth:`issueBatchJob` for each of them in order.
+
+        The default implementation does just that. Implementations that can submit several jobs
+        at once, or that have to synchronize with a thread of their own for every job, should
+        override this method.
+
+        :param list[toil.job.JobNode] jobNodes: the jobs to issue
+
+        :return: the jobIDs of the newly issued jobs, in the order of the given jobs
+        :rtype: list[int]
+        """
+        return [self.issueBatchJob(jobNode) for jobNode in jobNodes]
+
     @abstractmethod
     def killBatchJobs(self, jobIDs):
         """
@@ -154,6 +170,35 @@ class AbstractBatchSystem(object):
         """
         raise NotImplementedError()
 
+    def getUpdatedBatchJobs(self, maxWait, limit=None):
+        """
+        Returns all jobs that have updated their status and are ready to be processed. Blocks
+        for at most maxWait seconds until the first update becomes available and then returns
+        that update together with any others that are already available, without waiting any
+        further.
+
+        The default implementation repeatedly calls :meth:`getUpdatedBatchJob`. Implementations
+        that keep their updates in a queue should override this method to drain it directly.
+
+        :param float maxWait: the number of seconds to block, waiting for the first result
+
+        :param int limit: the maximum number of updates to return, or None to return all that
+               are available. The remaining updates are returned by subsequent calls.
+
+        :return: A list of (jobID, exitValue, wallTime) tuples as described in
+                 :meth:`getUpdatedBatchJob`. The list is empty if no job updated its status
+                 within maxWait seconds.
+        :rtype: list[tuple(str, int, float)]
+        """
+        updatedJobs = []
+        updatedJob = self.getUpdatedBatchJob(maxWait)
+        while updatedJob is not None:
+            updatedJobs.append(updatedJob)
+            if limit is not None and len(updatedJobs) >= limit:
+                break
+            updatedJob = self.getUpdatedBatchJob(0)
+        return updatedJobs
+
     @abstractmethod
     def shutdown(self):
         """
@@ -297,6 +342,33 @@ class BatchSystemSupport(AbstractBatchSystem):
         """
         raise NotImplementedError()
 
+    @staticmethod
+    def _drainQueue(queue, maxWait, limit=None):
+        """
+        Removes the items available in the given queue, blocking for at most maxWait seconds
+        until the first one becomes available. Meant for implementations of
+        :meth:`getUpdatedBatchJobs`.
+
+        :param Queue queue: the queue to drain
+
+        :param float maxWait: the number of seconds to block, waiting for the first item
+
+        :param int limit: the maximum number of items to remove, or None to remove all of them
+
+        :return: the removed items in the order they were put into the queue
+        :rtype: list
+        """
+        try:
+            items = [queue.get(timeout=maxWait)]
+        except Empty:
+            return []
+        while limit is None or len(items) < limit:
+            try:
+                items.append(queue.get_nowait())
+            except Empty:
+                break
+        return items
+
     def _getResultsFileName(self, toilPath):
         """
         Get a path for the batch systems to store results. GridEngine, slurm,
@@ -14,15 +14,20 @@
 
 from __future__ import absolute_import
 
+import errno
 import os
 import shutil
 import logging
+import tempfile
 import time
+from collections import OrderedDict
+from heapq import heapify, heappop, heappush
 from threading import Thread
 from abc import ABCMeta, abstractmethod
 
 # Python 3 compatibility imports
 from six.moves.queue import Empty, Queue
+from six import iteritems
 
 from bd2k.util.objects import abstractclassmethod
 
@@ -33,6 +38,90 @@ logger = logging.getLogger(__name__)
 # TODO: should this be an attribute?  Used in the worker and the batch system
 sleepSeconds = 10
 
+
+def writeJobArrayScript(dirPath, taskIDVariable, commands, preamble=None):
+    """
+    Writes the script run by each task of a job array, which looks up the command of the task by
+    the index of the task. Tasks are numbered from 1.
+
+    :param str dirPath: the directory to write the script to, which must be visible to the
+           nodes running the tasks. It is created if it doesn't exist yet.
+
+    :param str taskIDVariable: the environment variable the batch system sets to the index of
+           the task
+
+    :param list[str] commands: the command line of each task, in the order of their indices
+
+    :param str preamble: shell code to run before the command of the task
+
+    :return: the path of the script
+    :rtype: str
+    """
+    try:
+        os.makedirs(dirPath)
+    except OSError as e:
+        if e.errno != errno.EEXIST:
+            raise
+    fd, scriptPath = tempfile.mkstemp(dir=dirPath, prefix='jobArray', suffix='.sh')
+    with os.fdopen(fd, 'w') as f:
+        f.write('#!/bin/sh\n')
+        if preamble is not None:
+            f.write(preamble + '\n')
+        f.write('case "$%s" in\n' % taskIDVariable)
+        for task, command in enumerate(commands, 1):
+            assert '\n' not in command
+            f.write('%i) %s ;;\n' % (task, command))
+        f.write('*) echo "Unknown task $%s" >&2; exit 1 ;;\n' % taskIDVariable)
+        f.write('esac\n')
+    return scriptPath
+
+
+class PollInterval(object):
+    """
+    The interval between polls of the batch system for the status of the running jobs. It is
+    doubled after each poll that finds no finished jobs, up to the given maximum, as jobs that
+    have been running for a while need not be polled as often, and reset to the given minimum
+    once a poll finds finished jobs or new jobs are submitted.
+    """
+
+    def __init__(self, minInterval, maxInterval):
+        """
+        :param float minInterval: the minimum number of seconds between polls
+        :param float maxInterval: the maximum number of seconds between polls
+        """
+        self.minInterval = minInterval
+        self.maxInterval = maxInterval
+        self.interval = minInterval
+        self.nextPollTime = 0
+
+    def isDue(self):
+        """
+        Returns whether the batch system should be polled now.
+
+        :rtype: bool
+        """
+        return time.time() >= self.nextPollTime
+
+    def reset(self):
+        """
+        Schedules the next poll no later than the minimum interval from now.
+        """
+        self.interval = self.minInterval
+        self.nextPollTime = min(self.nextPollTime, time.time() + self.minInterval)
+
+    def update(self, activity):
+        """
+        Schedules the next poll after a poll of the batch system.
+
+        :param bool activity: whether the poll found finished jobs
+        """
+        if activity:
+            self.interval = self.minInterval
+        else:
+            self.interval = min(2 * self.interval, self.maxInterval)
+        self.nextPollTime = time.time() + self.interval
+
+
 class AbstractGridEngineBatchSystem(BatchSystemSupport):
     """
     A partial implementation of BatchSystemSupport for batch systems run on a
@@ -44,6 +133,19 @@ class AbstractGridEngineBatchSystem(BatchSystemSupport):
 
         __metaclass__ = ABCMeta
 
+        # The environment variable the batch system sets to the index of a task of a job array,
+        # or None if job arrays aren't supported. See prepareArraySubmission().
+        arrayTaskIDVariable = None
+
+        # The minimum number of waiting jobs with identical resource requirements to submit as
+        # a job array instead of one by one
+        minArraySize = 2
+
+        # The bounds of the interval between polls of the status of the running jobs, see
+        # PollInterval
+        minPollInterval = 1
+        maxPollInterval = 30
+
         def __init__(self, newJobsQueue, updatedJobsQueue, killQueue, killedJobsQueue, boss):
             """
             Abstract worker interface class. All instances are created with five
@@ -61,11 +163,17 @@ class AbstractGridEngineBatchSystem(BatchSystemSupport):
             self.updatedJobsQueue = updatedJobsQueue
             self.killQueue = killQueue
             self.killedJobsQueue = killedJobsQueue
+            # The jobs not yet submitted, as a heap of (negated priority, jobID, cpu, memory,
+            # command) tuples such that the job of the highest priority is submitted first
             self.waitingJobs = list()
             self.runningJobs = set()
             self.boss = boss
             self.allocatedCpus = dict()
             self.batchJobIDs = dict()
+            # Maps the batch system ID of each job array to the path of its script and the number
+            # of its tasks that haven't been forgotten yet
+            self.jobArrayScripts = dict()
+            self.pollInterval = PollInterval(self.minPollInterval, self.maxPollInterval)
 
         def getBatchSystemID(self, jobID):
             """
@@ -83,7 +191,17 @@ class AbstractGridEngineBatchSystem(BatchSystemSupport):
             if task is None:
                 return str(job)
             else:
-                return str(job) + "." + str(task)
+                return self.formatArrayTaskID(job, task)
+
+        def formatArrayTaskID(self, batchJobID, task):
+            """
+            Returns the batch system ID of the given task of a job array.
+
+            :param batchJobID: the batch system ID of the job array, as returned by submitJob()
+            :param int task: the index of the task
+            :rtype: str
+            """
+            return str(batchJobID) + "." + str(task)
 
         def forgetJob(self, jobID):
             """
@@ -93,45 +211,90 @@ class AbstractGridEngineBatchSystem(BatchSystemSupport):
             """
             self.runningJobs.remove(jobID)
             del self.allocatedCpus[jobID]
-            del self.batchJobIDs[jobID]
-
-        def createJobs(self, newJob):
+            batchJobID, task = self.batchJobIDs.pop(jobID)
+            if task is not None:
+                # Delete the script of a job array along with its last task
+                jobArrayScript = self.jobArrayScripts[batchJobID]
+                jobArrayScript[1] -= 1
+                if jobArrayScript[1] == 0:
+                    del self.jobArrayScripts[batchJobID]
+                    os.unlink(jobArrayScript[0])
+
+        def createJobs(self, newJobs):
             """
-            Create a new job with the Toil job ID. Implementation-specific; called
+            Create new jobs with the Toil job IDs. Implementation-specific; called
             by AbstractGridEngineWorker.run()
 
-            :param string newJob: Toil job ID
+            :param list[tuple] newJobs: the Toil job ID, cpu, memory, command and priority of each
+                   new job
             """
             activity = False
-            # Load new job id if present:
-            if newJob is not None:
-                self.waitingJobs.append(newJob)
-            # Launch jobs as necessary:
+            # Load new job ids:
+            for jobID, cpu, memory, command, priority in newJobs:
+                heappush(self.waitingJobs, (-priority, jobID, cpu, memory, command))
+            # Take as many waiting jobs as allowed, grouped by their resource requirements
+            jobGroups = OrderedDict()
             while (len(self.waitingJobs) > 0
                    and sum(self.allocatedCpus.values()) < int(self.boss.maxCores)):
                 activity = True
-                jobID, cpu, memory, command = self.waitingJobs.pop(0)
+                _, jobID, cpu, memory, command = heappop(self.waitingJobs)
+                # Add to allocated resources
+                self.allocatedCpus[jobID] = cpu
+                jobGroups.setdefault((cpu, memory), []).append((jobID, command))
+            # Launch jobs as necessary:
+            for (cpu, memory), jobs in jobGroups.items():
+                if self.arrayTaskIDVariable is not None and len(jobs) >= self.minArraySize:
+                    self.createJobArray(cpu, memory, jobs)
+                else:
+                    for jobID, command in jobs:
+                        self.createJob(cpu, memory, jobID, command)
+            if activity:
+                # Short jobs should not have to wait for a backed off poll to be noticed
+                self.pollInterval.reset()
+            return activity
 
-                # prepare job submission command
-                subLine = self.prepareSubmission(cpu, memory, jobID, command)
-                logger.debug("Running %r", subLine)
+        def createJob(self, cpu, memory, jobID, command):
+            """
+            Submits a single job.
+            """
+            # prepare job submission command
+            subLine = self.prepareSubmission(cpu, memory, jobID, command)
+            logger.debug("Running %r", subLine)
 
-                # submit job and get batch system ID
-                batchJobID = self.submitJob(subLine)
-                logger.debug("Submitted job %s", str(batchJobID))
+            # submit job and get batch system ID
+            batchJobID = self.submitJob(subLine)
+            logger.debug("Submitted job %s", str(batchJobID))
 
-                # Store dict for mapping Toil job ID to batch job ID
-                # TODO: Note that this currently stores a tuple of (batch system
-                # ID, Task), but the second value is None by default and doesn't
-                # seem to be used
-                self.batchJobIDs[jobID] = (batchJobID, None)
+            # Store dict for mapping Toil job ID to batch job ID
+            self.batchJobIDs[jobID] = (batchJobID, None)
 
-                # Add to queue of running jobs
-                self.runningJobs.add(jobID)
+            # Add to queue of running jobs
+            self.runningJobs.add(jobID)
 
-                # Add to allocated resources
-                self.allocatedCpus[jobID] = cpu
-            return activity
+        def createJobArray(self, cpu, memory, jobs):
+            """
+            Submits the given jobs, which have identical resource requirements, as the tasks of a
+            single job array. Each task runs a script that looks up the command of the task.
+
+            :param list[tuple(int,str)] jobs: the Toil job ID and the command of each job
+            """
+            scriptPath = writeJobArrayScript(self.boss.jobArrayDirPath,
+                                             self.arrayTaskIDVariable,
+                                             [command for _, command in jobs],
+                                             preamble=self.getJobArrayScriptPreamble())
+            jobIDs = [jobID for jobID, _ in jobs]
+            subLine = self.prepareArraySubmission(cpu, memory, jobIDs, scriptPath)
+            logger.debug("Running %r", subLine)
+            try:
+                batchJobID = self.submitJob(subLine)
+            except:
+                os.unlink(scriptPath)
+                raise
+            logger.debug("Submitted job array %s with %i tasks", str(batchJobID), len(jobs))
+            self.jobArrayScripts[batchJobID] = [scriptPath, len(jobs)]
+            for task, jobID in enumerate(jobIDs, 1):
+                self.batchJobIDs[jobID] = (batchJobID, task)
+                self.runningJobs.add(jobID)
 
         def killJobs(self):
             """
@@ -149,6 +312,13 @@ class AbstractGridEngineBatchSystem(BatchSystemSupport):
             if not killList:
                 return False
 
+            # Jobs that haven't been submitted yet are simply dropped
+            numWaitingJobs = len(self.waitingJobs)
+            self.waitingJobs = [waitingJob for waitingJob in self.waitingJobs
+                                if waitingJob[1] not in killList]
+            if len(self.waitingJobs) != numWaitingJobs:
+                heapify(self.waitingJobs)
+
             # Do the dirty job
             for jobID in list(killList):
                 if jobID in self.runningJobs:
@@ -158,16 +328,15 @@ class AbstractGridEngineBatchSystem(BatchSystemSupport):
                     # code is redundant w/ other implementations
                     self.killJob(jobID)
                 else:
-                    if jobID in self.waitingJobs:
-                        self.waitingJobs.remove(jobID)
                     self.killedJobsQueue.put(jobID)
                     killList.remove(jobID)
 
             # Wait to confirm the kill
             while killList:
-                for jobID in list(killList):
-                    batchJobID = self.getBatchSystemID(jobID)
-                    if self.getJobExitCode(batchJobID) is not None:
+                IDs = dict((jobID, self.getBatchSystemID(jobID)) for jobID in killList)
+                exitCodes = self.getJobExitCodes(list(IDs.values()))
+                for jobID, batchJobID in iteritems(IDs):
+                    if exitCodes.get(batchJobID) is not None:
                         logger.debug('Adding jobID %s to killedJobsQueue', jobID)
                         self.killedJobsQueue.put(jobID)
                         killList.remove(jobID)
@@ -180,16 +349,20 @@ class AbstractGridEngineBatchSystem(BatchSystemSupport):
 
         def checkOnJobs(self):
             """
-            Check and update status of all running jobs.
+            Check and update status of all running jobs, if a poll of the batch system is due.
             """
+            if not self.runningJobs or not self.pollInterval.isDue():
+                return False
+            IDs = dict((jobID, self.getBatchSystemID(jobID)) for jobID in self.runningJobs)
+            exitCodes = self.getJobExitCodes(list(IDs.values()))
             activity = False
-            for jobID in list(self.runningJobs):
-                batchJobID = self.getBatchSystemID(jobID)
-                status = self.getJobExitCode(batchJobID)
+            for jobID, batchJobID in iteritems(IDs):
+                status = exitCodes.get(batchJobID)
                 if status is not None:
                     activity = True
                     self.updatedJobsQueue.put((jobID, status))
                     self.forgetJob(jobID)
+            self.pollInterval.update(activity)
             return activity
 
         def run(self):
@@ -198,16 +371,25 @@ class AbstractGridEngineBatchSystem(BatchSystemSupport):
             """
 
             while True:
-                activity = False
-                newJob = None
-                if not self.newJobsQueue.empty():
-                    activity = True
-                    newJob = self.newJobsQueue.get()
-                    if newJob is None:
-                        logger.debug('Received queue sentinel.')
+                # Take all jobs issued since the last iteration, each item in the queue being a
+                # list of jobs issued together
+                newJobs = []
+                shuttingDown = False
+                while not shuttingDown:
+                    try:
+                        issuedJobs = self.newJobsQueue.get_nowait()
+                    except Empty:
                         break
+                    if issuedJobs is None:
+                        shuttingDown = True
+                    else:
+                        newJobs.extend(issuedJobs)
+                if shuttingDown:
+                    logger.debug('Received queue sentinel.')
+                    break
+                activity = len(newJobs) > 0
                 activity |= self.killJobs()
-                activity |= self.createJobs(newJob)
+                activity |= self.createJobs(newJobs)
                 activity |= self.checkOnJobs()
                 if not activity:
                     logger.debug('No activity, sleeping for %is', self.boss.sleepSeconds())
@@ -228,6 +410,30 @@ class AbstractGridEngineBatchSystem(BatchSystemSupport):
             """
             raise NotImplementedError()
 
+        def prepareArraySubmission(self, cpu, memory, jobIDs, scriptPath):
+            """
+            Preparation in putting together a command-line string for submitting a job array
+            (via submitJob()), whose tasks run the given script. Only called if
+            arrayTaskIDVariable is set.
+
+            :param: string cpu
+            :param: string memory
+            :param: list jobIDs: the Toil job IDs of the tasks, in the order of their indices
+            :param: string scriptPath: the script each task runs, see writeJobArrayScript()
+
+            :rtype: list[str]
+            """
+            raise NotImplementedError()
+
+        def getJobArrayScriptPreamble(self):
+            """
+            Returns the shell code the script of a job array runs before the command of a task,
+            if any.
+
+            :rtype: str|None
+            """
+            return None
+
         @abstractmethod
         def submitJob(self, subLine):
             """
@@ -271,11 +477,29 @@ class AbstractGridEngineBatchSystem(BatchSystemSupport):
             """
             raise NotImplementedError()
 
+        def getJobExitCodes(self, batchJobIDs):
+            """
+            Returns the exit codes of the given jobs. Called by
+            AbstractGridEngineWorker.checkOnJobs() for all running jobs at once, so
+            implementations should query the batch system once for all of them rather than once
+            per job, as this default implementation does.
+
+            :param list[str] batchJobIDs: batch system job IDs
+
+            :return: the exit code of each job, None or no entry for jobs that haven't finished
+            :rtype: dict[str,int|None]
+            """
+            return dict((batchJobID, self.getJobExitCode(batchJobID))
+                        for batchJobID in batchJobIDs)
+
 
     def __init__(self, config, maxCores, maxMemory, maxDisk):
         super(AbstractGridEngineBatchSystem, self).__init__(config, maxCores, maxMemory, maxDisk)
         # AbstractBatchSystem.__init__(self, config, maxCores, maxMemory, maxDisk)
         self.resultsFile = self._getResultsFileName(config.jobStore)
+        # The directory holding the scripts of job arrays, next to the results file, such that
+        # it is visible to the nodes
+        self.jobArrayDirPath = os.path.join(os.path.dirname(self.resultsFile), 'jobArrays')
         # Reset the job queue and results (initially, we do this again once we've killed the jobs)
         self.resultsFileHandle = open(self.resultsFile, 'w')
         # We lose any previous state in this file, and ensure the files existence
@@ -310,13 +534,24 @@ class AbstractGridEngineBatchSystem(BatchSystemSupport):
         return False
 
     def issueBatchJob(self, jobNode):
-        self.checkResourceRequest(jobNode.memory, jobNode.cores, jobNode.disk)
-        jobID = self.nextJobID
-        self.nextJobID += 1
-        self.currentJobs.add(jobID)
-        self.newJobsQueue.put((jobID, jobNode.cores, jobNode.memory, jobNode.command))
-        logger.debug("Issued the job command: %s with job id: %s ", jobNode.command, str(jobID))
-        return jobID
+        return self.issueBatchJobs([jobNode])[0]
+
+    def issueBatchJobs(self, jobNodes):
+        """
+        Hands the given jobs to the worker thread as a single item of its queue.
+        """
+        newJobs = []
+        for jobNode in jobNodes:
+            self.checkResourceRequest(jobNode.memory, jobNode.cores, jobNode.disk)
+            jobID = self.nextJobID
+            self.nextJobID += 1
+            self.currentJobs.add(jobID)
+            newJobs.append((jobID, jobNode.cores, jobNode.memory, jobNode.command,
+                            jobNode.priority))
+            logger.debug("Issued the job command: %s with job id: %s ", jobNode.command,
+                         str(jobID))
+        self.newJobsQueue.put(newJobs)
+        return [newJob[0] for newJob in newJobs]
 
     def killBatchJobs(self, jobIDs):
         """
@@ -354,6 +589,13 @@ class AbstractGridEngineBatchSystem(BatchSystemSupport):
             item = self.updatedJobsQueue.get(timeout=maxWait)
         except Empty:
             return None
+        return self._reapJob(item)
+
+    def getUpdatedBatchJobs(self, maxWait, limit=None):
+        return [self._reapJob(item)
+                for item in self._drainQueue(self.updatedJobsQueue, maxWait, limit)]
+
+    def _reapJob(self, item):
         logger.debug('UpdatedJobsQueue Item: %s', item)
         jobID, retcode = item
         self.currentJobs.remove(jobID)
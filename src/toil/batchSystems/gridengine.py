@@ -33,22 +33,27 @@ class GridEngineBatchSystem(AbstractGridEngineBatchSystem):
 
     class Worker(AbstractGridEngineBatchSystem.Worker):
 
+        arrayTaskIDVariable = 'SGE_TASK_ID'
+
         """
         Grid Engine-specific AbstractGridEngineWorker methods
         """
         def getRunningJobIDs(self):
             times = {}
-            currentjobs = dict((str(self.batchJobIDs[x][0]), x) for x in self.runningJobs)
+            currentjobs = dict((self.getBatchSystemID(x), x) for x in self.runningJobs)
             process = subprocess.Popen(["qstat"], stdout=subprocess.PIPE)
             stdout, stderr = process.communicate()
 
             for currline in stdout.split('\n'):
                 items = currline.strip().split()
                 if items:
-                    if items[0] in currentjobs and items[4] == 'r':
+                    # The tasks of a job array are listed with their index in the last column
+                    jobid = items[0] if len(items) < 10 else self.formatArrayTaskID(items[0],
+                                                                                    items[9])
+                    if jobid in currentjobs and items[4] == 'r':
                         jobstart = " ".join(items[5:7])
                         jobstart = time.mktime(time.strptime(jobstart, "%m/%d/%Y %H:%M:%S"))
-                        times[currentjobs[items[0]]] = time.time() - jobstart
+                        times[currentjobs[jobid]] = time.time() - jobstart
 
             return times
 
@@ -58,6 +63,10 @@ class GridEngineBatchSystem(AbstractGridEngineBatchSystem):
         def prepareSubmission(self, cpu, memory, jobID, command):
             return self.prepareQsub(cpu, memory, jobID) + [command]
 
+        def prepareArraySubmission(self, cpu, memory, jobIDs, scriptPath):
+            return self.prepareQsub(cpu, memory, 'array_' + str(jobIDs[0])) + [
+                '-t', '1-' + str(len(jobIDs)), '/bin/sh', scriptPath]
+
         def submitJob(self, subLine):
             process = subprocess.Popen(subLine, stdout=subprocess.PIPE)
             result = int(process.stdout.readline().strip().split('.')[0])
@@ -84,6 +93,57 @@ class GridEngineBatchSystem(AbstractGridEngineBatchSystem):
                     return int(line.split()[1])
             return None
 
+        def getJobExitCodes(self, sgeJobIDs):
+            # A single qstat tells which jobs are still queued or running, such that qacct, which
+            # only takes one job at a time, is only run for the jobs that have left the queue
+            queuedJobIDs = self.getQueuedJobIDs()
+            return dict((sgeJobID,
+                         None if sgeJobID in queuedJobIDs else self.getJobExitCode(sgeJobID))
+                        for sgeJobID in sgeJobIDs)
+
+        def getQueuedJobIDs(self):
+            """
+            Returns the IDs of the jobs and tasks of job arrays qstat lists, as formatted by
+            getBatchSystemID().
+
+            :rtype: set[str]
+            """
+            process = subprocess.Popen(["qstat"], stdout=subprocess.PIPE)
+            stdout, stderr = process.communicate()
+
+            jobIDs = set()
+            for currline in stdout.split('\n')[2:]:
+                items = currline.strip().split()
+                if len(items) < 8:
+                    continue
+                # The queue column is empty for pending jobs, the task column for jobs that aren't
+                # job arrays. Running tasks are listed one by one, pending ones by ranges like
+                # 1-10:1 or lists like 2,4.
+                taskIndex = 9 if '@' in items[7] else 8
+                if len(items) <= taskIndex:
+                    jobIDs.add(items[0])
+                else:
+                    for task in self.parseTaskRange(items[taskIndex]):
+                        jobIDs.add(self.formatArrayTaskID(items[0], task))
+            return jobIDs
+
+        @staticmethod
+        def parseTaskRange(taskRange):
+            """
+            Returns the indices of the tasks in a task range as qstat lists it.
+
+            >>> list(GridEngineBatchSystem.Worker.parseTaskRange('1-7:3,9'))
+            [1, 4, 7, 9]
+
+            :param str taskRange:
+            :rtype: iter[int]
+            """
+            for item in taskRange.split(','):
+                bounds, _, step = item.partition(':')
+                first, _, last = bounds.partition('-')
+                for task in range(int(first), int(last or first) + 1, int(step or 1)):
+                    yield task
+
         """
         Implementation-specific helper methods
         """
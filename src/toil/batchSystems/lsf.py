@@ -19,17 +19,21 @@
 #THE SOFTWARE.
 from __future__ import absolute_import
 import logging
+import re
 import subprocess
 import time
+from collections import OrderedDict
 from threading import Thread
 from datetime import date
 import os
 
 # Python 3 compatibility imports
 from six.moves.queue import Empty, Queue
+from six import iteritems
 
 from toil.batchSystems import MemoryString
 from toil.batchSystems.abstractBatchSystem import BatchSystemSupport
+from toil.batchSystems.abstractGridEngineBatchSystem import PollInterval, writeJobArrayScript
 from toil.batchSystems.lsfHelper import parse_memory, per_core_reservation
 
 logger = logging.getLogger( __name__ )
@@ -69,8 +73,22 @@ def bsub(bsubline):
     logger.debug("Got the job id: %s" % (str(result)))
     return result
 
+def formatLsfID(lsfJobID):
+    """
+    Returns the ID LSF refers to the given job by, which is <job>[<index>] for a task of a job
+    array.
+
+    :param tuple lsfJobID: the ID of the job and the index of the task, or None
+    :rtype: str
+    """
+    job, task = lsfJobID
+    if task is None:
+        return str(job)
+    else:
+        return '%s[%s]' % (job, task)
+
 def getjobexitcode(lsfJobID):
-        job, task = lsfJobID
+        job = "'%s'" % formatLsfID(lsfJobID)
 
         #first try bjobs to find out job state
         args = ["bjobs", "-l", str(job)]
@@ -113,7 +131,55 @@ def getjobexitcode(lsfJobID):
         logger.debug("Cant determine exit code for job or job still running: " + str(job))
         return None
 
+def getjobexitcodes(lsfJobIDs):
+    """
+    Returns the exit codes of the given jobs like getjobexitcode(), running bjobs once for all of
+    them. Only the jobs bjobs no longer knows about are looked up one by one.
+
+    :param list[tuple] lsfJobIDs: the ID of each job and the index of its task, or None
+    :rtype: dict[tuple,int|None]
+    """
+    # The ID of a job array covers all its tasks
+    args = ["bjobs", "-a", "-w"] + sorted(set(str(job) for job, _ in lsfJobIDs))
+    logger.debug("Checking job exit codes for %i jobs via bjobs", len(lsfJobIDs))
+    process = subprocess.Popen(args, stdout = subprocess.PIPE, stderr = subprocess.PIPE)
+    stdout, _ = process.communicate()
+    states = {}
+    for line in stdout.split('\n')[1:]:
+        # JOBID USER STAT QUEUE FROM_HOST EXEC_HOST JOB_NAME SUBMIT_TIME, without EXEC_HOST for
+        # pending jobs. The index of a task of a job array is part of its name.
+        items = line.strip().split()
+        if len(items) < 6 or not items[0].isdigit():
+            continue
+        task = None
+        for item in items[5:7]:
+            match = re.search(r'\[(\d+)\]$', item)
+            if match:
+                task = int(match.group(1))
+        states[(int(items[0]), task)] = items[2]
+    exitCodes = {}
+    for lsfJobID in lsfJobIDs:
+        state = states.get(lsfJobID)
+        if state == 'DONE':
+            exitCodes[lsfJobID] = 0
+        elif state == 'EXIT':
+            exitCodes[lsfJobID] = 1
+        elif state is None:
+            exitCodes[lsfJobID] = getjobexitcode(lsfJobID)
+        else:
+            exitCodes[lsfJobID] = None
+    return exitCodes
+
 class Worker(Thread):
+    # The minimum number of new jobs with identical resource requirements to submit as a job
+    # array instead of one by one
+    minArraySize = 2
+
+    # The bounds of the interval between polls of the status of the running jobs, see
+    # PollInterval
+    minPollInterval = 10
+    maxPollInterval = 60
+
     def __init__(self, newJobsQueue, updatedJobsQueue, boss):
         Thread.__init__(self)
         self.newJobsQueue = newJobsQueue
@@ -121,6 +187,10 @@ class Worker(Thread):
         self.currentjobs = list()
         self.runningjobs = set()
         self.boss = boss
+        # Maps the ID of each job array to the path of its script and the number of its tasks
+        # that are still running
+        self.jobArrayScripts = dict()
+        self.pollInterval = PollInterval(self.minPollInterval, self.maxPollInterval)
 
     def run(self):
         while True:
@@ -128,22 +198,71 @@ class Worker(Thread):
             while not self.newJobsQueue.empty():
                 self.currentjobs.append(self.newJobsQueue.get())
 
-            # Launch jobs as necessary:
-            while len(self.currentjobs) > 0:
-                jobID, bsubline = self.currentjobs.pop()
-                lsfJobID = bsub(bsubline)
-                self.boss.jobIDs[(lsfJobID, None)] = jobID
-                self.boss.lsfJobIDs[jobID] = (lsfJobID, None)
-                self.runningjobs.add((lsfJobID, None))
-
-            # Test known job list
-            for lsfJobID in list(self.runningjobs):
-                exit = getjobexitcode(lsfJobID)
-                if exit is not None:
-                    self.updatedJobsQueue.put((lsfJobID, exit))
-                    self.runningjobs.remove(lsfJobID)
+            # Launch jobs as necessary, grouping them by their resource requirements:
+            jobGroups = OrderedDict()
+            for jobID, bsubline in self.currentjobs:
+                jobGroups.setdefault(tuple(bsubline[:-1]), []).append((jobID, bsubline[-1]))
+            self.currentjobs = list()
+            if jobGroups:
+                self.pollInterval.reset()
+            for bsubline, jobs in jobGroups.items():
+                if len(jobs) >= self.minArraySize:
+                    self.submitJobArray(list(bsubline), jobs)
+                else:
+                    for jobID, command in jobs:
+                        lsfJobID = bsub(list(bsubline) + [command])
+                        self.addRunningJob(jobID, (lsfJobID, None))
+
+            # Test known job list, if a poll is due
+            if self.runningjobs and self.pollInterval.isDue():
+                activity = False
+                for lsfJobID, exit in iteritems(getjobexitcodes(list(self.runningjobs))):
+                    if exit is not None:
+                        activity = True
+                        self.updatedJobsQueue.put((lsfJobID, exit))
+                        self.runningjobs.remove(lsfJobID)
+                        self.releaseJobArrayScript(lsfJobID)
+                self.pollInterval.update(activity)
+
+            time.sleep(1)
+
+    def submitJobArray(self, bsubline, jobs):
+        """
+        Submits the given jobs, which have identical resource requirements, as the tasks of a
+        single job array. Each task runs a script that looks up the command of the task.
 
-            time.sleep(10)
+        :param list[str] bsubline: the bsub command line without the command
+        :param list[tuple(int,str)] jobs: the Toil job ID and the command of each job
+        """
+        scriptPath = writeJobArrayScript(self.boss.jobArrayDirPath, 'LSB_JOBINDEX',
+                                         [command for _, command in jobs])
+        arrayName = 'toil_array_%s[1-%i]' % (jobs[0][0], len(jobs))
+        try:
+            lsfJobID = bsub(bsubline + ['-J', "'%s'" % arrayName, '/bin/sh', scriptPath])
+        except:
+            os.unlink(scriptPath)
+            raise
+        self.jobArrayScripts[lsfJobID] = [scriptPath, len(jobs)]
+        for task, (jobID, _) in enumerate(jobs, 1):
+            self.addRunningJob(jobID, (lsfJobID, task))
+
+    def addRunningJob(self, jobID, lsfJobID):
+        self.boss.jobIDs[lsfJobID] = jobID
+        self.boss.lsfJobIDs[jobID] = lsfJobID
+        self.runningjobs.add(lsfJobID)
+
+    def releaseJobArrayScript(self, lsfJobID):
+        """
+        Deletes the script of the job array the given job is a task of once all tasks of the
+        array are done.
+        """
+        job, task = lsfJobID
+        if task is not None:
+            jobArrayScript = self.jobArrayScripts[job]
+            jobArrayScript[1] -= 1
+            if jobArrayScript[1] == 0:
+                del self.jobArrayScripts[job]
+                os.unlink(jobArrayScript[0])
 
 class LSFBatchSystem(BatchSystemSupport):
     """
@@ -167,6 +286,9 @@ class LSFBatchSystem(BatchSystemSupport):
         #Reset the job queue and results (initially, we do this again once we've killed the jobs)
         self.lsfResultsFileHandle = open(self.lsfResultsFile, 'w')
         self.lsfResultsFileHandle.close() #We lose any previous state in this file, and ensure the files existence
+        # The directory holding the scripts of job arrays, next to the results file, such that
+        # it is visible to the nodes
+        self.jobArrayDirPath = os.path.join(os.path.dirname(self.lsfResultsFile), 'jobArrays')
         self.currentjobs = set()
         self.obtainSystemConstants()
         self.jobIDs = dict()
@@ -196,11 +318,7 @@ class LSFBatchSystem(BatchSystemSupport):
         if not jobID in self.lsfJobIDs:
              RuntimeError("Unknown jobID, could not be converted")
 
-        (job,task) = self.lsfJobIDs[jobID]
-        if task is None:
-             return str(job)
-        else:
-             return str(job) + "." + str(task)
+        return formatLsfID(self.lsfJobIDs[jobID])
 
     def killBatchJobs(self, jobIDs):
         """Kills the given job IDs.
@@ -214,8 +332,9 @@ class LSFBatchSystem(BatchSystemSupport):
 
         toKill = set(jobIDs)
         while len(toKill) > 0:
+            exitCodes = getjobexitcodes([self.lsfJobIDs[jobID] for jobID in toKill])
             for jobID in list(toKill):
-                if getjobexitcode(self.lsfJobIDs[jobID]) is not None:
+                if exitCodes[self.lsfJobIDs[jobID]] is not None:
                     toKill.remove(jobID)
 
             if len(toKill) > 0:
@@ -255,14 +374,22 @@ class LSFBatchSystem(BatchSystemSupport):
 
     def getUpdatedBatchJob(self, maxWait):
         try:
-            sgeJobID, retcode = self.updatedJobsQueue.get(timeout=maxWait)
-            self.updatedJobsQueue.task_done()
-            jobID, retcode = (self.jobIDs[sgeJobID], retcode)
-            self.currentjobs -= {self.jobIDs[sgeJobID]}
+            item = self.updatedJobsQueue.get(timeout=maxWait)
         except Empty:
             pass
         else:
-            return jobID, retcode, None
+            return self._reapJob(item)
+
+    def getUpdatedBatchJobs(self, maxWait, limit=None):
+        return [self._reapJob(item)
+                for item in self._drainQueue(self.updatedJobsQueue, maxWait, limit)]
+
+    def _reapJob(self, item):
+        sgeJobID, retcode = item
+        self.updatedJobsQueue.task_done()
+        jobID, retcode = (self.jobIDs[sgeJobID], retcode)
+        self.currentjobs -= {self.jobIDs[sgeJobID]}
+        return jobID, retcode, None
 
     def getWaitDuration(self):
         """We give parasol a second to catch its breath (in seconds)
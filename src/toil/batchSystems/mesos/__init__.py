@@ -13,7 +13,8 @@
 # limitations under the License.
 from __future__ import absolute_import
 
-from Queue import Queue
+import itertools
+from Queue import PriorityQueue
 from collections import namedtuple
 from functools import total_ordering
 from bisect import bisect
@@ -37,30 +38,42 @@ TaskData = namedtuple('TaskData', (
 class JobQueue(object):
 
     def __init__(self):
-        # mapping of jobTypes to queues of jobs of that type
+        # mapping of jobTypes to queues of jobs of that type, each holding (negated priority,
+        # sequence number, job) tuples such that jobs of equal priority are dequeued in order
         self.queues = {}
+        self.sequence = itertools.count()
         # list of jobTypes in decreasing resource expense
         self.sortedTypes = []
         self.jobLock = Lock()
 
-    def insertJob(self, job, jobType):
+    def insertJob(self, job, jobType, priority=0):
+        self.insertJobs([(job, jobType, priority)])
+
+    def insertJobs(self, jobs):
+        """
+        Inserts several jobs while holding the lock only once.
+
+        :param list[(ToilJob,ResourceRequirement,float)] jobs: the job, type and priority of
+               each job to insert
+        """
         with self.jobLock:
-            if jobType not in self.queues:
-                index = bisect(self.sortedTypes, jobType)
-                self.sortedTypes.insert(index, jobType)
-                self.queues[jobType] = Queue()
-            self.queues[jobType].put(job)
+            for job, jobType, priority in jobs:
+                if jobType not in self.queues:
+                    index = bisect(self.sortedTypes, jobType)
+                    self.sortedTypes.insert(index, jobType)
+                    self.queues[jobType] = PriorityQueue()
+                self.queues[jobType].put((-priority, next(self.sequence), job))
 
     def sorted(self):
         return list(self.sortedTypes)
 
     def jobIDs(self):
         with self.jobLock:
-            return [job.jobID for queue in self.queues.values() for job in list(queue.queue)]
+            return [job.jobID for queue in self.queues.values() for _, _, job in list(queue.queue)]
 
     def nextJobOfType(self, jobType):
         with self.jobLock:
-            job = self.queues[jobType].get(block=False)
+            _, _, job = self.queues[jobType].get(block=False)
             if self.queues[jobType].empty():
                 del self.queues[jobType]
                 self.sortedTypes.remove(jobType)
@@ -70,7 +83,7 @@ class JobQueue(object):
         # without a lock we could get a false negative from this method
         # if it were called while nextJobOfType was executing
         with self.jobLock:
-            return self.queues.get(jobType, Queue()).empty()
+            return jobType not in self.queues or self.queues[jobType].empty()
 
 
 @total_ordering
@@ -157,4 +170,6 @@ ToilJob = namedtuple('ToilJob', (
     # A dictionary with additional environment variables to be set on the worker process
     'environment',
     # A named tuple containing all the required info for cleaning up the worker node
-    'workerCleanupInfo'))
+    'workerCleanupInfo',
+    # Whether the executor should run the command in a persistent worker process if possible
+    'persistentWorkers'))
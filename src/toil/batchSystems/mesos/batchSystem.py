@@ -92,6 +92,9 @@ class MesosBatchSystem(BatchSystemSupport,
         # Address of the Mesos master in the form host:port where host can be an IP or a hostname
         self.mesosMasterAddress = config.mesosMasterAddress
 
+        # Whether the executors should run Toil workers in their pools of long-lived processes
+        self.persistentWorkers = config.persistentWorkers
+
         # Written to when Mesos kills tasks, as directed by Toil
         self.killedJobIds = set()
 
@@ -160,24 +163,32 @@ class MesosBatchSystem(BatchSystemSupport,
         is an int giving the number of bytes the job needs to run in and cores is the number of cpus
         needed for the job and error-file is the path of the file to place any std-err/std-out in.
         """
-        self.checkResourceRequest(jobNode.memory, jobNode.cores, jobNode.disk)
-        jobID = next(self.unusedJobID)
-        job = ToilJob(jobID=jobID,
-                      name=str(jobNode),
-                      resources=ResourceRequirement(**jobNode._requirements),
-                      command=jobNode.command,
-                      userScript=self.userScript,
-                      environment=self.environment.copy(),
-                      workerCleanupInfo=self.workerCleanupInfo)
-        jobType = job.resources
-        log.debug("Queueing the job command: %s with job id: %s ...", jobNode.command, str(jobID))
-
-        # TODO: round all elements of resources
-
-        self.jobQueues.insertJob(job, jobType)
-        self.taskResources[jobID] = job.resources
-        log.debug("... queued")
-        return jobID
+        return self.issueBatchJobs([jobNode])[0]
+
+    def issueBatchJobs(self, jobNodes):
+        """
+        Queues the given jobs for the scheduler, taking the lock on the queues only once.
+        """
+        jobs = []
+        for jobNode in jobNodes:
+            self.checkResourceRequest(jobNode.memory, jobNode.cores, jobNode.disk)
+            jobID = next(self.unusedJobID)
+            job = ToilJob(jobID=jobID,
+                          name=str(jobNode),
+                          resources=ResourceRequirement(**jobNode._requirements),
+                          command=jobNode.command,
+                          userScript=self.userScript,
+                          environment=self.environment.copy(),
+                          workerCleanupInfo=self.workerCleanupInfo,
+                          persistentWorkers=self.persistentWorkers)
+            log.debug("Queueing the job command: %s with job id: %s ...", jobNode.command,
+                      str(jobID))
+            # TODO: round all elements of resources
+            self.taskResources[jobID] = job.resources
+            jobs.append((job, job.resources, jobNode.priority))
+        self.jobQueues.insertJobs(jobs)
+        log.debug("... queued %i jobs", len(jobs))
+        return [job.jobID for job, _, _ in jobs]
 
     def killBatchJobs(self, jobIDs):
         # FIXME: probably still racy
@@ -220,15 +231,28 @@ class MesosBatchSystem(BatchSystemSupport,
                 item = self.updatedJobsQueue.get(timeout=maxWait)
             except Empty:
                 return None
-            jobId, exitValue, wallTime = item
-            try:
-                self.intendedKill.remove(jobId)
-            except KeyError:
-                log.debug('Job %s ended with status %i, took %s seconds.', jobId, exitValue,
-                          '???' if wallTime is None else str(wallTime))
+            if self._isUpdateExpected(item):
                 return item
-            else:
-                log.debug('Job %s ended naturally before it could be killed.', jobId)
+
+    def getUpdatedBatchJobs(self, maxWait, limit=None):
+        items = self._drainQueue(self.updatedJobsQueue, maxWait, limit)
+        return [item for item in items if self._isUpdateExpected(item)]
+
+    def _isUpdateExpected(self, item):
+        """
+        Returns False for the update of a job that ended before it could be killed, which is not
+        to be reported.
+        """
+        jobId, exitValue, wallTime = item
+        try:
+            self.intendedKill.remove(jobId)
+        except KeyError:
+            log.debug('Job %s ended with status %i, took %s seconds.', jobId, exitValue,
+                      '???' if wallTime is None else str(wallTime))
+            return True
+        else:
+            log.debug('Job %s ended naturally before it could be killed.', jobId)
+            return False
 
     def nodeInUse(self, nodeIP):
         return nodeIP in self.hostToJobIDs
@@ -13,6 +13,7 @@
 # limitations under the License.
 
 from __future__ import absolute_import
+import math
 import os
 import random
 import socket
@@ -23,6 +24,7 @@ import pickle
 import logging
 import subprocess
 import traceback
+from collections import defaultdict
 from time import sleep, time
 
 import psutil
@@ -32,11 +34,167 @@ from mesos.interface import mesos_pb2
 import mesos.native
 from struct import pack
 from toil.batchSystems.abstractBatchSystem import BatchSystemSupport
+from toil.persistentWorker import PersistentWorker
 from toil.resource import Resource
 
 log = logging.getLogger(__name__)
 
 
+class WorkerPool(object):
+    """
+    The persistent Toil worker processes of an executor, see
+    :class:`toil.persistentWorker.PersistentWorker`.
+
+    The executor has no resources of its own, so the pool is sized to the cores of the running
+    tasks that were handed a worker, which are the only resources Mesos accounts to it. Whenever a
+    task is handed a worker, the pool starts idle workers from the same entry point in the
+    background until there is one worker per core, such that jobs need not wait for a new
+    interpreter to start. Idle workers in excess of the cores, as there are once tasks finish, are
+    stopped after they have been idle for maxIdleTime seconds. Each worker runs in a process group
+    of its own, so killing a task kills its worker along with the processes spawned by the job, and
+    the dead worker is replaced.
+    """
+
+    # The number of seconds an idle worker not accounted for by the running tasks is kept around
+    # for the next task
+    maxIdleTime = 10
+
+    def __init__(self, popenLock):
+        """
+        :param threading.Lock popenLock: the lock to hold while starting a process
+        """
+        self.popenLock = popenLock
+        # Guards all of the below
+        self.lock = threading.Lock()
+        # The cores of the running tasks that were handed a worker
+        self.cores = 0
+        # Maps the path of the worker entry point to the workers started from it that are not
+        # currently running a job, along with the time since which they have been idle, the one
+        # that ran a job most recently last
+        self.idleWorkers = defaultdict(list)
+        """
+        :type: dict[str,list[(float,PersistentWorker)]]
+        """
+        # The number of workers running a job
+        self.busyWorkers = 0
+        # The number of workers being started to fill up the pool
+        self.startingWorkers = 0
+        self.isShutdown = threading.Event()
+        reaper = threading.Thread(target=self._reap)
+        reaper.daemon = True
+        reaper.start()
+
+    def acquire(self, workerCommand, cores):
+        """
+        Returns an idle worker started from the given entry point, starting a new one if there is
+        none, and starts filling up the pool with idle workers in the background.
+
+        :param str workerCommand: the path to the worker entry point
+        :param float cores: the cores Mesos allocated to the task the worker is for
+        :rtype: PersistentWorker
+        """
+        with self.lock:
+            self.cores += cores
+            idleWorkers = self.idleWorkers[workerCommand]
+            worker = idleWorkers.pop()[1] if idleWorkers else None
+            self.busyWorkers += 1
+            numWorkers = self._getSize() - self._countWorkers()
+            self.startingWorkers += max(0, numWorkers)
+        if numWorkers > 0:
+            thread = threading.Thread(target=self._fill, args=(workerCommand, numWorkers))
+            thread.daemon = True
+            thread.start()
+        if worker is None:
+            log.debug('Starting a new persistent worker.')
+            try:
+                worker = self._startWorker(workerCommand)
+            except:
+                with self.lock:
+                    self.cores -= cores
+                    self.busyWorkers -= 1
+                raise
+        return worker
+
+    def release(self, worker, cores):
+        """
+        Returns the given worker to the pool after it ran a job, unless its process has died.
+
+        :param PersistentWorker worker: a worker returned by acquire()
+        :param float cores: the cores passed to acquire()
+        """
+        with self.lock:
+            self.cores -= cores
+            self.busyWorkers -= 1
+            alive = worker.popen.poll() is None
+            if alive and not self.isShutdown.is_set():
+                self.idleWorkers[worker.workerCommand].append((time(), worker))
+                return
+        if alive:
+            worker.shutdown()
+        else:
+            log.debug('Discarding persistent worker that exited with %i.',
+                      worker.popen.returncode)
+
+    def shutdown(self):
+        """
+        Stops all idle workers. Workers released after this are stopped, too.
+        """
+        with self.lock:
+            self.isShutdown.set()
+            idleWorkers = [worker for workers in self.idleWorkers.values() for _, worker in workers]
+            self.idleWorkers.clear()
+        for worker in idleWorkers:
+            worker.shutdown()
+
+    def _getSize(self):
+        return max(self.busyWorkers, int(math.ceil(self.cores)))
+
+    def _countWorkers(self):
+        return (self.busyWorkers + self.startingWorkers
+                + sum(len(workers) for workers in self.idleWorkers.values()))
+
+    def _startWorker(self, workerCommand):
+        with self.popenLock:
+            return PersistentWorker(workerCommand, env=dict(os.environ), newProcessGroup=True)
+
+    def _fill(self, workerCommand, numWorkers):
+        for _ in range(numWorkers):
+            try:
+                worker = self._startWorker(workerCommand)
+            except:
+                log.warn('Failed to start a persistent worker.', exc_info=True)
+                worker = None
+            with self.lock:
+                self.startingWorkers -= 1
+                if worker is not None and not self.isShutdown.is_set():
+                    # Put it at the bottom, such that workers that already ran jobs, and thus
+                    # have the job store loaded, are used first
+                    self.idleWorkers[workerCommand].insert(0, (time(), worker))
+                    worker = None
+            if worker is not None:
+                worker.shutdown()
+
+    def _reap(self):
+        """
+        Stops the idle workers in excess of the cores of the running tasks that have been idle
+        for too long, until the pool is shut down.
+        """
+        while not self.isShutdown.wait(self.maxIdleTime / 2.0):
+            expiredWorkers = []
+            with self.lock:
+                numExcessWorkers = self._countWorkers() - self._getSize()
+                expiryTime = time() - self.maxIdleTime
+                for workers in self.idleWorkers.values():
+                    # The workers that have been idle the longest come first
+                    workers.sort(key=lambda item: item[0])
+                    while numExcessWorkers > 0 and workers and workers[0][0] < expiryTime:
+                        expiredWorkers.append(workers.pop(0)[1])
+                        numExcessWorkers -= 1
+            for worker in expiredWorkers:
+                log.debug('Stopping persistent worker that has been idle for too long.')
+                worker.shutdown()
+
+
 class MesosExecutor(mesos.interface.Executor):
     """
     Part of Toil's Mesos framework, runs on a Mesos slave. A Toil job is passed to it via the
@@ -48,6 +206,7 @@ class MesosExecutor(mesos.interface.Executor):
         self.popenLock = threading.Lock()
         self.runningTasks = {}
         self.workerCleanupInfo = None
+        self.workerPool = WorkerPool(self.popenLock)
         Resource.prepareSystem()
         self.address = None
         # Setting this value at this point will ensure that the toil workflow directory will go to
@@ -94,6 +253,7 @@ class MesosExecutor(mesos.interface.Executor):
         log.critical('Shutting down executor ...')
         for taskId in self.runningTasks.keys():
             self.killTask(driver, taskId)
+        self.workerPool.shutdown()
         Resource.cleanSystem()
         BatchSystemSupport.workerCleanup(self.workerCleanupInfo)
         log.critical('... executor shut down.')
@@ -148,11 +308,25 @@ class MesosExecutor(mesos.interface.Executor):
             else:
                 self.workerCleanupInfo = taskData.workerCleanupInfo
             startTime = time()
+            persistentWorker = None
+            cores = sum(resource.scalar.value for resource in task.resources
+                        if resource.name == 'cpus')
             try:
-                popen = runJob(taskData)
+                workerArgs = (PersistentWorker.parseWorkerCommand(taskData.command)
+                              if taskData.persistentWorkers else None)
+                if workerArgs is None:
+                    popen = runJob(taskData)
+                    wait = popen.wait
+                else:
+                    workerCommand, jobStoreLocator, jobStoreID = workerArgs
+                    persistentWorker = self.workerPool.acquire(workerCommand, cores)
+                    popen = persistentWorker.popen
+                    environment = getJobEnvironment(taskData)
+                    wait = lambda: persistentWorker.runJob(jobStoreLocator, jobStoreID,
+                                                           environment)
                 self.runningTasks[task.task_id.value] = popen.pid
                 try:
-                    exitStatus = popen.wait()
+                    exitStatus = wait()
                     wallTime = time() - startTime
                     if 0 == exitStatus:
                         sendUpdate(mesos_pb2.TASK_FINISHED, wallTime)
@@ -162,7 +336,12 @@ class MesosExecutor(mesos.interface.Executor):
                         sendUpdate(mesos_pb2.TASK_FAILED, wallTime, message=str(exitStatus))
                 finally:
                     del self.runningTasks[task.task_id.value]
+                    if persistentWorker is not None:
+                        self.workerPool.release(persistentWorker, cores)
+                        persistentWorker = None
             except:
+                if persistentWorker is not None:
+                    self.workerPool.release(persistentWorker, cores)
                 wallTime = time() - startTime
                 exc_info = sys.exc_info()
                 log.error('Exception while running task:', exc_info=exc_info)
@@ -184,6 +363,21 @@ class MesosExecutor(mesos.interface.Executor):
                                         preexec_fn=lambda: os.setpgrp(),
                                         shell=True, env=dict(os.environ, **job.environment))
 
+        def getJobEnvironment(job):
+            """
+            Returns the variables to set in the environment of a persistent worker before it runs
+            the given job, which was started before the user script was registered.
+
+            :type job: toil.batchSystems.mesos.ToilJob
+
+            :rtype: dict[str,str]
+            """
+            environment = dict(job.environment)
+            if job.userScript:
+                environment[Resource.resourceEnvNamePrefix + job.userScript.pathHash] = \
+                    job.userScript.pickle()
+            return environment
+
         def sendUpdate(taskState, wallTime=None, message=''):
             log.debug('Sending task status update ...')
             status = mesos_pb2.TaskStatus()
@@ -34,6 +34,15 @@ def _singleMachineOptions(addOptionFn):
                 help=("When using Toil's importFile function for staging, input files are copied to the job store. "
                       "Specifying this option saves space by hard-linking imported files. As long as caching is "
                       "enabled Toil will protect the file automatically by changing the permissions to read-only."))
+    addOptionFn("--persistentWorkers", dest="persistentWorkers", default=False, action='store_true',
+                help=("Run jobs in a pool of long-lived worker processes instead of starting a new "
+                      "worker process for every job. This avoids the cost of starting the Python "
+                      "interpreter, importing modules and loading the job store for each job, which "
+                      "dominates the runtime of workflows with many short jobs. A worker process "
+                      "that crashes only fails the job it was running and is replaced. Jobs must not "
+                      "rely on running in a fresh process. Used in singleMachine and mesos batch "
+                      "systems. "
+                      "default=false"))
 
 
 def _mesosOptions(addOptionFn):
@@ -87,6 +96,7 @@ def setDefaultOptions(config):
     # single machine
     config.scale = 1
     config.linkImports = False
+    config.persistentWorkers = False
 
     # mesos
     config.mesosMasterAddress = 'localhost:5050'
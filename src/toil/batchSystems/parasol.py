@@ -263,16 +263,25 @@ class ParasolBatchSystem(BatchSystemSupport):
     def getUpdatedBatchJob(self, maxWait):
         while True:
             try:
-                jobID, status, wallTime = self.updatedJobsQueue.get(timeout=maxWait)
+                item = self.updatedJobsQueue.get(timeout=maxWait)
             except Empty:
                 return None
-            try:
-                self.runningJobs.remove(jobID)
-            except KeyError:
-                # We tried to kill this job, but it ended by itself instead, so skip it.
-                pass
-            else:
-                return jobID, status, wallTime
+            if self._isUpdateExpected(item):
+                return item
+
+    def getUpdatedBatchJobs(self, maxWait, limit=None):
+        items = self._drainQueue(self.updatedJobsQueue, maxWait, limit)
+        return [item for item in items if self._isUpdateExpected(item)]
+
+    def _isUpdateExpected(self, item):
+        jobID, status, wallTime = item
+        try:
+            self.runningJobs.remove(jobID)
+        except KeyError:
+            # We tried to kill this job, but it ended by itself instead, so skip it.
+            return False
+        else:
+            return True
 
     @classmethod
     def getRescueBatchJobFrequency(cls):
@@ -13,22 +13,23 @@
 # limitations under the License.
 
 from __future__ import absolute_import
-from contextlib import contextmanager
+import bisect
 import logging
 import multiprocessing
 import os
 import subprocess
 import time
 import math
-from threading import Thread
+from collections import defaultdict, namedtuple
+from threading import Thread, current_thread
 from threading import Lock, Condition
 
 # Python 3 compatibility imports
 from six.moves.queue import Empty, Queue
-from six.moves import xrange
 
 import toil
 from toil.batchSystems.abstractBatchSystem import BatchSystemSupport, InsufficientSystemResources
+from toil.persistentWorker import PersistentWorker
 
 log = logging.getLogger(__name__)
 
@@ -52,9 +53,14 @@ class SingleMachineBatchSystem(BatchSystemSupport):
     minCores = 0.1
     """
     The minimal fractional CPU. Tasks with a smaller core requirement will be rounded up to this
-    value. One important invariant of this class is that each worker thread represents a CPU
-    requirement of minCores, meaning that we can never run more than numCores / minCores jobs
-    concurrently.
+    value. CPU is allocated in units of minCores, meaning that we can never run more than
+    numCores / minCores jobs concurrently.
+    """
+
+    maxBackfillDelay = 60
+    """
+    The number of seconds a job may be overtaken by smaller jobs issued after it before the
+    scheduler reserves the resources it requires, see :meth:`scheduler`.
     """
     physicalMemory = toil.physicalMemory()
 
@@ -77,8 +83,6 @@ class SingleMachineBatchSystem(BatchSystemSupport):
         # squeezing more tasks onto each core (scale < 1) or stretching tasks over more cores
         # (scale > 1).
         self.scale = config.scale
-        # Number of worker threads that will be started
-        self.numWorkers = int(self.maxCores / self.minCores)
         # A counter to generate job IDs and a lock to guard it
         self.jobIndex = 0
         self.jobIndexLock = Lock()
@@ -87,106 +91,231 @@ class SingleMachineBatchSystem(BatchSystemSupport):
         """
         :type: dict[str,toil.job.JobNode]
         """
-        # A queue of jobs waiting to be executed. Consumed by the workers.
-        self.inputQueue = Queue()
-        # A queue of finished jobs. Produced by the workers.
+        # A list of jobs waiting for resources, sorted highest priority first, as tuples of the
+        # negated priority, the job ID and the PendingJob. Consumed by the scheduler thread.
+        self.pendingJobs = []
+        # A queue of finished jobs. Produced by the threads running the jobs.
         self.outputQueue = Queue()
         # A dictionary mapping IDs of currently running jobs to their Info objects
         self.runningJobs = {}
         """
         :type: dict[str,Info]
         """
-        # The list of worker threads
-        self.workerThreads = []
+        # The threads running the jobs started by the scheduler that haven't finished yet
+        self.jobThreads = set()
         """
-        :type list[Thread]
+        :type: set[Thread]
         """
-        # Variables involved with non-blocking resource acquisition
-        self.acquisitionTimeout = 5
-        self.acquisitionRetryDelay = 10
-        self.aquisitionCondition = Condition()
-
-        # A pool representing available CPU in units of minCores
-        self.coreFractions = ResourcePool(self.numWorkers, 'cores', self.acquisitionTimeout)
+        # Whether shutdown() was called. The scheduler exits once all pending jobs are started.
+        self.shuttingDown = False
+        # The resources not allocated to running jobs. Available CPU is counted in units of
+        # minCores, memory and disk in bytes.
+        self.coreFractions = int(self.maxCores / self.minCores)
+        self.memory = self.maxMemory
+        self.disk = self.maxDisk
+        # Guards all of the above except outputQueue, and is notified whenever a job is issued or
+        # killed, a job finishes or the batch system is shut down
+        self.schedulingCondition = Condition()
         # A lock to work around the lack of thread-safety in Python's subprocess module
         self.popenLock = Lock()
-        # A pool representing available memory in bytes
-        self.memory = ResourcePool(self.maxMemory, 'memory', self.acquisitionTimeout)
-        # A pool representing the available space in bytes
-        self.disk = ResourcePool(self.maxDisk, 'disk', self.acquisitionTimeout)
-
-        log.debug('Setting up the thread pool with %i workers, '
-                 'given a minimum CPU fraction of %f '
-                 'and a maximum CPU value of %i.', self.numWorkers, self.minCores, maxCores)
-        for i in xrange(self.numWorkers):
-            worker = Thread(target=self.worker, args=(self.inputQueue,))
-            self.workerThreads.append(worker)
-            worker.start()
-
-    # Note: The input queue is passed as an argument because the corresponding attribute is reset
-    # to None in shutdown()
-
-    def worker(self, inputQueue):
-        while True:
-            args = inputQueue.get()
-            if args is None:
-                log.debug('Received queue sentinel.')
-                break
-            jobCommand, jobID, jobCores, jobMemory, jobDisk, environment = args
+        # Whether to run Toil workers in long-lived processes instead of one process per job
+        self.persistentWorkers = config.persistentWorkers
+        # Maps the path of the worker entry point to the persistent workers started from it that
+        # are not currently running a job, and a lock to guard it
+        self.idlePersistentWorkers = defaultdict(list)
+        """
+        :type: dict[str,list[PersistentWorker]]
+        """
+        self.idlePersistentWorkersLock = Lock()
+
+        log.debug('Setting up the scheduler with %i fractional cores, given a minimum CPU '
+                  'fraction of %f and a maximum CPU value of %i.', self.coreFractions,
+                  self.minCores, maxCores)
+        self.schedulerThread = Thread(target=self.scheduler)
+        self.schedulerThread.start()
+
+    def scheduler(self):
+        """
+        Starts pending jobs as soon as the resources they require are free, until the batch system
+        is shut down and no jobs are left pending.
+
+        Jobs are considered highest priority first. A job that doesn't fit into the free
+        resources doesn't hold up the jobs behind it, which are started if they fit into what is
+        left (backfilling). To keep a stream of small jobs from starving a large one, the
+        resources of a job that has been pending for longer than maxBackfillDelay are reserved for
+        it: jobs behind it are then only started if they fit into the free resources minus that
+        job's requirements, which lets the free resources accumulate until the job fits.
+        """
+        with self.schedulingCondition:
             while True:
-                try:
-                    coreFractions = int(jobCores / self.minCores)
-                    log.debug('Acquiring %i bytes of memory from a pool of %s.', jobMemory,
-                              self.memory)
-                    with self.memory.acquisitionOf(jobMemory):
-                        log.debug('Acquiring %i fractional cores from a pool of %s to satisfy a '
-                                  'request of %f cores', coreFractions, self.coreFractions,
-                                  jobCores)
-                        with self.coreFractions.acquisitionOf(coreFractions):
-                            with self.disk.acquisitionOf(jobDisk):
-                                startTime = time.time() #Time job is started
-                                with self.popenLock:
-                                    popen = subprocess.Popen(jobCommand,
-                                                             shell=True,
-                                                             env=dict(os.environ, **environment))
-                                statusCode = None
-                                info = Info(time.time(), popen, killIntended=False)
-                                try:
-                                    self.runningJobs[jobID] = info
-                                    try:
-                                        statusCode = popen.wait()
-                                        if 0 != statusCode:
-                                            if statusCode != -9 or not info.killIntended:
-                                                log.error("Got exit code %i (indicating failure) "
-                                                          "from job %s.", statusCode,
-                                                          self.jobs[jobID])
-                                    finally:
-                                        self.runningJobs.pop(jobID)
-                                finally:
-                                    if statusCode is not None and not info.killIntended:
-                                        self.outputQueue.put((jobID, statusCode,
-                                                              time.time() - startTime))
-                except ResourcePool.AcquisitionTimeoutException as e:
-                    log.debug('Could not acquire enough (%s) to run job (%s). Requested: (%s), '
-                              'Avaliable: %s. Sleeping for 10s.', e.resource, jobID, e.requested,
-                              e.available)
-                    with self.aquisitionCondition:
-                        # Make threads sleep for the given delay, or until another job finishes.
-                        # Whichever is sooner.
-                        self.aquisitionCondition.wait(timeout=self.acquisitionRetryDelay)
-                    continue
-                else:
-                    log.debug('Finished job. self.coreFractions ~ %s and self.memory ~ %s',
-                              self.coreFractions.value, self.memory.value)
-                    with self.aquisitionCondition:
-                        # Wake up sleeping threads
-                        self.aquisitionCondition.notifyAll()
+                if self.pendingJobs:
+                    self._startPendingJobs()
+                if self.shuttingDown and not self.pendingJobs:
                     break
-        log.debug('Exiting worker thread normally.')
+                self.schedulingCondition.wait()
+        log.debug('Exiting scheduler thread normally.')
+
+    def _startPendingJobs(self):
+        """
+        Makes a single backfilling pass over the pending jobs. Must be called with the scheduling
+        condition held.
+        """
+        now = time.time()
+        # The resources that may be allocated in this pass, net of reservations
+        coreFractions, memory, disk = self.coreFractions, self.memory, self.disk
+        stillPending = []
+        for i, item in enumerate(self.pendingJobs):
+            if coreFractions <= 0:
+                # No job requires less than one fractional core
+                stillPending.extend(self.pendingJobs[i:])
+                break
+            job = item[2]
+            if (job.coreFractions <= coreFractions and job.memory <= memory
+                    and job.disk <= disk):
+                coreFractions -= job.coreFractions
+                memory -= job.memory
+                disk -= job.disk
+                self._startJob(job)
+            else:
+                if now - job.issueTime > self.maxBackfillDelay:
+                    log.debug('Reserving resources for job %s, which has been pending for %i '
+                              'seconds.', job.jobID, now - job.issueTime)
+                    coreFractions -= job.coreFractions
+                    memory -= job.memory
+                    disk -= job.disk
+                stillPending.append(item)
+        self.pendingJobs = stillPending
+
+    def _startJob(self, job):
+        """
+        Allocates the resources of the given job and runs it in a thread of its own. Must be called
+        with the scheduling condition held.
+
+        :param PendingJob job:
+        """
+        self.coreFractions -= job.coreFractions
+        self.memory -= job.memory
+        self.disk -= job.disk
+        log.debug('Starting job %s, leaving %i fractional cores, %i bytes of memory and %i bytes '
+                  'of disk free.', job.jobID, self.coreFractions, self.memory, self.disk)
+        thread = Thread(target=self._runJob, args=(job,))
+        self.jobThreads.add(thread)
+        thread.start()
+
+    def _runJob(self, job):
+        """
+        Runs the given job, reports its exit status unless it was killed and frees its resources.
+
+        :param PendingJob job:
+        """
+        try:
+            startTime = time.time()  # Time job is started
+            workerArgs = self._parseWorkerCommand(job.jobCommand)
+            if workerArgs is None:
+                persistentWorker = None
+                with self.popenLock:
+                    popen = subprocess.Popen(job.jobCommand,
+                                             shell=True,
+                                             env=dict(os.environ, **job.environment))
+                wait = popen.wait
+            else:
+                workerCommand, jobStoreLocator, jobStoreID = workerArgs
+                persistentWorker = self._acquirePersistentWorker(workerCommand, job.environment)
+                popen = persistentWorker.popen
+                wait = lambda: persistentWorker.runJob(jobStoreLocator,
+                                                       jobStoreID,
+                                                       job.environment)
+            statusCode = None
+            info = Info(time.time(), popen, killIntended=False)
+            try:
+                self.runningJobs[job.jobID] = info
+                try:
+                    statusCode = wait()
+                    if 0 != statusCode:
+                        if statusCode != -9 or not info.killIntended:
+                            log.error("Got exit code %i (indicating failure) "
+                                      "from job %s.", statusCode, self.jobs[job.jobID])
+                finally:
+                    self.runningJobs.pop(job.jobID)
+                    if persistentWorker is not None:
+                        self._releasePersistentWorker(persistentWorker)
+            finally:
+                if statusCode is not None and not info.killIntended:
+                    self.outputQueue.put((job.jobID, statusCode, time.time() - startTime))
+        finally:
+            with self.schedulingCondition:
+                self.coreFractions += job.coreFractions
+                self.memory += job.memory
+                self.disk += job.disk
+                self.jobThreads.remove(current_thread())
+                log.debug('Finished job %s, %i fractional cores, %i bytes of memory and %i bytes '
+                          'of disk are free.', job.jobID, self.coreFractions, self.memory,
+                          self.disk)
+                # Wake up the scheduler, and shutdown() if it is waiting for this job
+                self.schedulingCondition.notifyAll()
+
+    def _parseWorkerCommand(self, jobCommand):
+        """
+        Determines whether the given command should be run by a persistent worker, see
+        :meth:`PersistentWorker.parseWorkerCommand`.
+
+        :rtype: tuple(str,str,str)|None
+        """
+        if self.persistentWorkers:
+            return PersistentWorker.parseWorkerCommand(jobCommand)
+        return None
+
+    def _acquirePersistentWorker(self, workerCommand, environment):
+        """
+        Returns an idle persistent worker started from the given entry point, starting a new one
+        if there is none.
+
+        :rtype: PersistentWorker
+        """
+        with self.idlePersistentWorkersLock:
+            idleWorkers = self.idlePersistentWorkers[workerCommand]
+            if idleWorkers:
+                return idleWorkers.pop()
+        log.debug('Starting a new persistent worker.')
+        with self.popenLock:
+            return PersistentWorker(workerCommand, env=dict(os.environ, **environment))
+
+    def _releasePersistentWorker(self, persistentWorker):
+        """
+        Makes the given persistent worker available for the next job, unless its process has died.
+        """
+        if persistentWorker.popen.poll() is None:
+            with self.idlePersistentWorkersLock:
+                self.idlePersistentWorkers[persistentWorker.workerCommand].append(persistentWorker)
+        else:
+            log.debug('Discarding persistent worker that exited with %i.',
+                      persistentWorker.popen.returncode)
 
     def issueBatchJob(self, jobNode):
         """
-        Adds the command and resources to a queue to be run.
+        Adds the command and resources to the jobs waiting to be run.
+        """
+        return self.issueBatchJobs([jobNode])[0]
+
+    def issueBatchJobs(self, jobNodes):
+        """
+        Adds the commands and resources to the jobs waiting to be run, waking up the scheduler
+        only once.
+        """
+        jobs = [self._createPendingJob(jobNode) for jobNode in jobNodes]
+        with self.schedulingCondition:
+            assert not self.shuttingDown
+            for priority, job in jobs:
+                bisect.insort(self.pendingJobs, (-priority, job.jobID, job))
+            self.schedulingCondition.notifyAll()
+        return [job.jobID for _, job in jobs]
+
+    def _createPendingJob(self, jobNode):
+        """
+        Checks the resource requirements of the given job and assigns it an ID.
+
+        :return: the priority of the job and the job
+        :rtype: (float, PendingJob)
         """
         # Round cores to minCores and apply scale
         cores = math.ceil(jobNode.cores * self.scale / self.minCores) * self.minCores
@@ -205,15 +334,31 @@ class SingleMachineBatchSystem(BatchSystemSupport):
             jobID = self.jobIndex
             self.jobIndex += 1
         self.jobs[jobID] = jobNode.command
-        self.inputQueue.put((jobNode.command, jobID, cores, jobNode.memory,
-                             jobNode.disk, self.environment.copy()))
-        return jobID
+        job = PendingJob(jobCommand=jobNode.command,
+                         jobID=jobID,
+                         coreFractions=int(round(cores / self.minCores)),
+                         memory=jobNode.memory,
+                         disk=jobNode.disk,
+                         environment=self.environment.copy(),
+                         issueTime=time.time())
+        return jobNode.priority, job
 
     def killBatchJobs(self, jobIDs):
         """
         Kills jobs by ID
         """
         log.debug('Killing jobs: {}'.format(jobIDs))
+        jobIDs = set(jobIDs)
+        with self.schedulingCondition:
+            # Jobs that haven't been started yet are simply dropped. Like killed jobs, they are
+            # not reported as updated, so they must no longer count as issued.
+            stillPending = []
+            for item in self.pendingJobs:
+                if item[1] in jobIDs:
+                    self.jobs.pop(item[1])
+                else:
+                    stillPending.append(item)
+            self.pendingJobs = stillPending
         for jobID in jobIDs:
             if jobID in self.runningJobs:
                 info = self.runningJobs[jobID]
@@ -221,6 +366,7 @@ class SingleMachineBatchSystem(BatchSystemSupport):
                 os.kill(info.popen.pid, 9)
                 while jobID in self.runningJobs:
                     pass
+                self.jobs.pop(jobID)
 
     def getIssuedBatchJobIDs(self):
         """
@@ -234,16 +380,19 @@ class SingleMachineBatchSystem(BatchSystemSupport):
 
     def shutdown(self):
         """
-        Cleanly terminate worker threads. Add sentinels to inputQueue equal to maxThreads. Join
-        all worker threads.
+        Cleanly terminate the scheduler once all pending jobs were started and wait for all jobs
+        to finish.
         """
-        # Remove reference to inputQueue (raises exception if inputQueue is used after method call)
-        inputQueue = self.inputQueue
-        self.inputQueue = None
-        for i in xrange(self.numWorkers):
-            inputQueue.put(None)
-        for thread in self.workerThreads:
-            thread.join()
+        with self.schedulingCondition:
+            self.shuttingDown = True
+            self.schedulingCondition.notifyAll()
+        self.schedulerThread.join()
+        with self.schedulingCondition:
+            while self.jobThreads:
+                self.schedulingCondition.wait()
+        for idleWorkers in self.idlePersistentWorkers.values():
+            for persistentWorker in idleWorkers:
+                persistentWorker.shutdown()
         BatchSystemSupport.workerCleanup(self.workerCleanupInfo)
 
     def getUpdatedBatchJob(self, maxWait):
@@ -254,8 +403,17 @@ class SingleMachineBatchSystem(BatchSystemSupport):
             item = self.outputQueue.get(timeout=maxWait)
         except Empty:
             return None
+        return self._reapJob(item)
+
+    def getUpdatedBatchJobs(self, maxWait, limit=None):
+        """
+        Drains the queue of finished jobs, blocking for at most maxWait seconds for the first.
+        """
+        return [self._reapJob(item) for item in self._drainQueue(self.outputQueue, maxWait, limit)]
+
+    def _reapJob(self, item):
         jobID, exitValue, wallTime = item
-        jobCommand = self.jobs.pop(jobID)
+        self.jobs.pop(jobID)
         log.debug("Ran jobID: %s with exit value: %i", jobID, exitValue)
         return jobID, exitValue, wallTime
 
@@ -269,83 +427,20 @@ class SingleMachineBatchSystem(BatchSystemSupport):
     @classmethod
     def setOptions(cls, setOption):
         setOption("scale", default=1)
-        
+        setOption("persistentWorkers", default=False)
+
+
+class PendingJob(namedtuple('PendingJob', ('jobCommand', 'jobID', 'coreFractions', 'memory',
+                                           'disk', 'environment', 'issueTime'))):
+    """
+    A job waiting for the scheduler to allocate the resources it requires. The number of cores is
+    given in units of minCores, memory and disk in bytes.
+    """
+
+
 class Info(object):
     # Can't use namedtuple here since killIntended needs to be mutable
     def __init__(self, startTime, popen, killIntended):
         self.time = startTime
         self.popen = popen
         self.killIntended = killIntended
-
-
-class ResourcePool(object):
-    def __init__(self, initial_value, resourceType, timeout):
-        super(ResourcePool, self).__init__()
-        self.condition = Condition()
-        self.value = initial_value
-        self.resourceType = resourceType
-        self.timeout = timeout
-
-    def acquire(self, amount):
-        with self.condition:
-            startTime = time.time()
-            while amount > self.value:
-                if time.time() - startTime >= self.timeout:
-                    # This means the thread timed out waiting for the resource.  We exit the nested
-                    # context managers in worker to prevent blocking of a resource due to
-                    # unavailability of a nested resource request.
-                    raise self.AcquisitionTimeoutException(resource=self.resourceType,
-                                                           requested=amount, available=self.value)
-                # Allow 5 seconds to get the resource, else quit through the above if condition.
-                # This wait + timeout is the last thing in the loop such that a request that takes
-                # longer than 5s due to multiple wakes under the 5 second threshold are still
-                # honored.
-                self.condition.wait(timeout=self.timeout)
-            self.value -= amount
-            self.__validate()
-
-    def release(self, amount):
-        with self.condition:
-            self.value += amount
-            self.__validate()
-            self.condition.notifyAll()
-
-    def __validate(self):
-        assert 0 <= self.value
-
-    def __str__(self):
-        return str(self.value)
-
-    def __repr__(self):
-        return "ResourcePool(%i)" % self.value
-
-    @contextmanager
-    def acquisitionOf(self, amount):
-        self.acquire(amount)
-        try:
-            yield
-        finally:
-            self.release(amount)
-
-    class AcquisitionTimeoutException(Exception):
-        """
-        To be raised when a resource request times out.
-        """
-
-        def __init__(self, resource, requested, available):
-            """
-            Creates an instance of this exception that indicates which resource is insufficient for
-            current demands, as well as the amount requested and amount actually available.
-
-            :param str resource: string representing the resource type
-
-            :param int|float requested: the amount of the particular resource requested that resulted
-                   in this exception
-
-            :param int|float available: amount of the particular resource actually available
-            """
-            self.requested = requested
-            self.available = available
-            self.resource = resource
-
-
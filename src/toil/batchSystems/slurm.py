@@ -33,10 +33,12 @@ class SlurmBatchSystem(AbstractGridEngineBatchSystem):
 
     class Worker(AbstractGridEngineBatchSystem.Worker):
 
+        arrayTaskIDVariable = 'SLURM_ARRAY_TASK_ID'
+
         def getRunningJobIDs(self):
             # Should return a dictionary of Job IDs and number of seconds
             times = {}
-            currentjobs = dict((str(self.batchJobIDs[x][0]), x) for x in self.runningJobs)
+            currentjobs = dict((self.getBatchSystemID(x), x) for x in self.runningJobs)
             # currentjobs is a dictionary that maps a slurm job id (string) to our own internal job id
             # squeue arguments:
             # -h for no header
@@ -60,6 +62,15 @@ class SlurmBatchSystem(AbstractGridEngineBatchSystem):
         def prepareSubmission(self, cpu, memory, jobID, command):
             return self.prepareSbatch(cpu, memory, jobID) + ['--wrap={}'.format(command)]
 
+        def prepareArraySubmission(self, cpu, memory, jobIDs, scriptPath):
+            return self.prepareSbatch(cpu, memory, 'array_{}'.format(jobIDs[0])) + [
+                '--array=1-{}'.format(len(jobIDs)),
+                '--wrap=/bin/sh {}'.format(quote(scriptPath))]
+
+        def formatArrayTaskID(self, batchJobID, task):
+            # Slurm refers to the tasks of a job array as <array job ID>_<task index>
+            return '{}_{}'.format(batchJobID, task)
+
         def submitJob(self, subLine):
             try:
                 output = subprocess.check_output(subLine, stderr=subprocess.STDOUT)
@@ -75,87 +86,95 @@ class SlurmBatchSystem(AbstractGridEngineBatchSystem):
                 raise e
 
         def getJobExitCode(self, slurmJobID):
-            logger.debug("Getting exit code for slurm job %d", int(slurmJobID))
-            
-            state, rc = self._getJobDetailsFromSacct(slurmJobID)
-            
-            if rc == -999:
-                state, rc = self._getJobDetailsFromScontrol(slurmJobID)
-            
-            logger.debug("s job state is %s", state)
-            # If Job is in a running state, return None to indicate we don't have an update                                 
-            if state in ('PENDING', 'RUNNING', 'CONFIGURING', 'COMPLETING', 'RESIZING', 'SUSPENDED'):
-                return None
-            
-            return rc
-            
-        def _getJobDetailsFromSacct(self, slurmJobID):
-            # SLURM job exit codes are obtained by running sacct.
+            return self.getJobExitCodes([slurmJobID])[slurmJobID]
+
+        def getJobExitCodes(self, slurmJobIDs):
+            logger.debug("Getting exit codes for %i slurm jobs", len(slurmJobIDs))
+
+            jobDetails = self._getJobDetailsFromSacct(slurmJobIDs)
+
+            if jobDetails is None:
+                jobDetails = self._getJobDetailsFromScontrol(slurmJobIDs)
+
+            exitCodes = {}
+            for slurmJobID in slurmJobIDs:
+                state, rc = jobDetails.get(str(slurmJobID), (None, None))
+                logger.debug("s job %s state is %s", slurmJobID, state)
+                # If Job is in a running state, return None to indicate we don't have an update
+                if state in ('PENDING', 'RUNNING', 'CONFIGURING', 'COMPLETING', 'RESIZING', 'SUSPENDED'):
+                    rc = None
+                exitCodes[slurmJobID] = rc
+            return exitCodes
+
+        def _getJobDetailsFromSacct(self, slurmJobIDs):
+            # SLURM job exit codes are obtained by running sacct, once for all jobs.
             args = ['sacct',
                     '-n', # no header
-                    '-j', str(slurmJobID), # job
-                    '--format', 'State,ExitCode', # specify output columns
+                    '-j', ','.join(map(str, slurmJobIDs)), # jobs
+                    '--format', 'JobID,State,ExitCode', # specify output columns
                     '-P', # separate columns with pipes
                     '-S', '1970-01-01'] # override start time limit
-            
+
             process = subprocess.Popen(args, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
-            rc = process.returncode
-            
-            if rc != 0:
+            stdout, _ = process.communicate()
+
+            if process.returncode != 0:
                 # no accounting system or some other error
-                return (None, -999)
-            
-            for line in process.stdout:
+                logger.debug("sacct failed with code %d, falling back to scontrol", process.returncode)
+                return None
+
+            jobDetails = {}
+            for line in stdout.split('\n'):
                 values = line.strip().split('|')
-                if len(values) < 2:
+                if len(values) < 3:
                     continue
-                state, exitcode = values
-                logger.debug("sacct job state is %s", state)
-                # If Job is in a running state, return None to indicate we don't have an update
+                jobID, state, exitcode = values
+                # Skip the steps of a job, like 1234.batch
+                if '.' in jobID:
+                    continue
+                # A cancelled job's state reads 'CANCELLED by <uid>'
+                state = state.split(' ')[0]
                 status, _ = exitcode.split(':')
-                logger.debug("sacct exit code is %s, returning status %s", exitcode, status)
-                return (state, int(status))
-            logger.debug("Did not find exit code for job in sacct output")
-            return None
+                jobDetails[jobID] = (state, int(status))
+            return jobDetails
 
-        def _getJobDetailsFromScontrol(self, slurmJobID):
+        def _getJobDetailsFromScontrol(self, slurmJobIDs):
+            # Without a job ID, scontrol shows all jobs the controller still remembers, one per
+            # line with --oneliner
             args = ['scontrol',
+                    '--oneliner',
                     'show',
-                    'job',
-                    str(slurmJobID)]
-    
+                    'job']
+
             process = subprocess.Popen(args, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
-    
-            job = dict()
-            for line in process.stdout:
-                values = line.strip().split()
-    
-                # If job information is not available an error is issued:
-                # slurm_load_jobs error: Invalid job id specified
-                # There is no job information, so exit.
-                if len(values)>0 and values[0] == 'slurm_load_jobs':
-                    return (None, None)
-                
-                # Output is in the form of many key=value pairs, multiple pairs on each line
-                # and multiple lines in the output. Each pair is pulled out of each line and
-                # added to a dictionary
-                for v in values:
-                    bits = v.split('=')
-                    job[bits[0]] = bits[1]
-    
-            state = job['JobState']
-            try:
-                exitcode = job['ExitCode']
+            stdout, _ = process.communicate()
+
+            slurmJobIDs = set(map(str, slurmJobIDs))
+            jobDetails = {}
+            for line in stdout.split('\n'):
+                # Output is in the form of many key=value pairs. Each pair is pulled out of the
+                # line and added to a dictionary
+                job = dict(v.split('=', 1) for v in line.strip().split() if '=' in v)
+                if 'JobId' not in job or 'JobState' not in job:
+                    continue
+
+                # Tasks of a job array are referred to by the ID of the array and their index
+                if job.get('ArrayTaskId', 'N/A') != 'N/A':
+                    jobID = '{}_{}'.format(job['ArrayJobId'], job['ArrayTaskId'])
+                else:
+                    jobID = job['JobId']
+                if jobID not in slurmJobIDs:
+                    continue
+
+                exitcode = job.get('ExitCode')
                 if exitcode is not None:
                     status, _ = exitcode.split(':')
                     logger.debug("scontrol exit code is %s, returning status %s", exitcode, status)
                     rc = int(status)
                 else:
                     rc = None
-            except KeyError:
-                rc = None
-            
-            return (state, rc)
+                jobDetails[jobID] = (job['JobState'], rc)
+            return jobDetails
 
         """
         Implementation-specific helper methods
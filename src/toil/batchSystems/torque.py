@@ -69,7 +69,7 @@ class TorqueBatchSystem(AbstractGridEngineBatchSystem):
         def getRunningJobIDs(self):
             times = {}
             
-            currentjobs = dict((str(self.batchJobIDs[x][0].strip()), x) for x in self.runningJobs)
+            currentjobs = dict((self.getBatchSystemID(x).strip(), x) for x in self.runningJobs)
             logger.debug("getRunningJobIDs current jobs are: " + str(currentjobs))
             # Limit qstat to current username to avoid clogging the batch system on heavily loaded clusters
             #job_user = os.environ.get('USER')
@@ -124,35 +124,71 @@ class TorqueBatchSystem(AbstractGridEngineBatchSystem):
         def prepareSubmission(self, cpu, memory, jobID, command):
             return self.prepareQsub(cpu, memory, jobID) + [self.generateTorqueWrapper(command)]
 
+        @property
+        def arrayTaskIDVariable(self):
+            return 'PBS_ARRAY_INDEX' if self._version == "pro" else 'PBS_ARRAYID'
+
+        def prepareArraySubmission(self, cpu, memory, jobIDs, scriptPath):
+            # PBS Pro and Torque OSS differ in the option for submitting a job array
+            arrayOption = '-J' if self._version == "pro" else '-t'
+            return self.prepareQsub(cpu, memory, 'array_{}'.format(jobIDs[0])) + [
+                arrayOption, '1-{}'.format(len(jobIDs)), scriptPath]
+
+        def getJobArrayScriptPreamble(self):
+            return 'cd "$PBS_O_WORKDIR"'
+
+        def formatArrayTaskID(self, batchJobID, task):
+            # qsub prints the ID of a job array as <number>[].<server>, the index of a task goes
+            # between the brackets
+            return str(batchJobID).strip().replace('[]', '[{}]'.format(task), 1)
+
         def submitJob(self, subLine):
             process = subprocess.Popen(subLine, stdout=subprocess.PIPE)
             so, se = process.communicate()
             return so
 
         def getJobExitCode(self, torqueJobID):
+            return self.getJobExitCodes([torqueJobID])[torqueJobID]
+
+        def getJobExitCodes(self, torqueJobIDs):
+            # qstat takes any number of jobs, so a single call covers all of them
+            shortJobIDs = dict((str(torqueJobID).strip().split('.')[0], torqueJobID)
+                               for torqueJobID in torqueJobIDs)
             if self._version == "pro":
-                args = ["qstat", "-x", "-f", str(torqueJobID).split('.')[0]]
+                args = ["qstat", "-x", "-f"] + list(shortJobIDs.keys())
             elif self._version == "oss":
-                args = ["qstat", "-f", str(torqueJobID).split('.')[0]]
+                args = ["qstat", "-f"] + list(shortJobIDs.keys())
 
             process = subprocess.Popen(args, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
-            for line in process.stdout:
+            stdout, _ = process.communicate()
+
+            exitCodes = dict((torqueJobID, None) for torqueJobID in torqueJobIDs)
+            torqueJobID = None
+            for line in stdout.split('\n'):
                 line = line.strip()
-                #logger.debug("getJobExitCode exit status: " + line)
-                # Case differences due to PBSPro vs OSS Torque qstat outputs
-                if line.startswith("failed") or line.startswith("FAILED") and int(line.split()[1]) == 1:
-                    return 1
-                if line.startswith("exit_status") or line.startswith("Exit_status"):
-                    status = line.split(' = ')[1]
-                    logger.debug('Exit Status: ' + status)
-                    return int(status)
+                # The attributes of each job follow a line like 'Job Id: 1234.server'
+                if line.startswith("Job Id:"):
+                    torqueJobID = shortJobIDs.get(line.split()[-1].split('.')[0])
+                    continue
                 if 'unknown job id' in line.lower():
                     # some clusters configure Torque to forget everything about just
                     # finished jobs instantly, apparently for performance reasons
-                    logger.debug('Batch system no longer remembers about job {}'.format(torqueJobID))
-                    # return assumed success; status files should reveal failure
-                    return 0
-            return None
+                    unknownJobID = shortJobIDs.get(line.split()[-1].split('.')[0])
+                    if unknownJobID is not None:
+                        logger.debug('Batch system no longer remembers about job {}'.format(unknownJobID))
+                        # return assumed success; status files should reveal failure
+                        exitCodes[unknownJobID] = 0
+                    continue
+                if torqueJobID is None or exitCodes[torqueJobID] is not None:
+                    continue
+                # Case differences due to PBSPro vs OSS Torque qstat outputs
+                if line.startswith("failed") or line.startswith("FAILED") and int(line.split()[1]) == 1:
+                    exitCodes[torqueJobID] = 1
+                elif line.startswith("exit_status") or line.startswith("Exit_status"):
+                    status = line.split(' = ')[1]
+                    logger.debug('Exit Status of {}: {}'.format(torqueJobID, status))
+                    exitCodes[torqueJobID] = int(status)
+            return exitCodes
 
         """
         Implementation-specific helper methods
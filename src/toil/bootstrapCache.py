@@ -0,0 +1,148 @@
+# Copyright (C) 2015-2017 Regents of the University of California
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import absolute_import
+
+import errno
+import hashlib
+import logging
+import os
+import stat
+import tempfile
+import time
+
+# Python 3 compatibility imports
+from six.moves import cPickle
+
+logger = logging.getLogger( __name__ )
+
+
+class BootstrapCache( object ):
+    """
+    Caches the configuration and the environment of a workflow on a node, such that each worker
+    starting on the node need not read them from the job store before it can run its job.
+
+    The leader computes a digest of the shared files holding the configuration and the environment
+    once they are written to the job store and passes it to the workers, see
+    :meth:`computeDigest`. The first worker on a node to miss the cache saves what it read from the
+    job store in a file named after the digest. Entries are written atomically and never modified,
+    so concurrent workers need no locking, and an entry can be shared by any worker passed the
+    same digest. As entries are unpickled, the cache is private to the user running the workers.
+    """
+    # The shared files in the job store a worker reads before it can run a job
+    sharedFileNames = ('config.pickle', 'environment.pickle')
+
+    # Entries that have not been written for this many seconds are deleted when an entry is added
+    maxEntryAge = 7 * 24 * 60 * 60
+
+    def __init__(self, digest, dirPath=None):
+        """
+        :param str digest: the digest of the configuration and the environment, as computed by the
+               leader
+
+        :param str dirPath: the directory holding the cache on this node, by default a directory
+               in the directory specified by TOIL_WORKDIR or the system's temporary directory
+        """
+        if dirPath is None:
+            workDir = os.getenv('TOIL_WORKDIR') or tempfile.gettempdir()
+            dirPath = os.path.join(workDir, 'toil-bootstrap-cache-%i' % os.getuid())
+        self.digest = digest
+        self.dirPath = dirPath
+
+    @classmethod
+    def computeDigest(cls, jobStore):
+        """
+        Computes the digest of the configuration and the environment of the workflow. Must be
+        called on the leader after both were written to the given job store.
+
+        :param toil.jobStores.abstractJobStore.AbstractJobStore jobStore:
+        :rtype: str
+        """
+        digest = hashlib.md5()
+        for sharedFileName in cls.sharedFileNames:
+            with jobStore.readSharedFileStream(sharedFileName) as f:
+                digest.update(f.read())
+        return digest.hexdigest()
+
+    @property
+    def entryPath(self):
+        return os.path.join(self.dirPath, self.digest)
+
+    def load(self):
+        """
+        :return: the configuration and the environment cached on this node, or None if they are
+                 not cached
+        :rtype: (toil.common.Config, dict[str,str])|None
+        """
+        try:
+            if not self._isPrivate():
+                return None
+            with open(self.entryPath, 'rb') as f:
+                return cPickle.load(f)
+        except (IOError, OSError) as e:
+            if e.errno != errno.ENOENT:
+                logger.warn('Failed to read the bootstrap cache at %s.', self.entryPath,
+                            exc_info=True)
+            return None
+
+    def save(self, config, environment):
+        """
+        Caches the given configuration and environment on this node. Failing to do so isn't fatal,
+        as workers only miss the cache then.
+
+        :param toil.common.Config config: the configuration of the workflow
+        :param dict[str,str] environment: the environment of the workflow
+        """
+        try:
+            try:
+                os.mkdir(self.dirPath, 0o700)
+            except OSError as e:
+                if e.errno != errno.EEXIST:
+                    raise
+            if not self._isPrivate():
+                return
+            fd, tempPath = tempfile.mkstemp(dir=self.dirPath, prefix='.' + self.digest)
+            try:
+                with os.fdopen(fd, 'wb') as f:
+                    cPickle.dump((config, environment), f, cPickle.HIGHEST_PROTOCOL)
+                os.rename(tempPath, self.entryPath)
+            except:
+                os.unlink(tempPath)
+                raise
+            self._deleteOldEntries()
+        except (IOError, OSError):
+            logger.warn('Failed to write the bootstrap cache at %s.', self.entryPath, exc_info=True)
+
+    def _isPrivate(self):
+        """
+        Returns whether the cache directory is owned by and only writable by the current user.
+        """
+        dirStat = os.stat(self.dirPath)
+        if dirStat.st_uid != os.getuid() or dirStat.st_mode & (stat.S_IWGRP | stat.S_IWOTH):
+            logger.warn('Not using the bootstrap cache at %s as other users can write to it.',
+                        self.dirPath)
+            return False
+        return True
+
+    def _deleteOldEntries(self):
+        now = time.time()
+        for name in os.listdir(self.dirPath):
+            path = os.path.join(self.dirPath, name)
+            try:
+                if now - os.path.getmtime(path) > self.maxEntryAge:
+                    os.unlink(path)
+            except OSError as e:
+                # Another worker beat us to it
+                if e.errno != errno.ENOENT:
+                    raise
@@ -33,6 +33,7 @@ from bd2k.util.exceptions import require
 from bd2k.util.humanize import bytes2human
 
 from toil import logProcessContext
+from toil.bootstrapCache import BootstrapCache
 from toil.lib.bioio import addLoggingOptions, getLogLevelString, setLoggingFromOptions
 from toil.realtimeLogger import RealtimeLogger
 from toil.batchSystems.options import setOptions as setBatchOptions
@@ -72,6 +73,8 @@ class Config(object):
 
         #Restarting the workflow options
         self.restart = False
+        self.stateSnapshotInterval = 600
+        self.disableJournal = False
 
         #Batch system options
         setDefaultBatchOptions(self)
@@ -111,9 +114,16 @@ class Config(object):
         self.retryCount = 0
         self.maxJobDuration = sys.maxsize
         self.rescueJobsFrequency = 3600
+        self.speculativePercentile = None
+        self.speculationInterval = 30
 
         #Misc
         self.disableCaching = False
+        self.cacheEvictionPolicy = 'lru'
+        self.readParallelism = 8
+        self.parallelReadThreshold = 128 * 1024 * 1024
+        self.maxInlinedJobSize = 4 * 1024
+        self.maxLocalSuccessors = 0
         self.maxLogFileSize = 64000
         self.writeLogs = None
         self.writeLogsGzip = None
@@ -187,6 +197,8 @@ class Config(object):
 
         #Restarting the workflow options
         setOption("restart")
+        setOption("stateSnapshotInterval", float, fC(0.0))
+        setOption("disableJournal")
 
         #Batch system options
         setOption("batchSystem")
@@ -196,6 +208,7 @@ class Config(object):
         setOption("parasolCommand")
         setOption("parasolMaxBatches", int, iC(1))
         setOption("linkImports")
+        setOption("persistentWorkers")
 
         setOption("environment", parseSetEnv)
 
@@ -237,9 +250,16 @@ class Config(object):
         setOption("retryCount", int, iC(0))
         setOption("maxJobDuration", int, iC(1))
         setOption("rescueJobsFrequency", int, iC(1))
+        setOption("speculativePercentile", float, fC(0.0, 100.0))
+        setOption("speculationInterval", int, iC(1))
 
         #Misc
         setOption("disableCaching")
+        setOption("cacheEvictionPolicy")
+        setOption("readParallelism", int, iC(1))
+        setOption("parallelReadThreshold", h2b, iC(0))
+        setOption("maxInlinedJobSize", h2b, iC(0))
+        setOption("maxLocalSuccessors", int, iC(0))
         setOption("maxLogFileSize", h2b, iC(1))
         setOption("writeLogs")
         setOption("writeLogsGzip")
@@ -321,6 +341,17 @@ def _addOptions(addGroupFn, config):
                 help="If --restart is specified then will attempt to restart existing workflow "
                      "at the location pointed to by the --jobStore option. Will raise an exception "
                      "if the workflow does not exist")
+    addOptionFn("--stateSnapshotInterval", dest="stateSnapshotInterval", default=None,
+                help="The minimum time in seconds between snapshots of the leader's state, which "
+                     "are saved to the job store along with a journal of the jobs completed since. "
+                     "On restart, the state is restored from the snapshot and the journal, only "
+                     "loading the jobs that were not waiting for their successors when the "
+                     "snapshot was taken, instead of cleaning the entire job store. "
+                     "default=%s" % config.stateSnapshotInterval)
+    addOptionFn("--disableJournal", dest="disableJournal", action="store_true", default=None,
+                help="Neither save snapshots of the leader's state nor restore the state from "
+                     "the snapshot saved by a previous attempt at running the workflow. The "
+                     "entire job store is cleaned on restart instead.")
 
     #
     #Batch system options
@@ -472,6 +503,17 @@ def _addOptions(addGroupFn, config):
                       help=("Period of time to wait (in seconds) between checking for "
                             "missing/overlong jobs, that is jobs which get lost by the batch "
                             "system. Expert parameter. default=%s" % config.rescueJobsFrequency))
+    addOptionFn("--speculativePercentile", dest="speculativePercentile", default=None,
+                      help=("Start a backup attempt of any job that has been running for longer "
+                            "than the given percentile of the run times of the completed jobs of "
+                            "the same name. Whichever attempt finishes first is kept and the other "
+                            "one is killed. Only use this if jobs have no side effects outside of "
+                            "the job store. Only supported by the file job store. By default "
+                            "jobs are never run speculatively."))
+    addOptionFn("--speculationInterval", dest="speculationInterval", default=None,
+                      help=("Period of time to wait (in seconds) between checking for jobs to run "
+                            "speculatively, see --speculativePercentile. Expert parameter. "
+                            "default=%s" % config.speculationInterval))
 
     #
     #Misc options
@@ -481,6 +523,33 @@ def _addOptions(addGroupFn, config):
                 help='Disables caching in the file store. This flag must be set to use '
                      'a batch system that does not support caching such as Grid Engine, Parasol, '
                      'LSF, or Slurm')
+    addOptionFn('--cacheEvictionPolicy', dest='cacheEvictionPolicy', default=None,
+                choices=['lru', 'lfu', 'cost'],
+                help="The policy deciding which files are evicted first from the cache of the "
+                     "file store when a job needs space: 'lru' evicts the least recently used "
+                     "files, 'lfu' the least frequently used ones, and 'cost' those that save "
+                     "the least download time per byte. default=%s" % config.cacheEvictionPolicy)
+    addOptionFn('--readParallelism', dest='readParallelism', default=None,
+                help="The number of concurrent ranged requests used by the file store to "
+                     "download a file from a job store backed by an object store, i.e. AWS, "
+                     "Azure or Google. Only applies to files of at least the size given by "
+                     "--parallelReadThreshold. default=%s" % config.readParallelism)
+    addOptionFn('--parallelReadThreshold', dest='parallelReadThreshold', default=None,
+                help="The minimum size of a file for it to be downloaded with multiple "
+                     "concurrent requests, see --readParallelism. "
+                     "default=%s" % bytes2human(config.parallelReadThreshold))
+    addOptionFn('--maxInlinedJobSize', dest='maxInlinedJobSize', default=None,
+                help="The maximum size of a pickled job for it to be stored inline with the job's "
+                     "record in the job store, such that loading the job takes no extra request "
+                     "to the job store. Larger jobs are stored in a file of their own. Setting "
+                     "this option to zero stores every job in its own file. "
+                     "default=%s" % bytes2human(config.maxInlinedJobSize))
+    addOptionFn('--maxLocalSuccessors', dest='maxLocalSuccessors', default=None,
+                help="The maximum number of successors of a job that its worker runs in parallel "
+                     "instead of returning them to the leader, as long as they fit within the "
+                     "cores, memory and disk of the job. Only successors that have no other "
+                     "predecessor are run this way. Setting this option to zero disables it. "
+                     "default=%s" % config.maxLocalSuccessors)
     addOptionFn("--maxLogFileSize", dest="maxLogFileSize", default=None,
                 help=("The maximum size of a job log file to keep (in bytes), log files "
                       "larger than this will be truncated to the last X bytes. Setting "
@@ -641,6 +710,10 @@ class Toil(object):
         config = Config()
         config.setOptions(self.options)
         jobStore = self.getJobStore(config.jobStore)
+        if config.speculativePercentile is not None and not jobStore.supportsConditionalUpdates():
+            raise RuntimeError("Jobs can't be run speculatively with the %s job store as it can't "
+                               "guarantee that only one attempt at running a job completes it."
+                               % type(jobStore).__name__)
         if not config.restart:
             config.workflowAttemptNumber = 0
             jobStore.initialize(config)
@@ -732,10 +805,22 @@ class Toil(object):
         try:
             self._setBatchSystemEnvVars()
             self._serialiseEnv()
-            self._cacheAllJobs()
             self._setProvisioner()
-            rootJobGraph = self._jobStore.clean(jobCache=self._jobCache)
-            return self._runMainLoop(rootJobGraph)
+            self._jobStore.compact()
+            journal = None
+            if not self.config.disableJournal:
+                from toil.leaderJournal import LeaderJournal
+                journal = LeaderJournal.load(self._jobStore, self.config.stateSnapshotInterval)
+            if journal is None:
+                self._cacheAllJobs()
+                rootJobGraph = self._jobStore.clean(jobCache=self._jobCache)
+            else:
+                # The jobs are loaded and repaired when the state of the leader is restored from
+                # the journal, but the stats and logs of the previous attempt are discarded here
+                # like clean() would
+                self._jobStore.discardStatsAndLogging()
+                rootJobGraph = self._jobStore.loadRootJob()
+            return self._runMainLoop(rootJobGraph, journal=journal)
         finally:
             self._shutdownBatchSystem()
 
@@ -799,9 +884,17 @@ class Toil(object):
         return name + ':' + rest
 
     @classmethod
-    def resumeJobStore(cls, locator):
+    def resumeJobStore(cls, locator, config=None):
+        """
+        Connects to the existing job store at the given location.
+
+        :param str locator: the location of the job store
+        :param toil.common.Config config: the configuration of the workflow, if known already, see
+               :meth:`toil.jobStores.abstractJobStore.AbstractJobStore.resume`
+        :rtype: toil.jobStores.abstractJobStore.AbstractJobStore
+        """
         jobStore = cls.getJobStore(locator)
-        jobStore.resume()
+        jobStore.resume(config)
         return jobStore
 
     @staticmethod
@@ -964,10 +1057,12 @@ class Toil(object):
             logger.info('Created the workflow directory at %s' % workflowDir)
         return workflowDir
 
-    def _runMainLoop(self, rootJob):
+    def _runMainLoop(self, rootJob, journal=None):
         """
         Runs the main loop with the given job.
         :param toil.job.Job rootJob: The root job for the workflow.
+        :param toil.leaderJournal.LeaderJournal journal: The journal saved by the leader of a
+               previous attempt at running the workflow, if its state is to be restored from it.
         :rtype: Any
         """
         logProcessContext(self.config)
@@ -981,7 +1076,9 @@ class Toil(object):
                           provisioner=self._provisioner,
                           jobStore=self._jobStore,
                           rootJob=rootJob,
-                          jobCache=self._jobCache).run()
+                          jobCache=self._jobCache,
+                          journal=journal,
+                          bootstrapDigest=BootstrapCache.computeDigest(self._jobStore)).run()
 
     def _shutdownBatchSystem(self):
         """
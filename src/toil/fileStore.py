@@ -18,7 +18,7 @@ from abc import abstractmethod, ABCMeta
 from bd2k.util.objects import abstractclassmethod
 
 import base64
-from collections import namedtuple, defaultdict
+from collections import namedtuple, defaultdict, OrderedDict
 
 import dill
 import errno
@@ -26,19 +26,22 @@ import logging
 import os
 import shutil
 import stat
+import sys
 import tempfile
 import time
 import uuid
 
 from contextlib import contextmanager
-from fcntl import flock, LOCK_EX, LOCK_UN
+from fcntl import flock, LOCK_EX, LOCK_NB, LOCK_UN
 from functools import partial
 from hashlib import sha1
+from multiprocessing.pool import ThreadPool
 from threading import Thread, Semaphore, Event
 
 # Python 3 compatibility imports
 from six.moves.queue import Empty, Queue
 from six.moves import xrange
+from six import reraise
 
 from bd2k.util.humanize import bytes2human
 from toil.common import cacheDirName, getDirSizeRecursively, getFileSystemSize
@@ -89,6 +92,82 @@ class DeferredFunction(namedtuple('DeferredFunction', 'function args kwargs name
     __repr__ = __str__
 
 
+class CachedFile(namedtuple('CachedFile', 'size cost hits')):
+    """
+    The record of a file in the cache index of a CachingFileStore: its size in bytes, the time in
+    seconds it took to download it from the job store (None if it was written by a job on the
+    node), and the number of times it was read from the cache since it was cached.
+    """
+
+
+class CacheEvictionPolicy(object):
+    """
+    An abstract base class for the policies that decide which files a CachingFileStore evicts
+    from the cache first when it needs to make room for a job.
+    """
+    __metaclass__ = ABCMeta
+
+    @abstractmethod
+    def evictionOrder(self, cacheIndex):
+        """
+        Order the files in the cache for eviction. Only files that are not in use by any job will
+        actually be evicted.
+
+        :param OrderedDict cacheIndex: The CachedFile record of each file in the cache, keyed by
+               the file's name and ordered from the least to the most recently used.
+        :return: The names of the cached files, in the order in which they should be evicted.
+        :rtype: list
+        """
+        raise NotImplementedError()
+
+
+class LRUCacheEvictionPolicy(CacheEvictionPolicy):
+    """
+    Evicts the least recently used files first.
+    """
+    def evictionOrder(self, cacheIndex):
+        return list(cacheIndex.keys())
+
+
+class LFUCacheEvictionPolicy(CacheEvictionPolicy):
+    """
+    Evicts the least frequently used files first, and the least recently used of those files
+    that were used equally often.
+    """
+    def evictionOrder(self, cacheIndex):
+        # The sort is stable so ties stay in the order of least recent use
+        return sorted(cacheIndex.keys(), key=lambda name: cacheIndex[name].hits)
+
+
+class CostAwareCacheEvictionPolicy(CacheEvictionPolicy):
+    """
+    Evicts the files that would save the least download time per byte of cache first, assuming
+    that a file that was read often from the cache will be read as often again. The download time
+    of files that were written by jobs on the node is estimated from the average download rate of
+    the other cached files.
+    """
+    def evictionOrder(self, cacheIndex):
+        downloaded = [cachedFile for cachedFile in cacheIndex.values()
+                      if cachedFile.cost is not None]
+        downloadTime = sum(cachedFile.cost for cachedFile in downloaded)
+        # Bytes per second, or an arbitrary rate if nothing was downloaded so far
+        downloadRate = (float(sum(cachedFile.size for cachedFile in downloaded)) / downloadTime
+                        if downloadTime > 0 else 1.0)
+
+        def savedTimePerByte(name):
+            cachedFile = cacheIndex[name]
+            size = max(cachedFile.size, 1)
+            cost = cachedFile.cost if cachedFile.cost is not None else size / downloadRate
+            return (cachedFile.hits + 1) * cost / size
+
+        return sorted(cacheIndex.keys(), key=savedTimePerByte)
+
+
+cacheEvictionPolicies = {'lru': LRUCacheEvictionPolicy,
+                         'lfu': LFUCacheEvictionPolicy,
+                         'cost': CostAwareCacheEvictionPolicy}
+
+
 class FileStore(object):
     """
     An abstract base class to represent the interface between a worker and the job store.  Concrete
@@ -99,6 +178,9 @@ class FileStore(object):
     _pendingFileWritesLock = Semaphore()
     _pendingFileWrites = set()
     _terminateEvent = Event()  # Used to signify crashes in threads
+    _supersededEvent = Event()  # Used to signify that another attempt completed the job first
+    # The maximum number of files transferred concurrently by readGlobalFiles and writeGlobalFiles
+    _maxConcurrentTransfers = 16
 
     __metaclass__ = ABCMeta
 
@@ -112,6 +194,15 @@ class FileStore(object):
         self.loggingMessages = []
         self.filesToDelete = set()
         self.jobsToDelete = set()
+        # If the leader may run a backup attempt of the job, the command, inlined pickled job and
+        # successors of the job as loaded by this attempt, see _completeJob()
+        if (jobStore.config.speculativePercentile is None
+                or not jobStore.supportsConditionalUpdates()):
+            self.jobCommand = None
+        else:
+            self.jobCommand = jobGraph.command
+            self.pickledJob = jobGraph.pickledJob
+            self.jobSuccessorIDs = self._getSuccessorIDs(jobGraph)
 
     @staticmethod
     def createFileStore(jobStore, jobGraph, localTempDir, inputBlockFn, caching):
@@ -182,6 +273,36 @@ class FileStore(object):
         """
         raise NotImplementedError()
 
+    def writeGlobalFiles(self, localFileNames, cleanup=False):
+        """
+        Takes a list of files (as paths) and uploads them to the job store. This is equivalent
+        to calling writeGlobalFile on each of them but much cheaper for many small files since
+        the files are uploaded concurrently and the bookkeeping is done in bulk. A path that
+        occurs more than once is only uploaded once.
+
+        :param list[str] localFileNames: The paths to the local files to upload.
+        :param bool cleanup: is as in :func:`toil.fileStore.FileStore.writeGlobalFile`.
+        :return: a list of IDs that can be used to retrieve the files, one for each given path
+        :rtype: list[toil.fileStore.FileID]
+        """
+        absLocalFileNames = [self._resolveAbsoluteLocalPath(localFileName)
+                             for localFileName in localFileNames]
+        uniqueFileNames = list(OrderedDict.fromkeys(absLocalFileNames))
+        fileStoreIDs = dict(zip(uniqueFileNames, self._writeGlobalFiles(uniqueFileNames, cleanup)))
+        return [fileStoreIDs[absLocalFileName] for absLocalFileName in absLocalFileNames]
+
+    @abstractmethod
+    def _writeGlobalFiles(self, absLocalFileNames, cleanup):
+        """
+        Uploads the given distinct files to the job store, backing both writeGlobalFile and
+        writeGlobalFiles.
+
+        :param list[str] absLocalFileNames: The absolute paths to the local files to upload.
+        :param bool cleanup: is as in :func:`toil.fileStore.FileStore.writeGlobalFile`.
+        :rtype: list[toil.fileStore.FileID]
+        """
+        raise NotImplementedError()
+
     def writeGlobalFileStream(self, cleanup=False):
         """
         Similar to writeGlobalFile, but allows the writing of a stream to the job store.
@@ -213,6 +334,43 @@ class FileStore(object):
         """
         raise NotImplementedError()
 
+    def readGlobalFiles(self, fileStoreIDs, cache=True, mutable=None):
+        """
+        Downloads the files described by the given list of IDs to the local temp directory.
+        This is equivalent to calling readGlobalFile on each of them but much cheaper for many
+        small files since the files missing from the cache are downloaded concurrently and the
+        cache is consulted in bulk. An ID that occurs more than once is only downloaded once and
+        all its occurrences map to the same local file.
+
+        :param list[toil.fileStore.FileID] fileStoreIDs: job store ids for the files
+        :param bool cache: Described in :func:`toil.fileStore.CachingFileStore.readGlobalFile`
+        :param bool mutable: Described in :func:`toil.fileStore.CachingFileStore.readGlobalFile`
+        :return: a list of absolute paths to local, temporary copies of the files, one for each
+                 given ID
+        :rtype: list[str]
+        """
+        uniqueIDs = list(OrderedDict.fromkeys(fileStoreIDs))
+        localFilePaths = dict(zip(uniqueIDs,
+                                  self._readGlobalFiles([(fileStoreID, None)
+                                                         for fileStoreID in uniqueIDs],
+                                                        cache=cache, mutable=mutable)))
+        return [localFilePaths[fileStoreID] for fileStoreID in fileStoreIDs]
+
+    @abstractmethod
+    def _readGlobalFiles(self, reads, cache, mutable):
+        """
+        Downloads the given distinct files from the job store, backing both readGlobalFile and
+        readGlobalFiles.
+
+        :param list[tuple] reads: a (fileStoreID, userPath) pair for each file to download, as
+               in :func:`toil.fileStore.FileStore.readGlobalFile`
+        :param bool cache: Described in :func:`toil.fileStore.CachingFileStore.readGlobalFile`
+        :param bool mutable: Described in :func:`toil.fileStore.CachingFileStore.readGlobalFile`
+        :return: the absolute path to the local copy of each file, in order
+        :rtype: list[str]
+        """
+        raise NotImplementedError()
+
     @abstractmethod
     def readGlobalFileStream(self, fileStoreID):
         """
@@ -250,6 +408,22 @@ class FileStore(object):
     def exportFile(self, jobStoreFileID, dstUrl):
         raise NotImplementedError()
 
+    def _getReadParallelism(self, fileStoreID):
+        """
+        Returns the number of concurrent requests to download the given file with. Files are
+        only downloaded in parallel if their size is known, i.e. if the ID is a FileID, and is
+        at least the configured threshold.
+
+        :param toil.fileStore.FileID fileStoreID: job store id for the file
+        :rtype: int
+        """
+        config = self.jobStore.config
+        fileSize = getattr(fileStoreID, 'size', None)
+        if fileSize is not None and fileSize >= config.parallelReadThreshold:
+            return config.readParallelism
+        else:
+            return 1
+
     # A utility method for accessing filenames
     def _resolveAbsoluteLocalPath(self, filePath):
         """
@@ -337,6 +511,36 @@ class FileStore(object):
         """
         raise NotImplementedError()
 
+    @classmethod
+    def _mapConcurrently(cls, function, args):
+        """
+        Calls the given function on each of the given arguments in a bounded pool of threads.
+        All calls run to completion, even if some of them fail, so the caller can finish its
+        bookkeeping for the successful ones before reraising the first failure.
+
+        :param function: a callable taking a single argument
+        :param list args: the arguments to call the function on
+        :return: a (result, excInfo) pair for each argument, in order. excInfo is None if the
+                 call succeeded, and the value of sys.exc_info() if it failed, in which case the
+                 result is None.
+        :rtype: list[tuple]
+        """
+        def call(arg):
+            try:
+                return function(arg), None
+            except Exception:
+                return None, sys.exc_info()
+
+        if len(args) <= 1:
+            # Don't bother with threads when there is nothing to run concurrently
+            return [call(arg) for arg in args]
+        pool = ThreadPool(min(len(args), cls._maxConcurrentTransfers))
+        try:
+            return pool.map(call, args)
+        finally:
+            pool.close()
+            pool.join()
+
     @staticmethod
     def _runDeferredFunctions(deferredFunctions):
         """
@@ -375,6 +579,34 @@ class FileStore(object):
         """
         raise NotImplementedError()
 
+    def _completeJob(self):
+        """
+        Persists the job graph updated by this attempt at running the job. The leader may start
+        a backup attempt of a job that is taking much longer than its peers and only the first
+        attempt to complete may update the job graph. The job store therefore only persists the
+        job graph if its command and inlined pickled job are still the ones this attempt loaded,
+        checking and updating it atomically. If another attempt has completed the job first, the
+        successor jobs created by this attempt are deleted and JobSupersededException is raised.
+        """
+        if self.jobCommand is None:
+            self.jobStore.update(self.jobGraph)
+        elif not self.jobStore.updateIfUnchanged(self.jobGraph, self.jobCommand,
+                                                   self.pickledJob):
+            self._supersededEvent.set()
+            createdJobStoreIDs = self._getSuccessorIDs(self.jobGraph) - self.jobSuccessorIDs
+            map(self.jobStore.delete, createdJobStoreIDs)
+            raise JobSupersededException(self.jobGraph)
+
+    @staticmethod
+    def _getSuccessorIDs(jobGraph):
+        """
+        :return: the job store IDs of the successors and services of the given job graph
+        :rtype: set[str]
+        """
+        return {jobNode.jobStoreID
+                for jobNodes in jobGraph.stack + jobGraph.services
+                for jobNode in jobNodes}
+
     @abstractmethod
     def _blockFn(self):
         """
@@ -445,18 +677,28 @@ class CachingFileStore(FileStore):
                                           cacheDirName(self.jobStore.config.workflowID))
         self.cacheLockFile = os.path.join(self.localCacheDir, '.cacheLock')
         self.cacheStateFile = os.path.join(self.localCacheDir, '_cacheState')
+        self.cacheIndexFile = os.path.join(self.localCacheDir, '_cacheIndex')
         # Since each worker has it's own unique CachingFileStore instance, and only one Job can run
         # at a time on a worker, we can bookkeep the job's file store operated files in a
         # dictionary.
         self.jobSpecificFiles = {}
         self.jobName = str(self.jobGraph)
-        self.jobID = sha1(self.jobName).hexdigest()
+        # The worker's temporary directory tells apart concurrent attempts at running the job
+        self.jobID = sha1(self.jobName + self.localTempDir).hexdigest()
+        # The state of each job is kept in a separate file that only the job itself writes to,
+        # such that the node-wide cache state file stays small and job specific updates don't
+        # need the cache lock.
+        self.jobStateFile = os.path.join(self._jobStatesDir(self.localCacheDir), self.jobID)
         logger.info('Starting job (%s) with ID (%s).', self.jobName, self.jobID)
         # A variable to describe how many hard links an unused file in the cache will have.
         self.nlinkThreshold = None
         self.workflowAttemptNumber = self.jobStore.config.workflowAttemptNumber
         # This is a flag to better resolve cache equation imbalances at cleanup time.
         self.cleanupInProgress = False
+        # The policy deciding which files are evicted from the cache first
+        self.evictionPolicy = cacheEvictionPolicies[self.jobStore.config.cacheEvictionPolicy]()
+        # The number of cache hits, misses and evictions during the job, reported in the stats
+        self.cacheStats = dict(hits=0, misses=0, evictions=0)
         # Now that we've setup all the required variables, setup the cache directory for the
         # job if required.
         self._setupCache()
@@ -510,14 +752,13 @@ class CachingFileStore(FileStore):
             self.cleanupInProgress = True
             # Delete all the job specific files and return sizes to jobReqs
             self.returnJobReqs(jobReqs)
-            with self._CacheState.open(self) as cacheInfo:
-                # Carry out any user-defined cleanup actions
-                deferredFunctions = cacheInfo.jobState[self.jobID]['deferredFunctions']
-                failures = self._runDeferredFunctions(deferredFunctions)
-                for failure in failures:
-                    self.logToMaster('Deferred function "%s" failed.' % failure, logging.WARN)
-                # Finally delete the job from the cache state file
-                cacheInfo.jobState.pop(self.jobID)
+            # Carry out any user-defined cleanup actions
+            jobState = self._JobState._load(self.jobStateFile)
+            failures = self._runDeferredFunctions(jobState.deferredFunctions)
+            for failure in failures:
+                self.logToMaster('Deferred function "%s" failed.' % failure, logging.WARN)
+            # Finally delete the job's state file
+            os.remove(self.jobStateFile)
 
     # Functions related to reading, writing and removing files to/from the job store
     def writeGlobalFile(self, localFileName, cleanup=False):
@@ -526,64 +767,94 @@ class CachingFileStore(FileStore):
         used, carry out the appropriate cache functions.
         """
         absLocalFileName = self._resolveAbsoluteLocalPath(localFileName)
+        return self._writeGlobalFiles([absLocalFileName], cleanup)[0]
+
+    def _writeGlobalFiles(self, absLocalFileNames, cleanup):
+        """
+        Uploads the given files to the job store. Files that need to be uploaded are uploaded
+        concurrently, after which all files from the scope of the local temp dir are added to the
+        cache, each while holding only the lock of that file.
+        """
         # What does this do?
         cleanupID = None if not cleanup else self.jobGraph.jobStoreID
-        # If the file is from the scope of local temp dir
-        if absLocalFileName.startswith(self.localTempDir):
-            # If the job store is of type FileJobStore and the job store and the local temp dir
-            # are on the same file system, then we want to hard link the files istead of copying
-            # barring the case where the file being written was one that was previously read
-            # from the file store. In that case, you want to copy to the file store so that
-            # the two have distinct nlink counts.
-            # Can read without a lock because we're only reading job-specific info.
-            jobSpecificFiles = self._CacheState._load(self.cacheStateFile).jobState[
-                self.jobID]['filesToFSIDs'].keys()
-            # Saying nlink is 2 implicitly means we are using the job file store, and it is on
-            # the same device as the work dir.
-            if self.nlinkThreshold == 2 and absLocalFileName not in jobSpecificFiles:
-                jobStoreFileID = self.jobStore.getEmptyFileStoreID(cleanupID)
-                # getEmptyFileStoreID creates the file in the scope of the job store hence we
-                # need to delete it before linking.
-                os.remove(self.jobStore._getAbsPath(jobStoreFileID))
-                os.link(absLocalFileName, self.jobStore._getAbsPath(jobStoreFileID))
-            # If they're not on the file system, or if the file is already linked with an
-            # existing file, we need to copy to the job store.
-            # Check if the user allows asynchronous file writes
-            elif self.jobStore.config.useAsync:
-                jobStoreFileID = self.jobStore.getEmptyFileStoreID(cleanupID)
-                # Before we can start the async process, we should also create a dummy harbinger
-                # file in the cache such that any subsequent jobs asking for this file will not
-                # attempt to download it from the job store till the write is complete.  We do
-                # this now instead of in the writing thread because there is an edge case where
-                # readGlobalFile in a subsequent job is called before the writing thread has
-                # received the message to write the file and has created the dummy harbinger
-                # (and the file was unable to be cached/was evicted from the cache).
-                harbingerFile = self.HarbingerFile(self, fileStoreID=jobStoreFileID)
-                harbingerFile.write()
-                fileHandle = open(absLocalFileName, 'r')
-                with self._pendingFileWritesLock:
-                    self._pendingFileWrites.add(jobStoreFileID)
-                # A file handle added to the queue allows the asyncWrite threads to remove their
-                # jobID from _pendingFileWrites. Therefore, a file should only be added after
-                # its fileID is added to _pendingFileWrites
-                self.queue.put((fileHandle, jobStoreFileID))
+        # Can read without a lock because we're only reading job-specific info.
+        jobSpecificFiles = self._JobState._load(self.jobStateFile).filesToFSIDs.keys()
+        jobStoreFileIDs = [None] * len(absLocalFileNames)
+        uploads = []
+        for index, absLocalFileName in enumerate(absLocalFileNames):
+            # If the file is from the scope of local temp dir
+            if absLocalFileName.startswith(self.localTempDir):
+                # If the job store is of type FileJobStore and the job store and the local temp
+                # dir are on the same file system, then we want to hard link the files istead of
+                # copying barring the case where the file being written was one that was
+                # previously read from the file store. In that case, you want to copy to the
+                # file store so that the two have distinct nlink counts.
+                # Saying nlink is 2 implicitly means we are using the job file store, and it is
+                # on the same device as the work dir.
+                if self.nlinkThreshold == 2 and absLocalFileName not in jobSpecificFiles:
+                    jobStoreFileID = self.jobStore.getEmptyFileStoreID(cleanupID)
+                    # getEmptyFileStoreID creates the file in the scope of the job store hence
+                    # we need to delete it before linking.
+                    os.remove(self.jobStore._getAbsPath(jobStoreFileID))
+                    os.link(absLocalFileName, self.jobStore._getAbsPath(jobStoreFileID))
+                    jobStoreFileIDs[index] = jobStoreFileID
+                # If they're not on the file system, or if the file is already linked with an
+                # existing file, we need to copy to the job store.
+                # Check if the user allows asynchronous file writes
+                elif self.jobStore.config.useAsync:
+                    jobStoreFileID = self.jobStore.getEmptyFileStoreID(cleanupID)
+                    # Before we can start the async process, we should also create a dummy
+                    # harbinger file in the cache such that any subsequent jobs asking for this
+                    # file will not attempt to download it from the job store till the write is
+                    # complete.  We do this now instead of in the writing thread because there is
+                    # an edge case where readGlobalFile in a subsequent job is called before the
+                    # writing thread has received the message to write the file and has created
+                    # the dummy harbinger (and the file was unable to be cached/was evicted from
+                    # the cache).
+                    harbingerFile = self.HarbingerFile(self, fileStoreID=jobStoreFileID)
+                    harbingerFile.write()
+                    fileHandle = open(absLocalFileName, 'r')
+                    with self._pendingFileWritesLock:
+                        self._pendingFileWrites.add(jobStoreFileID)
+                    # A file handle added to the queue allows the asyncWrite threads to remove
+                    # their jobID from _pendingFileWrites. Therefore, a file should only be added
+                    # after its fileID is added to _pendingFileWrites
+                    self.queue.put((fileHandle, jobStoreFileID))
+                    jobStoreFileIDs[index] = jobStoreFileID
+                # Else write directly to the job store.
+                else:
+                    uploads.append(index)
             # Else write directly to the job store.
             else:
-                jobStoreFileID = self.jobStore.writeFile(absLocalFileName, cleanupID)
-            # Local files are cached by default, unless they were written from previously read
-            # files.
-            if absLocalFileName not in jobSpecificFiles:
-                self.addToCache(absLocalFileName, jobStoreFileID, 'write')
+                uploads.append(index)
+        outcomes = self._mapConcurrently(
+            lambda index: self.jobStore.writeFile(absLocalFileNames[index], cleanupID), uploads)
+        excInfo = None
+        for index, (jobStoreFileID, failure) in zip(uploads, outcomes):
+            jobStoreFileIDs[index] = jobStoreFileID
+            if failure is not None and excInfo is None:
+                excInfo = failure
+        written = [(absLocalFileName, jobStoreFileID)
+                   for absLocalFileName, jobStoreFileID in zip(absLocalFileNames, jobStoreFileIDs)
+                   if jobStoreFileID is not None]
+        for absLocalFileName, jobStoreFileID in written:
+            if absLocalFileName.startswith(self.localTempDir):
+                # Local files are cached by default, unless they were written from previously
+                # read files.
+                if absLocalFileName not in jobSpecificFiles:
+                    with self.fileLock(jobStoreFileID):
+                        self._addToCache(absLocalFileName, jobStoreFileID, 'write')
+                else:
+                    self._JobState.updateJobSpecificFiles(self, jobStoreFileID,
+                                                          absLocalFileName, 0.0, False)
             else:
-                self._JobState.updateJobSpecificFiles(self, jobStoreFileID, absLocalFileName,
-                                                      0.0, False)
-        # Else write directly to the job store.
-        else:
-            jobStoreFileID = self.jobStore.writeFile(absLocalFileName, cleanupID)
-            # Non local files are NOT cached by default, but they are tracked as local files.
-            self._JobState.updateJobSpecificFiles(self, jobStoreFileID, None,
-                                                  0.0, False)
-        return FileID.forPath(jobStoreFileID, absLocalFileName)
+                # Non local files are NOT cached by default, but they are tracked as local
+                # files.
+                self._JobState.updateJobSpecificFiles(self, jobStoreFileID, None, 0.0, False)
+        if excInfo is not None:
+            reraise(*excInfo)
+        return [FileID.forPath(jobStoreFileID, absLocalFileName)
+                for absLocalFileName, jobStoreFileID in written]
 
     def writeGlobalFileStream(self, cleanup=False):
         # TODO: Make this work with caching
@@ -607,119 +878,178 @@ class CachingFileStore(FileStore):
                multiple workers share a file via hard links. The default is False unless backwards
                compatibility was requested.
         """
-        # Check that the file hasn't been deleted by the user
-        if fileStoreID in self.filesToDelete:
-            raise RuntimeError('Trying to access a file in the jobStore you\'ve deleted: ' + \
-                               '%s' % fileStoreID)
+        return self._readGlobalFiles([(fileStoreID, userPath)], cache=cache, mutable=mutable)[0]
+
+    def _readGlobalFiles(self, reads, cache, mutable):
+        """
+        Looks up each of the given files in the cache while holding the lock of that file. The
+        files that are missing from the cache are then downloaded concurrently, and those that are
+        to be cached are added to the cache. The cache lock is only held to account for the sizes
+        of the files.
+        """
         # Set up the modifiable variable if it wasn't provided by the user in the function call.
         if mutable is None:
             mutable = self.mutable
-        # Get the name of the file as it would be in the cache
-        cachedFileName = self.encodedFileID(fileStoreID)
-        # setup the harbinger variable for the file.  This is an identifier that the file is
-        # currently being downloaded by another job and will be in the cache shortly. It is used
-        # to prevent multiple jobs from simultaneously downloading the same file from the file
-        # store.
-        harbingerFile = self.HarbingerFile(self, cachedFileName=cachedFileName)
-        # setup the output filename.  If a name is provided, use it - This makes it a Named
-        # Local File. If a name isn't provided, use the base64 encoded name such that we can
-        # easily identify the files later on.
-        if userPath is not None:
-            localFilePath = self._resolveAbsoluteLocalPath(userPath)
-            if os.path.exists(localFilePath):
-                # yes, this is illegal now.
-                raise RuntimeError(' File %s ' % localFilePath + ' exists. Cannot Overwrite.')
-            fileIsLocal = True if localFilePath.startswith(self.localTempDir) else False
-        else:
-            localFilePath = self.getLocalTempFileName()
-            fileIsLocal = True
-        # First check whether the file is in cache.  If it is, then hardlink the file to
-        # userPath. Cache operations can only occur on local files.
-        with self.cacheLock() as lockFileHandle:
-            if fileIsLocal and self._fileIsCached(fileStoreID):
-                logger.debug('CACHE: Cache hit on file with ID \'%s\'.' % fileStoreID)
-                assert not os.path.exists(localFilePath)
-                if mutable:
-                    shutil.copyfile(cachedFileName, localFilePath)
-                    cacheInfo = self._CacheState._load(self.cacheStateFile)
-                    jobState = self._JobState(cacheInfo.jobState[self.jobID])
-                    jobState.addToJobSpecFiles(fileStoreID, localFilePath, -1, None)
-                    cacheInfo.jobState[self.jobID] = jobState.__dict__
-                    cacheInfo.write(self.cacheStateFile)
-                else:
-                    os.link(cachedFileName, localFilePath)
-                    self.returnFileSize(fileStoreID, localFilePath, lockFileHandle,
-                                        fileAlreadyCached=True)
-            # If the file is not in cache, check whether the .harbinger file for the given
-            # FileStoreID exists.  If it does, the wait and periodically check for the removal
-            # of the file and the addition of the completed download into cache of the file by
-            # the other job. Then we link to it.
-            elif fileIsLocal and harbingerFile.exists():
-                harbingerFile.waitOnDownload(lockFileHandle)
-                # If the code reaches here, the harbinger file has been removed. This means
-                # either the file was successfully downloaded and added to cache, or something
-                # failed. To prevent code duplication, we recursively call readGlobalFile.
-                flock(lockFileHandle, LOCK_UN)
-                return self.readGlobalFile(fileStoreID, userPath=userPath, cache=cache,
-                                           mutable=mutable)
-            # If the file is not in cache, then download it to the userPath and then add to
-            # cache if specified.
+        localFiles = []
+        for fileStoreID, userPath in reads:
+            # Check that the file hasn't been deleted by the user
+            if fileStoreID in self.filesToDelete:
+                raise RuntimeError('Trying to access a file in the jobStore you\'ve deleted: ' + \
+                                   '%s' % fileStoreID)
+            # setup the output filename.  If a name is provided, use it - This makes it a Named
+            # Local File. If a name isn't provided, use the base64 encoded name such that we can
+            # easily identify the files later on.
+            if userPath is not None:
+                localFilePath = self._resolveAbsoluteLocalPath(userPath)
+                if os.path.exists(localFilePath):
+                    # yes, this is illegal now.
+                    raise RuntimeError(' File %s ' % localFilePath + ' exists. Cannot Overwrite.')
+                fileIsLocal = True if localFilePath.startswith(self.localTempDir) else False
             else:
-                logger.debug('CACHE: Cache miss on file with ID \'%s\'.' % fileStoreID)
-                if fileIsLocal and cache:
-                    # If caching of the downloaded file is desired, First create the harbinger
-                    # file so other jobs know not to redundantly download the same file.  Write
-                    # the PID of this process into the file so other jobs know who is carrying
-                    # out the download.
-                    harbingerFile.write()
-                    # Now release the file lock while the file is downloaded as download could
-                    # take a while.
-                    flock(lockFileHandle, LOCK_UN)
-                    # Use try:finally: so that the .harbinger file is removed whether the
-                    # download succeeds or not.
-                    try:
-                        self.jobStore.readFile(fileStoreID,
-                                               '/.'.join(os.path.split(cachedFileName)))
-                    except:
-                        if os.path.exists('/.'.join(os.path.split(cachedFileName))):
-                            os.remove('/.'.join(os.path.split(cachedFileName)))
-                        raise
-                    else:
-                        # If the download succeded, officially add the file to cache (by
-                        # recording it in the cache lock file) if possible.
-                        if os.path.exists('/.'.join(os.path.split(cachedFileName))):
-                            os.rename('/.'.join(os.path.split(cachedFileName)), cachedFileName)
-                            self.addToCache(localFilePath, fileStoreID, 'read', mutable)
-                            # We don't need to return the file size here because addToCache
-                            # already does it for us
-                    finally:
-                        # In any case, delete the harbinger file.
-                        harbingerFile.delete()
-                else:
-                    # Release the cache lock since the remaining stuff is not cache related.
-                    flock(lockFileHandle, LOCK_UN)
-                    self.jobStore.readFile(fileStoreID, localFilePath)
-                    os.chmod(localFilePath, stat.S_IRUSR | stat.S_IRGRP | stat.S_IROTH)
-                    # Now that we have the file, we have 2 options. It's modifiable or not.
-                    # Either way, we need to account for FileJobStore making links instead of
-                    # copies.
-                    if mutable:
-                        if self.nlinkThreshold == 2:
-                            # nlinkThreshold can only be 1 or 2 and it can only be 2 iff the
-                            # job store is FilejobStore, and the job store and local temp dir
-                            # are on the same device. An atomic rename removes the nlink on the
-                            # file handle linked from the job store.
-                            shutil.copyfile(localFilePath, localFilePath + '.tmp')
-                            os.rename(localFilePath + '.tmp', localFilePath)
-                        self._JobState.updateJobSpecificFiles(self, fileStoreID, localFilePath,
-                                                              -1, False)
-                    # If it was immutable
+                localFilePath = self.getLocalTempFileName()
+                fileIsLocal = True
+            localFiles.append((fileStoreID, localFilePath, fileIsLocal))
+        pending = localFiles
+        while pending:
+            # Files that are currently being downloaded to the cache by another job
+            waiting = []
+            # A (fileStoreID, localFilePath, harbingerFile) triple for each file we need to
+            # download ourselves. The harbinger file is None if the file is not to be cached.
+            downloads = []
+            # First check whether each file is in cache.  If it is, then hardlink the file to
+            # userPath. Cache operations can only occur on local files.
+            for fileStoreID, localFilePath, fileIsLocal in pending:
+                with self.fileLock(fileStoreID):
+                    # Get the name of the file as it would be in the cache
+                    cachedFileName = self.encodedFileID(fileStoreID)
+                    # setup the harbinger variable for the file.  This is an identifier that the
+                    # file is currently being downloaded by another job and will be in the cache
+                    # shortly. It is used to prevent multiple jobs from simultaneously
+                    # downloading the same file from the file store.
+                    harbingerFile = self.HarbingerFile(self, cachedFileName=cachedFileName)
+                    if fileIsLocal and self._fileIsCached(fileStoreID):
+                        logger.debug('CACHE: Cache hit on file with ID \'%s\'.' % fileStoreID)
+                        assert not os.path.exists(localFilePath)
+                        self.cacheStats['hits'] += 1
+                        self._accessCacheIndex(cachedFileName)
+                        if mutable:
+                            shutil.copyfile(cachedFileName, localFilePath)
+                            self._JobState.updateJobSpecificFiles(self, fileStoreID,
+                                                                  localFilePath, -1, None)
+                        else:
+                            os.link(cachedFileName, localFilePath)
+                            self.returnFileSize(fileStoreID, localFilePath,
+                                                fileAlreadyCached=True)
+                    # If the file is not in cache, check whether the .harbinger file for the
+                    # given FileStoreID exists.  If it does, wait for the removal of the file
+                    # and the addition of the completed download into cache of the file by the
+                    # other job once we are done with the other files. Then we link to it.
+                    elif fileIsLocal and harbingerFile.exists():
+                        waiting.append((fileStoreID, localFilePath, fileIsLocal))
+                    # If the file is not in cache, then download it to the userPath and then add
+                    # to cache if specified.
                     else:
-                        if self.nlinkThreshold == 2:
-                            self._accountForNlinkEquals2(localFilePath)
-                        self._JobState.updateJobSpecificFiles(self, fileStoreID, localFilePath,
-                                                              0.0, False)
-        return localFilePath
+                        logger.debug('CACHE: Cache miss on file with ID \'%s\'.' % fileStoreID)
+                        self.cacheStats['misses'] += 1
+                        if fileIsLocal and cache:
+                            # If caching of the downloaded file is desired, First create the
+                            # harbinger file so other jobs know not to redundantly download the
+                            # same file.  Write the PID of this process into the file so other
+                            # jobs know who is carrying out the download.
+                            harbingerFile.write()
+                            downloads.append((fileStoreID, localFilePath, harbingerFile))
+                        else:
+                            downloads.append((fileStoreID, localFilePath, None))
+            # No lock is held while the files are downloaded as download could take a while.
+            excInfo = self._downloadFiles(downloads, mutable)
+            if excInfo is not None:
+                reraise(*excInfo)
+            for fileStoreID, _, _ in waiting:
+                with self.fileLock(fileStoreID) as lockFileHandle:
+                    self.HarbingerFile(self, fileStoreID=fileStoreID).waitOnDownload(
+                        lockFileHandle)
+            # If the code reaches here, the harbinger files we waited on have been removed. This
+            # means either the files were successfully downloaded and added to cache, or
+            # something failed. To prevent code duplication, we try again.
+            pending = waiting
+        return [localFilePath for _, localFilePath, _ in localFiles]
+
+    def _downloadFiles(self, downloads, mutable):
+        """
+        Concurrently downloads the files that were missing from the cache in readGlobalFile.
+        Files to be cached are downloaded into the cache and then added to the cache while
+        holding the lock of each file. Their harbinger files are removed whether the download
+        succeeds or not.
+
+        :param list[tuple] downloads: a (fileStoreID, localFilePath, harbingerFile) triple for
+               each file to download. The harbinger file is None if the file is not to be cached.
+        :param bool mutable: See modifiable in readGlobalFile
+        :return: the value of sys.exc_info() for the first failed download, or None if all
+                 downloads succeeded
+        """
+        def download(args):
+            fileStoreID, localFilePath, harbingerFile = args
+            if harbingerFile is None:
+                self.jobStore.readFile(fileStoreID, localFilePath,
+                                       parallelism=self._getReadParallelism(fileStoreID))
+                return None
+            downloadPath = '/.'.join(os.path.split(self.encodedFileID(fileStoreID)))
+            try:
+                startTime = time.time()
+                self.jobStore.readFile(fileStoreID, downloadPath,
+                                       parallelism=self._getReadParallelism(fileStoreID))
+                return time.time() - startTime
+            except:
+                if os.path.exists(downloadPath):
+                    os.remove(downloadPath)
+                raise
+
+        outcomes = self._mapConcurrently(download, downloads)
+        failures = [failure for _, failure in outcomes if failure is not None]
+        for (fileStoreID, localFilePath, harbingerFile), (downloadTime, failure) in \
+                zip(downloads, outcomes):
+            if harbingerFile is None:
+                continue
+            with self.fileLock(fileStoreID):
+                try:
+                    # If the download succeded, officially add the file to cache (by recording
+                    # it in the cache index) if possible.
+                    cachedFileName = self.encodedFileID(fileStoreID)
+                    downloadPath = '/.'.join(os.path.split(cachedFileName))
+                    if failure is None and os.path.exists(downloadPath):
+                        os.rename(downloadPath, cachedFileName)
+                        self._addToCache(localFilePath, fileStoreID, 'read', mutable,
+                                         downloadTime=downloadTime)
+                        # We don't need to return the file size here because addToCache
+                        # already does it for us
+                except:
+                    failures.append(sys.exc_info())
+                finally:
+                    # In any case, delete the harbinger file.
+                    harbingerFile._delete()
+        for (fileStoreID, localFilePath, harbingerFile), (_, failure) in zip(downloads, outcomes):
+            if harbingerFile is not None or failure is not None:
+                continue
+            os.chmod(localFilePath, stat.S_IRUSR | stat.S_IRGRP | stat.S_IROTH)
+            # Now that we have the file, we have 2 options. It's modifiable or not. Either way,
+            # we need to account for FileJobStore making links instead of copies.
+            if mutable:
+                if self.nlinkThreshold == 2:
+                    # nlinkThreshold can only be 1 or 2 and it can only be 2 iff the job store is
+                    # FilejobStore, and the job store and local temp dir are on the same device.
+                    # An atomic rename removes the nlink on the file handle linked from the job
+                    # store.
+                    shutil.copyfile(localFilePath, localFilePath + '.tmp')
+                    os.rename(localFilePath + '.tmp', localFilePath)
+                self._JobState.updateJobSpecificFiles(self, fileStoreID, localFilePath, -1,
+                                                      False)
+            # If it was immutable
+            else:
+                if self.nlinkThreshold == 2:
+                    self._accountForNlinkEquals2(localFilePath)
+                self._JobState.updateJobSpecificFiles(self, fileStoreID, localFilePath, 0.0,
+                                                      False)
+        return failures[0] if failures else None
 
     def exportFile(self, jobStoreFileID, dstUrl):
         while jobStoreFileID in self._pendingFileWrites:
@@ -736,9 +1066,11 @@ class CachingFileStore(FileStore):
         # If fileStoreID is in the cache provide a handle from the local cache
         if self._fileIsCached(fileStoreID):
             logger.debug('CACHE: Cache hit on file with ID \'%s\'.' % fileStoreID)
+            self.cacheStats['hits'] += 1
             return open(self.encodedFileID(fileStoreID), 'r')
         else:
             logger.debug('CACHE: Cache miss on file with ID \'%s\'.' % fileStoreID)
+            self.cacheStats['misses'] += 1
             return self.jobStore.readFileStream(fileStoreID)
 
     def deleteLocalFile(self, fileStoreID):
@@ -748,8 +1080,7 @@ class CachingFileStore(FileStore):
         # if a file was cached or not based on the value held in the third tuple value for the
         # dict item having key = fileStoreID. If it was cached, it holds the value True else
         # False.
-        with self._CacheState.open(self) as cacheInfo:
-            jobState = self._JobState(cacheInfo.jobState[self.jobID])
+        with self._CacheState.open(self) as cacheInfo, self._JobState.open(self) as jobState:
             if fileStoreID not in jobState.jobSpecificFiles.keys():
                 # EOENT indicates that the file did not exist
                 raise OSError(errno.ENOENT, "Attempting to delete a non-local file")
@@ -762,8 +1093,7 @@ class CachingFileStore(FileStore):
                 if fileToDelete is None:
                     filesToDelete.pop(fileToDelete)
                     allOwnedFiles[fileToDelete].remove(fileStoreID)
-                    cacheInfo.jobState[self.jobID] = jobState.__dict__
-                    cacheInfo.write(self.cacheStateFile)
+                    jobState.write(self.jobStateFile)
                     continue
                 # If the file size is zero (copied into the local temp dir) or -1 (mutable), we
                 # can safely delete without any bookkeeping
@@ -780,8 +1110,7 @@ class CachingFileStore(FileStore):
                                 raise IllegalDeletionCacheError(fileToDelete)
                     allOwnedFiles[fileToDelete].remove(fileStoreID)
                     filesToDelete.pop(fileToDelete)
-                    cacheInfo.jobState[self.jobID] = jobState.__dict__
-                    cacheInfo.write(self.cacheStateFile)
+                    jobState.write(self.jobStateFile)
                     continue
                 # If not, we need to do bookkeeping
                 # Get the size of the file to be deleted, and the number of jobs using the file
@@ -799,19 +1128,21 @@ class CachingFileStore(FileStore):
                 filesToDelete.pop(fileToDelete)
                 allOwnedFiles[fileToDelete].remove(fileStoreID)
                 jobState.updateJobReqs(fileSize, 'remove')
-                cacheInfo.jobState[self.jobID] = jobState.__dict__
             # If the job is not in the process of cleaning up, then we may need to remove the
             # cached copy of the file as well.
             if not self.cleanupInProgress:
                 # If the file is cached and if other jobs are using the cached copy of the file,
                 # or if retaining the file in the cache doesn't affect the cache equation, then
                 # don't remove it from cache.
-                if self._fileIsCached(fileStoreID):
-                    cachedFile = self.encodedFileID(fileStoreID)
-                    jobsUsingFile = os.stat(cachedFile).st_nlink
-                    if not cacheInfo.isBalanced() and jobsUsingFile == self.nlinkThreshold:
-                        os.remove(cachedFile)
-                        cacheInfo.cached -= fileSize
+                # If another worker holds the lock of the file, it is about to use the file.
+                with self.fileLock(fileStoreID, blocking=False) as fileLockHandle:
+                    if fileLockHandle is not None and self._fileIsCached(fileStoreID):
+                        cachedFile = self.encodedFileID(fileStoreID)
+                        jobsUsingFile = os.stat(cachedFile).st_nlink
+                        if not cacheInfo.isBalanced() and jobsUsingFile == self.nlinkThreshold:
+                            os.remove(cachedFile)
+                            cacheInfo.cached -= fileSize
+                            self._removeFromCacheIndex(cachedFile)
                 self.logToMaster('Successfully deleted cached copy of file with ID '
                                  '\'%s\'.' % fileStoreID, level=logging.DEBUG)
             self.logToMaster('Successfully deleted local copies of file with ID '
@@ -819,10 +1150,9 @@ class CachingFileStore(FileStore):
 
     def deleteGlobalFile(self, fileStoreID):
         jobStateIsPopulated = False
-        with self._CacheState.open(self) as cacheInfo:
-            if self.jobID in cacheInfo.jobState:
-                jobState = self._JobState(cacheInfo.jobState[self.jobID])
-                jobStateIsPopulated = True
+        if os.path.exists(self.jobStateFile):
+            jobState = self._JobState._load(self.jobStateFile)
+            jobStateIsPopulated = True
         if jobStateIsPopulated and fileStoreID in jobState.jobSpecificFiles.keys():
             # Use deleteLocalFile in the backend to delete the local copy of the file.
             self.deleteLocalFile(fileStoreID)
@@ -861,6 +1191,44 @@ class CachingFileStore(FileStore):
             cacheLockFile.close()
             logger.debug("CACHE: Released lock")
 
+    # The number of lock files the files in the cache are spread over, see fileLock()
+    numFileLocks = 256
+
+    @contextmanager
+    def fileLock(self, jobStoreFileID, blocking=True):
+        """
+        This is a context manager to acquire a lock on a single file in the cache, such that
+        workers operating on different files don't wait for each other. It must be held while
+        checking whether the file is cached and linking to or copying it, while creating or
+        deleting its harbinger file, and while adding the file to or removing it from the cache.
+        The cache lock is only needed to update the size of the cache and the cache index. It may
+        be acquired while holding a file lock but a file lock may only be acquired without
+        blocking while holding the cache lock.
+
+        The files are spread over a fixed number of lock files such that lock files never need
+        to be removed, which could not be done safely.
+
+        :param str jobStoreFileID: The job store ID of the file to lock
+        :param bool blocking: If False, don't wait for another worker to release the lock
+        :yields: File descriptor for the lock file, or None if blocking is False and the lock is
+                 held by another worker
+        """
+        lockNumber = int(sha1(jobStoreFileID).hexdigest(), 16) % self.numFileLocks
+        fileLockFile = open(os.path.join(self._fileLocksDir(self.localCacheDir),
+                                         str(lockNumber)), 'w')
+        try:
+            try:
+                flock(fileLockFile, LOCK_EX if blocking else LOCK_EX | LOCK_NB)
+            except IOError as err:
+                if blocking or err.errno not in (errno.EAGAIN, errno.EACCES):
+                    logger.critical('CACHE: Unable to acquire lock on %s' % fileLockFile.name)
+                    raise
+                yield None
+            else:
+                yield fileLockFile
+        finally:
+            fileLockFile.close()
+
     def _setupCache(self):
         """
         Setup the cache based on the provided values for localCacheDir.
@@ -890,14 +1258,19 @@ class CachingFileStore(FileStore):
             # Ensure this cache is from the correct attempt at the workflow!  If it isn't, we
             # need to reset the cache lock file
             if cacheInfo.attemptNumber != self.workflowAttemptNumber:
+                # Rebuild the cache index from the cache directory in case a previous attempt
+                # died between adding a file to the cache and recording it in the index.
+                cacheIndex = OrderedDict()
+                for cachedFileName in os.listdir(self.localCacheDir):
+                    if not self._isHidden(cachedFileName):
+                        cachedFile = os.path.join(self.localCacheDir, cachedFileName)
+                        cacheIndex[cachedFileName] = CachedFile(os.stat(cachedFile).st_size,
+                                                                None, 0)
+                self._writeCacheIndex(cacheInfo, cacheIndex)
                 if cacheInfo.nlink == 2:
                     cacheInfo.cached = 0  # cached file sizes are accounted for by job store
                 else:
-                    allCachedFiles = [os.path.join(self.localCacheDir, x)
-                                      for x in os.listdir(self.localCacheDir)
-                                      if not self._isHidden(x)]
-                    cacheInfo.cached = sum([os.stat(cachedFile).st_size
-                                            for cachedFile in allCachedFiles])
+                    cacheInfo.cached = sum(record.size for record in cacheIndex.values())
                     # TODO: Delete the working directories
                 cacheInfo.sigmaJob = 0
                 cacheInfo.attemptNumber = self.workflowAttemptNumber
@@ -915,8 +1288,12 @@ class CachingFileStore(FileStore):
         self.setNlinkThreshold()
         # Get the free space on the device
         freeSpace, _ = getFileSystemSize(tempCacheDir)
-        # Create the cache lock file.
+        # Create the cache lock file, the empty cache index, the directory holding the state of
+        # each job and the one holding the locks of the cached files.
         open(os.path.join(tempCacheDir, os.path.basename(self.cacheLockFile)), 'w').close()
+        open(os.path.join(tempCacheDir, os.path.basename(self.cacheIndexFile)), 'w').close()
+        os.mkdir(self._jobStatesDir(tempCacheDir), 0o755)
+        os.mkdir(self._fileLocksDir(tempCacheDir), 0o755)
         # Setup the cache state file
         personalCacheStateFile = os.path.join(tempCacheDir,
                                               os.path.basename(self.cacheStateFile))
@@ -928,7 +1305,7 @@ class CachingFileStore(FileStore):
             'cached': 0,
             'sigmaJob': 0,
             'cacheDir': self.localCacheDir,
-            'jobState': {}})
+            'compactedIndexSize': 0})
         cacheInfo.write(personalCacheStateFile)
 
     def encodedFileID(self, jobStoreFileID):
@@ -963,7 +1340,126 @@ class CachingFileStore(FileStore):
         assert fileDir == self.localCacheDir, 'Can\'t decode uncached file names'
         return base64.urlsafe_b64decode(fileName)
 
-    def addToCache(self, localFilePath, jobStoreFileID, callingFunc, mutable=None):
+    @staticmethod
+    def _jobStatesDir(cacheDir):
+        """
+        :param str cacheDir: Path to the cache directory on the node.
+        :return: Path to the directory holding the state file of each job running on the node.
+        :rtype: str
+        """
+        return os.path.join(cacheDir, '_jobStates')
+
+    @staticmethod
+    def _fileLocksDir(cacheDir):
+        """
+        :param str cacheDir: Path to the cache directory on the node.
+        :return: Path to the directory holding the lock files of the cached files, see fileLock().
+        :rtype: str
+        """
+        return os.path.join(cacheDir, '_fileLocks')
+
+    # The number of bytes the cache index may grow by before it is compacted
+    maxCacheIndexGrowth = 100 * 1024
+
+    def _addToCacheIndex(self, cachedFile, fileSize, downloadTime=None):
+        """
+        Record a file that was added to the cache in the cache index. The cache index is an
+        append-only log of the files added to, read from and removed from the cache, in that
+        order, such that evictions can find candidates without listing and stat-ing the whole
+        cache directory. The order in which the files were used is only worked out from the log
+        when evicting files. This function assumes you already have the cache lock!
+
+        :param str cachedFile: Path to the cached file
+        :param int fileSize: Size of the cached file
+        :param float downloadTime: The time in seconds it took to download the file from the job
+               store, or None if the file was written by the job.
+        """
+        self._appendToCacheIndex('+', cachedFile, CachedFile(fileSize, downloadTime, 0))
+
+    def _accessCacheIndex(self, cachedFile):
+        """
+        Record a read of a cached file in the cache index. Unlike the other records, this one is
+        appended without the cache lock so that cache hits don't wait for each other. A read that
+        is recorded while the index is being compacted may be lost, which only affects the order
+        in which files are evicted.
+
+        :param str cachedFile: Path to the cached file
+        """
+        self._appendToCacheIndex('*', cachedFile, CachedFile(0, None, 0))
+
+    def _removeFromCacheIndex(self, cachedFile):
+        """
+        Record a file that was removed from the cache in the cache index. This function assumes
+        you already have the cache lock!
+
+        :param str cachedFile: Path to the removed file
+        """
+        self._appendToCacheIndex('-', cachedFile, CachedFile(0, None, 0))
+
+    def _appendToCacheIndex(self, action, cachedFile, record):
+        """
+        Append a record for the given cached file to the cache index. The record is appended in
+        a single write, so that concurrent appends don't interleave.
+        """
+        fd = os.open(self.cacheIndexFile, os.O_WRONLY | os.O_APPEND)
+        try:
+            os.write(fd, self._formatCacheIndexRecord(action, os.path.basename(cachedFile),
+                                                      record))
+        finally:
+            os.close(fd)
+
+    @staticmethod
+    def _formatCacheIndexRecord(action, cachedFileName, record):
+        """
+        :return: The line representing the given CachedFile record in the cache index.
+        :rtype: str
+        """
+        cost = '-' if record.cost is None else repr(record.cost)
+        return '%s %d %s %d %s\n' % (action, record.size, cost, record.hits, cachedFileName)
+
+    def _readCacheIndex(self):
+        """
+        Replay the cache index. This function assumes you already have the cache lock!
+
+        :return: The CachedFile record of every file in the cache, keyed by its file name and
+                 ordered from the least to the most recently used.
+        :rtype: OrderedDict
+        """
+        cacheIndex = OrderedDict()
+        with open(self.cacheIndexFile, 'r') as indexFile:
+            for record in indexFile:
+                action, fileSize, cost, hits, cachedFileName = record.split()
+                if action == '+':
+                    cacheIndex.pop(cachedFileName, None)
+                    cacheIndex[cachedFileName] = CachedFile(int(fileSize),
+                                                            None if cost == '-' else float(cost),
+                                                            int(hits))
+                elif action == '*':
+                    # Move the file to the most recently used end of the index
+                    cachedFile = cacheIndex.pop(cachedFileName, None)
+                    if cachedFile is not None:
+                        cacheIndex[cachedFileName] = cachedFile._replace(hits=cachedFile.hits + 1)
+                else:
+                    assert action == '-'
+                    cacheIndex.pop(cachedFileName, None)
+        return cacheIndex
+
+    def _writeCacheIndex(self, cacheInfo, cacheIndex):
+        """
+        Atomically replace the cache index with one that only lists the given files, dropping the
+        records of reads and removed files. This function assumes you already have the cache lock!
+
+        :param toil.fileStore.CachingFileStore._CacheState cacheInfo: The state of the node cache
+        :param OrderedDict cacheIndex: The cached files as returned by _readCacheIndex
+        """
+        with open(self.cacheIndexFile + '.tmp', 'w') as indexFile:
+            for cachedFileName, record in cacheIndex.items():
+                indexFile.write(self._formatCacheIndexRecord('+', cachedFileName, record))
+        os.rename(self.cacheIndexFile + '.tmp', self.cacheIndexFile)
+        cacheInfo.compactedIndexSize = os.path.getsize(self.cacheIndexFile)
+
+    def addToCache(self, localFilePath, jobStoreFileID, callingFunc, mutable=None,
+                   downloadTime=None):
         """
         Used to process the caching of a file. This depends on whether a file is being written
         to file store, or read from it.
@@ -978,27 +1474,36 @@ class CachingFileStore(FileStore):
         :param jobStoreFileID: jobStoreID for the file
         :param str callingFunc: Who called this function, 'write' or 'read'
         :param bool mutable: See modifiable in readGlobalFile
+        :param float downloadTime: The time in seconds it took to download the file from the job
+               store, when reading.
+        """
+        with self.fileLock(jobStoreFileID):
+            self._addToCache(localFilePath, jobStoreFileID, callingFunc, mutable, downloadTime)
+
+    def _addToCache(self, localFilePath, jobStoreFileID, callingFunc, mutable=None,
+                    downloadTime=None):
+        """
+        Like addToCache but assumes the lock of the file is already held.
         """
         assert callingFunc in ('read', 'write')
         # Set up the modifiable variable if it wasn't provided by the user in the function call.
         if mutable is None:
             mutable = self.mutable
         assert isinstance(mutable, bool)
-        with self.cacheLock() as lockFileHandle:
-            cachedFile = self.encodedFileID(jobStoreFileID)
-            # The file to be cached MUST originate in the environment of the TOIL temp directory
-            if (os.stat(self.localCacheDir).st_dev !=
-                    os.stat(os.path.dirname(localFilePath)).st_dev):
-                raise InvalidSourceCacheError('Attempting to cache a file across file systems '
-                                              'cachedir = %s, file = %s.' % (self.localCacheDir,
-                                                                             localFilePath))
-            if not localFilePath.startswith(self.localTempDir):
-                raise InvalidSourceCacheError('Attempting a cache operation on a non-local file '
-                                              '%s.' % localFilePath)
-            if callingFunc == 'read' and mutable:
-                shutil.copyfile(cachedFile, localFilePath)
-                fileSize = os.stat(cachedFile).st_size
-                cacheInfo = self._CacheState._load(self.cacheStateFile)
+        cachedFile = self.encodedFileID(jobStoreFileID)
+        # The file to be cached MUST originate in the environment of the TOIL temp directory
+        if (os.stat(self.localCacheDir).st_dev !=
+                os.stat(os.path.dirname(localFilePath)).st_dev):
+            raise InvalidSourceCacheError('Attempting to cache a file across file systems '
+                                          'cachedir = %s, file = %s.' % (self.localCacheDir,
+                                                                         localFilePath))
+        if not localFilePath.startswith(self.localTempDir):
+            raise InvalidSourceCacheError('Attempting a cache operation on a non-local file '
+                                          '%s.' % localFilePath)
+        if callingFunc == 'read' and mutable:
+            shutil.copyfile(cachedFile, localFilePath)
+            fileSize = os.stat(cachedFile).st_size
+            with self._CacheState.open(self) as cacheInfo:
                 cacheInfo.cached += fileSize if cacheInfo.nlink != 2 else 0
                 if not cacheInfo.isBalanced():
                     os.remove(cachedFile)
@@ -1007,51 +1512,51 @@ class CachingFileStore(FileStore):
                                  '%s as mutable and add to ' % os.path.basename(localFilePath) +
                                  'cache. Hence only mutable copy retained.')
                 else:
+                    self._addToCacheIndex(cachedFile, fileSize, downloadTime)
                     logger.info('CACHE: Added file with ID \'%s\' to the cache.' %
                                 jobStoreFileID)
-                jobState = self._JobState(cacheInfo.jobState[self.jobID])
-                jobState.addToJobSpecFiles(jobStoreFileID, localFilePath, -1, False)
-                cacheInfo.jobState[self.jobID] = jobState.__dict__
-                cacheInfo.write(self.cacheStateFile)
+            self._JobState.updateJobSpecificFiles(self, jobStoreFileID, localFilePath, -1,
+                                                  False)
+        else:
+            # There are two possibilities, read and immutable, and write. both cases do
+            # almost the same thing except for the direction of the os.link hence we're
+            # writing them together.
+            if callingFunc == 'read':  # and mutable is inherently False
+                src = cachedFile
+                dest = localFilePath
+                # To mirror behaviour of shutil.copyfile
+                if os.path.exists(dest):
+                    os.remove(dest)
+            else:  # write
+                src = localFilePath
+                dest = cachedFile
+            try:
+                os.link(src, dest)
+            except OSError as err:
+                if err.errno != errno.EEXIST:
+                    raise
+                # If we get the EEXIST error, it can only be from write since in read we are
+                # explicitly deleting the file.  This shouldn't happen with the .partial
+                # logic hence we raise a cache error.
+                raise CacheError('Attempting to recache a file %s.' % src)
             else:
-                # There are two possibilities, read and immutable, and write. both cases do
-                # almost the same thing except for the direction of the os.link hence we're
-                # writing them together.
-                if callingFunc == 'read':  # and mutable is inherently False
-                    src = cachedFile
-                    dest = localFilePath
-                    # To mirror behaviour of shutil.copyfile
-                    if os.path.exists(dest):
-                        os.remove(dest)
-                else:  # write
-                    src = localFilePath
-                    dest = cachedFile
-                try:
-                    os.link(src, dest)
-                except OSError as err:
-                    if err.errno != errno.EEXIST:
-                        raise
-                    # If we get the EEXIST error, it can only be from write since in read we are
-                    # explicitly deleting the file.  This shouldn't happen with the .partial
-                    # logic hence we raise a cache error.
-                    raise CacheError('Attempting to recache a file %s.' % src)
-                else:
-                    # Chmod the cached file. Cached files can never be modified.
-                    os.chmod(cachedFile, stat.S_IRUSR | stat.S_IRGRP | stat.S_IROTH)
+                # Chmod the cached file. Cached files can never be modified.
+                os.chmod(cachedFile, stat.S_IRUSR | stat.S_IRGRP | stat.S_IROTH)
+                with self._CacheState.open(self) as cacheInfo:
+                    self._addToCacheIndex(cachedFile, os.stat(cachedFile).st_size, downloadTime)
                     # Return the filesize of cachedFile to the job and increase the cached size
                     # The values passed here don't matter since rFS looks at the file only for
                     # the stat
-                    self.returnFileSize(jobStoreFileID, localFilePath, lockFileHandle,
-                                        fileAlreadyCached=False)
-                if callingFunc == 'read':
-                    logger.debug('CACHE: Read file with ID \'%s\' from the cache.' %
-                                 jobStoreFileID)
-                else:
-                    logger.debug('CACHE: Added file with ID \'%s\' to the cache.' %
-                                 jobStoreFileID)
+                    self._returnFileSize(cacheInfo, jobStoreFileID, localFilePath,
+                                         fileAlreadyCached=False)
+            if callingFunc == 'read':
+                logger.debug('CACHE: Read file with ID \'%s\' from the cache.' %
+                             jobStoreFileID)
+            else:
+                logger.debug('CACHE: Added file with ID \'%s\' to the cache.' %
+                             jobStoreFileID)
 
-    def returnFileSize(self, fileStoreID, cachedFileSource, lockFileHandle,
-                       fileAlreadyCached=False):
+    def returnFileSize(self, fileStoreID, cachedFileSource, fileAlreadyCached=False):
         """
         Returns the fileSize of the file described by fileStoreID to the job requirements pool
         if the file was recently added to, or read from cache (A job that reads n bytes from
@@ -1060,12 +1565,19 @@ class CachingFileStore(FileStore):
 
         :param fileStoreID: fileStore ID of the file bein added to cache
         :param str cachedFileSource: File being added to cache
-        :param file lockFileHandle: Open file handle to the cache lock file
         :param bool fileAlreadyCached: A flag to indicate whether the file was already cached or
                not. If it was, then it means that you don't need to add the filesize to cache again.
         """
+        with self._CacheState.open(self) as cacheInfo:
+            self._returnFileSize(cacheInfo, fileStoreID, cachedFileSource, fileAlreadyCached)
+
+    def _returnFileSize(self, cacheInfo, fileStoreID, cachedFileSource, fileAlreadyCached=False):
+        """
+        Like returnFileSize but assumes you already have the cache lock!
+
+        :param toil.fileStore.CachingFileStore._CacheState cacheInfo: The state of the node cache
+        """
         fileSize = os.stat(cachedFileSource).st_size
-        cacheInfo = self._CacheState._load(self.cacheStateFile)
         # If the file isn't cached, add the size of the file to the cache pool. However, if the
         # nlink threshold is not 1 -  i.e. it is 2 (it can only be 1 or 2), then don't do this
         # since the size of the file is accounted for by the file store copy.
@@ -1076,10 +1588,7 @@ class CachingFileStore(FileStore):
             self.logToMaster('CACHE: The cache was not balanced on returning file size',
                              logging.WARN)
         # Add the info to the job specific cache info
-        jobState = self._JobState(cacheInfo.jobState[self.jobID])
-        jobState.addToJobSpecFiles(fileStoreID, cachedFileSource, fileSize, True)
-        cacheInfo.jobState[self.jobID] = jobState.__dict__
-        cacheInfo.write(self.cacheStateFile)
+        self._JobState.updateJobSpecificFiles(self, fileStoreID, cachedFileSource, fileSize, True)
 
     @staticmethod
     def _isHidden(filePath):
@@ -1108,62 +1617,86 @@ class CachingFileStore(FileStore):
             # Initialize the job state here. we use a partial in the jobSpecificFiles call so
             # that this entire thing is pickleable. Based on answer by user Nathaniel Gentile at
             # http://stackoverflow.com/questions/2600790
-            assert self.jobID not in cacheInfo.jobState
-            cacheInfo.jobState[self.jobID] = {
+            assert not os.path.exists(self.jobStateFile)
+            jobState = self._JobState({
                 'jobName': self.jobName,
                 'jobReqs': newJobReqs,
                 'jobDir': self.localTempDir,
                 'jobSpecificFiles': defaultdict(partial(defaultdict,int)),
                 'filesToFSIDs': defaultdict(set),
                 'pid': os.getpid(),
-                'deferredFunctions': []}
-            # If the caching equation is balanced, do nothing.
+                'deferredFunctions': []})
+            # If the caching equation is balanced, don't evict anything.
             if cacheInfo.isBalanced():
-                return None
-
-            # List of deletable cached files.  A deletable cache file is one
-            #  that is not in use by any other worker (identified by the number of symlinks to
-            # the file)
-            allCacheFiles = [os.path.join(self.localCacheDir, x)
-                             for x in os.listdir(self.localCacheDir)
-                             if not self._isHidden(x)]
-            allCacheFiles = [(path, os.stat(path)) for path in allCacheFiles]
-            # TODO mtime vs ctime
-            deletableCacheFiles = {(path, inode.st_mtime, inode.st_size)
-                                   for path, inode in allCacheFiles
-                                   if inode.st_nlink == self.nlinkThreshold}
-
-            # Sort in descending order of mtime so the first items to be popped from the list
-            # are the least recently created.
-            deletableCacheFiles = sorted(deletableCacheFiles, key=lambda x: (-x[1], -x[2]))
-            logger.debug('CACHE: Need %s bytes for new job. Detecting an estimated %s (out of a '
-                         'total %s) bytes available for running the new job. The size of the cache '
-                         'is %s bytes.', newJobReqs,
-                         (cacheInfo.total - (cacheInfo.cached + cacheInfo.sigmaJob - newJobReqs)),
-                         cacheInfo.total, cacheInfo.cached)
-            logger.debug('CACHE: Evicting files to make room for the new job.')
-
-            # Now do the actual file removal
-            totalEvicted = 0
-            while not cacheInfo.isBalanced() and len(deletableCacheFiles) > 0:
-                cachedFile, fileCreateTime, cachedFileSize = deletableCacheFiles.pop()
+                # Drop the records of reads and removed files from the cache index every once in
+                # a while
+                if (os.path.getsize(self.cacheIndexFile) - cacheInfo.compactedIndexSize >
+                        self.maxCacheIndexGrowth):
+                    self._writeCacheIndex(cacheInfo, self._readCacheIndex())
+            else:
+                self._evictFromCache(cacheInfo, newJobReqs)
+            # Only register the job once its requirements are accounted for, or the cleanup of a
+            # dead job would return requirements that were never added.
+            jobState.write(self.jobStateFile)
+
+    def _evictFromCache(self, cacheInfo, newJobReqs):
+        """
+        Evict files that are not in use by any job from the cache until the caching equation is
+        balanced. This function assumes you already have the cache lock!
+
+        :param toil.fileStore.CachingFileStore._CacheState cacheInfo: The state of the node cache
+        :param float newJobReqs: The disk requirements of the job being started.
+        """
+        cacheIndex = self._readCacheIndex()
+        logger.debug('CACHE: Need %s bytes for new job. Detecting an estimated %s (out of a '
+                     'total %s) bytes available for running the new job. The size of the cache '
+                     'is %s bytes.', newJobReqs,
+                     (cacheInfo.total - (cacheInfo.cached + cacheInfo.sigmaJob - newJobReqs)),
+                     cacheInfo.total, cacheInfo.cached)
+        logger.debug('CACHE: Evicting files to make room for the new job.')
+
+        # Now do the actual file removal. A deletable cache file is one that is not in use by
+        # any other worker (identified by the number of hard links to the file) and that no other
+        # worker is about to use (identified by the lock of the file being held)
+        totalEvicted = 0
+        for cachedFileName in self.evictionPolicy.evictionOrder(cacheIndex):
+            if cacheInfo.isBalanced():
+                break
+            cachedFile = os.path.join(self.localCacheDir, cachedFileName)
+            with self.fileLock(self.decodedFileID(cachedFile), blocking=False) as fileLockHandle:
+                if fileLockHandle is None:
+                    continue
+                try:
+                    cachedFileStats = os.stat(cachedFile)
+                except OSError as err:
+                    if err.errno != errno.ENOENT:
+                        raise
+                    # The file was removed without being recorded in the index
+                    del cacheIndex[cachedFileName]
+                    continue
+                if cachedFileStats.st_nlink != self.nlinkThreshold:
+                    continue
                 os.remove(cachedFile)
-                cacheInfo.cached -= cachedFileSize if self.nlinkThreshold != 2 else 0
-                totalEvicted += cachedFileSize
-                assert cacheInfo.cached >= 0
-                logger.debug('CACHE: Evicted  file with ID \'%s\' (%s bytes)' %
-                             (self.decodedFileID(cachedFile), cachedFileSize))
-            logger.debug('CACHE: Evicted a total of %s bytes. Available space is now %s bytes.',
-                         totalEvicted,
-                         (cacheInfo.total - (cacheInfo.cached + cacheInfo.sigmaJob - newJobReqs)))
-            if not cacheInfo.isBalanced():
-                raise CacheUnbalancedError()
+            cachedFileSize = cachedFileStats.st_size
+            del cacheIndex[cachedFileName]
+            cacheInfo.cached -= cachedFileSize if self.nlinkThreshold != 2 else 0
+            totalEvicted += cachedFileSize
+            self.cacheStats['evictions'] += 1
+            assert cacheInfo.cached >= 0
+            logger.debug('CACHE: Evicted  file with ID \'%s\' (%s bytes)' %
+                         (self.decodedFileID(cachedFile), cachedFileSize))
+        self._writeCacheIndex(cacheInfo, cacheIndex)
+        logger.debug('CACHE: Evicted a total of %s bytes. Available space is now %s bytes.',
+                     totalEvicted,
+                     (cacheInfo.total - (cacheInfo.cached + cacheInfo.sigmaJob - newJobReqs)))
+        if not cacheInfo.isBalanced():
+            raise CacheUnbalancedError()
 
     def removeSingleCachedFile(self, fileStoreID):
         """
         Removes a single file described by the fileStoreID from the cache forcibly.
         """
-        with self._CacheState.open(self) as cacheInfo:
+        with self.fileLock(fileStoreID), self._CacheState.open(self) as cacheInfo:
             cachedFile = self.encodedFileID(fileStoreID)
             cachedFileStats = os.stat(cachedFile)
             # We know the file exists because this function was called in the if block.  So we
@@ -1173,6 +1706,7 @@ class CachingFileStore(FileStore):
             # Remove the file size from the cached file size if the jobstore is not fileJobStore
             # and then delete the file
             os.remove(cachedFile)
+            self._removeFromCacheIndex(cachedFile)
             if self.nlinkThreshold != 2:
                 cacheInfo.cached -= cachedFileStats.st_size
             if not cacheInfo.isBalanced():
@@ -1203,8 +1737,6 @@ class CachingFileStore(FileStore):
         assert fileStats.st_nlink >= self.nlinkThreshold
         with self._CacheState.open(self) as cacheInfo:
             cacheInfo.sigmaJob -= fileStats.st_size
-            jobState = self._JobState(cacheInfo.jobState[self.jobID])
-            jobState.updateJobReqs(fileStats.st_size, 'remove')
 
     def returnJobReqs(self, jobReqs):
         """
@@ -1213,10 +1745,8 @@ class CachingFileStore(FileStore):
 
         :param float jobReqs: Original size requirement of the job
         """
-        # Since we are only reading this job's specific values from the state file, we don't
-        # need a lock
-        jobState = self._JobState(self._CacheState._load(self.cacheStateFile
-                                                         ).jobState[self.jobID])
+        # Since we are only reading this job's state file, we don't need a lock
+        jobState = self._JobState._load(self.jobStateFile)
         for x in jobState.jobSpecificFiles.keys():
             self.deleteLocalFile(x)
         with self._CacheState.open(self) as cacheInfo:
@@ -1227,7 +1757,8 @@ class CachingFileStore(FileStore):
         """
         Utility class to read and write the cache lock file. Also for checking whether the
         caching equation is balanced or not.  It extends the _StateFile class to add other cache
-        related functions.
+        related functions. The state of the individual jobs is kept in separate _JobState files
+        such that the cache lock file only holds a handful of node-wide values.
         """
         @classmethod
         @contextmanager
@@ -1275,11 +1806,21 @@ class CachingFileStore(FileStore):
         :param toil.fileStore.CachingFileStore._CacheState nodeInfo: The state of the node cache as
                a _CacheState object
         """
-        # A list of tuples of (hashed job id, pid or process running job)
-        registeredJobs = [(jid, state['pid']) for jid, state in nodeInfo.jobState.items()]
-        for jobID, jobPID in registeredJobs:
-            if not cls._pidExists(jobPID):
-                jobState = CachingFileStore._JobState(nodeInfo.jobState[jobID])
+        jobStatesDir = cls._jobStatesDir(nodeInfo.cacheDir)
+        for jobID in os.listdir(jobStatesDir):
+            if jobID.endswith('.tmp'):
+                # A state file that is being written
+                continue
+            jobStateFile = os.path.join(jobStatesDir, jobID)
+            try:
+                jobState = cls._JobState._load(jobStateFile)
+            except IOError as e:
+                if e.errno == errno.ENOENT:
+                    # The job finished since the state files were listed
+                    continue
+                else:
+                    raise
+            if not cls._pidExists(jobState.pid):
                 logger.warning('Detected that job (%s) prematurely terminated.  Fixing the state '
                                'of the cache.', jobState.jobName)
                 if not batchSystemShutdown:
@@ -1292,23 +1833,32 @@ class CachingFileStore(FileStore):
                     nodeInfo.sigmaJob -= jobState.jobReqs
                 logger.debug('Running user-defined deferred functions.')
                 cls._runDeferredFunctions(jobState.deferredFunctions)
-                # Remove job from the cache state file
-                nodeInfo.jobState.pop(jobID)
+                # Remove the job's state file
+                os.remove(jobStateFile)
 
     def _registerDeferredFunction(self, deferredFunction):
-        with self._CacheState.open(self) as cacheInfo:
-            cacheInfo.jobState[self.jobID]['deferredFunctions'].append(deferredFunction)
+        with self._JobState.open(self) as jobState:
+            jobState.deferredFunctions.append(deferredFunction)
             logger.debug('Registered "%s" with job "%s".', deferredFunction, self.jobName)
 
-    class _JobState(object):
+    class _JobState(FileStore._StateFile):
         """
         This is a utility class to handle the state of a job in terms of it's current disk
-        requirements, working directory, and job specific files.
+        requirements, working directory, and job specific files. Each job keeps its state in its
+        own file, which only the job itself writes to while it is alive.
         """
-
-        def __init__(self, dictObj):
-            assert isinstance(dictObj, dict)
-            self.__dict__.update(dictObj)
+        @classmethod
+        @contextmanager
+        def open(cls, outer=None):
+            """
+            This is a context manager that opens the job's state file and reads it into an object
+            that is returned to the user in the yield. No lock is needed since no other process
+            writes to the file while the job is alive.
+            """
+            assert outer is not None
+            jobState = cls._load(outer.jobStateFile)
+            yield jobState
+            jobState.write(outer.jobStateFile)
 
         @classmethod
         def updateJobSpecificFiles(cls, outer, jobStoreFileID, filePath, fileSize, cached):
@@ -1322,10 +1872,8 @@ class CachingFileStore(FileStore):
             :param float fileSize: The size of the file (may be deprecated soon)
             :param bool cached: T : F : None :: cached : not cached : mutably read
             """
-            with outer._CacheState.open(outer) as cacheInfo:
-                jobState = cls(cacheInfo.jobState[outer.jobID])
+            with cls.open(outer) as jobState:
                 jobState.addToJobSpecFiles(jobStoreFileID, filePath, fileSize, cached)
-                cacheInfo.jobState[outer.jobID] = jobState.__dict__
 
         def addToJobSpecFiles(self, jobStoreFileID, filePath, fileSize, cached):
             """
@@ -1409,7 +1957,8 @@ class CachingFileStore(FileStore):
             This method is called when a readGlobalFile process is waiting on another process to
             write a file to the cache.
 
-            :param lockFileHandle: The open handle to the cache lock file
+            :param lockFileHandle: The open handle to the lock file of the file, see
+                   CachingFileStore.fileLock()
             """
             while self.exists():
                 logger.info('CACHE: Waiting for another worker to download file with ID %s.'
@@ -1436,14 +1985,14 @@ class CachingFileStore(FileStore):
 
         def delete(self):
             """
-            Acquires the cache lock then attempts to delete the harbinger file.
+            Acquires the lock of the file then attempts to delete the harbinger file.
             """
-            with self.fileStore.cacheLock():
+            with self.fileStore.fileLock(self.fileStoreID):
                 self._delete()
 
         def _delete(self):
             """
-            This function assumes you already have the cache lock!
+            This function assumes you already have the lock of the file!
             """
             assert self.exists()
             self.fileStore.logToMaster('CACHE: Deleting the harbinger file for (%s)' %
@@ -1524,8 +2073,8 @@ class CachingFileStore(FileStore):
                 # the job wrapper is completed.
                 self.jobGraph.filesToDelete = list(self.filesToDelete)
 
-                # Complete the job
-                self.jobStore.update(self.jobGraph)
+                # Complete the job, unless another attempt has already done so
+                self._completeJob()
 
                 # Delete any remnant jobs
                 map(self.jobStore.delete, self.jobsToDelete)
@@ -1642,22 +2191,50 @@ class NonCachingFileStore(FileStore):
 
     def writeGlobalFile(self, localFileName, cleanup=False):
         absLocalFileName = self._resolveAbsoluteLocalPath(localFileName)
+        return self._writeGlobalFiles([absLocalFileName], cleanup)[0]
+
+    def _writeGlobalFiles(self, absLocalFileNames, cleanup):
         cleanupID = None if not cleanup else self.jobGraph.jobStoreID
-        fileStoreID = self.jobStore.writeFile(absLocalFileName, cleanupID)
-        self.localFileMap[fileStoreID].append(absLocalFileName)
-        return FileID.forPath(fileStoreID, absLocalFileName)
+        outcomes = self._mapConcurrently(
+            lambda absLocalFileName: self.jobStore.writeFile(absLocalFileName, cleanupID),
+            absLocalFileNames)
+        failures = [failure for _, failure in outcomes if failure is not None]
+        fileStoreIDs = []
+        for absLocalFileName, (fileStoreID, failure) in zip(absLocalFileNames, outcomes):
+            if failure is None:
+                self.localFileMap[fileStoreID].append(absLocalFileName)
+                fileStoreIDs.append(FileID.forPath(fileStoreID, absLocalFileName))
+        if failures:
+            reraise(*failures[0])
+        return fileStoreIDs
 
     def readGlobalFile(self, fileStoreID, userPath=None, cache=True, mutable=None):
-        if userPath is not None:
-            localFilePath = self._resolveAbsoluteLocalPath(userPath)
-            if os.path.exists(localFilePath):
-                raise RuntimeError(' File %s ' % localFilePath + ' exists. Cannot Overwrite.')
-        else:
-            localFilePath = self.getLocalTempFileName()
-
-        self.jobStore.readFile(fileStoreID, localFilePath)
-        self.localFileMap[fileStoreID].append(localFilePath)
-        return localFilePath
+        return self._readGlobalFiles([(fileStoreID, userPath)], cache=cache, mutable=mutable)[0]
+
+    def _readGlobalFiles(self, reads, cache, mutable):
+        localFiles = []
+        for fileStoreID, userPath in reads:
+            if userPath is not None:
+                localFilePath = self._resolveAbsoluteLocalPath(userPath)
+                if os.path.exists(localFilePath):
+                    raise RuntimeError(' File %s ' % localFilePath + ' exists. Cannot Overwrite.')
+            else:
+                localFilePath = self.getLocalTempFileName()
+            localFiles.append((fileStoreID, localFilePath))
+
+        def download(args):
+            fileStoreID, localFilePath = args
+            self.jobStore.readFile(fileStoreID, localFilePath,
+                                   parallelism=self._getReadParallelism(fileStoreID))
+
+        outcomes = self._mapConcurrently(download, localFiles)
+        failures = [failure for _, failure in outcomes if failure is not None]
+        for (fileStoreID, localFilePath), (_, failure) in zip(localFiles, outcomes):
+            if failure is None:
+                self.localFileMap[fileStoreID].append(localFilePath)
+        if failures:
+            reraise(*failures[0])
+        return [localFilePath for _, localFilePath in localFiles]
 
     @contextmanager
     def readGlobalFileStream(self, fileStoreID):
@@ -1696,8 +2273,8 @@ class NonCachingFileStore(FileStore):
             # Indicate any files that should be deleted once the update of
             # the job wrapper is completed.
             self.jobGraph.filesToDelete = list(self.filesToDelete)
-            # Complete the job
-            self.jobStore.update(self.jobGraph)
+            # Complete the job, unless another attempt has already done so
+            self._completeJob()
             # Delete any remnant jobs
             map(self.jobStore.delete, self.jobsToDelete)
             # Delete any remnant files
@@ -1876,6 +2453,16 @@ def shutdownFileStore(workflowDir, workflowID):
         NonCachingFileStore.shutdown(workflowDir)
 
 
+class JobSupersededException(Exception):
+    """
+    Raised if another attempt at running a job has completed the job first
+    """
+
+    def __init__(self, jobGraph):
+        super(JobSupersededException, self).__init__(
+            'Another attempt at running job %s has completed it first' % jobGraph)
+
+
 class CacheError(Exception):
     """
     Error Raised if the user attempts to add a non-local file to cache
@@ -17,6 +17,7 @@ from __future__ import absolute_import, print_function
 import collections
 import importlib
 import inspect
+import itertools
 import logging
 import os
 import sys
@@ -53,6 +54,9 @@ class JobLikeObject(object):
     If the object doesn't specify explicit requirements, these properties will fall back
     to the configured defaults. If the value cannot be determined, an AttributeError is raised.
     """
+    # Subclasses that don't declare __slots__ keep their attributes in a dictionary as usual
+    __slots__ = ()
+
     def __init__(self, requirements, unitName, jobName=None):
         cores = requirements.get('cores')
         memory = requirements.get('memory')
@@ -185,12 +189,20 @@ class JobNode(JobLikeObject):
     """
     This object bridges the job graph, job, and batchsystem classes
     """
+    # The leader holds many instances of this class so we keep them free of per-instance
+    # dictionaries.
+    __slots__ = ('unitName', 'jobName', '_cores', '_memory', '_disk', '_preemptable', '_config',
+                 'jobStoreID', 'predecessorNumber', 'command', 'priority')
+
     def __init__(self, requirements, jobName, unitName, jobStoreID,
                  command, predecessorNumber=1):
         super(JobNode, self).__init__(requirements=requirements, unitName=unitName, jobName=jobName)
         self.jobStoreID = jobStoreID
         self.predecessorNumber = predecessorNumber
         self.command = command
+        # Set by the leader when the job is issued. Batch systems run jobs with a higher priority
+        # first. It isn't persisted in the job store.
+        self.priority = 0
 
     def __str__(self):
         return super(JobNode, self).__str__() + ' ' + self.jobStoreID
@@ -200,7 +212,7 @@ class JobNode(JobLikeObject):
 
     def __eq__(self, other):
         if isinstance(other, self.__class__):
-            return self.__dict__ == other.__dict__
+            return self.__getstate__() == other.__getstate__()
         return NotImplemented
 
     def __ne__(self, other):
@@ -209,7 +221,29 @@ class JobNode(JobLikeObject):
         return NotImplemented
 
     def __repr__(self):
-        return '%s( **%r )' % (self.__class__.__name__, self.__dict__)
+        return '%s( **%r )' % (self.__class__.__name__, self.__getstate__())
+
+    def __getstate__(self):
+        """
+        Returns the attributes of this object as a dictionary, like the __dict__ of an instance
+        of a class without __slots__ would.
+        """
+        state = dict(getattr(self, '__dict__', {}))
+        for cls in type(self).__mro__:
+            for name in cls.__dict__.get('__slots__', ()):
+                try:
+                    state[name] = getattr(self, name)
+                except AttributeError:
+                    pass
+        return state
+
+    def __setstate__(self, state):
+        """
+        Restores the attributes returned by :meth:`__getstate__`. This also accepts the pickled
+        __dict__ of instances written before this class declared __slots__.
+        """
+        for name, value in iteritems(state):
+            setattr(self, name, value)
 
     @classmethod
     def fromJobGraph(cls, jobGraph):
@@ -552,13 +586,17 @@ class Job(JobLikeObject):
         :func:`toil.job.Job.checkJobGraphAcyclic` and
         :func:`toil.job.Job.checkNewCheckpointsAreLeafVertices` for more info.
 
+        The connected component of jobs containing this job is only traversed once for all three
+        checks.
+
         :raises toil.job.JobGraphDeadlockException: if the job graph
             is cyclic, contains multiple roots or contains checkpoint jobs that are
             not leaf vertices when defined (see :func:`toil.job.Job.checkNewCheckpointsAreLeaves`).
         """
-        self.checkJobGraphConnected()
-        self.checkJobGraphAcylic()
-        self.checkNewCheckpointsAreLeafVertices()
+        jobs, roots = self._getConnectedJobs()
+        self._checkJobGraphConnected(roots)
+        self._checkJobGraphAcylic(jobs, roots)
+        self._checkNewCheckpointsAreLeafVertices(jobs, roots)
 
     def getRootJobs(self):
         """
@@ -567,21 +605,7 @@ class Job(JobLikeObject):
 
         :rtype : set of toil.job.Job instances
         """
-        roots = set()
-        visited = set()
-        #Function to get the roots of a job
-        def getRoots(job):
-            if job not in visited:
-                visited.add(job)
-                if len(job._directPredecessors) > 0:
-                    map(lambda p : getRoots(p), job._directPredecessors)
-                else:
-                    roots.add(job)
-                #The following call ensures we explore all successor edges.
-                map(lambda c : getRoots(c), job._children +
-                    job._followOns)
-        getRoots(self)
-        return roots
+        return self._getConnectedJobs()[1]
 
     def checkJobGraphConnected(self):
         """
@@ -591,10 +615,7 @@ class Job(JobLikeObject):
         As execution always starts from one root job, having multiple root jobs will \
         cause a deadlock to occur.
         """
-        rootJobs = self.getRootJobs()
-        if len(rootJobs) != 1:
-            raise JobGraphDeadlockException("Graph does not contain exactly one"
-                                            " root job: %s" % rootJobs)
+        self._checkJobGraphConnected(self.getRootJobs())
 
     def checkJobGraphAcylic(self):
         """
@@ -609,21 +630,10 @@ class Job(JobLikeObject):
         an edge an "implied" edge. The augmented job graph is a job graph including \
         all the implied edges.
 
-        For a job graph G = (V, E) the algorithm is ``O(|V|^2)``. It is ``O(|V| + |E|)`` for \
-        a graph with no follow-ons. The former follow-on case could be improved!
+        The implied edges are never materialized, see :func:`toil.job.Job._checkJobGraphAcylic`. \
+        For a job graph G = (V, E) the algorithm is ``O(|V| + |E|)``, with or without follow-ons.
         """
-        #Get the root jobs
-        roots = self.getRootJobs()
-        if len(roots) == 0:
-            raise JobGraphDeadlockException("Graph contains no root jobs due to cycles")
-
-        #Get implied edges
-        extraEdges = self._getImpliedEdges(roots)
-
-        #Check for directed cycles in the augmented graph
-        visited = set()
-        for root in roots:
-            root._checkJobGraphAcylicDFS([], visited, extraEdges)
+        self._checkJobGraphAcylic(*self._getConnectedJobs())
 
     def checkNewCheckpointsAreLeafVertices(self):
         """
@@ -639,17 +649,7 @@ class Job(JobLikeObject):
         :raises toil.job.JobGraphDeadlockException: if there exists a job being added to the graph for which \
         checkpoint=True and which is not a leaf.
         """
-        roots = self.getRootJobs() # Roots jobs of component, these are preexisting jobs in the graph
-
-        # All jobs in the component of the job graph containing self
-        jobs = set()
-        map(lambda x : x._dfs(jobs), roots)
-
-        # Check for each job for which checkpoint is true that it is a cut vertex or leaf
-        for y in filter(lambda x : x.checkpoint, jobs):
-            if y not in roots: # The roots are the prexisting jobs
-                if not Job._isLeafVertex(y):
-                    raise JobGraphDeadlockException("New checkpoint job %s is not a leaf in the job graph" % y)
+        self._checkNewCheckpointsAreLeafVertices(*self._getConnectedJobs())
 
     def defer(self, function, *args, **kwargs):
         """
@@ -843,7 +843,7 @@ class Job(JobLikeObject):
         return userModule.load()
 
     @classmethod
-    def _loadJob(cls, command, jobStore):
+    def _loadJob(cls, command, jobStore, pickledJob=None):
         """
         Unpickles a :class:`toil.job.Job` instance by decoding command.
 
@@ -851,11 +851,14 @@ class Job(JobLikeObject):
         pickle file for the job and a list of modules which must be imported so that \
         the Job can be successfully unpickled. \
         See :func:`toil.job.Job._serialiseFirstJob` and \
-        :func:`toil.job.Job._makeJobGraphs` to see precisely how the Job is encoded \
+        :func:`toil.job.Job._serialiseJob` to see precisely how the Job is encoded \
         in the command.
 
         :param string command: encoding of the job in the job store.
         :param toil.jobStores.abstractJobStore.AbstractJobStore jobStore: The job store.
+        :param str pickledJob: the pickled job stored inline with the job graph, if any, see \
+               :attr:`toil.jobGraph.JobGraph.pickledJob`, or the pickled job as returned by \
+               :meth:`_readPickledJob`
         :returns: The job referenced by the command.
         :rtype: toil.job.Job
         """
@@ -864,13 +867,32 @@ class Job(JobLikeObject):
         userModule = ModuleDescriptor.fromCommand(commandTokens[2:])
         logger.debug('Loading user module %s.', userModule)
         userModule = cls._loadUserModule(userModule)
-        pickleFile = commandTokens[1]
+        pickledJob = cls._readPickledJob(command, jobStore, pickledJob)
+        return cls._unpickle(userModule, BytesIO(pickledJob), jobStore.config)
+
+    @classmethod
+    def _readPickledJob(cls, command, jobStore, pickledJob=None):
+        """
+        Returns the pickled :class:`toil.job.Job` instance referenced by command, without
+        unpickling it, such that it can be read ahead of time. Unpickling the job resolves the
+        promises it holds, which may not have been fulfilled yet.
+
+        :param string command: encoding of the job in the job store.
+        :param toil.jobStores.abstractJobStore.AbstractJobStore jobStore: The job store.
+        :param str pickledJob: the pickled job stored inline with the job graph or read already, \
+               if any, which is returned as is
+        :rtype: str
+        """
+        if pickledJob is not None:
+            return pickledJob
+        pickleFile = command.split()[1]
+        assert pickleFile != "inline"
         if pickleFile == "firstJob":
             openFileStream = jobStore.readSharedFileStream(pickleFile)
         else:
             openFileStream = jobStore.readFileStream(pickleFile)
         with openFileStream as fileHandle:
-            return cls._unpickle(userModule, fileHandle, jobStore.config)
+            return fileHandle.read()
 
 
     @classmethod
@@ -930,57 +952,120 @@ class Job(JobLikeObject):
                     with jobStore.updateFileStream(promiseFileStoreID) as fileHandle:
                         cPickle.dump(promisedValue, fileHandle, cPickle.HIGHEST_PROTOCOL)
 
-    # Functions associated with Job.checkJobGraphAcyclic to establish that the job graph does not
-    # contain any cycles of dependencies:
+    # Functions associated with Job.checkJobGraphForDeadlocks to establish that the job graph does
+    # not contain any cycles of dependencies:
 
-    def _dfs(self, visited):
+    def _getConnectedJobs(self):
         """
-        Adds the job and all jobs reachable on a directed path from current node to the given set.
+        Iteratively collects the connected component of jobs containing this job, following
+        predecessor, child and follow-on edges.
+
+        :return: the set of jobs in the component and the subset of them that are roots, i.e.
+                 have no predecessors
+        :rtype: tuple(set, set)
         """
-        if self not in visited:
-            visited.add(self)
-            for successor in self._children + self._followOns:
-                successor._dfs(visited)
+        jobs = {self}
+        roots = set()
+        stack = [self]
+        while stack:
+            job = stack.pop()
+            if not job._directPredecessors:
+                roots.add(job)
+            for neighbour in itertools.chain(job._directPredecessors, job._children,
+                                             job._followOns):
+                if neighbour not in jobs:
+                    jobs.add(neighbour)
+                    stack.append(neighbour)
+        return jobs, roots
+
+    @staticmethod
+    def _checkJobGraphConnected(roots):
+        if len(roots) != 1:
+            raise JobGraphDeadlockException("Graph does not contain exactly one"
+                                            " root job: %s" % roots)
+
+    # The kinds of vertices in the graph checked by _checkJobGraphAcylic, see there
+    _jobStarted, _jobFinished, _childrenFinished = range(3)
 
-    def _checkJobGraphAcylicDFS(self, stack, visited, extraEdges):
+    @staticmethod
+    def _checkJobGraphAcylic(jobs, roots):
         """
-        DFS traversal to detect cycles in augmented job graph.
+        Checks that the augmented job graph of the given component of jobs is acyclic (see
+        :func:`toil.job.Job.checkJobGraphAcylic`), in time linear in the size of the component.
+
+        Instead of adding an implied edge from every descendant of A's children to each
+        follow-on B of A, which amounts to O(|V|^2) edges, we search an equivalent graph with
+        three vertices per job J: (1) J started, (2) J and all its successors finished and (3)
+        all of J's children and their successors finished. Every successor of J starts after J
+        has started, J is finished after J has started and after each of its successors is
+        finished, J's children are finished after each child is finished, and each follow-on of J
+        starts after J's children are finished. A path from the start of one job to the start of
+        another exists in this graph if and only if one exists in the augmented job graph, so
+        both graphs have the same cycles.
         """
-        if self not in visited:
-            visited.add(self)
-            stack.append(self)
-            for successor in self._children + self._followOns + extraEdges[self]:
-                successor._checkJobGraphAcylicDFS(stack, visited, extraEdges)
-            assert stack.pop() == self
-        if self in stack:
-            stack.append(self)
-            raise JobGraphDeadlockException("A cycle of job dependencies has been detected '%s'" % stack)
+        if len(roots) == 0:
+            raise JobGraphDeadlockException("Graph contains no root jobs due to cycles")
+
+        # Maps each child to its parents, since _directPredecessors doesn't distinguish parents
+        # from jobs that the child is a follow-on of
+        parents = collections.defaultdict(list)
+        for job in jobs:
+            for child in job._children:
+                parents[child].append(job)
+
+        def successors(vertex):
+            kind, job = vertex
+            if kind == Job._jobStarted:
+                for successor in itertools.chain(job._children, job._followOns):
+                    yield Job._jobStarted, successor
+                yield Job._jobFinished, job
+            elif kind == Job._jobFinished:
+                for predecessor in job._directPredecessors:
+                    yield Job._jobFinished, predecessor
+                for parent in parents.get(job, ()):
+                    yield Job._childrenFinished, parent
+            else:
+                for followOn in job._followOns:
+                    yield Job._jobStarted, followOn
+
+        # Iterative depth-first search, keeping the vertices on the current path in a dict so
+        # that we can detect back edges in constant time
+        visited = set()
+        for job in jobs:
+            vertex = (Job._jobStarted, job)
+            if vertex in visited:
+                continue
+            visited.add(vertex)
+            path = [vertex]
+            pathIndices = {vertex: 0}
+            iterators = [successors(vertex)]
+            while iterators:
+                for successor in iterators[-1]:
+                    if successor in pathIndices:
+                        cycle = path[pathIndices[successor]:] + [successor]
+                        # Only report each job once per visit, not each of its vertices
+                        cycle = [cycleJob for i, (_, cycleJob) in enumerate(cycle)
+                                 if i == 0 or cycle[i - 1][1] is not cycleJob]
+                        raise JobGraphDeadlockException("A cycle of job dependencies has been "
+                                                        "detected '%s'" % cycle)
+                    if successor not in visited:
+                        visited.add(successor)
+                        pathIndices[successor] = len(path)
+                        path.append(successor)
+                        iterators.append(successors(successor))
+                        break
+                else:
+                    iterators.pop()
+                    del pathIndices[path.pop()]
 
     @staticmethod
-    def _getImpliedEdges(roots):
-        """
-        Gets the set of implied edges. See Job.checkJobGraphAcylic
-        """
-        #Get nodes in job graph
-        nodes = set()
-        for root in roots:
-            root._dfs(nodes)
-
-        ##For each follow-on edge calculate the extra implied edges
-        #Adjacency list of implied edges, i.e. map of jobs to lists of jobs
-        #connected by an implied edge
-        extraEdges = dict(map(lambda n : (n, []), nodes))
-        for job in nodes:
-            if len(job._followOns) > 0:
-                #Get set of jobs connected by a directed path to job, starting
-                #with a child edge
-                reacheable = set()
-                for child in job._children:
-                    child._dfs(reacheable)
-                #Now add extra edges
-                for descendant in reacheable:
-                    extraEdges[descendant] += job._followOns[:]
-        return extraEdges
+    def _checkNewCheckpointsAreLeafVertices(jobs, roots):
+        # Check for each job for which checkpoint is true that it is a cut vertex or leaf
+        for job in jobs:
+            if job.checkpoint and job not in roots:  # The roots are the prexisting jobs
+                if not Job._isLeafVertex(job):
+                    raise JobGraphDeadlockException("New checkpoint job %s is not a leaf in the "
+                                                    "job graph" % job)
 
     ####################################################
     #The following functions are used to serialise
@@ -991,40 +1076,48 @@ class Job(JobLikeObject):
         """
         Create an empty job for the job.
         """
+        return jobStore.create(self._makeEmptyJobNode(jobStore, command=command,
+                                                      predecessorNumber=predecessorNumber))
+
+    def _makeEmptyJobNode(self, jobStore, command=None, predecessorNumber=0):
+        """
+        Create the job node from which the empty job for the job is created.
+        """
         # set _config to determine user determined default values for resource requirements
         self._config = jobStore.config
-        return jobStore.create(JobNode.fromJob(self, command=command,
-                                               predecessorNumber=predecessorNumber))
+        return JobNode.fromJob(self, command=command, predecessorNumber=predecessorNumber)
 
     def _makeJobGraphs(self, jobGraph, jobStore):
         """
-        Creates a jobGraph for each job in the job graph, recursively.
-        """
-        jobsToJobGraphs = {self:jobGraph}
-        for successors in (self._followOns, self._children):
-            jobs = map(lambda successor:
-                successor._makeJobGraphs2(jobStore, jobsToJobGraphs), successors)
-            jobGraph.stack.append(jobs)
-        return jobsToJobGraphs
-
-    def _makeJobGraphs2(self, jobStore, jobsToJobGraphs):
-        #Make the jobGraph for the job, if necessary
-        if self not in jobsToJobGraphs:
-            jobGraph = self._createEmptyJobGraphForJob(jobStore, predecessorNumber=len(self._directPredecessors))
-            jobsToJobGraphs[self] = jobGraph
-            #Add followOns/children to be run after the current job.
-            for successors in (self._followOns, self._children):
-                jobs = map(lambda successor:
-                    successor._makeJobGraphs2(jobStore, jobsToJobGraphs), successors)
-                jobGraph.stack.append(jobs)
-        else:
-            jobGraph = jobsToJobGraphs[self]
-        #The return is a tuple stored within a job.stack
-        #The tuple is jobStoreID, memory, cores, disk,
+        Creates a jobGraph for each job in the job graph. The jobGraphs of all successors are
+        created in a single batch, see :meth:`toil.jobStores.abstractJobStore.AbstractJobStore.createMany`.
+        """
+        # Collect the successors in the order they are first reached
+        jobs = []
+        visited = {self}
+        stack = [self]
+        while stack:
+            job = stack.pop()
+            for successors in (job._followOns, job._children):
+                for successor in successors:
+                    if successor not in visited:
+                        visited.add(successor)
+                        jobs.append(successor)
+                        stack.append(successor)
+        jobGraphs = jobStore.createMany([
+            job._makeEmptyJobNode(jobStore, predecessorNumber=len(job._directPredecessors))
+            for job in jobs])
+        jobsToJobGraphs = dict(zip(jobs, jobGraphs))
+        jobsToJobGraphs[self] = jobGraph
+        #Add followOns/children to be run after each job.
         #The predecessorID is used to establish which predecessors have been
         #completed before running the given Job - it is just a unique ID
         #per predecessor
-        return JobNode.fromJobGraph(jobGraph)
+        for job in [self] + jobs:
+            for successors in (job._followOns, job._children):
+                jobsToJobGraphs[job].stack.append([JobNode.fromJobGraph(jobsToJobGraphs[successor])
+                                                   for successor in successors])
+        return jobsToJobGraphs
 
     def getTopologicalOrderingOfJobs(self):
         """
@@ -1049,7 +1142,9 @@ class Job(JobLikeObject):
 
     def _serialiseJob(self, jobStore, jobsToJobGraphs, rootJobGraph):
         """
-        Pickle a job and its jobGraph to disk.
+        Pickle a job to disk and point the command of its jobGraph at the pickle. The jobGraph
+        itself is not written to the job store, which is left to the caller such that the
+        jobGraphs of several jobs can be updated in a single batch.
         """
         # Pickle the job so that its run method can be run at a later time.
         # Drop out the children/followOns/predecessors/services - which are
@@ -1059,9 +1154,17 @@ class Job(JobLikeObject):
         self._directPredecessors, self._promiseJobStore = set(), None
         # The pickled job is "run" as the command of the job, see worker
         # for the mechanism which unpickles the job and executes the Job.run
-        # method.
-        with jobStore.writeFileStream(rootJobGraph.jobStoreID) as (fileHandle, fileStoreID):
-            cPickle.dump(self, fileHandle, cPickle.HIGHEST_PROTOCOL)
+        # method. Small pickles are stored inline with the jobGraph, saving
+        # the worker a request to the job store when loading the job.
+        jobGraph = jobsToJobGraphs[self]
+        pickledJob = cPickle.dumps(self, cPickle.HIGHEST_PROTOCOL)
+        if len(pickledJob) <= jobStore.config.maxInlinedJobSize:
+            jobGraph.pickledJob = pickledJob
+            fileStoreID = 'inline'
+        else:
+            jobGraph.pickledJob = None
+            with jobStore.writeFileStream(rootJobGraph.jobStoreID) as (fileHandle, fileStoreID):
+                fileHandle.write(pickledJob)
         # Note that getUserScript() may have been overridden. This is intended. If we used
         # self.userModule directly, we'd be getting a reference to job.py if the job was
         # specified as a function (as opposed to a class) since that is where FunctionWrappingJob
@@ -1069,14 +1172,17 @@ class Job(JobLikeObject):
         # and FunctionWrappingJob overrides getUserScript() to give us just that. Only then can
         # filter_main() in _unpickle( ) do its job of resolving any user-defined type or function.
         userScript = self.getUserScript().globalize()
-        jobsToJobGraphs[self].command = ' '.join(('_toil', fileStoreID) + userScript.toCommand())
-        #Update the status of the jobGraph on disk
-        jobStore.update(jobsToJobGraphs[self])
+        jobGraph.command = ' '.join(('_toil', fileStoreID) + userScript.toCommand())
 
     def _serialiseServices(self, jobStore, jobGraph, rootJobGraph):
         """
         Serialises the services for a job.
+
+        :return: the jobGraphs of the services, which have yet to be updated in the job store
+        :rtype: list[toil.jobGraph.JobGraph]
         """
+        serviceJobGraphs = []
+
         def processService(serviceJob, depth):
             # Extend the depth of the services if necessary
             if depth == len(jobGraph.services):
@@ -1123,6 +1229,7 @@ class Job(JobLikeObject):
 
             # Serialise the service job and job wrapper
             serviceJob._serialiseJob(jobStore, { serviceJob:serviceJobGraph }, rootJobGraph)
+            serviceJobGraphs.append(serviceJobGraph)
 
             # Restore values
             #serviceJob.service = service
@@ -1132,6 +1239,7 @@ class Job(JobLikeObject):
             processService(serviceJob, 0)
 
         self._services = []
+        return serviceJobGraphs
 
     def _serialiseJobGraph(self, jobGraph, jobStore, returnValues, firstJob):
         """
@@ -1162,13 +1270,17 @@ class Job(JobLikeObject):
 
         ordering.reverse()
         assert self == ordering[-1]
+        # The jobGraphs to write once all jobs have been pickled
+        updatedJobGraphs = []
         if firstJob:
             #If the first job we serialise all the jobs, including the root job
             for job in ordering:
                 # Pickle the services for the job
-                job._serialiseServices(jobStore, jobsToJobGraphs[job], jobGraph)
+                updatedJobGraphs.extend(job._serialiseServices(jobStore, jobsToJobGraphs[job],
+                                                               jobGraph))
                 # Now pickle the job
                 job._serialiseJob(jobStore, jobsToJobGraphs, jobGraph)
+                updatedJobGraphs.append(jobsToJobGraphs[job])
         else:
             #We store the return values at this point, because if a return value
             #is a promise from another job, we need to register the promise
@@ -1177,11 +1289,16 @@ class Job(JobLikeObject):
             #Pickle the non-root jobs
             for job in ordering[:-1]:
                 # Pickle the services for the job
-                job._serialiseServices(jobStore, jobsToJobGraphs[job], jobGraph)
+                updatedJobGraphs.extend(job._serialiseServices(jobStore, jobsToJobGraphs[job],
+                                                               jobGraph))
                 # Pickle the job itself
                 job._serialiseJob(jobStore, jobsToJobGraphs, jobGraph)
+                updatedJobGraphs.append(jobsToJobGraphs[job])
             # Pickle any services for the job
-            self._serialiseServices(jobStore, jobGraph, jobGraph)
+            updatedJobGraphs.extend(self._serialiseServices(jobStore, jobGraph, jobGraph))
+        # Update the status of the jobGraphs on disk. None of them is reachable from the
+        # workflow before the caller updates the root jobGraph.
+        jobStore.updateMany(updatedJobGraphs)
 
     def _serialiseFirstJob(self, jobStore):
         """
@@ -1213,6 +1330,9 @@ class Job(JobLikeObject):
         self._serialiseJobGraph(jobGraph, jobStore, returnValues, False)
         #Drop the completed command, if not dropped already
         jobGraph.command = None
+        #A checkpoint restores its command when restarted, which needs the inlined job
+        if jobGraph.checkpoint is None:
+            jobGraph.pickledJob = None
         #Merge any children (follow-ons) created in the initial serialisation
         #with children (follow-ons) created in the subsequent scale-up.
         assert len(jobGraph.stack) >= 4
@@ -1269,6 +1389,7 @@ class Job(JobLikeObject):
                     time=str(time.time() - startTime),
                     clock=str(totalCpuTime - startClock),
                     class_name=self._jobName(),
+                    job_name=self.jobName,
                     memory=str(totalMemoryUsage)
                 )
             )
@@ -1519,6 +1640,8 @@ class EncapsulatedJob(Job):
 
 
 class ServiceJobNode(JobNode):
+    __slots__ = ('startJobStoreID', 'terminateJobStoreID', 'errorJobStoreID')
+
     def __init__(self, jobStoreID, memory, cores, disk, preemptable, startJobStoreID, terminateJobStoreID,
                  errorJobStoreID, unitName, jobName, command, predecessorNumber):
         requirements = dict(memory=memory, cores=cores, disk=disk, preemptable=preemptable)
@@ -12,9 +12,15 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 from __future__ import absolute_import
+import copy
 import logging
+import marshal
 
-from toil.job import JobNode
+# Python 3 compatibility imports
+from six.moves import cPickle
+
+from toil import internString
+from toil.job import JobNode, ServiceJobNode
 
 logger = logging.getLogger( __name__ )
 
@@ -26,6 +32,38 @@ class JobGraph(JobNode):
     scripts is persisted separately since it may be much bigger than the state managed by this
     class and should therefore only be held in memory for brief periods of time.
     """
+    __slots__ = ('remainingRetryCount', 'filesToDelete', 'predecessorsFinished', 'stack',
+                 'logJobStoreFileID', 'services', 'terminateJobStoreID', 'startJobStoreID',
+                 'errorJobStoreID', 'checkpoint', 'checkpointFilesToDelete', 'chainedJobs',
+                 'pickledJob')
+
+    # The binary representation of a job graph starts with this prefix, followed by a byte holding
+    # the version of the schema. Neither pickle protocol ever produces a string with this prefix.
+    binaryPrefix = 'TJG'
+    binaryVersion = 2
+
+    # The attributes stored in the binary representation of job nodes, service job nodes and job
+    # graphs, in the order they are stored. The _config attribute is deliberately left out as it
+    # is never set on the instances that are persisted. Changing any of these requires bumping
+    # binaryVersion and continuing to support the previous versions in fromBinary.
+    _jobNodeFields = ('jobStoreID', 'command', 'unitName', 'jobName', '_memory', '_cores',
+                      '_disk', '_preemptable', 'predecessorNumber')
+    _serviceJobNodeFields = _jobNodeFields + ('startJobStoreID', 'terminateJobStoreID',
+                                              'errorJobStoreID')
+    _jobGraphFields = _jobNodeFields + ('remainingRetryCount', 'filesToDelete',
+                                        'predecessorsFinished', 'logJobStoreFileID',
+                                        'terminateJobStoreID', 'startJobStoreID',
+                                        'errorJobStoreID', 'checkpoint',
+                                        'checkpointFilesToDelete', 'chainedJobs', 'pickledJob')
+    # The job graph attributes stored by previous versions of the binary representation. Any
+    # attribute missing from a previous version is set to None when loading that version.
+    _previousJobGraphFields = {1: _jobGraphFields[:-1]}
+
+    # The attributes whose values are typically shared by many job nodes. They are interned such
+    # that marshal stores each distinct value only once per job graph and such that the job nodes
+    # loaded from it share a single copy of each value.
+    _internedFields = frozenset(('unitName', 'jobName'))
+
     def __init__(self, command, memory, cores, disk, unitName, jobName, preemptable,
                  jobStoreID, remainingRetryCount, predecessorNumber,
                  filesToDelete=None, predecessorsFinished=None,
@@ -35,7 +73,8 @@ class JobGraph(JobNode):
                  logJobStoreFileID=None,
                  checkpoint=None,
                  checkpointFilesToDelete=None,
-                 chainedJobs=None):
+                 chainedJobs=None,
+                 pickledJob=None):
         requirements = {'memory': memory, 'cores': cores, 'disk': disk,
                         'preemptable': preemptable}
         super(JobGraph, self).__init__(command=command,
@@ -95,6 +134,10 @@ class JobGraph(JobNode):
         # this job
         self.chainedJobs = chainedJobs
 
+        # The pickled job referenced by the command if it is small enough to be stored inline
+        # with the job graph instead of in a file of its own, see Job._serialiseJob
+        self.pickledJob = pickledJob
+
     def setupJobAfterFailure(self, config):
         """
         Reduce the remainingRetryCount if greater than zero and set the memory
@@ -162,6 +205,97 @@ class JobGraph(JobNode):
                 jobStore.update(self)
         return successorsDeleted
 
+    def toBinary(self):
+        """
+        Returns a compact, versioned binary representation of this job graph for job stores to
+        persist. It is several times smaller and faster to produce and parse than a pickle.
+
+        :rtype: str
+        """
+        fields = self._fieldValues(self, self._jobGraphFields)
+        try:
+            stack = [[self._jobNodeToTuple(jobNode) for jobNode in jobNodes]
+                     for jobNodes in self.stack]
+            services = [[self._jobNodeToTuple(jobNode) for jobNode in jobNodes]
+                        for jobNodes in self.services]
+            binary = marshal.dumps((fields, stack, services), 2)
+        except ValueError:
+            # One of the attributes holds a value we can't represent, e.g. an instance of a
+            # subclass of int. This is rare enough for us to simply fall back to pickling.
+            return cPickle.dumps(self, protocol=cPickle.HIGHEST_PROTOCOL)
+        return self.binaryPrefix + chr(self.binaryVersion) + binary
+
+    @classmethod
+    def fromBinary(cls, binary):
+        """
+        Returns the job graph represented by the given string, as returned by :meth:`toBinary`.
+        Pickled job graphs, as persisted by older versions of Toil, are accepted as well.
+
+        :param str binary: the binary representation of the job graph
+
+        :rtype: toil.jobGraph.JobGraph
+        """
+        if not binary.startswith(cls.binaryPrefix):
+            return cPickle.loads(binary)
+        version = ord(binary[len(cls.binaryPrefix)])
+        if version == cls.binaryVersion:
+            fieldNames = cls._jobGraphFields
+        elif version in cls._previousJobGraphFields:
+            fieldNames = cls._previousJobGraphFields[version]
+        else:
+            raise ValueError("Unsupported version %i of the binary job graph format." % version)
+        # Unmarshal from a buffer rather than a slice, which would copy the potentially large
+        # binary representation
+        fields, stack, services = marshal.loads(buffer(binary, len(cls.binaryPrefix) + 1))
+        self = cls._fromTuple(cls, fieldNames, fields)
+        for name in cls._jobGraphFields[len(fieldNames):]:
+            setattr(self, name, None)
+        self.stack = [cls._jobNodesFromTuples(jobNodes) for jobNodes in stack]
+        self.services = [cls._jobNodesFromTuples(jobNodes) for jobNodes in services]
+        return self
+
+    @classmethod
+    def _jobNodeToTuple(cls, jobNode):
+        if type(jobNode) is JobNode:
+            return cls._fieldValues(jobNode, cls._jobNodeFields)
+        elif type(jobNode) is ServiceJobNode:
+            return cls._fieldValues(jobNode, cls._serviceJobNodeFields)
+        else:
+            raise ValueError("Cannot convert a %s to binary." % type(jobNode))
+
+    @classmethod
+    def _fieldValues(cls, obj, names):
+        return tuple(internString(getattr(obj, name)) if name in cls._internedFields
+                     else getattr(obj, name)
+                     for name in names)
+
+    @classmethod
+    def _jobNodesFromTuples(cls, tuples):
+        # Consume the tuples as we go such that the memory of each tuple can be reused for the
+        # job nodes created after it. A job graph can have a very large number of successors.
+        tuples.reverse()
+        jobNodes = []
+        while tuples:
+            jobNodes.append(cls._jobNodeFromTuple(tuples.pop()))
+        return jobNodes
+
+    @classmethod
+    def _jobNodeFromTuple(cls, values):
+        if len(values) == len(cls._jobNodeFields):
+            return cls._fromTuple(JobNode, cls._jobNodeFields, values)
+        else:
+            return cls._fromTuple(ServiceJobNode, cls._serviceJobNodeFields, values)
+
+    @staticmethod
+    def _fromTuple(nodeCls, names, values):
+        # Bypass the constructor, which would parse the requirements again
+        node = nodeCls.__new__(nodeCls)
+        for name, value in zip(names, values):
+            setattr(node, name, value)
+        node._config = None
+        node.priority = 0
+        return node
+
     def getLogFileHandle( self, jobStore ):
         """
         Returns a context manager that yields a file handle to the log file
@@ -186,6 +320,25 @@ class JobGraph(JobNode):
                    unitName=jobNode.unitName, jobName=jobNode.jobName,
                    **jobNode._requirements)
 
+    def copy(self):
+        """
+        Returns a copy of this job graph that can be modified without affecting this one, e.g.
+        while this one is being written to the job store in the background. Unlike a deep copy,
+        the copy shares the job nodes in the stack and the services, which are never modified.
+
+        :rtype: toil.jobGraph.JobGraph
+        """
+        jobGraph = copy.copy(self)
+        jobGraph.stack = [list(jobNodes) for jobNodes in self.stack]
+        jobGraph.services = [list(jobNodes) for jobNodes in self.services]
+        jobGraph.filesToDelete = list(self.filesToDelete)
+        jobGraph.predecessorsFinished = set(self.predecessorsFinished)
+        if self.checkpointFilesToDelete is not None:
+            jobGraph.checkpointFilesToDelete = list(self.checkpointFilesToDelete)
+        if self.chainedJobs is not None:
+            jobGraph.chainedJobs = list(self.chainedJobs)
+        return jobGraph
+
     def __eq__(self, other):
         return (
             isinstance(other, self.__class__)
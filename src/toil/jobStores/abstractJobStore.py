@@ -26,8 +26,6 @@ from six import itervalues
 from six.moves.urllib.request import urlopen
 import six.moves.urllib.parse as urlparse
 
-from bd2k.util.retry import retry_http
-
 from toil.fileStore import FileID
 from toil.job import JobException
 from bd2k.util import memoize
@@ -140,17 +138,30 @@ class AbstractJobStore(object):
         with self.writeSharedFileStream('config.pickle', isProtected=False) as fileHandle:
             cPickle.dump(self.__config, fileHandle, cPickle.HIGHEST_PROTOCOL)
 
-    def resume(self):
+    def resume(self, config=None):
         """
         Connect this instance to the physical storage it represents and load the Toil configuration
         into the :attr:`AbstractJobStore.config` attribute.
 
+        :param toil.common.Config config: the configuration persisted to the store, if it is known
+               already, in which case it isn't loaded again
+
         :raises NoSuchJobStoreException: if the physical storage for this job store doesn't exist
         """
-        with self.readSharedFileStream('config.pickle') as fileHandle:
-            config = cPickle.load(fileHandle)
-            assert config.workflowID is not None
-            self.__config = config
+        if config is None:
+            with self.readSharedFileStream('config.pickle') as fileHandle:
+                config = cPickle.load(fileHandle)
+        assert config.workflowID is not None
+        self.__config = config
+
+    def compact(self):
+        """
+        Reclaims the space taken by the bookkeeping of this job store that grows while a workflow
+        runs, and repairs it if it was lost. Only the leader calls this, when it restarts the
+        workflow, but workers left over from the previous attempt may still be using the store.
+        The default implementation does nothing.
+        """
+        pass
 
     @property
     def config(self):
@@ -439,10 +450,21 @@ class AbstractJobStore(object):
                 try:
                     return jobCache[jobId]
                 except KeyError:
-                    self.load(jobId)
+                    return self.load(jobId)
             else:
                 return self.load(jobId)
 
+        def getJobsThatExist(jobIds):
+            jobs = {}
+            if jobCache is not None:
+                for jobId in jobIds:
+                    try:
+                        jobs[jobId] = jobCache[jobId]
+                    except KeyError:
+                        pass
+            jobs.update(self.loadMany([jobId for jobId in jobIds if jobId not in jobs]))
+            return jobs
+
         def haveJob(jobId):
             if jobCache is not None:
                 if jobId in jobCache:
@@ -461,23 +483,32 @@ class AbstractJobStore(object):
         # Iterate from the root jobGraph and collate all jobs that are reachable from it
         # All other jobs returned by self.jobs() are orphaned and can be removed
         reachableFromRoot = set()
-
-        def getConnectedJobs(jobGraph):
-            if jobGraph.jobStoreID in reachableFromRoot:
-                return
-            reachableFromRoot.add(jobGraph.jobStoreID)
-            # Traverse jobs in stack
-            for jobs in jobGraph.stack:
-                for successorJobStoreID in map(lambda x: x.jobStoreID, jobs):
-                    if (successorJobStoreID not in reachableFromRoot
-                        and haveJob(successorJobStoreID)):
-                        getConnectedJobs(getJob(successorJobStoreID))
-            # Traverse service jobs
-            for jobs in jobGraph.services:
-                for serviceJobStoreID in map(lambda x: x.jobStoreID, jobs):
-                    if haveJob(serviceJobStoreID):
-                        assert serviceJobStoreID not in reachableFromRoot
-                        reachableFromRoot.add(serviceJobStoreID)
+        # The non-service jobs among them, keyed by their ID
+        loadedJobGraphs = {}
+
+        def getConnectedJobs(rootJobGraph):
+            # Traverse the graph breadth-first, loading the successors of each frontier in bulk
+            frontier = [rootJobGraph]
+            reachableFromRoot.add(rootJobGraph.jobStoreID)
+            loadedJobGraphs[rootJobGraph.jobStoreID] = rootJobGraph
+            while len(frontier) > 0:
+                successorJobStoreIDs = set()
+                for jobGraph in frontier:
+                    # Traverse jobs in stack
+                    for jobs in jobGraph.stack:
+                        for successorJobStoreID in map(lambda x: x.jobStoreID, jobs):
+                            if successorJobStoreID not in reachableFromRoot:
+                                successorJobStoreIDs.add(successorJobStoreID)
+                    # Traverse service jobs
+                    for jobs in jobGraph.services:
+                        for serviceJobStoreID in map(lambda x: x.jobStoreID, jobs):
+                            if haveJob(serviceJobStoreID):
+                                assert serviceJobStoreID not in reachableFromRoot
+                                reachableFromRoot.add(serviceJobStoreID)
+                successorJobGraphs = getJobsThatExist(successorJobStoreIDs)
+                reachableFromRoot.update(successorJobGraphs)
+                loadedJobGraphs.update(successorJobGraphs)
+                frontier = successorJobGraphs.values()
 
         logger.info("Checking job graph connectivity...")
         getConnectedJobs(self.loadRootJob())
@@ -495,7 +526,8 @@ class AbstractJobStore(object):
             # Delete the job
             self.delete(jobGraph.jobStoreID)
 
-        jobGraphsReachableFromRoot = {id: getJob(id) for id in reachableFromRoot}
+        jobGraphsReachableFromRoot = {id: loadedJobGraphs[id] if id in loadedJobGraphs else getJob(id)
+                                      for id in reachableFromRoot}
 
         # Clean up any checkpoint jobs -- delete any successors it
         # may have launched, and restore the job to a pristine
@@ -515,122 +547,151 @@ class AbstractJobStore(object):
 
         # Clean up jobs that are in reachable from the root
         for jobGraph in jobGraphsReachableFromRoot.values():
-            # jobGraphs here are necessarily in reachable from root.
+            self.cleanJob(jobGraph, jobCache=jobCache)
 
-            changed = [False]  # This is a flag to indicate the jobGraph state has
-            # changed
+        # Remove any crufty stats/logging files from the previous run
+        self.discardStatsAndLogging()
 
-            # If the job has files to delete delete them.
-            if len(jobGraph.filesToDelete) != 0:
-                # Delete any files that should already be deleted
-                for fileID in jobGraph.filesToDelete:
-                    logger.critical("Removing file in job store: %s that was "
-                                    "marked for deletion but not previously removed" % fileID)
-                    self.deleteFile(fileID)
-                jobGraph.filesToDelete = []
-                changed[0] = True
+        logger.info("Job store is clean")
+        # TODO: reloading of the rootJob may be redundant here
+        return self.loadRootJob()
 
-            # For a job whose command is already executed, remove jobs from the stack that are
-            # already deleted. This cleans up the case that the jobGraph had successors to run,
-            # but had not been updated to reflect this.
-            if jobGraph.command is None:
-                stackSizeFn = lambda: sum(map(len, jobGraph.stack))
-                startStackSize = stackSizeFn()
-                # Remove deleted jobs
-                jobGraph.stack = map(lambda x: filter(lambda y: self.exists(y.jobStoreID), x),
-                                       jobGraph.stack)
-                # Remove empty stuff from the stack
-                jobGraph.stack = filter(lambda x: len(x) > 0, jobGraph.stack)
-                # Check if anything got removed
-                if stackSizeFn() != startStackSize:
-                    changed[0] = True
-
-            # Cleanup any services that have already been finished.
-            # Filter out deleted services and update the flags for services that exist
-            # If there are services then renew
-            # the start and terminate flags if they have been removed
-            def subFlagFile(jobStoreID, jobStoreFileID, flag):
-                if self.fileExists(jobStoreFileID):
-                    return jobStoreFileID
-
-                # Make a new flag
-                newFlag = self.getEmptyFileStoreID()
-
-                # Load the jobGraph for the service and initialise the link
-                serviceJobGraph = getJob(jobStoreID)
-
-                if flag == 1:
-                    logger.debug("Recreating a start service flag for job: %s, flag: %s",
-                                 jobStoreID, newFlag)
-                    serviceJobGraph.startJobStoreID = newFlag
-                elif flag == 2:
-                    logger.debug("Recreating a terminate service flag for job: %s, flag: %s",
-                                 jobStoreID, newFlag)
-                    serviceJobGraph.terminateJobStoreID = newFlag
-                else:
-                    logger.debug("Recreating a error service flag for job: %s, flag: %s",
-                                 jobStoreID, newFlag)
-                    assert flag == 3
-                    serviceJobGraph.errorJobStoreID = newFlag
+    def discardStatsAndLogging(self):
+        """
+        Discards the stats and logging files left by a previous attempt at running the workflow
+        that its leader didn't get to process. Done on restart, as part of :meth:`clean` or
+        before the leader restores its state from its journal.
+        """
+        logger.info("Discarding old statistics and logs...")
+        # We have to manually discard the stream to avoid getting
+        # stuck on a blocking write from the job store.
+        def discardStream(stream):
+            """Read the stream 4K at a time until EOF, discarding all input."""
+            while len(stream.read(4096)) != 0:
+                pass
+        self.readStatsAndLogging(discardStream)
+
+    def cleanJob(self, jobGraph, jobCache=None):
+        """
+        Repairs the given job after a restart, as part of :meth:`clean`. Deletes the files the
+        job has marked for deletion, removes deleted jobs from its stack and services, renews
+        the flags of its services, resets its retry count and deletes its log file. The job is
+        updated in the job store if anything changed.
+
+        :param toil.jobGraph.JobGraph jobGraph: the job to repair
+
+        :param dict[str,toil.jobGraph.JobGraph] jobCache: if a value it must be a dict
+               from job ID keys to JobGraph object values, from which the job's services are
+               taken instead of being loaded from the job store
+        """
+        def getJob(jobId):
+            if jobCache is not None:
+                try:
+                    return jobCache[jobId]
+                except KeyError:
+                    pass
+            return self.load(jobId)
 
-                # Update the service job on disk
-                self.update(serviceJobGraph)
+        changed = [False]  # This is a flag to indicate the jobGraph state has
+        # changed
 
+        # If the job has files to delete delete them.
+        if len(jobGraph.filesToDelete) != 0:
+            # Delete any files that should already be deleted
+            for fileID in jobGraph.filesToDelete:
+                logger.critical("Removing file in job store: %s that was "
+                                "marked for deletion but not previously removed" % fileID)
+                self.deleteFile(fileID)
+            jobGraph.filesToDelete = []
+            changed[0] = True
+
+        # For a job whose command is already executed, remove jobs from the stack that are
+        # already deleted. This cleans up the case that the jobGraph had successors to run,
+        # but had not been updated to reflect this.
+        if jobGraph.command is None:
+            stackSizeFn = lambda: sum(map(len, jobGraph.stack))
+            startStackSize = stackSizeFn()
+            # Remove deleted jobs
+            jobGraph.stack = map(lambda x: filter(lambda y: self.exists(y.jobStoreID), x),
+                                   jobGraph.stack)
+            # Remove empty stuff from the stack
+            jobGraph.stack = filter(lambda x: len(x) > 0, jobGraph.stack)
+            # Check if anything got removed
+            if stackSizeFn() != startStackSize:
                 changed[0] = True
 
-                return newFlag
+        # Cleanup any services that have already been finished.
+        # Filter out deleted services and update the flags for services that exist
+        # If there are services then renew
+        # the start and terminate flags if they have been removed
+        def subFlagFile(jobStoreID, jobStoreFileID, flag):
+            if self.fileExists(jobStoreFileID):
+                return jobStoreFileID
+
+            # Make a new flag
+            newFlag = self.getEmptyFileStoreID()
+
+            # Load the jobGraph for the service and initialise the link
+            serviceJobGraph = getJob(jobStoreID)
+
+            if flag == 1:
+                logger.debug("Recreating a start service flag for job: %s, flag: %s",
+                             jobStoreID, newFlag)
+                serviceJobGraph.startJobStoreID = newFlag
+            elif flag == 2:
+                logger.debug("Recreating a terminate service flag for job: %s, flag: %s",
+                             jobStoreID, newFlag)
+                serviceJobGraph.terminateJobStoreID = newFlag
+            else:
+                logger.debug("Recreating a error service flag for job: %s, flag: %s",
+                             jobStoreID, newFlag)
+                assert flag == 3
+                serviceJobGraph.errorJobStoreID = newFlag
 
-            servicesSizeFn = lambda: sum(map(len, jobGraph.services))
-            startServicesSize = servicesSizeFn()
+            # Update the service job on disk
+            self.update(serviceJobGraph)
 
-            def replaceFlagsIfNeeded(serviceJobNode):
-                serviceJobNode.startJobStoreID = subFlagFile(serviceJobNode.jobStoreID, serviceJobNode.startJobStoreID, 1)
-                serviceJobNode.terminateJobStoreID = subFlagFile(serviceJobNode.jobStoreID, serviceJobNode.terminateJobStoreID, 2)
-                serviceJobNode.errorJobStoreID = subFlagFile(serviceJobNode.jobStoreID, serviceJobNode.errorJobStoreID, 3)
+            changed[0] = True
 
-            # jobGraph.services is a list of lists containing serviceNodes
-            # remove all services that no longer exist
-            services = jobGraph.services
-            jobGraph.services = []
-            for serviceList in services:
-                existingServices = filter(lambda service: self.exists(service.jobStoreID), serviceList)
-                if existingServices:
-                    jobGraph.services.append(existingServices)
+            return newFlag
 
-            map(lambda serviceList: map(replaceFlagsIfNeeded, serviceList), jobGraph.services)
+        servicesSizeFn = lambda: sum(map(len, jobGraph.services))
+        startServicesSize = servicesSizeFn()
 
-            if servicesSizeFn() != startServicesSize:
-                changed[0] = True
+        def replaceFlagsIfNeeded(serviceJobNode):
+            serviceJobNode.startJobStoreID = subFlagFile(serviceJobNode.jobStoreID, serviceJobNode.startJobStoreID, 1)
+            serviceJobNode.terminateJobStoreID = subFlagFile(serviceJobNode.jobStoreID, serviceJobNode.terminateJobStoreID, 2)
+            serviceJobNode.errorJobStoreID = subFlagFile(serviceJobNode.jobStoreID, serviceJobNode.errorJobStoreID, 3)
 
-            # Reset the retry count of the jobGraph
-            if jobGraph.remainingRetryCount != self._defaultTryCount():
-                jobGraph.remainingRetryCount = self._defaultTryCount()
-                changed[0] = True
+        # jobGraph.services is a list of lists containing serviceNodes
+        # remove all services that no longer exist
+        services = jobGraph.services
+        jobGraph.services = []
+        for serviceList in services:
+            existingServices = filter(lambda service: self.exists(service.jobStoreID), serviceList)
+            if existingServices:
+                jobGraph.services.append(existingServices)
 
-            # This cleans the old log file which may
-            # have been left if the jobGraph is being retried after a jobGraph failure.
-            if jobGraph.logJobStoreFileID != None:
-                self.delete(jobGraph.logJobStoreFileID)
-                jobGraph.logJobStoreFileID = None
-                changed[0] = True
+        map(lambda serviceList: map(replaceFlagsIfNeeded, serviceList), jobGraph.services)
 
-            if changed[0]:  # Update, but only if a change has occurred
-                logger.critical("Repairing job: %s" % jobGraph.jobStoreID)
-                self.update(jobGraph)
+        if servicesSizeFn() != startServicesSize:
+            changed[0] = True
 
-        # Remove any crufty stats/logging files from the previous run
-        logger.info("Discarding old statistics and logs...")
-        # We have to manually discard the stream to avoid getting
-        # stuck on a blocking write from the job store.
-        def discardStream(stream):
-            """Read the stream 4K at a time until EOF, discarding all input."""
-            while len(stream.read(4096)) != 0:
-                pass
-        self.readStatsAndLogging(discardStream)
+        # Reset the retry count of the jobGraph
+        if jobGraph.remainingRetryCount != self._defaultTryCount():
+            jobGraph.remainingRetryCount = self._defaultTryCount()
+            changed[0] = True
 
-        logger.info("Job store is clean")
-        # TODO: reloading of the rootJob may be redundant here
-        return self.loadRootJob()
+        # This cleans the old log file which may
+        # have been left if the jobGraph is being retried after a jobGraph failure.
+        if jobGraph.logJobStoreFileID != None:
+            self.delete(jobGraph.logJobStoreFileID)
+            jobGraph.logJobStoreFileID = None
+            changed[0] = True
+
+        if changed[0]:  # Update, but only if a change has occurred
+            logger.critical("Repairing job: %s" % jobGraph.jobStoreID)
+            self.update(jobGraph)
 
     ##########################################
     # The following methods deal with creating/loading/updating/writing/checking for the
@@ -646,6 +707,19 @@ class AbstractJobStore(object):
         """
         raise NotImplementedError()
 
+    def createMany(self, jobNodes):
+        """
+        Creates a job graph from each of the given job nodes & writes them to the job store. Job
+        stores that can write several jobs in a single request should override this method. The
+        default implementation invokes :meth:`create` for each job node.
+
+        :param list[toil.job.JobNode] jobNodes: the job nodes to create job graphs from
+
+        :return: the created job graphs, in the order of the given job nodes
+        :rtype: list[toil.jobGraph.JobGraph]
+        """
+        return [self.create(jobNode) for jobNode in jobNodes]
+
     @abstractmethod
     def exists(self, jobStoreID):
         """
@@ -704,6 +778,26 @@ class AbstractJobStore(object):
         """
         raise NotImplementedError()
 
+    def loadMany(self, jobStoreIDs):
+        """
+        Loads the jobs referenced by the given IDs. Job stores that can fetch several jobs in a
+        single request should override this method. The default implementation invokes
+        :meth:`load` for each ID.
+
+        :param list[str] jobStoreIDs: the IDs of the jobs to load
+
+        :return: A dictionary mapping the ID of each job that exists in this job store to the
+                 loaded job. The IDs of jobs that do not exist are omitted.
+        :rtype: dict[str,toil.jobGraph.JobGraph]
+        """
+        jobs = {}
+        for jobStoreID in jobStoreIDs:
+            try:
+                jobs[jobStoreID] = self.load(jobStoreID)
+            except NoSuchJobException:
+                pass
+        return jobs
+
     @abstractmethod
     def update(self, job):
         """
@@ -713,6 +807,48 @@ class AbstractJobStore(object):
         """
         raise NotImplementedError()
 
+    def updateMany(self, jobs):
+        """
+        Persists each of the given jobs in this store. Each individual job is persisted
+        atomically but the batch as a whole is not. Job stores that can write several jobs in a
+        single request should override this method. The default implementation invokes
+        :meth:`update` for each job.
+
+        :param list[toil.jobGraph.JobGraph] jobs: the jobs to write to this job store
+        """
+        for job in jobs:
+            self.update(job)
+
+    def supportsConditionalUpdates(self):
+        """
+        Whether this job store implements :meth:`updateIfUnchanged`. The leader only runs jobs
+        speculatively if it does.
+
+        :rtype: bool
+        """
+        return False
+
+    def updateIfUnchanged(self, job, expectedCommand, expectedPickledJob=None):
+        """
+        Persists the job in this store atomically, provided the command and the inlined pickled
+        job of the stored version of the job are still the given ones. The pickled job is
+        compared as well because the commands of jobs stored inline are all alike. Checking the stored job and persisting the given one is a
+        single atomic operation with respect to other invocations of this method for the same job.
+        This lets exactly one of several attempts at running the same job complete it.
+
+        :param toil.jobGraph.JobGraph job: the job to write to this job store
+
+        :param str expectedCommand: the command of the job as loaded by the caller
+
+        :param str expectedPickledJob: the pickled job stored inline with the job as loaded by the
+               caller, if any
+
+        :return: True if the job was persisted, False if the stored job was changed or deleted
+                 since the caller loaded it
+        :rtype: bool
+        """
+        raise NotImplementedError()
+
     @abstractmethod
     def delete(self, jobStoreID):
         """
@@ -813,7 +949,7 @@ class AbstractJobStore(object):
         raise NotImplementedError()
 
     @abstractmethod
-    def readFile(self, jobStoreFileID, localFilePath):
+    def readFile(self, jobStoreFileID, localFilePath, parallelism=1):
         """
         Copies the file referenced by jobStoreFileID to the given local file path. The version
         will be consistent with the last copy of the file written/updated.
@@ -824,6 +960,11 @@ class AbstractJobStore(object):
 
         :param str localFilePath: the local path indicating where to place the contents of the
                given file in the job store
+
+        :param int parallelism: the maximum number of concurrent requests used to download the
+               file. Job stores backed by an object store that supports ranged reads split the
+               file into this many ranges and download them in parallel into a preallocated
+               local file. Other job stores ignore this parameter.
         """
         raise NotImplementedError()
 
@@ -994,6 +1135,7 @@ class JobStoreSupport(AbstractJobStore):
     def getSize(cls, url):
         if url.scheme.lower() == 'ftp':
             return None
+        from bd2k.util.retry import retry_http
         for attempt in retry_http():
             with attempt:
                 with closing(urlopen(url.geturl())) as readable:
@@ -1002,6 +1144,7 @@ class JobStoreSupport(AbstractJobStore):
 
     @classmethod
     def _readFromUrl(cls, url, writable):
+        from bd2k.util.retry import retry_http
         for attempt in retry_http():
             with attempt:
                 with closing(urlopen(url.geturl())) as readable:
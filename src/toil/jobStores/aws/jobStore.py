@@ -26,7 +26,7 @@ import urlparse
 import urllib
 
 # Python 3 compatibility imports
-from six.moves import xrange, cPickle, StringIO, reprlib
+from six.moves import xrange, StringIO, reprlib
 from six import iteritems
 
 from bd2k.util import strict_bool
@@ -52,7 +52,7 @@ from toil.jobStores.aws.utils import (SDBHelper,
                                       bucket_location_to_region,
                                       region_to_bucket_location, copyKeyMultipart,
                                       uploadFromPath, chunkedFileUpload, fileSizeAndTime)
-from toil.jobStores.utils import WritablePipe, ReadablePipe
+from toil.jobStores.utils import WritablePipe, ReadablePipe, downloadInParallel
 from toil.jobGraph import JobGraph
 import toil.lib.encryption as encryption
 
@@ -132,11 +132,11 @@ class AWSJobStore(AbstractJobStore):
     def sseKeyPath(self):
         return self.config.sseKey
 
-    def resume(self):
+    def resume(self, config=None):
         if not self._registered:
             raise NoSuchJobStoreException(self.locator)
         self._bind(create=False)
-        super(AWSJobStore, self).resume()
+        super(AWSJobStore, self).resume(config)
 
     def _bind(self, create=False, block=True):
         def qualify(name):
@@ -233,11 +233,11 @@ class AWSJobStore(AbstractJobStore):
         else:
             binary,_ = SDBHelper.attributesToBinary(item)
             assert binary is not None
-        job = cPickle.loads(binary)
+        job = JobGraph.fromBinary(binary)
         return job
 
     def _awsJobToItem(self, job):
-        binary = cPickle.dumps(job, protocol=cPickle.HIGHEST_PROTOCOL)
+        binary = job.toBinary()
         if len(binary) > SDBHelper.maxBinarySize():
             #Store as an overlarge job in S3
             with self.writeFileStream() as (writable, fileID):
@@ -260,6 +260,47 @@ class AWSJobStore(AbstractJobStore):
                 assert self.jobsDomain.put_attributes(job.jobStoreID, item)
         return job
 
+    # SimpleDB allows at most 25 items and 1MB of attribute names and values per batch put
+    itemsPerBatchPut = 25
+    bytesPerBatchPut = 1024 * 1024
+
+    def createMany(self, jobNodes):
+        jobs = []
+        for jobNode in jobNodes:
+            jobStoreID = self._newJobID()
+            log.debug("Creating job %s for '%s'",
+                      jobStoreID, '<no command>' if jobNode.command is None else jobNode.command)
+            jobs.append(JobGraph.fromJobNode(jobNode, jobStoreID=jobStoreID,
+                                             tryCount=self._defaultTryCount()))
+        self._putJobs(jobs)
+        return jobs
+
+    def _putJobs(self, jobs):
+        """
+        Writes the given jobs to SimpleDB using as few batch puts as the limits on the number and
+        size of the items in a single request allow.
+
+        :param list[JobGraph] jobs: the jobs to write
+        """
+        def putBatch(batch):
+            for attempt in retry_sdb():
+                with attempt:
+                    assert self.jobsDomain.batch_put_attributes(batch)
+
+        batch, batchSize = {}, 0
+        for job in jobs:
+            item = self._awsJobToItem(job)
+            itemSize = len(job.jobStoreID) + sum(len(name) + len(value)
+                                                 for name, value in iteritems(item))
+            if batch and (len(batch) == self.itemsPerBatchPut
+                          or batchSize + itemSize > self.bytesPerBatchPut):
+                putBatch(batch)
+                batch, batchSize = {}, 0
+            batch[job.jobStoreID] = item
+            batchSize += itemSize
+        if batch:
+            putBatch(batch)
+
     def exists(self, jobStoreID):
         for attempt in retry_sdb():
             with attempt:
@@ -292,6 +333,30 @@ class AWSJobStore(AbstractJobStore):
         log.debug("Loaded job %s", jobStoreID)
         return job
 
+    # SimpleDB allows at most 20 comparisons per select expression
+    itemsPerBatchLoad = 20
+
+    def loadMany(self, jobStoreIDs):
+        jobStoreIDs = list(set(jobStoreIDs))
+        jobs = {}
+        n = self.itemsPerBatchLoad
+        for batch in (jobStoreIDs[i:i + n] for i in range(0, len(jobStoreIDs), n)):
+            items = None
+            for attempt in retry_sdb():
+                with attempt:
+                    items = list(self.jobsDomain.select(
+                        consistent_read=True,
+                        query="select * from `%s` where itemName() in (%s)" % (
+                            self.jobsDomain.name,
+                            ', '.join("'%s'" % jobStoreID for jobStoreID in batch))))
+            assert items is not None
+            for item in items:
+                job = self._awsJobFromItem(item)
+                if job is not None:
+                    jobs[job.jobStoreID] = job
+        log.debug("Loaded %d of %d requested jobs", len(jobs), len(jobStoreIDs))
+        return jobs
+
     def update(self, job):
         log.debug("Updating job %s", job.jobStoreID)
         item = self._awsJobToItem(job)        
@@ -299,6 +364,10 @@ class AWSJobStore(AbstractJobStore):
             with attempt:
                 assert self.jobsDomain.put_attributes(job.jobStoreID, item)
 
+    def updateMany(self, jobs):
+        log.debug("Updating %d job(s)", len(jobs))
+        self._putJobs(jobs)
+
     itemsPerBatchDelete = 25
 
     def delete(self, jobStoreID):
@@ -520,10 +589,10 @@ class AWSJobStore(AbstractJobStore):
     def fileExists(self, jobStoreFileID):
         return self.FileInfo.exists(jobStoreFileID)
 
-    def readFile(self, jobStoreFileID, localFilePath):
+    def readFile(self, jobStoreFileID, localFilePath, parallelism=1):
         info = self.FileInfo.loadOrFail(jobStoreFileID)
         log.debug("Reading %r into %r.", info, localFilePath)
-        info.download(localFilePath)
+        info.download(localFilePath, parallelism=parallelism)
 
     @contextmanager
     def readFileStream(self, jobStoreFileID):
@@ -1124,21 +1193,50 @@ class AWSJobStore(AbstractJobStore):
                                                       metadata=srcKey.metadata,
                                                       headers=headers)
 
-        def download(self, localFilePath):
+        def download(self, localFilePath, parallelism=1):
+            """
+            Downloads the content of this file to the given local path.
+
+            :param str localFilePath: the local path to download to
+            :param int parallelism: if greater than 1, the number of ranged GET requests to
+                   split the download into, all of which are run concurrently
+            """
             if self.content is not None:
                 with open(localFilePath, 'w') as f:
                     f.write(self.content)
             elif self.version:
                 headers = self._s3EncryptionHeaders()
-                key = self.outer.filesBucket.get_key(self.fileID, validate=False)
-                for attempt in retry_s3():
-                    with attempt:
-                        key.get_contents_to_filename(localFilePath,
-                                                     version_id=self.version,
-                                                     headers=headers)
+                if parallelism > 1:
+                    for attempt in retry_s3():
+                        with attempt:
+                            key = self.outer.filesBucket.get_key(self.fileID,
+                                                                 headers=headers,
+                                                                 version_id=self.version)
+                    downloadInParallel(localFilePath, key.size, parallelism,
+                                       self._downloadRange)
+                else:
+                    key = self.outer.filesBucket.get_key(self.fileID, validate=False)
+                    for attempt in retry_s3():
+                        with attempt:
+                            key.get_contents_to_filename(localFilePath,
+                                                         version_id=self.version,
+                                                         headers=headers)
             else:
                 assert False
 
+        def _downloadRange(self, start, end, writable):
+            # Boto keys aren't thread-safe so each range needs its own
+            key = self.outer.filesBucket.get_key(self.fileID, validate=False)
+            headers = self._s3EncryptionHeaders()
+            # S3 range intervals are closed at the end
+            headers['Range'] = 'bytes=%d-%d' % (start, end - 1)
+            for attempt in retry_s3():
+                with attempt:
+                    writable.seek(start)
+                    key.get_contents_to_file(writable,
+                                             version_id=self.version,
+                                             headers=headers)
+
         @contextmanager
         def downloadStream(self):
             info = self
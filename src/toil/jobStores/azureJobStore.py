@@ -26,7 +26,6 @@ from contextlib import contextmanager
 from datetime import datetime, timedelta
 
 # Python 3 compatibility imports
-from six.moves import cPickle
 from six.moves.http_client import HTTPException
 from six.moves.configparser import RawConfigParser, NoOptionError
 
@@ -42,7 +41,7 @@ from bd2k.util import strict_bool, memoize
 from bd2k.util.exceptions import panic
 from bd2k.util.retry import retry
 
-from toil.jobStores.utils import WritablePipe, ReadablePipe
+from toil.jobStores.utils import WritablePipe, ReadablePipe, downloadInParallel
 from toil.jobGraph import JobGraph
 from toil.jobStores.abstractJobStore import (AbstractJobStore,
                                              NoSuchJobException,
@@ -157,12 +156,12 @@ class AzureJobStore(AbstractJobStore):
         self._bind(create=True)
         super(AzureJobStore, self).initialize(config)
 
-    def resume(self):
+    def resume(self, config=None):
         if not self._jobStoreExists():
             raise NoSuchJobStoreException(self.locator)
         logger.debug("Using existing job store at '%s'" % self.locator)
         self._bind(create=False)
-        super(AzureJobStore, self).resume()
+        super(AzureJobStore, self).resume(config)
 
     def destroy(self):
         self._bind()
@@ -233,6 +232,46 @@ class AzureJobStore(AbstractJobStore):
         self.jobItems.insert_entity(entity=entity)
         return job
 
+    # An entity group transaction may contain at most 100 entities and 4MB of payload
+    entitiesPerBatchWrite = 100
+    bytesPerBatchWrite = 4 * 1000 * 1000
+
+    def createMany(self, jobNodes):
+        jobs = [AzureJob.fromJobNode(jobNode, self._newJobID(), self._defaultTryCount())
+                for jobNode in jobNodes]
+        # The IDs are fresh so replacing instead of inserting makes a retried batch idempotent
+        self._writeJobs('insert_or_replace_entity', jobs)
+        return jobs
+
+    def updateMany(self, jobs):
+        self._writeJobs('update_entity', jobs)
+
+    def _writeJobs(self, operation, jobs):
+        """
+        Writes the given jobs to the job table using as few entity group transactions as the
+        limits on the number and size of the entities in a single transaction allow. All jobs
+        share the default partition so they can be written in the same transaction.
+
+        :param str operation: the name of the TableService method to apply to each entity
+
+        :param list[AzureJob] jobs: the jobs to write
+        """
+        batch, batchSize = [], 0
+        for job in jobs:
+            entity = job.toItem(chunkSize=self.jobChunkSize)
+            entity['RowKey'] = job.jobStoreID
+            # Binary properties are base64-encoded in the request
+            entitySize = 4 * sum(len(prop.value) for prop in entity.values()
+                                 if isinstance(prop, EntityProperty)) / 3 + 1024
+            if batch and (len(batch) == self.entitiesPerBatchWrite
+                          or batchSize + entitySize > self.bytesPerBatchWrite):
+                self.jobItems.batch_entities(operation=operation, entities=batch)
+                batch, batchSize = [], 0
+            batch.append(entity)
+            batchSize += entitySize
+        if batch:
+            self.jobItems.batch_entities(operation=operation, entities=batch)
+
     def exists(self, jobStoreID):
         if self.jobItems.get_entity(row_key=jobStoreID) is None:
             return False
@@ -244,6 +283,20 @@ class AzureJobStore(AbstractJobStore):
             raise NoSuchJobException(jobStoreID)
         return AzureJob.fromEntity(jobEntity)
 
+    # Azure Table storage allows at most 15 discrete comparisons in a filter string
+    entitiesPerBatchLoad = 15
+
+    def loadMany(self, jobStoreIDs):
+        jobStoreIDs = list(set(jobStoreIDs))
+        jobs = {}
+        n = self.entitiesPerBatchLoad
+        for batch in (jobStoreIDs[i:i + n] for i in range(0, len(jobStoreIDs), n)):
+            filterString = ' or '.join("RowKey eq '%s'" % jobStoreID for jobStoreID in batch)
+            for jobEntity in self.jobItems.query_entities_auto(filter=filterString):
+                job = AzureJob.fromEntity(jobEntity)
+                jobs[job.jobStoreID] = job
+        return jobs
+
     def update(self, job):
         self.jobItems.update_entity(row_key=job.jobStoreID,
                                     entity=job.toItem(chunkSize=self.jobChunkSize))
@@ -329,15 +382,18 @@ class AzureJobStore(AbstractJobStore):
                     if len(buf) == 0:
                         break
 
-    def readFile(self, jobStoreFileID, localFilePath):
+    def readFile(self, jobStoreFileID, localFilePath, parallelism=1):
         try:
-            with self._downloadStream(jobStoreFileID, self.files) as read_fd:
-                with open(localFilePath, 'w') as write_fd:
-                    while True:
-                        buf = read_fd.read(self._maxAzureBlockBytes)
-                        write_fd.write(buf)
-                        if not buf:
-                            break
+            if parallelism > 1:
+                self._downloadInParallel(jobStoreFileID, self.files, localFilePath, parallelism)
+            else:
+                with self._downloadStream(jobStoreFileID, self.files) as read_fd:
+                    with open(localFilePath, 'w') as write_fd:
+                        while True:
+                            buf = read_fd.read(self._maxAzureBlockBytes)
+                            write_fd.write(buf)
+                            if not buf:
+                                break
         except AzureMissingResourceHttpError:
             raise NoSuchFileException(jobStoreFileID)
 
@@ -638,6 +694,42 @@ class AzureJobStore(AbstractJobStore):
         with DownloadPipe() as readable:
             yield readable
 
+    def _downloadInParallel(self, jobStoreFileID, container, localFilePath, parallelism):
+        blobProps = container.get_blob_properties(blob_name=jobStoreFileID)
+
+        encrypted = strict_bool(blobProps['x-ms-meta-encrypted'])
+        if encrypted and self.keyPath is None:
+            raise AssertionError('Content is encrypted but no key was provided.')
+
+        # All blocks but the last one are of the maximum size (see _uploadStream). Each encrypted
+        # block carries a constant overhead so offsets in the local file have to be mapped to
+        # blocks in the blob, which is why ranges must start at a block boundary.
+        blobSize = int(blobProps['Content-Length'])
+        blockSize = self._maxAzureBlockBytes
+        numBlocks = (blobSize + blockSize - 1) // blockSize
+        if encrypted:
+            localBlockSize = blockSize - encryption.overhead
+            fileSize = blobSize - numBlocks * encryption.overhead
+        else:
+            localBlockSize = blockSize
+            fileSize = blobSize
+
+        def downloadRange(start, end, writable):
+            for blockIndex in range(start // localBlockSize,
+                                    (end + localBlockSize - 1) // localBlockSize):
+                blockStart = blockIndex * blockSize
+                blockEnd = min(blockStart + blockSize, blobSize) - 1
+                blockRange = "bytes=%d-%d" % (blockStart, blockEnd)
+                for attempt in retry_azure():
+                    with attempt:
+                        buf = container.get_blob(blob_name=jobStoreFileID, x_ms_range=blockRange)
+                if encrypted:
+                    buf = encryption.decrypt(buf, self.keyPath)
+                writable.write(buf)
+
+        downloadInParallel(localFilePath, fileSize, parallelism, downloadRange,
+                           alignment=localBlockSize)
+
 
 class AzureTable(object):
     """
@@ -683,6 +775,29 @@ class AzureTable(object):
         except AzureMissingResourceHttpError:
             return None
 
+    def batch_entities(self, operation, entities):
+        """
+        Applies the given TableService operation, e.g. 'update_entity', to each of the given
+        entities in a single entity group transaction. Each entity must have a RowKey and all of
+        them must belong to the same partition.
+
+        The batch is assembled on a TableService of its own such that requests made concurrently
+        through the shared service can't end up in it.
+        """
+        batchTable = AzureTable(TableService(account_name=self.tableService.account_name,
+                                             account_key=self.tableService.account_key),
+                                self.tableName)
+        for attempt in retry_azure():
+            with attempt:
+                batchTable.tableService.begin_batch()
+                try:
+                    for entity in entities:
+                        getattr(batchTable, operation)(row_key=entity['RowKey'], entity=entity)
+                except:
+                    batchTable.tableService.cancel_batch()
+                    raise
+                batchTable.tableService.commit_batch()
+
     def query_entities_auto(self, **kwargs):
         """
         An automatically-paged version of query_entities. The iterator just
@@ -758,6 +873,8 @@ class AzureJob(JobGraph):
     fact that Azure properties must start with a letter or underscore.
     """
 
+    __slots__ = ()
+
     defaultAttrs = ['PartitionKey', 'RowKey', 'etag', 'Timestamp']
 
     @classmethod
@@ -784,7 +901,7 @@ class AzureJob(JobGraph):
             wholeJobString = chunkedJob[0][1].value
         else:
             wholeJobString = ''.join(item[1].value for item in chunkedJob)
-        return cPickle.loads(bz2.decompress(wholeJobString))
+        return cls.fromBinary(bz2.decompress(wholeJobString))
 
     def toItem(self, chunkSize=maxAzureTablePropertySize):
         """
@@ -794,7 +911,7 @@ class AzureJob(JobGraph):
         """
         assert chunkSize <= maxAzureTablePropertySize
         item = {}
-        serializedAndEncodedJob = bz2.compress(cPickle.dumps(self, protocol=cPickle.HIGHEST_PROTOCOL))
+        serializedAndEncodedJob = bz2.compress(self.toBinary())
         jobChunks = [serializedAndEncodedJob[i:i + chunkSize]
                      for i in range(0, len(serializedAndEncodedJob), chunkSize)]
         for attributeOrder, chunk in enumerate(jobChunks):
@@ -16,13 +16,14 @@ from __future__ import absolute_import
 
 from contextlib import contextmanager
 import logging
-import pickle as pickler
 import random
 import shutil
 import os
 import tempfile
 import stat
 import errno
+import fcntl
+from hashlib import sha1
 
 # Python 3 compatibility imports
 from six.moves import xrange
@@ -51,6 +52,18 @@ class FileJobStore(AbstractJobStore):
     validDirs = "ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz0123456789"
     levels = 2
 
+    # Names of the append-only index files. The job index records the creation of a job as a line
+    # holding '+' followed by its ID, and the deletion as '-' followed by its ID. The stats index
+    # holds the relative path of each stats and logging file, in the order they were written.
+    # Both only grow while a workflow runs and are compacted when it is restarted, see compact().
+    jobIndexName = 'jobs'
+    statsIndexName = 'stats'
+
+    # The job index is split into this many files, each holding the entries of the jobs whose ID
+    # hashes to it, such that concurrent creations and deletions of jobs rarely wait on the same
+    # lock
+    numJobIndexShards = 16
+
     def __init__(self, path):
         """
         :param str path: Path to directory holding the job store
@@ -60,6 +73,10 @@ class FileJobStore(AbstractJobStore):
         logger.debug("Path to job store directory is '%s'.", self.jobStoreDir)
         # Directory where temporary files go
         self.tempFilesDir = os.path.join(self.jobStoreDir, 'tmp')
+        # Directory holding the index files, see jobIndexName and statsIndexName
+        self.indexDir = os.path.join(self.jobStoreDir, 'index')
+        # The offset into the stats index up to which readStatsAndLogging has read all entries
+        self.statsIndexOffset = 0
         self.linkImports = None
 
     def initialize(self, config):
@@ -71,14 +88,29 @@ class FileJobStore(AbstractJobStore):
             else:
                 raise
         os.mkdir(self.tempFilesDir)
+        self._writeIndices(jobEntries=[], statsEntries=[])
         self.linkImports = config.linkImports
         super(FileJobStore, self).initialize(config)
 
-    def resume(self):
+    def resume(self, config=None):
         if not os.path.exists(self.jobStoreDir):
             raise NoSuchJobStoreException(self.jobStoreDir)
         require( os.path.isdir, "'%s' is not a directory", self.jobStoreDir)
-        super(FileJobStore, self).resume()
+        super(FileJobStore, self).resume(config)
+
+    def compact(self):
+        # Rebuilding a lost index takes a walk of the entire job store, which only the leader does
+        if not os.path.exists(self.indexDir):
+            logger.warn("The job store at '%s' has no index, rebuilding it.", self.jobStoreDir)
+            self.rebuildIndex()
+            return
+        numEntries = 0
+        for indexName in self._getJobIndexNames():
+            numEntries += self._compactIndex(indexName, self._liveJobEntries)
+        logger.debug("Compacted the job index to %i entries.", numEntries)
+        numEntries = self._compactIndex(self.statsIndexName, self._liveStatsEntries)
+        self.statsIndexOffset = 0
+        logger.debug("Compacted the stats index to %i entries.", numEntries)
 
     def destroy(self):
         if os.path.exists(self.jobStoreDir):
@@ -90,16 +122,31 @@ class FileJobStore(AbstractJobStore):
     ##########################################
 
     def create(self, jobNode):
-        # The absolute path to the job directory.
-        absJobDir = tempfile.mkdtemp(prefix="job", dir=self._getTempSharedDir())
-        # Sub directory to put temporary files associated with the job in
-        os.mkdir(os.path.join(absJobDir, "g"))
-        # Make the job
-        job = JobGraph.fromJobNode(jobNode, jobStoreID=self._getRelativePath(absJobDir),
-                                   tryCount=self._defaultTryCount())
-        # Write job file to disk
-        self.update(job)
-        return job
+        return self.createMany([jobNode])[0]
+
+    def createMany(self, jobNodes):
+        jobStoreIDs = []
+        for _ in jobNodes:
+            # The absolute path to the job directory.
+            absJobDir = tempfile.mkdtemp(prefix="job", dir=self._getTempSharedDir())
+            # Sub directory to put temporary files associated with the job in
+            os.mkdir(os.path.join(absJobDir, "g"))
+            jobStoreIDs.append(self._getRelativePath(absJobDir))
+        # Index the jobs before writing them so that a job file can never be missing from the
+        # index. The entries are appended per shard, taking the lock of each shard only once per
+        # batch.
+        entriesByShard = {}
+        for jobStoreID in jobStoreIDs:
+            entriesByShard.setdefault(self._getJobIndexName(jobStoreID), []).append('+' + jobStoreID)
+        for indexName, entries in entriesByShard.iteritems():
+            self._appendToIndex(indexName, *entries)
+        # Make the jobs
+        jobs = [JobGraph.fromJobNode(jobNode, jobStoreID=jobStoreID,
+                                     tryCount=self._defaultTryCount())
+                for jobNode, jobStoreID in zip(jobNodes, jobStoreIDs)]
+        # Write job files to disk
+        self.updateMany(jobs)
+        return jobs
 
     def exists(self, jobStoreID):
         return os.path.exists(self._getJobFileName(jobStoreID))
@@ -123,8 +170,8 @@ class FileJobStore(AbstractJobStore):
         self._checkJobStoreId(jobStoreID)
         # Load a valid version of the job
         jobFile = self._getJobFileName(jobStoreID)
-        with open(jobFile, 'r') as fileHandle:
-            job = pickler.load(fileHandle)
+        with open(jobFile, 'rb') as fileHandle:
+            job = JobGraph.fromBinary(fileHandle.read())
         # The following cleans up any issues resulting from the failure of the
         # job during writing by the batch system.
         if os.path.isfile(jobFile + ".new"):
@@ -138,27 +185,67 @@ class FileJobStore(AbstractJobStore):
         # The file is then moved to its correct path.
         # Atomicity guarantees use the fact the underlying file systems "move"
         # function is atomic.
-        with open(self._getJobFileName(job.jobStoreID) + ".new", 'w') as f:
-            pickler.dump(job, f)
+        with open(self._getJobFileName(job.jobStoreID) + ".new", 'wb') as f:
+            f.write(job.toBinary())
         # This should be atomic for the file system
         os.rename(self._getJobFileName(job.jobStoreID) + ".new", self._getJobFileName(job.jobStoreID))
 
+    def supportsConditionalUpdates(self):
+        return True
+
+    def updateIfUnchanged(self, job, expectedCommand, expectedPickledJob=None):
+        # Attempts at running the same job serialize on a lock file in the job's directory. Each
+        # one writes to its own temporary file since they may race to get here.
+        jobFile = self._getJobFileName(job.jobStoreID)
+        try:
+            fd = os.open(os.path.join(self._getAbsPath(job.jobStoreID), 'lock'),
+                         os.O_WRONLY | os.O_CREAT)
+        except OSError as e:
+            if e.errno == errno.ENOENT:
+                # The job was deleted
+                return False
+            raise
+        try:
+            fcntl.lockf(fd, fcntl.LOCK_EX)
+            try:
+                with open(jobFile, 'rb') as fileHandle:
+                    storedJob = JobGraph.fromBinary(fileHandle.read())
+            except IOError as e:
+                if e.errno == errno.ENOENT:
+                    return False
+                raise
+            if (storedJob.command != expectedCommand
+                    or storedJob.pickledJob != expectedPickledJob):
+                return False
+            tempFd, tempJobFile = tempfile.mkstemp(prefix='job', suffix='.tmp',
+                                                   dir=self._getAbsPath(job.jobStoreID))
+            with os.fdopen(tempFd, 'wb') as f:
+                f.write(job.toBinary())
+            os.rename(tempJobFile, jobFile)
+            return True
+        finally:
+            # This also releases the lock
+            os.close(fd)
+
     def delete(self, jobStoreID):
         # The jobStoreID is the relative path to the directory containing the job,
         # removing this directory deletes the job.
         if self.exists(jobStoreID):
             shutil.rmtree(self._getAbsPath(jobStoreID))
+            self._appendToIndex(self._getJobIndexName(jobStoreID), '-' + jobStoreID)
 
     def jobs(self):
-        # Walk through list of temporary directories searching for jobs
-        for tempDir in self._tempDirectories():
-            for i in os.listdir(tempDir):
-                if i.startswith( 'job' ):
-                    try:
-                        yield self.load(self._getRelativePath(os.path.join(tempDir, i)))
-                    except NoSuchJobException:
-                        # An orphaned job may leave an empty or incomplete job file which we can safely ignore
-                        pass
+        # Replay the job index instead of walking the temporary directories searching for jobs
+        jobStoreIDs = []
+        for indexName in self._getJobIndexNames():
+            entries, _ = self._readIndex(indexName)
+            jobStoreIDs.extend(self._replayJobEntries(entries))
+        for jobStoreID in jobStoreIDs:
+            try:
+                yield self.load(jobStoreID)
+            except NoSuchJobException:
+                # An orphaned job may leave an empty or incomplete job file which we can safely ignore
+                pass
 
     ##########################################
     # Functions that deal with temporary files associated with jobs
@@ -249,7 +336,7 @@ class FileJobStore(AbstractJobStore):
         self._checkJobStoreFileID(jobStoreFileID)
         shutil.copyfile(localFilePath, self._getAbsPath(jobStoreFileID))
 
-    def readFile(self, jobStoreFileID, localFilePath):
+    def readFile(self, jobStoreFileID, localFilePath, parallelism=1):
         self._checkJobStoreFileID(jobStoreFileID)
         jobStoreFilePath = self._getAbsPath(jobStoreFileID)
         localDirPath = os.path.dirname(localFilePath)
@@ -335,27 +422,192 @@ class FileJobStore(AbstractJobStore):
             f.write(statsAndLoggingString)
         os.close(fd)
         os.rename(tempStatsFile, tempStatsFile[:-4])  # This operation is atomic
+        self._appendToIndex(self.statsIndexName, self._getRelativePath(tempStatsFile[:-4]))
 
     def readStatsAndLogging(self, callback, readAll=False):
         numberOfFilesProcessed = 0
-        for tempDir in self._tempDirectories():
-            for tempFile in os.listdir(tempDir):
-                if tempFile.startswith('stats'):
-                    absTempFile = os.path.join(tempDir, tempFile)
-                    if readAll or not tempFile.endswith('.new'):
-                        with open(absTempFile, 'r') as fH:
-                            callback(fH)
-                        numberOfFilesProcessed += 1
-                        newName = tempFile.rsplit('.', 1)[0] + '.new'
-                        newAbsTempFile = os.path.join(tempDir, newName)
-                        # Mark this item as read
-                        os.rename(absTempFile, newAbsTempFile)
+        # Only look at the files indexed since the last call, unless we are asked to read them all
+        entries, self.statsIndexOffset = self._readIndex(self.statsIndexName,
+                                                         0 if readAll else self.statsIndexOffset)
+        for entry in entries:
+            absTempFile = self._getAbsPath(entry)
+            newAbsTempFile = absTempFile + '.new'
+            if os.path.exists(absTempFile):
+                with open(absTempFile, 'r') as fH:
+                    callback(fH)
+                numberOfFilesProcessed += 1
+                # Mark this item as read
+                os.rename(absTempFile, newAbsTempFile)
+            elif readAll and os.path.exists(newAbsTempFile):
+                with open(newAbsTempFile, 'r') as fH:
+                    callback(fH)
+                numberOfFilesProcessed += 1
         return numberOfFilesProcessed
 
+    def rebuildIndex(self):
+        """
+        Rebuilds the job and stats indices of this job store by walking its directory tree. This
+        is only needed if the indices were lost or damaged and must not be done while a workflow
+        is using the job store.
+        """
+        jobEntries = []
+        statsEntries = []
+        for tempDir in self._tempDirectories():
+            for i in os.listdir(tempDir):
+                relPath = self._getRelativePath(os.path.join(tempDir, i))
+                if i.startswith('job'):
+                    jobEntries.append('+' + relPath)
+                elif i.startswith('stats'):
+                    # Stats files that were already read have a '.new' suffix. We can't tell them
+                    # apart from stats files that were left incomplete so we index both.
+                    statsEntries.append(relPath[:-4] if i.endswith('.new') else relPath)
+        self._writeIndices(jobEntries=jobEntries, statsEntries=statsEntries)
+        self.statsIndexOffset = 0
+        logger.info("Indexed %i jobs and %i stats and logging files.",
+                    len(jobEntries), len(statsEntries))
+
     ##########################################
     # Private methods
     ##########################################
 
+    def _getIndexPath(self, indexName):
+        return os.path.join(self.indexDir, indexName)
+
+    def _getJobIndexName(self, jobStoreID):
+        """
+        Returns the name of the shard of the job index holding the entries of the given job.
+
+        :rtype: str
+        """
+        shard = int(sha1(jobStoreID).hexdigest(), 16) % self.numJobIndexShards
+        return '%s.%i' % (self.jobIndexName, shard)
+
+    def _getJobIndexNames(self):
+        """
+        Returns the names of all shards of the job index.
+
+        :rtype: list[str]
+        """
+        return ['%s.%i' % (self.jobIndexName, shard) for shard in xrange(self.numJobIndexShards)]
+
+    def _writeIndices(self, jobEntries, statsEntries):
+        """
+        Replaces the index files with ones holding the given entries.
+
+        :param list[str] jobEntries: the entries of the job index
+
+        :param list[str] statsEntries: the entries of the stats index
+        """
+        if not os.path.exists(self.indexDir):
+            os.mkdir(self.indexDir)
+        entriesByIndex = {indexName: [] for indexName in self._getJobIndexNames()}
+        for entry in jobEntries:
+            entriesByIndex[self._getJobIndexName(entry[1:])].append(entry)
+        entriesByIndex[self.statsIndexName] = statsEntries
+        for indexName, entries in entriesByIndex.iteritems():
+            self._writeIndex(indexName, entries)
+
+    def _writeIndex(self, indexName, entries):
+        """
+        Atomically replaces the given index with one holding the given entries.
+        """
+        fd, tempIndexPath = tempfile.mkstemp(prefix=indexName, suffix=".tmp", dir=self.indexDir)
+        with os.fdopen(fd, 'w') as f:
+            for entry in entries:
+                f.write(entry + '\n')
+        os.rename(tempIndexPath, self._getIndexPath(indexName))  # This operation is atomic
+
+    def _appendToIndex(self, indexName, *entries):
+        """
+        Appends entries to the given index in a single write. The file is locked while
+        appending, which makes concurrent appends safe even if the job store is shared via NFS.
+
+        :param str indexName: the name of a shard of the job index or statsIndexName
+
+        :param str entries: the entries to append, none of which may contain a newline
+        """
+        if not entries:
+            return
+        indexPath = self._getIndexPath(indexName)
+        while True:
+            fd = os.open(indexPath, os.O_WRONLY | os.O_APPEND)
+            try:
+                fcntl.lockf(fd, fcntl.LOCK_EX)
+                # The index may have been replaced by a compacted one while we waited for the
+                # lock, in which case we append to the new one instead, see _compactIndex()
+                if os.fstat(fd).st_ino == os.stat(indexPath).st_ino:
+                    os.write(fd, ''.join(entry + '\n' for entry in entries))
+                    return
+            finally:
+                # This also releases the lock
+                os.close(fd)
+
+    def _compactIndex(self, indexName, liveEntries):
+        """
+        Replaces the given index with one holding only the entries that are still relevant. The
+        old index stays locked until it is replaced, so entries appended concurrently end up in
+        the new one, see _appendToIndex().
+
+        :param str indexName: the name of a shard of the job index or statsIndexName
+
+        :param liveEntries: a function that takes the entries of the index and returns the ones
+               to keep
+
+        :return: the number of entries kept
+        :rtype: int
+        """
+        with open(self._getIndexPath(indexName), 'r+') as f:
+            fcntl.lockf(f, fcntl.LOCK_EX)
+            entries = liveEntries(f.read().splitlines())
+            self._writeIndex(indexName, entries)
+        return len(entries)
+
+    @staticmethod
+    def _replayJobEntries(entries):
+        """
+        Returns the IDs of the jobs that the given entries of the job index record as created
+        but not deleted.
+
+        :rtype: list[str]
+        """
+        jobStoreIDs = set()
+        for entry in entries:
+            if entry[0] == '+':
+                jobStoreIDs.add(entry[1:])
+            else:
+                jobStoreIDs.discard(entry[1:])
+        return list(jobStoreIDs)
+
+    def _liveJobEntries(self, entries):
+        # A job is indexed after its directory was created, so a job without a directory was
+        # deleted or left behind by a failed creation
+        return ['+' + jobStoreID for jobStoreID in self._replayJobEntries(entries)
+                if os.path.exists(self._getAbsPath(jobStoreID))]
+
+    def _liveStatsEntries(self, entries):
+        # Stats files that were already read are kept for readStatsAndLogging(readAll=True)
+        return [entry for entry in entries
+                if os.path.exists(self._getAbsPath(entry))
+                or os.path.exists(self._getAbsPath(entry) + '.new')]
+
+    def _readIndex(self, indexName, offset=0):
+        """
+        Reads the entries of the given index, starting at the given offset.
+
+        :param str indexName: the name of a shard of the job index or statsIndexName
+
+        :param int offset: the offset to start reading at, as previously returned by this method
+
+        :return: The entries read and the offset to pass in order to read subsequent entries. An
+                 entry that is still being appended is not returned and will be read next time.
+        :rtype: (list[str], int)
+        """
+        with open(self._getIndexPath(indexName), 'r') as f:
+            f.seek(offset)
+            data = f.read()
+        end = data.rfind('\n') + 1
+        return data[:end].splitlines(), offset + end
+
     def _getAbsPath(self, relativePath):
         """
         :rtype : string, string is the absolute path to a file path relative
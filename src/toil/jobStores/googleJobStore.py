@@ -6,15 +6,19 @@ import uuid
 from bd2k.util.threading import ExceptionalThread
 import boto
 import logging
+import socket
 import time
 
 # Python 3 compatibility imports
-from six.moves import cPickle, StringIO
+from six.moves import StringIO
+from six.moves.http_client import HTTPException
+
+from bd2k.util.retry import retry
 
 from toil.jobStores.abstractJobStore import (AbstractJobStore, NoSuchJobException,
                                              NoSuchFileException,
                                              ConcurrentFileModificationException)
-from toil.jobStores.utils import WritablePipe, ReadablePipe
+from toil.jobStores.utils import WritablePipe, ReadablePipe, downloadInParallel
 from toil.jobGraph import JobGraph
 
 log = logging.getLogger(__name__)
@@ -118,7 +122,7 @@ class GoogleJobStore(AbstractJobStore):
                        command=jobNode.command, remainingRetryCount=self._defaultTryCount(),
                        logJobStoreFileID=None, predecessorNumber=jobNode.predecessorNumber,
                        **jobNode._requirements)
-        self._writeString(jobStoreID, cPickle.dumps(job, protocol=cPickle.HIGHEST_PROTOCOL))
+        self._writeString(jobStoreID, job.toBinary())
         return job
 
     def exists(self, jobStoreID):
@@ -145,10 +149,10 @@ class GoogleJobStore(AbstractJobStore):
             jobString = self._readContents(jobStoreID)
         except NoSuchFileException:
             raise NoSuchJobException(jobStoreID)
-        return cPickle.loads(jobString)
+        return JobGraph.fromBinary(jobString)
 
     def update(self, job):
-        self._writeString(job.jobStoreID, cPickle.dumps(job, protocol=cPickle.HIGHEST_PROTOCOL), update=True)
+        self._writeString(job.jobStoreID, job.toBinary(), update=True)
 
     def delete(self, jobStoreID):
         # jobs will always be encrypted when avaliable
@@ -178,14 +182,28 @@ class GoogleJobStore(AbstractJobStore):
         self._writeFile(fileID, StringIO(""))
         return fileID
 
-    def readFile(self, jobStoreFileID, localFilePath):
+    def readFile(self, jobStoreFileID, localFilePath, parallelism=1):
         # used on non-shared files which will be encrypted if avaliable
         headers = self.encryptedHeaders
         # checking for JobStoreID existance
         if not self.exists(jobStoreFileID):
             raise NoSuchFileException(jobStoreFileID)
-        with open(localFilePath, 'w') as writeable:
-            self._getKey(jobStoreFileID, headers).get_contents_to_file(writeable, headers=headers)
+        key = self._getKey(jobStoreFileID, headers)
+        if parallelism > 1:
+            def downloadRange(start, end, writable):
+                # Boto keys aren't thread-safe so each range needs its own
+                rangeKey = self._newKey(jobStoreFileID)
+                # GCS range intervals are closed at the end
+                rangeHeaders = dict(headers, Range='bytes=%d-%d' % (start, end - 1))
+                for attempt in retry_gs():
+                    with attempt:
+                        writable.seek(start)
+                        rangeKey.get_contents_to_file(writable, headers=rangeHeaders)
+
+            downloadInParallel(localFilePath, key.size, parallelism, downloadRange)
+        else:
+            with open(localFilePath, 'w') as writeable:
+                key.get_contents_to_file(writeable, headers=headers)
 
     @contextmanager
     def readFileStream(self, jobStoreFileID):
@@ -480,3 +498,12 @@ class GoogleJobStore(AbstractJobStore):
 
         with DownloadPipe() as readable:
             yield readable
+
+
+def retryable_gs_errors(e):
+    return (isinstance(e, boto.exception.GSResponseError) and (e.status == 429 or e.status >= 500)
+            or isinstance(e, (socket.error, HTTPException)))
+
+
+def retry_gs(delays=(0, 1, 1, 4, 16, 64), timeout=300, predicate=retryable_gs_errors):
+    return retry(delays=delays, timeout=timeout, predicate=predicate)
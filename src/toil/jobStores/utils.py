@@ -1,9 +1,11 @@
 import logging
 import os
+import sys
 from abc import ABCMeta
 from abc import abstractmethod
 
 from bd2k.util.threading import ExceptionalThread
+from six import reraise
 
 log = logging.getLogger(__name__)
 
@@ -234,3 +236,77 @@ class ReadablePipe(object):
                 # FIXME: This is still racy. The writer thread could close it now, and someone
                 # else may immediately open a new file, reusing the file handle.
                 os.close(writable_fh)
+
+
+def downloadInParallel(localFilePath, fileSize, parallelism, downloadRange, alignment=1):
+    """
+    Downloads a file of the given size into a local file using up to the given number of
+    concurrent ranged requests. The local file is allocated to its full size upfront so each
+    range can be written in place, without having to be buffered or reassembled afterwards.
+
+    The file is split into contiguous ranges whose boundaries are multiples of the given
+    alignment, one per thread. The downloadRange callback is invoked in a separate thread for
+    each range with the start and end offset of the range (inclusive and exclusive,
+    respectively) and a writable file object positioned at the start offset. It must write
+    exactly end - start bytes to that file object. The callback is responsible for retrying
+    failed requests. If it does so after having written to the file object, it must seek back to
+    the start offset first.
+
+    >>> import tempfile
+    >>> content = ''.join(chr(i % 256) for i in range(1000))
+    >>> def downloadRange(start, end, writable):
+    ...     writable.write(content[start:end])
+    >>> fd, path = tempfile.mkstemp()
+    >>> os.close(fd)
+    >>> downloadInParallel(path, len(content), 4, downloadRange, alignment=64)
+    >>> with open(path, 'rb') as f:
+    ...     f.read() == content
+    True
+    >>> downloadInParallel(path, 0, 4, downloadRange)
+    >>> os.path.getsize(path)
+    0
+    >>> def failingDownloadRange(start, end, writable):
+    ...     raise RuntimeError('Failed to download bytes %i to %i' % (start, end))
+    >>> downloadInParallel(path, len(content), 1, failingDownloadRange)
+    Traceback (most recent call last):
+    ...
+    RuntimeError: Failed to download bytes 0 to 1000
+    >>> os.remove(path)
+
+    :param str localFilePath: the path of the local file to download to, will be overwritten if
+           it already exists
+    :param int fileSize: the size of the file in bytes
+    :param int parallelism: the maximum number of ranges to download concurrently
+    :param downloadRange: a callable accepting the start offset, end offset and writable file
+           object of a range, as described above
+    :param int alignment: the granularity, in bytes, at which the file may be split into ranges
+    """
+    # Round the range size up to the alignment so that we don't need more than the requested
+    # number of ranges.
+    numAlignedUnits = (fileSize + alignment - 1) // alignment
+    rangeSize = max((numAlignedUnits + parallelism - 1) // parallelism, 1) * alignment
+    with open(localFilePath, 'wb') as f:
+        f.truncate(fileSize)
+
+    def download(start, end):
+        with open(localFilePath, 'r+b') as writable:
+            writable.seek(start)
+            downloadRange(start, end, writable)
+            assert writable.tell() == end
+
+    threads = [ExceptionalThread(target=download, args=(start, min(start + rangeSize, fileSize)))
+               for start in range(0, fileSize, rangeSize)]
+    log.debug('Downloading %i bytes to %s in %i range(s).', fileSize, localFilePath, len(threads))
+    for thread in threads:
+        thread.start()
+    # Wait for all threads before failing such that none of them is still writing to the file.
+    excInfo = None
+    for thread in threads:
+        try:
+            # reraises any exception that was raised in the thread
+            thread.join()
+        except Exception:
+            if excInfo is None:
+                excInfo = sys.exc_info()
+    if excInfo is not None:
+        reraise(*excInfo)
@@ -19,9 +19,13 @@ from __future__ import absolute_import
 
 import logging
 import gzip
+import itertools
 import os
+import random
 import time
+from bisect import insort
 from collections import namedtuple
+from heapq import heappush, heappop
 
 # Python 3 compatibility imports
 from six.moves import cPickle
@@ -29,8 +33,9 @@ from six.moves import cPickle
 from bd2k.util.expando import Expando
 from bd2k.util.humanize import bytes2human
 
-from toil import resolveEntryPoint
+from toil import internString, resolveEntryPoint
 from toil.jobStores.abstractJobStore import NoSuchJobException
+from toil.leaderJournal import LeaderJournal
 from toil.provisioners.clusterScaler import ClusterScaler
 from toil.serviceManager import ServiceManager
 from toil.statsAndLogging import StatsAndLogging
@@ -73,6 +78,37 @@ class DeadlockException( Exception ):
         msg = "Deadlock encountered: " + msg
         super( DeadlockException, self ).__init__(msg)
 
+####################################################
+# The leader's record of an issued job
+####################################################
+
+class IssuedJob(namedtuple('IssuedJob', ('jobStoreID', 'jobName', 'requirements'))):
+    """
+    What the leader keeps of a job for as long as it is issued: its job store ID, its name and
+    its resource requirements as a (memory, cores, disk, preemptable) tuple. Jobs with the same
+    requirements share the tuple, see Leader.issueJobs().
+    """
+    __slots__ = ()
+
+    @property
+    def memory(self):
+        return self.requirements[0]
+
+    @property
+    def cores(self):
+        return self.requirements[1]
+
+    @property
+    def disk(self):
+        return self.requirements[2]
+
+    @property
+    def preemptable(self):
+        return self.requirements[3]
+
+    def __str__(self):
+        return "'%s' %s" % (self.jobName, self.jobStoreID)
+
 ####################################################
 ##Following class represents the leader
 ####################################################
@@ -80,7 +116,18 @@ class DeadlockException( Exception ):
 class Leader:
     """ Class that encapsulates the logic of the leader.
     """
-    def __init__(self, config, batchSystem, provisioner, jobStore, rootJob, jobCache=None):
+    # The maximum number of wall times kept per job name to decide when to speculatively run
+    # a straggling job, and the minimum number needed to do so
+    maxRuntimeSamples = 1000
+    minRuntimeSamples = 10
+
+    # The maximum number of updated jobs taken from the batch system per iteration of the main
+    # loop, such that the successors of the processed jobs are issued before the next batch is
+    # taken
+    maxUpdatedJobsPerIteration = 10000
+
+    def __init__(self, config, batchSystem, provisioner, jobStore, rootJob, jobCache=None,
+                 journal=None, bootstrapDigest=None):
         """
         :param toil.common.Config config:
         :param toil.batchSystems.abstractBatchSystem.AbstractBatchSystem batchSystem:
@@ -91,6 +138,13 @@ class Leader:
         If jobCache is passed, it must be a dict from job ID to pre-existing
         JobGraph objects. Jobs will be loaded from the cache (which can be
         downloaded from the jobStore in a batch) during the construction of the ToilState object.
+
+        If journal is passed, the state is restored from the snapshot in the journal instead of
+        being built from the root job, and the journal is continued.
+
+        If bootstrapDigest is passed, it is passed on to the workers such that they can cache the
+        configuration and the environment of the workflow, see
+        :class:`toil.bootstrapCache.BootstrapCache`.
         """
         # Object containing parameters for the run
         self.config = config
@@ -98,9 +152,28 @@ class Leader:
         # The job store
         self.jobStore = jobStore
         self.jobStoreLocator = config.jobStore
+        self.bootstrapDigest = bootstrapDigest
 
         # Get a snap shot of the current state of the jobs in the jobStore
-        self.toilState = ToilState(jobStore, rootJob, jobCache=jobCache)
+        if journal is None:
+            self.toilState = ToilState(jobStore, rootJob, jobCache=jobCache)
+        else:
+            snapshot, removedJobStoreIDs, failedJobStoreIDs = journal.popSnapshot()
+            self.toilState = ToilState(jobStore, rootJob, snapshot=snapshot,
+                                       removedJobStoreIDs=removedJobStoreIDs,
+                                       failedJobStoreIDs=failedJobStoreIDs)
+            del snapshot, removedJobStoreIDs, failedJobStoreIDs
+        # The cached job graphs and the pickled jobs stored inline with them aren't needed anymore
+        if jobCache is not None:
+            jobCache.clear()
+
+        # Saves the state to the job store, such that a restart need not rebuild it
+        if config.disableJournal:
+            self.journal = None
+        elif journal is None:
+            self.journal = LeaderJournal(jobStore, config.stateSnapshotInterval)
+        else:
+            self.journal = journal
         logger.info("Found %s jobs to start and %i jobs with successors to run",
                         len(self.toilState.updatedJobs), len(self.toilState.successorCounts))
 
@@ -109,9 +182,16 @@ class Leader:
         assert len(self.batchSystem.getIssuedBatchJobIDs()) == 0 #Batch system must start with no active jobs!
         logger.info("Checked batch system has no running jobs and no updated jobs")
 
-        # Map of batch system IDs to IsseudJob tuples
+        # Map of batch system IDs to IssuedJob tuples
         self.jobBatchSystemIDToIssuedJob = {}
 
+        # The distinct requirements of the jobs issued so far, shared by their IssuedJob tuples
+        self.issuedJobRequirements = {}
+
+        # Map of batch system IDs to the ServiceJobNode objects of the issued service jobs, which
+        # the service manager needs to tell whether a service is running
+        self.jobBatchSystemIDToIssuedServiceJob = {}
+
         # Number of preempetable jobs currently being run by batch system
         self.preemptableJobsIssued = 0
 
@@ -123,6 +203,37 @@ class Leader:
         self.preemptableServiceJobsIssued = 0
         self.preemptableServiceJobsToBeIssued = []
 
+        # The jobs to be issued at the end of the current iteration of the main loop, as a heap
+        # of (negated priority, sequence number, job node) tuples, see _queueJob()
+        self.jobsToIssue = []
+        self.jobsToIssueSequence = itertools.count()
+
+        # The number of successful runs and their total wall time, per job name, including the
+        # runs reported in the stats of earlier attempts at running the workflow. Used to
+        # estimate the run time of jobs when prioritizing them, see _estimateRuntime().
+        self.jobRuntimes = {}
+
+        # The estimated run time of the work that can only start once a job and its successors
+        # are done, for the jobs followed by any such work, see _getTail()
+        self.jobTails = {}
+
+        # The batch system IDs of the issued jobs that don't have a command to run, whose wall
+        # time doesn't reflect the run time of the job
+        self.jobBatchSystemIDsWithoutCommand = set()
+
+        # A uniform sample of the wall times of successful runs, as a sorted list per job name.
+        # Only maintained if jobs are run speculatively, see speculateStragglers().
+        self.jobRuntimeSamples = {}
+
+        # The batch system IDs of the attempts at running the jobs that were run speculatively,
+        # per job store ID, see speculateStragglers()
+        self.speculatedJobs = {}
+
+        # The job graphs whose topmost list of successors was popped by loadWaitingJobGraph(),
+        # to be written back to the job store in one batch at the end of the current iteration of
+        # the main loop
+        self.jobsToUpdate = []
+
         # Hash to store number of times a job is lost by the batch system,
         # used to decide if to reissue an apparently missing job
         self.reissueMissingJobs_missingHash = {}
@@ -140,6 +251,12 @@ class Leader:
         # A thread to manage the aggregation of statistics and logging from the run
         self.statsAndLogging = StatsAndLogging(self.jobStore, self.config)
 
+        # When restarting a workflow that keeps its stats, the run times of the jobs completed by
+        # earlier attempts at running it seed the estimates used to prioritize jobs
+        if config.stats and config.workflowAttemptNumber > 0:
+            for jobName, runtime in StatsAndLogging.readJobRuntimes(self.jobStore).items():
+                self.jobRuntimes[internString(jobName)] = runtime
+
         # Set used to monitor deadlocked jobs
         self.potentialDeadlockedJobs = set()
         self.potentialDeadlockTime = 0
@@ -214,6 +331,7 @@ class Leader:
         """
         # Sets up the timing of the jobGraph rescuing method
         timeSinceJobsLastRescued = time.time()
+        timeStragglersLastChecked = time.time()
 
         logger.info("Starting the main loop")
         while True:
@@ -234,7 +352,7 @@ class Leader:
                     # being considered further in this loop. This catch is necessary because
                     # the job's service's can fail while being issued, causing the job to be
                     # added to updated jobs.
-                    if jobGraph in self.serviceManager.jobGraphsWithServicesBeingStarted:
+                    if jobGraph.jobStoreID in self.serviceManager.jobStoreIDsWithServicesBeingStarted:
                         logger.debug("Got a job to update which is still owned by the service "
                                      "manager: %s", jobGraph.jobStoreID)
                         continue
@@ -267,7 +385,7 @@ class Leader:
                         elif jobGraph.checkpoint is not None and jobGraph.remainingRetryCount > 1:
                             logger.warn('Job: %s is being restarted as a checkpoint after the total '
                                         'failure of jobs in its subtree.', jobGraph.jobStoreID)
-                            self.issueJob(JobNode.fromJobGraph(jobGraph))
+                            self._queueJobGraph(jobGraph)
                         else: # Mark it totally failed
                             logger.debug("Job %s is being processed as completely failed", jobGraph.jobStoreID)
                             self.processTotallyFailedJob(jobGraph)
@@ -287,7 +405,7 @@ class Leader:
                                         jobGraph, jobGraph.jobStoreID)
                         else:
                             # Otherwise try the job again
-                            self.issueJob(JobNode.fromJobGraph(jobGraph))
+                            self._queueJobGraph(jobGraph)
 
                     # If the job has services to run, which have not been started, start them
                     elif len(jobGraph.services) > 0:
@@ -295,11 +413,12 @@ class Leader:
                         # of the services created for the job
                         assert jobGraph.jobStoreID not in self.toilState.servicesIssued
                         self.toilState.servicesIssued[jobGraph.jobStoreID] = {}
+                        jobStoreID = internString(jobGraph.jobStoreID)
                         for serviceJobList in jobGraph.services:
                             for serviceTuple in serviceJobList:
                                 serviceID = serviceTuple.jobStoreID
                                 assert serviceID not in self.toilState.serviceJobStoreIDToPredecessorJob
-                                self.toilState.serviceJobStoreIDToPredecessorJob[serviceID] = jobGraph
+                                self.toilState.serviceJobStoreIDToPredecessorJob[serviceID] = jobStoreID
                                 self.toilState.servicesIssued[jobGraph.jobStoreID][serviceID] = serviceTuple
 
                         # Use the service manager to start the services
@@ -314,10 +433,15 @@ class Leader:
                                      jobGraph.jobStoreID, len(jobGraph.stack[-1]))
                         #Record the number of successors that must be completed before
                         #the jobGraph can be considered again
-                        assert jobGraph.jobStoreID not in self.toilState.successorCounts
-                        self.toilState.successorCounts[jobGraph.jobStoreID] = len(jobGraph.stack[-1])
+                        # Only the ID of the jobGraph is retained while its successors run, the
+                        # jobGraph itself is loaded again once they are done
+                        jobStoreID = internString(jobGraph.jobStoreID)
+                        assert jobStoreID not in self.toilState.successorCounts
+                        self.toilState.successorCounts[jobStoreID] = len(jobGraph.stack[-1])
                         #List of successors to schedule
                         successors = []
+                        # The successors share the work that follows them
+                        tail = self._getTail(jobGraph, jobGraph.stack[:-1])
 
                         #For each successor schedule if all predecessors have been completed
                         for jobNode in jobGraph.stack[-1]:
@@ -325,21 +449,21 @@ class Leader:
                             #Build map from successor to predecessors.
                             if successorJobStoreID not in self.toilState.successorJobStoreIDToPredecessorJobs:
                                 self.toilState.successorJobStoreIDToPredecessorJobs[successorJobStoreID] = []
-                            self.toilState.successorJobStoreIDToPredecessorJobs[successorJobStoreID].append(jobGraph)
+                            self.toilState.successorJobStoreIDToPredecessorJobs[successorJobStoreID].append(jobStoreID)
                             #Case that the jobGraph has multiple predecessors
                             if jobNode.predecessorNumber > 1:
                                 logger.debug("Successor job: %s of job: %s has multiple "
                                              "predecessors", jobNode, jobGraph)
 
-                                # Get the successor job, using a cache
-                                # (if the successor job has already been seen it will be in this cache,
-                                # but otherwise put it in the cache)
+                                # Get the finished predecessors of the successor job
+                                # (if the successor job has already been seen they will be in this cache,
+                                # but otherwise put them in the cache)
                                 if successorJobStoreID not in self.toilState.jobsToBeScheduledWithMultiplePredecessors:
-                                    self.toilState.jobsToBeScheduledWithMultiplePredecessors[successorJobStoreID] = self.jobStore.load(successorJobStoreID)
-                                successorJobGraph = self.toilState.jobsToBeScheduledWithMultiplePredecessors[successorJobStoreID]
+                                    self.toilState.jobsToBeScheduledWithMultiplePredecessors[successorJobStoreID] = set()
+                                predecessorsFinished = self.toilState.jobsToBeScheduledWithMultiplePredecessors[successorJobStoreID]
 
                                 #Add the jobGraph as a finished predecessor to the successor
-                                successorJobGraph.predecessorsFinished.add(jobGraph.jobStoreID)
+                                predecessorsFinished.add(jobStoreID)
 
                                 # If the successor is in the set of successors of failed jobs
                                 if successorJobStoreID in self.toilState.failedSuccessors:
@@ -352,7 +476,7 @@ class Leader:
                                     # Reduce active successor count and remove the successor as an active successor of the job
                                     self.toilState.successorCounts[jobGraph.jobStoreID] -= 1
                                     assert self.toilState.successorCounts[jobGraph.jobStoreID] >= 0
-                                    self.toilState.successorJobStoreIDToPredecessorJobs[successorJobStoreID].remove(jobGraph)
+                                    self.toilState.successorJobStoreIDToPredecessorJobs[successorJobStoreID].remove(jobStoreID)
                                     if len(self.toilState.successorJobStoreIDToPredecessorJobs[successorJobStoreID]) == 0:
                                         self.toilState.successorJobStoreIDToPredecessorJobs.pop(successorJobStoreID)
 
@@ -368,8 +492,8 @@ class Leader:
 
                                 # If the successor job's predecessors have all not all completed then
                                 # ignore the jobGraph as is not yet ready to run
-                                assert len(successorJobGraph.predecessorsFinished) <= successorJobGraph.predecessorNumber
-                                if len(successorJobGraph.predecessorsFinished) < successorJobGraph.predecessorNumber:
+                                assert len(predecessorsFinished) <= jobNode.predecessorNumber
+                                if len(predecessorsFinished) < jobNode.predecessorNumber:
                                     continue
                                 else:
                                     # Remove the successor job from the cache
@@ -377,7 +501,12 @@ class Leader:
 
                             # Add successor to list of successors to schedule
                             successors.append(jobNode)
-                        self.issueJobs(successors)
+                        for jobNode in successors:
+                            if tail > 0:
+                                self.jobTails[jobNode.jobStoreID] = max(
+                                    tail, self.jobTails.get(jobNode.jobStoreID, 0))
+                            self._queueJob(jobNode, tail)
+                        del successors
 
                     elif jobGraph.jobStoreID in self.toilState.servicesIssued:
                         logger.debug("Telling job: %s to terminate its services due to the "
@@ -395,12 +524,19 @@ class Leader:
                     else:
                         # Remove the job
                         if jobGraph.remainingRetryCount > 0:
-                            self.issueJob(JobNode.fromJobGraph(jobGraph))
+                            self._queueJobGraph(jobGraph)
                             logger.debug("Job: %s is empty, we are scheduling to clean it up", jobGraph.jobStoreID)
                         else:
                             self.processTotallyFailedJob(jobGraph)
                             logger.warn("Job: %s is empty but completely failed - something is very wrong", jobGraph.jobStoreID)
 
+                # Drop our references to the job graphs processed above. Jobs that wait on their
+                # successors are loaded again once these are done.
+                del updatedJobs, jobGraph
+
+                # Issue the jobs that became ready above, most critical first
+                self._issueQueuedJobs()
+
             # Start any service jobs available from the service manager
             self.issueQueingServiceJobs()
             while True:
@@ -420,27 +556,22 @@ class Leader:
                 jobGraph.services = []
                 self.toilState.updatedJobs.add((jobGraph, 0))
 
-            # Gather any new, updated jobGraph from the batch system
-            updatedJobTuple = self.batchSystem.getUpdatedBatchJob(2)
-            if updatedJobTuple is not None:
-                jobID, result, wallTime = updatedJobTuple
-                # easy, track different state
-                try:
-                    updatedJob = self.jobBatchSystemIDToIssuedJob[jobID]
-                except KeyError:
-                    logger.warn("A result seems to already have been processed "
-                                "for job %s", jobID)
-                else:
-                    if result == 0:
-                        cur_logger = (logger.debug if str(updatedJob.jobName).startswith(self.debugJobNames)
-                                      else logger.info)
-                        cur_logger('Job ended successfully: %s', updatedJob)
-                    else:
-                        logger.warn('Job failed with exit value %i: %s',
-                                    result, updatedJob)
-                    self.processFinishedJob(jobID, result, wallTime=wallTime)
+            # Gather all new, updated jobGraphs from the batch system. We only block waiting for
+            # updates if there is nothing else for us to do.
+            maxWait = 0 if len(self.toilState.updatedJobs) > 0 else 2
+            updatedJobTuples = self.batchSystem.getUpdatedBatchJobs(
+                maxWait, limit=self.maxUpdatedJobsPerIteration)
+            if len(updatedJobTuples) > 0:
+                logger.debug('Got %i updated jobs from the batch system', len(updatedJobTuples))
+                for jobID, result, wallTime in updatedJobTuples:
+                    self.processUpdatedBatchJob(jobID, result, wallTime)
+
+            elif len(self.toilState.updatedJobs) == 0:
+                # Start backup attempts of jobs that take much longer than their peers
+                if time.time() - timeStragglersLastChecked >= self.config.speculationInterval:
+                    self.speculateStragglers()
+                    timeStragglersLastChecked = time.time()
 
-            else:
                 # Process jobs that have gone awry
 
                 #In the case that there is nothing happening
@@ -463,6 +594,16 @@ class Leader:
                         #in a minute, providing things are quiet
                     logger.info("Rescued any (long) missing jobs")
 
+            # Persist the jobs whose successors completed in this iteration before any of them is
+            # loaded again
+            if self.jobsToUpdate:
+                self.jobStore.updateMany(self.jobsToUpdate)
+                self.jobsToUpdate = []
+
+            # Save the state, which is consistent with the job store in between iterations
+            if self.journal is not None:
+                self.journal.update(self.toilState)
+
             # Check on the associated threads and exit if a failure is detected
             self.statsAndLogging.check()
             self.serviceManager.check()
@@ -497,7 +638,7 @@ class Leader:
         totalServicesIssued = self.serviceJobsIssued + self.preemptableServiceJobsIssued
         # If there are no updated jobs and at least some jobs running
         if totalServicesIssued >= totalRunningJobs and len(self.toilState.updatedJobs) == 0 and totalRunningJobs > 0:
-            serviceJobs = filter(lambda x : isinstance(x, ServiceJobNode), self.jobBatchSystemIDToIssuedJob.values())
+            serviceJobs = self.jobBatchSystemIDToIssuedServiceJob.values()
             runningServiceJobs = set(filter(lambda x : self.serviceManager.isRunning(x), serviceJobs))
             assert len(runningServiceJobs) <= totalRunningJobs
 
@@ -522,34 +663,138 @@ class Leader:
     def issueJob(self, jobNode):
         """
         Add a job to the queue of jobs
+
+        :return: the batch system ID of the job
         """
-        jobNode.command = ' '.join((resolveEntryPoint('_toil_worker'),
-                                    self.jobStoreLocator, jobNode.jobStoreID))
-        jobBatchSystemID = self.batchSystem.issueBatchJob(jobNode)
-        self.jobBatchSystemIDToIssuedJob[jobBatchSystemID] = jobNode
-        if jobNode.preemptable:
-            # len(jobBatchSystemIDToIssuedJob) should always be greater than or equal to preemptableJobsIssued,
-            # so increment this value after the job is added to the issuedJob dict
-            self.preemptableJobsIssued += 1
-        cur_logger = (logger.debug if jobNode.jobName.startswith(self.debugJobNames)
-                      else logger.info)
-        cur_logger("Issued job %s with job batch system ID: "
-                   "%s and cores: %s, disk: %s, and memory: %s",
-                   jobNode, str(jobBatchSystemID), int(jobNode.cores),
-                   bytes2human(jobNode.disk), bytes2human(jobNode.memory))
+        return self.issueJobs([jobNode])[0]
 
     def issueJobs(self, jobs):
         """
-        Add a list of jobs, each represented as a jobNode object
+        Add a list of jobs, each represented as a jobNode object, issuing them to the batch system
+        in one go
+
+        :return: the batch system IDs of the jobs, in the same order
+        :rtype: list[int]
+        """
+        workerArgs = [resolveEntryPoint('_toil_worker'), self.jobStoreLocator, None]
+        if self.bootstrapDigest is not None:
+            workerArgs.append(self.bootstrapDigest)
+        for jobNode in jobs:
+            workerArgs[2] = jobNode.jobStoreID
+            jobNode.command = ' '.join(workerArgs)
+        jobBatchSystemIDs = self.batchSystem.issueBatchJobs(jobs)
+        for jobNode, jobBatchSystemID in zip(jobs, jobBatchSystemIDs):
+            # The batch system has taken what it needs from the command, so we don't hold on to
+            # it for as long as the job is issued.
+            jobNode.command = None
+            requirements = (jobNode.memory, jobNode.cores, jobNode.disk, jobNode.preemptable)
+            requirements = self.issuedJobRequirements.setdefault(requirements, requirements)
+            self.jobBatchSystemIDToIssuedJob[jobBatchSystemID] = IssuedJob(
+                jobStoreID=jobNode.jobStoreID,
+                jobName=internString(jobNode.jobName),
+                requirements=requirements)
+            if isinstance(jobNode, ServiceJobNode):
+                self.jobBatchSystemIDToIssuedServiceJob[jobBatchSystemID] = jobNode
+            if jobNode.preemptable:
+                # len(jobBatchSystemIDToIssuedJob) should always be greater than or equal to preemptableJobsIssued,
+                # so increment this value after the job is added to the issuedJob dict
+                self.preemptableJobsIssued += 1
+            cur_logger = (logger.debug if jobNode.jobName.startswith(self.debugJobNames)
+                          else logger.info)
+            cur_logger("Issued job %s with job batch system ID: "
+                       "%s and cores: %s, disk: %s, and memory: %s",
+                       jobNode, str(jobBatchSystemID), int(jobNode.cores),
+                       bytes2human(jobNode.disk), bytes2human(jobNode.memory))
+        return jobBatchSystemIDs
+
+    def _queueJob(self, jobNode, tail, hasCommand=True):
+        """
+        Queues a job to be issued at the end of the current iteration of the main loop. Jobs are
+        issued in the order of their priority, the estimated run time of the longest path of
+        known work through the job, such that jobs on the critical path of the workflow start
+        first.
+
+        :param toil.job.JobNode jobNode: the job to queue
+        :param float tail: the estimated run time of the work following the job
+        :param bool hasCommand: False if the job is only issued to clean up after its successors
+        """
+        jobNode.priority = self._estimateRuntime(jobNode) + tail if hasCommand else tail
+        heappush(self.jobsToIssue,
+                 (-jobNode.priority, next(self.jobsToIssueSequence), jobNode, hasCommand))
+
+    def _queueJobGraph(self, jobGraph):
+        """
+        Queues a job graph that is to be (re)run, its whole stack of successors following it.
         """
-        for job in jobs:
-            self.issueJob(job)
+        self._queueJob(JobNode.fromJobGraph(jobGraph), self._getTail(jobGraph, jobGraph.stack),
+                       hasCommand=jobGraph.command is not None)
+
+    def _issueQueuedJobs(self):
+        """
+        Issues the queued jobs in the order of their priority.
+        """
+        jobNodes, hasCommands = [], []
+        while self.jobsToIssue:
+            _, _, jobNode, hasCommand = heappop(self.jobsToIssue)
+            jobNodes.append(jobNode)
+            hasCommands.append(hasCommand)
+        if jobNodes:
+            jobBatchSystemIDs = self.issueJobs(jobNodes)
+            for jobBatchSystemID, hasCommand in zip(jobBatchSystemIDs, hasCommands):
+                if not hasCommand:
+                    self.jobBatchSystemIDsWithoutCommand.add(jobBatchSystemID)
+
+    def _estimateRuntime(self, jobNode):
+        """
+        Estimates the run time of the given job as the average wall time of the jobs with the
+        same name that have completed so far, in this or an earlier attempt at running the
+        workflow, or zero if there are none.
+
+        :rtype: float
+        """
+        try:
+            runs, totalWallTime = self.jobRuntimes[jobNode.jobName]
+        except KeyError:
+            return 0.0
+        return totalWallTime / runs
+
+    def _recordRuntime(self, jobNode, wallTime):
+        """
+        Adds the wall time of a successful run of the given job to the estimate of the run time
+        of jobs of the same name.
+        """
+        runs, totalWallTime = self.jobRuntimes.get(jobNode.jobName, (0, 0.0))
+        self.jobRuntimes[internString(jobNode.jobName)] = (runs + 1, totalWallTime + wallTime)
+        if self.config.speculativePercentile is not None:
+            samples = self.jobRuntimeSamples.setdefault(internString(jobNode.jobName), [])
+            if len(samples) < self.maxRuntimeSamples:
+                insort(samples, wallTime)
+            elif random.randrange(runs + 1) < self.maxRuntimeSamples:
+                # Replace a random sample, which keeps the sample uniform (reservoir sampling)
+                del samples[random.randrange(len(samples))]
+                insort(samples, wallTime)
+
+    def _getTail(self, jobGraph, levels):
+        """
+        Estimates the run time of the work that can only start once the given levels of the
+        stack of the given job are done, i.e. the levels themselves, run one after the other,
+        and the work that follows the job.
+
+        :param toil.jobGraph.JobGraph jobGraph: the job
+        :param list[list[toil.job.JobNode]] levels: some levels of the stack of the job
+        :rtype: float
+        """
+        return (self.jobTails.get(jobGraph.jobStoreID, 0.0) +
+                sum(max(self._estimateRuntime(jobNode) for jobNode in jobNodes)
+                    for jobNodes in levels if jobNodes))
 
     def issueServiceJob(self, jobNode):
         """
         Issue a service job, putting it on a queue if the maximum number of service
         jobs to be scheduled has been reached.
         """
+        # The jobs using the service are blocked until it is running
+        jobNode.priority = float('inf')
         if jobNode.preemptable:
             self.preemptableServiceJobsToBeIssued.append(jobNode)
         else:
@@ -560,12 +805,15 @@ class Leader:
         """
         Issues any queuing service jobs up to the limit of the maximum allowed.
         """
+        jobNodes = []
         while len(self.serviceJobsToBeIssued) > 0 and self.serviceJobsIssued < self.config.maxServiceJobs:
-            self.issueJob(self.serviceJobsToBeIssued.pop())
+            jobNodes.append(self.serviceJobsToBeIssued.pop())
             self.serviceJobsIssued += 1
         while len(self.preemptableServiceJobsToBeIssued) > 0 and self.preemptableServiceJobsIssued < self.config.maxPreemptableServiceJobs:
-            self.issueJob(self.preemptableServiceJobsToBeIssued.pop())
+            jobNodes.append(self.preemptableServiceJobsToBeIssued.pop())
             self.preemptableServiceJobsIssued += 1
+        if jobNodes:
+            self.issueJobs(jobNodes)
 
     def getNumberOfJobsIssued(self, preemptable=None):
         """
@@ -605,22 +853,23 @@ class Leader:
         Removes a job from the system.
         """
         assert jobBatchSystemID in self.jobBatchSystemIDToIssuedJob
-        jobNode = self.jobBatchSystemIDToIssuedJob[jobBatchSystemID]
-        if jobNode.preemptable:
+        issuedJob = self.jobBatchSystemIDToIssuedJob[jobBatchSystemID]
+        if issuedJob.preemptable:
             # len(jobBatchSystemIDToIssuedJob) should always be greater than or equal to preemptableJobsIssued,
             # so decrement this value before removing the job from the issuedJob map
             assert self.preemptableJobsIssued > 0
             self.preemptableJobsIssued -= 1
         del self.jobBatchSystemIDToIssuedJob[jobBatchSystemID]
+        self.jobBatchSystemIDToIssuedServiceJob.pop(jobBatchSystemID, None)
         # If service job
-        if jobNode.jobStoreID in self.toilState.serviceJobStoreIDToPredecessorJob:
+        if issuedJob.jobStoreID in self.toilState.serviceJobStoreIDToPredecessorJob:
             # Decrement the number of services
-            if jobNode.preemptable:
+            if issuedJob.preemptable:
                 self.preemptableServiceJobsIssued -= 1
             else:
                 self.serviceJobsIssued -= 1
 
-        return jobNode
+        return issuedJob
 
     def getJobIDs(self):
         """
@@ -637,6 +886,38 @@ class Leader:
             for jobBatchSystemID in jobsToKill:
                 self.processFinishedJob(jobBatchSystemID, 1)
 
+    def speculateStragglers(self):
+        """
+        Issues a backup attempt of each job that has been running for longer than the configured
+        percentile of the wall times of the completed jobs of the same name. The first attempt to
+        complete wins, see processFinishedJob(). The worker of any other attempt that tries to
+        complete the job is rejected by the job store and discards its results. Toil refuses to
+        run jobs speculatively with a job store that doesn't support conditional updates.
+        """
+        percentile = self.config.speculativePercentile
+        if percentile is None:
+            return
+        for jobBatchSystemID, runTime in self.batchSystem.getRunningBatchJobIDs().items():
+            issuedJob = self.jobBatchSystemIDToIssuedJob.get(jobBatchSystemID)
+            # Service jobs run until they are told to stop and jobs without a command only clean
+            # up after their successors
+            if (issuedJob is None or issuedJob.jobStoreID in self.speculatedJobs
+                    or jobBatchSystemID in self.jobBatchSystemIDToIssuedServiceJob
+                    or jobBatchSystemID in self.jobBatchSystemIDsWithoutCommand):
+                continue
+            samples = self.jobRuntimeSamples.get(issuedJob.jobName)
+            if samples is None or len(samples) < self.minRuntimeSamples:
+                continue
+            threshold = samples[min(len(samples) - 1, int(len(samples) * percentile / 100))]
+            if runTime > threshold:
+                logger.warn("The job %s has been running for %i seconds, longer than %s percent "
+                            "of the completed jobs of the same name. Issuing a backup attempt.",
+                            issuedJob, runTime, percentile)
+                jobNode = JobNode.fromJobGraph(self.jobStore.load(issuedJob.jobStoreID))
+                backupJobBatchSystemID = self.issueJob(jobNode)
+                self.speculatedJobs[issuedJob.jobStoreID] = {jobBatchSystemID,
+                                                             backupJobBatchSystemID}
+
     #Following functions handle error cases for when jobs have gone awry with the batch system.
 
     def reissueOverLongJobs(self):
@@ -693,6 +974,25 @@ class Leader:
         return len( self.reissueMissingJobs_missingHash ) == 0 #We use this to inform
         #if there are missing jobs
 
+    def processUpdatedBatchJob(self, batchSystemID, resultStatus, wallTime):
+        """
+        Processes a single update received from the batch system.
+        """
+        try:
+            updatedJob = self.jobBatchSystemIDToIssuedJob[batchSystemID]
+        except KeyError:
+            logger.warn("A result seems to already have been processed "
+                        "for job %s", batchSystemID)
+        else:
+            if resultStatus == 0:
+                cur_logger = (logger.debug if str(updatedJob.jobName).startswith(self.debugJobNames)
+                              else logger.info)
+                cur_logger('Job ended successfully: %s', updatedJob)
+            else:
+                logger.warn('Job failed with exit value %i: %s',
+                            resultStatus, updatedJob)
+            self.processFinishedJob(batchSystemID, resultStatus, wallTime=wallTime)
+
     def processFinishedJob(self, batchSystemID, resultStatus, wallTime=None):
         """
         Function reads a processed jobGraph file and updates it state.
@@ -701,13 +1001,26 @@ class Leader:
             if resultStatus != 0:
                 logger.warn("Despite the batch system claiming failure the "
                             "job %s seems to have finished and been removed", issuedJob)
+            self.jobTails.pop(issuedJob.jobStoreID, None)
+            if self.journal is not None:
+                self.journal.recordRemovedJob(issuedJob.jobStoreID)
             self._updatePredecessorStatus(issuedJob.jobStoreID)
-        jobNode = self.removeJob(batchSystemID)
-        jobStoreID = jobNode.jobStoreID
+        issuedJob = self.removeJob(batchSystemID)
+        jobStoreID = issuedJob.jobStoreID
+        if jobStoreID in self.speculatedJobs and not self._resolveAttempt(jobStoreID,
+                                                                          batchSystemID,
+                                                                          resultStatus):
+            logger.debug("Ignoring the unsuccessful attempt %s at running job %s while another "
+                         "attempt is running", batchSystemID, issuedJob)
+            return
         if wallTime is not None and self.clusterScaler is not None:
-            self.clusterScaler.addCompletedJob(jobNode, wallTime)
+            self.clusterScaler.addCompletedJob(issuedJob, wallTime)
+        if batchSystemID in self.jobBatchSystemIDsWithoutCommand:
+            self.jobBatchSystemIDsWithoutCommand.remove(batchSystemID)
+        elif wallTime is not None and resultStatus == 0:
+            self._recordRuntime(issuedJob, wallTime)
         if self.jobStore.exists(jobStoreID):
-            logger.debug("Job %s continues to exist (i.e. has more to do)", jobNode)
+            logger.debug("Job %s continues to exist (i.e. has more to do)", issuedJob)
             try:
                 jobGraph = self.jobStore.load(jobStoreID)
             except NoSuchJobException:
@@ -718,8 +1031,8 @@ class Leader:
                     # Process the job from here as any other job removed from the job store.
                     # This is a temporary work around until https://github.com/BD2KGenomics/toil/issues/1091
                     # is completed
-                    logger.warn('Got a stale read from SDB for job %s', jobNode)
-                    processRemovedJob(jobNode)
+                    logger.warn('Got a stale read from SDB for job %s', issuedJob)
+                    processRemovedJob(issuedJob)
                     return
                 else:
                     raise
@@ -738,18 +1051,49 @@ class Leader:
                 # is assumed not to have captured the failure of the job, so we
                 # reduce the retry count here.
                 if jobGraph.logJobStoreFileID is None:
-                    logger.warn("No log file is present, despite job failing: %s", jobNode)
+                    logger.warn("No log file is present, despite job failing: %s", issuedJob)
                 jobGraph.setupJobAfterFailure(self.config)
                 self.jobStore.update(jobGraph)
             elif jobStoreID in self.toilState.hasFailedSuccessors:
                 # If the job has completed okay, we can remove it from the list of jobs with failed successors
                 self.toilState.hasFailedSuccessors.remove(jobStoreID)
+            # The job graph isn't written again by the leader, which doesn't need the pickled job
+            # stored inline with it
+            jobGraph.pickledJob = None
 
             self.toilState.updatedJobs.add((jobGraph, resultStatus)) #Now we know the
             #jobGraph is done we can add it to the list of updated jobGraph files
             logger.debug("Added job: %s to active jobs", jobGraph)
         else:  #The jobGraph is done
-            processRemovedJob(jobNode)
+            processRemovedJob(issuedJob)
+
+    def _resolveAttempt(self, jobStoreID, batchSystemID, resultStatus):
+        """
+        Decides whether the result of the given finished attempt at running a speculatively run
+        job is to be processed. It is if the attempt completed the job, in which case the other
+        attempts are killed, or if it was the last attempt.
+
+        :rtype: bool
+        """
+        attempts = self.speculatedJobs[jobStoreID]
+        attempts.remove(batchSystemID)
+        if attempts:
+            if resultStatus != 0:
+                return False
+            # A job that failed in the worker still has its command
+            if self.jobStore.exists(jobStoreID):
+                try:
+                    if self.jobStore.load(jobStoreID).command is not None:
+                        return False
+                except NoSuchJobException:
+                    pass
+            logger.debug("Killing the redundant attempts %s at running job %s",
+                         list(attempts), jobStoreID)
+            self.batchSystem.killBatchJobs(list(attempts))
+            for attempt in attempts:
+                self.removeJob(attempt)
+        del self.speculatedJobs[jobStoreID]
+        return True
 
     @staticmethod
     def getSuccessors(jobGraph, alreadySeenSuccessors, jobStore):
@@ -792,12 +1136,14 @@ class Leader:
         """
         # Mark job as a totally failed job
         self.toilState.totalFailedJobs.add(JobNode.fromJobGraph(jobGraph))
+        if self.journal is not None:
+            self.journal.recordFailedJob(jobGraph.jobStoreID)
 
         if jobGraph.jobStoreID in self.toilState.serviceJobStoreIDToPredecessorJob: # Is
             # a service job
             logger.debug("Service job is being processed as a totally failed job: %s", jobGraph)
 
-            predecesssorJobGraph = self.toilState.serviceJobStoreIDToPredecessorJob[jobGraph.jobStoreID]
+            predecessorJobStoreID = self.toilState.serviceJobStoreIDToPredecessorJob[jobGraph.jobStoreID]
 
             # This removes the service job as a service of the predecessor
             # and potentially makes the predecessor active
@@ -811,11 +1157,11 @@ class Leader:
             # Signal to any other services in the group that they should
             # terminate. We do this to prevent other services in the set
             # of services from deadlocking waiting for this service to start properly
-            if predecesssorJobGraph.jobStoreID in self.toilState.servicesIssued:
-                self.serviceManager.killServices(self.toilState.servicesIssued[predecesssorJobGraph.jobStoreID], error=True)
+            if predecessorJobStoreID in self.toilState.servicesIssued:
+                self.serviceManager.killServices(self.toilState.servicesIssued[predecessorJobStoreID], error=True)
                 logger.debug("Job: %s is instructing all the services of its parent job to quit", jobGraph)
 
-            self.toilState.hasFailedSuccessors.add(predecesssorJobGraph.jobStoreID) # This ensures that the
+            self.toilState.hasFailedSuccessors.add(predecessorJobStoreID) # This ensures that the
             # job will not attempt to run any of it's successors on the stack
         else:
             # Is a non-service job
@@ -839,51 +1185,72 @@ class Leader:
                     # For each such predecessor job
                     # (we remove the successor from toilState.successorJobStoreIDToPredecessorJobs to avoid doing
                     # this multiple times for each failed predecessor)
-                    for predecessorJob in self.toilState.successorJobStoreIDToPredecessorJobs.pop(successorJobStoreID):
+                    for predecessorJobStoreID in self.toilState.successorJobStoreIDToPredecessorJobs.pop(successorJobStoreID):
 
                         # Reduce the predecessor job's successor count.
-                        self.toilState.successorCounts[predecessorJob.jobStoreID] -= 1
+                        self.toilState.successorCounts[predecessorJobStoreID] -= 1
 
                         # Indicate that it has failed jobs.
-                        self.toilState.hasFailedSuccessors.add(predecessorJob.jobStoreID)
+                        self.toilState.hasFailedSuccessors.add(predecessorJobStoreID)
                         logger.debug("Marking job: %s as having failed successors (found by "
-                                     "reading successors failed job)", predecessorJob)
+                                     "reading successors failed job)", predecessorJobStoreID)
 
                         # If the predecessor has no remaining successors, add to list of active jobs
-                        assert self.toilState.successorCounts[predecessorJob.jobStoreID] >= 0
-                        if self.toilState.successorCounts[predecessorJob.jobStoreID] == 0:
-                            self.toilState.updatedJobs.add((predecessorJob, 0))
+                        assert self.toilState.successorCounts[predecessorJobStoreID] >= 0
+                        if self.toilState.successorCounts[predecessorJobStoreID] == 0:
+                            self.toilState.updatedJobs.add((self.loadWaitingJobGraph(predecessorJobStoreID), 0))
 
                             # Remove the predecessor job from the set of jobs with successors.
-                            self.toilState.successorCounts.pop(predecessorJob.jobStoreID)
+                            self.toilState.successorCounts.pop(predecessorJobStoreID)
 
             # If the job has predecessor(s)
             if jobGraph.jobStoreID in self.toilState.successorJobStoreIDToPredecessorJobs:
 
                 # For each predecessor of the job
-                for predecessorJobGraph in self.toilState.successorJobStoreIDToPredecessorJobs[jobGraph.jobStoreID]:
+                for predecessorJobStoreID in self.toilState.successorJobStoreIDToPredecessorJobs[jobGraph.jobStoreID]:
 
                     # Mark the predecessor as failed
-                    self.toilState.hasFailedSuccessors.add(predecessorJobGraph.jobStoreID)
+                    self.toilState.hasFailedSuccessors.add(predecessorJobStoreID)
                     logger.debug("Totally failed job: %s is marking direct predecessor: %s "
-                                 "as having failed jobs", jobGraph, predecessorJobGraph)
+                                 "as having failed jobs", jobGraph, predecessorJobStoreID)
 
                 self._updatePredecessorStatus(jobGraph.jobStoreID)
 
+    def loadWaitingJobGraph(self, jobStoreID, popSuccessors=False):
+        """
+        Loads the job graph of a job that was waiting on its successors or services, which the
+        leader only references by ID while they run.
+
+        :param str jobStoreID: the ID of the job
+        :param bool popSuccessors: If True, all successors in the topmost list of the job's stack
+               have completed. The list is removed from the stack and the job is queued to be
+               updated in the job store at the end of the current iteration of the main loop, such
+               that the job's successors aren't considered again if the job is loaded once more.
+        :rtype: toil.jobGraph.JobGraph
+        """
+        jobGraph = self.jobStore.load(jobStoreID)
+        if popSuccessors:
+            jobGraph.stack.pop()
+            self.jobsToUpdate.append(jobGraph)
+        # Services are started before the successors are scheduled, so at this point they have
+        # already been handed to the service manager.
+        jobGraph.services = []
+        return jobGraph
+
     def _updatePredecessorStatus(self, jobStoreID):
         """
         Update status of predecessors for finished successor job.
         """
         if jobStoreID in self.toilState.serviceJobStoreIDToPredecessorJob:
             # Is a service job
-            predecessorJob = self.toilState.serviceJobStoreIDToPredecessorJob.pop(jobStoreID)
-            self.toilState.servicesIssued[predecessorJob.jobStoreID].pop(jobStoreID)
-            if len(self.toilState.servicesIssued[predecessorJob.jobStoreID]) == 0: # Predecessor job has
+            predecessorJobStoreID = self.toilState.serviceJobStoreIDToPredecessorJob.pop(jobStoreID)
+            self.toilState.servicesIssued[predecessorJobStoreID].pop(jobStoreID)
+            if len(self.toilState.servicesIssued[predecessorJobStoreID]) == 0: # Predecessor job has
                 # all its services terminated
-                self.toilState.servicesIssued.pop(predecessorJob.jobStoreID) # The job has no running services
-                self.toilState.updatedJobs.add((predecessorJob, 0)) # Now we know
+                self.toilState.servicesIssued.pop(predecessorJobStoreID) # The job has no running services
+                self.toilState.updatedJobs.add((self.loadWaitingJobGraph(predecessorJobStoreID), 0)) # Now we know
                 # the job is done we can add it to the list of updated job files
-                logger.debug("Job %s services have completed or totally failed, adding to updated jobs", predecessorJob)
+                logger.debug("Job %s services have completed or totally failed, adding to updated jobs", predecessorJobStoreID)
 
         elif jobStoreID not in self.toilState.successorJobStoreIDToPredecessorJobs:
             #We have reach the root job
@@ -897,24 +1264,22 @@ class Leader:
             logger.debug("Cleaning the predecessors of %s" % jobStoreID)
 
             # For each predecessor
-            for predecessorJob in self.toilState.successorJobStoreIDToPredecessorJobs.pop(jobStoreID):
+            for predecessorJobStoreID in self.toilState.successorJobStoreIDToPredecessorJobs.pop(jobStoreID):
 
                 # Reduce the predecessor's number of successors by one to indicate the
                 # completion of the jobStoreID job
-                self.toilState.successorCounts[predecessorJob.jobStoreID] -= 1
+                self.toilState.successorCounts[predecessorJobStoreID] -= 1
 
                 # If the predecessor job is done and all the successors are complete
-                if self.toilState.successorCounts[predecessorJob.jobStoreID] == 0:
+                if self.toilState.successorCounts[predecessorJobStoreID] == 0:
 
                     # Remove it from the set of jobs with active successors
-                    self.toilState.successorCounts.pop(predecessorJob.jobStoreID)
+                    self.toilState.successorCounts.pop(predecessorJobStoreID)
 
-                    if predecessorJob.jobStoreID not in self.toilState.hasFailedSuccessors:
-                        # Pop stack at this point, as we can get rid of its successors
-                        predecessorJob.stack.pop()
+                    predecessorJob = self.loadWaitingJobGraph(predecessorJobStoreID,
+                        popSuccessors=predecessorJobStoreID not in self.toilState.hasFailedSuccessors)
 
                     # Now we know the job is done we can add it to the list of updated job files
-                    assert predecessorJob not in self.toilState.updatedJobs
                     self.toilState.updatedJobs.add((predecessorJob, 0))
 
                     logger.debug('Job %s has all its non-service successors completed or totally '
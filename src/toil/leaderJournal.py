@@ -0,0 +1,210 @@
+# Copyright (C) 2015-2017 Regents of the University of California
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import absolute_import
+
+import logging
+import time
+
+# Python 3 compatibility imports
+from six.moves import cPickle
+
+from toil.jobStores.abstractJobStore import NoSuchFileException
+
+logger = logging.getLogger( __name__ )
+
+
+class LeaderJournal( object ):
+    """
+    Saves the scheduling state of the leader to the job store, such that the leader of a later
+    attempt at running the workflow can restore it instead of cleaning and traversing the entire
+    job store.
+
+    The state is saved as a snapshot of the jobs waiting for their successors, taken
+    periodically, followed by a journal of the jobs that have been removed from the job store or
+    have totally failed since. On restart, only the jobs that were not waiting for their
+    successors when the snapshot was taken are loaded from the job store again, see
+    :class:`toil.toilState.ToilState`. The journal spares loading the jobs known to be gone and
+    names the failed jobs to be retried, so records lost when the leader dies are recovered from
+    the job store.
+
+    The snapshot and each segment of the journal are kept in files of their own. The shared file
+    references the snapshot and the first segment, each segment references the next one. The last
+    segment is empty and is written once there are records to add to the journal.
+    """
+    sharedFileName = 'leaderJournal'
+
+    # The minimum number of seconds between writes of segments of the journal
+    flushInterval = 10
+
+    def __init__(self, jobStore, snapshotInterval):
+        """
+        :param toil.jobStores.abstractJobStore.AbstractJobStore jobStore:
+        :param float snapshotInterval: the minimum number of seconds between snapshots
+        """
+        self.jobStore = jobStore
+        self.snapshotInterval = snapshotInterval
+
+        # The state restored from the job store, if any, see popSnapshot()
+        self.snapshot = None
+        self.restoredRemovedJobStoreIDs = []
+        self.restoredFailedJobStoreIDs = []
+
+        # The IDs of the removed and of the totally failed jobs to be written with the next
+        # segment of the journal
+        self.removedJobStoreIDs = []
+        self.failedJobStoreIDs = []
+
+        # The ID of the file the next segment of the journal is written to, None if no snapshot
+        # has been taken yet
+        self.segmentID = None
+
+        # The IDs of the files of the current snapshot and journal, which are deleted once the
+        # next snapshot has been taken
+        self.fileIDs = []
+
+        self.timeOfLastSnapshot = time.time()
+        self.timeOfLastFlush = time.time()
+
+    @classmethod
+    def load(cls, jobStore, snapshotInterval):
+        """
+        Loads the snapshot and the journal saved by the leader of a previous attempt at running
+        the workflow. The returned journal keeps appending to the loaded one.
+
+        :param toil.jobStores.abstractJobStore.AbstractJobStore jobStore:
+        :param float snapshotInterval: the minimum number of seconds between snapshots
+
+        :return: the loaded journal or None if the job store does not contain a snapshot
+        :rtype: LeaderJournal|None
+        """
+        try:
+            with jobStore.readSharedFileStream(cls.sharedFileName) as f:
+                snapshotID, segmentID = cPickle.load(f)
+        except NoSuchFileException:
+            logger.info('No snapshot of the state of the workflow was found in the job store.')
+            return None
+        journal = cls(jobStore, snapshotInterval)
+        try:
+            with jobStore.readFileStream(snapshotID) as f:
+                journal.snapshot = cPickle.load(f)
+        except NoSuchFileException:
+            logger.warn('The snapshot of the state of the workflow is missing from the job store.')
+            return None
+        journal.fileIDs.append(snapshotID)
+        while True:
+            journal.fileIDs.append(segmentID)
+            with jobStore.readFileStream(segmentID) as f:
+                try:
+                    removedJobStoreIDs, failedJobStoreIDs, nextSegmentID = cPickle.load(f)
+                except EOFError:
+                    # The last segment is empty
+                    break
+                except Exception:
+                    # The leader died while writing the segment, which will be overwritten
+                    logger.warn('Ignoring the incomplete last segment of the journal.')
+                    break
+            journal.restoredRemovedJobStoreIDs.extend(removedJobStoreIDs)
+            journal.restoredFailedJobStoreIDs.extend(failedJobStoreIDs)
+            segmentID = nextSegmentID
+        journal.segmentID = segmentID
+        logger.info('Loaded a snapshot of the state of the workflow and a journal of %i removed '
+                    'and %i failed jobs.', len(journal.restoredRemovedJobStoreIDs),
+                    len(journal.restoredFailedJobStoreIDs))
+        return journal
+
+    def popSnapshot(self):
+        """
+        Returns the loaded snapshot, as returned by
+        :meth:`toil.toilState.ToilState.getSnapshot`, the IDs of the jobs that were removed
+        since it was taken and the IDs of the jobs that totally failed since, and releases them.
+
+        :rtype: (dict, list[str], list[str])
+        """
+        restored = (self.snapshot, self.restoredRemovedJobStoreIDs,
+                    self.restoredFailedJobStoreIDs)
+        self.snapshot = None
+        self.restoredRemovedJobStoreIDs, self.restoredFailedJobStoreIDs = [], []
+        return restored
+
+    def recordRemovedJob(self, jobStoreID):
+        """
+        Adds the given job to the journal, as it has been removed from the job store.
+
+        :param str jobStoreID: the ID of the removed job
+        """
+        # Before the first snapshot, there is no journal to add the job to
+        if self.segmentID is not None:
+            self.removedJobStoreIDs.append(jobStoreID)
+
+    def recordFailedJob(self, jobStoreID):
+        """
+        Adds the given job to the journal, as it has totally failed. A restarted workflow retries
+        it like it would after cleaning the job store.
+
+        :param str jobStoreID: the ID of the failed job
+        """
+        # Before the first snapshot, there is no journal to add the job to
+        if self.segmentID is not None:
+            self.failedJobStoreIDs.append(jobStoreID)
+
+    def update(self, toilState):
+        """
+        Takes a snapshot of the given state if one is due, and writes the pending records to the
+        journal otherwise. Must only be called while the state is consistent with the job store.
+
+        :param toil.toilState.ToilState toilState: the state of the leader
+        """
+        now = time.time()
+        if now - self.timeOfLastSnapshot >= self.snapshotInterval:
+            snapshot = toilState.getSnapshot()
+            if snapshot is not None:
+                self._writeSnapshot(snapshot)
+                return
+        if ((len(self.removedJobStoreIDs) > 0 or len(self.failedJobStoreIDs) > 0)
+                and now - self.timeOfLastFlush >= self.flushInterval):
+            self._flush()
+
+    def _writeSnapshot(self, snapshot):
+        """
+        Writes the given snapshot and starts a new journal, deleting the previous ones.
+        """
+        with self.jobStore.writeFileStream() as (f, snapshotID):
+            cPickle.dump(snapshot, f, protocol=cPickle.HIGHEST_PROTOCOL)
+        segmentID = self.jobStore.getEmptyFileStoreID()
+        with self.jobStore.writeSharedFileStream(self.sharedFileName) as f:
+            cPickle.dump((snapshotID, segmentID), f, protocol=cPickle.HIGHEST_PROTOCOL)
+        for fileID in self.fileIDs:
+            self.jobStore.deleteFile(fileID)
+        self.fileIDs = [snapshotID, segmentID]
+        self.segmentID = segmentID
+        # The snapshot already reflects the removal of these jobs
+        self.removedJobStoreIDs = []
+        self.failedJobStoreIDs = []
+        self.timeOfLastSnapshot = self.timeOfLastFlush = time.time()
+        logger.debug('Saved a snapshot of the state of the workflow.')
+
+    def _flush(self):
+        """
+        Writes the pending records to the last segment of the journal.
+        """
+        segmentID = self.jobStore.getEmptyFileStoreID()
+        with self.jobStore.updateFileStream(self.segmentID) as f:
+            cPickle.dump((self.removedJobStoreIDs, self.failedJobStoreIDs, segmentID), f,
+                         protocol=cPickle.HIGHEST_PROTOCOL)
+        self.fileIDs.append(segmentID)
+        self.segmentID = segmentID
+        self.removedJobStoreIDs = []
+        self.failedJobStoreIDs = []
+        self.timeOfLastFlush = time.time()
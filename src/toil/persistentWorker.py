@@ -0,0 +1,97 @@
+# Copyright (C) 2015-2017 Regents of the University of California
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import absolute_import
+
+import os
+import subprocess
+
+# Python 3 compatibility imports
+from six.moves import cPickle
+
+
+class PersistentWorker(object):
+    """
+    A long-lived Toil worker process that runs jobs one after another, keeping modules, the job
+    store and the workflow configuration loaded in between. See :func:`toil.worker.persistentWorker`
+    for the other side of the protocol.
+    """
+
+    def __init__(self, workerCommand, env, newProcessGroup=False):
+        """
+        :param str workerCommand: the path to the worker entry point
+
+        :param dict[str,str] env: the environment to start the worker process with
+
+        :param bool newProcessGroup: whether to start the worker process in a process group of its
+               own, such that it can be killed along with any processes spawned by its jobs
+        """
+        self.workerCommand = workerCommand
+        self.popen = subprocess.Popen([workerCommand, '--persistent'],
+                                      stdin=subprocess.PIPE,
+                                      stdout=subprocess.PIPE,
+                                      env=env,
+                                      preexec_fn=os.setpgrp if newProcessGroup else None,
+                                      close_fds=True)
+
+    @staticmethod
+    def parseWorkerCommand(jobCommand):
+        """
+        Determines whether the given command can be run by a persistent worker.
+
+        :return: None if the command should be run in a process of its own, otherwise a tuple
+                 of the path to the worker entry point, the job store locator and the job store
+                 ID of the job.
+        :rtype: tuple(str,str,str)|None
+        """
+        args = jobCommand.split()
+        # Persistent workers keep the config and environment loaded, any bootstrap digest
+        # following the job store ID is not needed
+        if len(args) in (3, 4) and os.path.basename(args[0]) == '_toil_worker':
+            return tuple(args[:3])
+        return None
+
+    def runJob(self, jobStoreLocator, jobStoreID, environment):
+        """
+        Runs the given job in the worker process and waits for it to finish.
+
+        :return: The exit status of the job. If the worker process died while running the job,
+                 this is the exit status of the process. The worker must not be used again if
+                 its process has exited, which it also does after a failed job.
+        :rtype: int
+        """
+        try:
+            cPickle.dump((jobStoreLocator, jobStoreID, environment),
+                         self.popen.stdin, cPickle.HIGHEST_PROTOCOL)
+            self.popen.stdin.flush()
+            exitStatus, exiting = cPickle.load(self.popen.stdout)
+        except (IOError, EOFError, cPickle.UnpicklingError):
+            try:
+                self.popen.stdin.close()
+            except IOError:
+                # The request may still be buffered, with nobody left to read it
+                pass
+            return self.popen.wait()
+        if exiting:
+            # Wait for the process to exit so that it is not mistaken for an idle worker
+            self.popen.stdin.close()
+            self.popen.wait()
+        return exitStatus
+
+    def shutdown(self):
+        """
+        Tells the worker process to exit once it is idle and waits for it to do so.
+        """
+        self.popen.stdin.close()
+        self.popen.wait()
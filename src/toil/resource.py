@@ -15,23 +15,26 @@
 from __future__ import absolute_import
 
 import errno
+import fcntl
 import hashlib
 import importlib
 import json
 import logging
 import os
 import shutil
+import stat
 import sys
+import time
 from collections import namedtuple
-from contextlib import closing
+from contextlib import closing, contextmanager
 from io import BytesIO
 from pydoc import locate
-from tempfile import mkdtemp
+from tempfile import gettempdir, mkdtemp
 from urllib2 import HTTPError
 from zipfile import ZipFile
 
 # Python 3 compatibility imports
-from bd2k.util.retry import retry
+from six.moves import cPickle
 from six.moves.urllib.request import urlopen
 
 from bd2k.util import strict_bool
@@ -56,6 +59,10 @@ class Resource(namedtuple('Resource', ('name', 'pathHash', 'url', 'contentHash')
     The contentHash element is an MD5 checksum of the resource, allowing for validation and
     caching of resources.
 
+    On the worker nodes, resources are downloaded to a directory shared by all workers of the same
+    user, such that a resource is downloaded once per node, not once per worker. See
+    :meth:`prepareSystem`.
+
     If the resource is a regular file, the type attribute will be 'file'.
 
     If the resource is a directory, the type attribute will be 'dir' and the URL will point at a
@@ -66,6 +73,10 @@ class Resource(namedtuple('Resource', ('name', 'pathHash', 'url', 'contentHash')
 
     rootDirPathEnvName = resourceEnvNamePrefix + 'ROOT'
 
+    # Downloaded resources that have not been used for this many seconds are deleted when another
+    # resource is downloaded
+    maxUnusedTime = 7 * 24 * 60 * 60
+
     @classmethod
     def create(cls, jobStore, leaderPath):
         """
@@ -73,6 +84,10 @@ class Resource(namedtuple('Resource', ('name', 'pathHash', 'url', 'contentHash')
         and returns a resource object representing that content for the purpose of obtaining it
         again at a generic, public URL. This method should be invoked on the leader node.
 
+        If the content was saved to the job store before and the files at the given path haven't
+        been modified since, it isn't saved again, which spares zipping and uploading large
+        directories on every restart of a workflow.
+
         :param toil.jobStores.abstractJobStore.AbstractJobStore jobStore:
 
         :param str leaderPath:
@@ -80,17 +95,71 @@ class Resource(namedtuple('Resource', ('name', 'pathHash', 'url', 'contentHash')
         :rtype: Resource
         """
         pathHash = cls._pathHash(leaderPath)
-        contentHash = hashlib.md5()
-        # noinspection PyProtectedMember
-        with cls._load(leaderPath) as src:
-            with jobStore.writeSharedFileStream(sharedFileName=pathHash, isProtected=False) as dst:
-                userScript = src.read()
-                contentHash.update(userScript)
-                dst.write(userScript)
+        # The fingerprint of the files saved last and the hash of their content
+        fingerprintFileName = pathHash + '.fingerprint'
+        fingerprint = cls._fingerprint(leaderPath)
+        savedFingerprint = cls._loadFingerprint(jobStore, fingerprintFileName)
+        if savedFingerprint is not None and savedFingerprint[0] == fingerprint:
+            log.info("The content of '%s' is unchanged, not saving it again.", leaderPath)
+            contentHash = savedFingerprint[1]
+        else:
+            if savedFingerprint is not None:
+                # Invalidate the fingerprint such that a failure to save the content is noticed
+                with jobStore.writeSharedFileStream(fingerprintFileName, isProtected=False) as f:
+                    cPickle.dump(None, f, cPickle.HIGHEST_PROTOCOL)
+            contentHash = hashlib.md5()
+            # noinspection PyProtectedMember
+            with cls._load(leaderPath) as src:
+                with jobStore.writeSharedFileStream(sharedFileName=pathHash,
+                                                    isProtected=False) as dst:
+                    userScript = src.read()
+                    contentHash.update(userScript)
+                    dst.write(userScript)
+            contentHash = contentHash.hexdigest()
+            with jobStore.writeSharedFileStream(fingerprintFileName, isProtected=False) as f:
+                cPickle.dump((fingerprint, contentHash), f, cPickle.HIGHEST_PROTOCOL)
         return cls(name=os.path.basename(leaderPath),
                    pathHash=pathHash,
                    url=jobStore.getSharedPublicUrl(sharedFileName=pathHash),
-                   contentHash=contentHash.hexdigest())
+                   contentHash=contentHash)
+
+    @classmethod
+    def _fingerprint(cls, path):
+        """
+        Returns a digest of the names, sizes and modification times of the files and directories
+        at the given path. The digest changes whenever the content of the resource would.
+
+        :type path: str
+        :rtype: str
+        """
+        fingerprint = hashlib.md5(cls.__name__)
+
+        def update(filePath):
+            fileStat = os.stat(filePath)
+            fingerprint.update('%s\0%i\0%r\0' % (os.path.relpath(filePath, path),
+                                                  fileStat.st_size, fileStat.st_mtime))
+
+        update(path)
+        if os.path.isdir(path):
+            for dirPath, dirNames, fileNames in os.walk(path):
+                # Walk the tree in a well-defined order
+                dirNames.sort()
+                for name in dirNames + sorted(fileNames):
+                    update(os.path.join(dirPath, name))
+        return fingerprint.hexdigest()
+
+    @classmethod
+    def _loadFingerprint(cls, jobStore, fingerprintFileName):
+        """
+        :return: the fingerprint and content hash saved to the given job store, if any
+        :rtype: (str,str)|None
+        """
+        from toil.jobStores.abstractJobStore import NoSuchFileException
+        try:
+            with jobStore.readSharedFileStream(fingerprintFileName) as f:
+                return cPickle.load(f)
+        except NoSuchFileException:
+            return None
 
     def refresh(self, jobStore):
         return type(self)(name=self.name,
@@ -103,12 +172,27 @@ class Resource(namedtuple('Resource', ('name', 'pathHash', 'url', 'contentHash')
         """
         Prepares this system for the downloading and lookup of resources. This method should only
         be invoked on a worker node. It is idempotent but not thread-safe.
+
+        Resources are downloaded to a directory in the directory specified by TOIL_WORKDIR or the
+        system's temporary directory, which is shared by all workers of the current user. Should
+        other users be able to write to it, a private directory is used instead.
         """
         try:
             resourceRootDirPath = os.environ[cls.rootDirPathEnvName]
         except KeyError:
             # Create directory holding local copies of requested resources ...
-            resourceRootDirPath = mkdtemp()
+            resourceRootDirPath = cls._sharedRootDirPath()
+            try:
+                os.mkdir(resourceRootDirPath, 0o700)
+            except OSError as e:
+                if e.errno != errno.EEXIST:
+                    raise
+            # ... making sure nobody else can put code into it ...
+            dirStat = os.stat(resourceRootDirPath)
+            if dirStat.st_uid != os.getuid() or dirStat.st_mode & (stat.S_IWGRP | stat.S_IWOTH):
+                log.warn("Other users can write to '%s', downloading resources to a private "
+                         "directory instead.", resourceRootDirPath)
+                resourceRootDirPath = mkdtemp()
             # .. and register its location in an environment variable such that child processes
             # can find it.
             os.environ[cls.rootDirPathEnvName] = resourceRootDirPath
@@ -117,15 +201,22 @@ class Resource(namedtuple('Resource', ('name', 'pathHash', 'url', 'contentHash')
     @classmethod
     def cleanSystem(cls):
         """
-        Removes all downloaded, localized resources
+        Forgets about all downloaded, localized resources, removing them unless they are shared
+        with other workers.
         """
         resourceRootDirPath = os.environ[cls.rootDirPathEnvName]
         os.environ.pop(cls.rootDirPathEnvName)
-        shutil.rmtree(resourceRootDirPath)
+        if resourceRootDirPath != cls._sharedRootDirPath():
+            shutil.rmtree(resourceRootDirPath)
         for k, v in os.environ.items():
             if k.startswith(cls.resourceEnvNamePrefix):
                 os.environ.pop(k)
 
+    @classmethod
+    def _sharedRootDirPath(cls):
+        workDir = os.getenv('TOIL_WORKDIR') or gettempdir()
+        return os.path.join(workDir, 'toil-resources-%i' % os.getuid())
+
     def register(self):
         """
         Register this resource for later retrieval via lookup(), possibly in a child process.
@@ -161,21 +252,78 @@ class Resource(namedtuple('Resource', ('name', 'pathHash', 'url', 'contentHash')
         prepareSystem().
         """
         dirPath = self.localDirPath
-        if not os.path.exists(dirPath):
-            tempDirPath = mkdtemp(dir=os.path.dirname(dirPath), prefix=self.contentHash + "-")
-            self._save(tempDirPath)
-            if callback is not None:
-                callback(tempDirPath)
+        rootDirPath = os.path.dirname(dirPath)
+        try:
+            # Record the use of the resource such that it isn't deleted as unused
+            os.utime(dirPath, None)
+        except OSError as e:
+            if e.errno != errno.ENOENT:
+                raise
+            # Only one worker on this node downloads the resource, the others wait for it to do so
+            with self._lockResource(dirPath):
+                if not os.path.exists(dirPath):
+                    tempDirPath = mkdtemp(dir=rootDirPath, prefix='.' + self.contentHash + "-")
+                    try:
+                        self._save(tempDirPath)
+                        if callback is not None:
+                            callback(tempDirPath)
+                        os.rename(tempDirPath, dirPath)
+                    except:
+                        shutil.rmtree(tempDirPath)
+                        raise
+            self._deleteUnusedResources(rootDirPath)
+
+    @classmethod
+    def _deleteUnusedResources(cls, rootDirPath):
+        """
+        Deletes the downloaded resources in the given directory that haven't been used recently.
+        """
+        def isUnused(dirPath):
             try:
-                os.rename(tempDirPath, dirPath)
+                return time.time() - os.path.getmtime(dirPath) > cls.maxUnusedTime
             except OSError as e:
-                # If dirPath already exists & is non-empty either ENOTEMPTY or EEXIST will be raised
-                if e.errno == errno.ENOTEMPTY or e.errno == errno.EEXIST:
-                    # Another process beat us to it.
-                    # TODO: This is correct but inefficient since multiple processes download the resource redundantly
-                    pass
-                else:
+                # Another worker deleted it already
+                if e.errno != errno.ENOENT:
                     raise
+                return False
+
+        for name in os.listdir(rootDirPath):
+            dirPath = os.path.join(rootDirPath, name)
+            if name.startswith('.') or not os.path.isdir(dirPath) or not isUnused(dirPath):
+                continue
+            with cls._lockResource(dirPath):
+                # Check again, as another worker may have used it in the meantime
+                if isUnused(dirPath):
+                    log.info("Deleting unused resource '%s'.", dirPath)
+                    # Move it out of the way first, as deleting it isn't atomic
+                    tempDirPath = mkdtemp(dir=rootDirPath, prefix='.' + name + '-')
+                    os.rename(dirPath, os.path.join(tempDirPath, name))
+                    shutil.rmtree(tempDirPath)
+                    os.unlink(dirPath + '.lock')
+
+    @staticmethod
+    @contextmanager
+    def _lockResource(dirPath):
+        """
+        Holds an exclusive lock on the lock file of the resource downloaded to the given directory.
+        The lock file is deleted along with the resource while it is locked, so a lock acquired on
+        a lock file that has since been deleted is useless and the lock is attempted again.
+        """
+        lockFilePath = dirPath + '.lock'
+        while True:
+            with open(lockFilePath, 'w') as lockFile:
+                fcntl.flock(lockFile, fcntl.LOCK_EX)
+                try:
+                    lockFileStat = os.stat(lockFilePath)
+                except OSError as e:
+                    if e.errno != errno.ENOENT:
+                        raise
+                else:
+                    openedStat = os.fstat(lockFile.fileno())
+                    if (lockFileStat.st_dev, lockFileStat.st_ino) == (openedStat.st_dev,
+                                                                      openedStat.st_ino):
+                        yield
+                        return
 
     @property
     def localPath(self):
@@ -191,7 +339,9 @@ class Resource(namedtuple('Resource', ('name', 'pathHash', 'url', 'contentHash')
         The path to the directory containing the resource on the worker.
         """
         rootDirPath = os.environ[self.rootDirPathEnvName]
-        return os.path.join(rootDirPath, self.contentHash)
+        # The directory holds information about the resource's path on the leader besides its
+        # content, see ModuleDescriptor.localize()
+        return os.path.join(rootDirPath, self.contentHash + '-' + self.pathHash)
 
     def pickle(self):
         return self.__class__.__module__ + "." + self.__class__.__name__ + ':' + json.dumps(self)
@@ -235,6 +385,8 @@ class Resource(namedtuple('Resource', ('name', 'pathHash', 'url', 'contentHash')
 
         :type dstFile: io.BytesIO|io.FileIO
         """
+        # Importing the retry module is expensive and most workers never need it
+        from bd2k.util.retry import retry
         for attempt in retry(predicate=lambda e: isinstance(e, HTTPError) and e.code == 400):
             with attempt:
                 with closing(urlopen(self.url)) as content:
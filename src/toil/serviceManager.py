@@ -34,7 +34,8 @@ class ServiceManager( object ):
         
         self.toilState = toilState
 
-        self.jobGraphsWithServicesBeingStarted = set()
+        # The jobStoreIDs of the jobs whose services are being started
+        self.jobStoreIDsWithServicesBeingStarted = set()
 
         self._terminate = Event() # This is used to terminate the thread associated
         # with the service manager
@@ -75,7 +76,7 @@ class ServiceManager( object ):
         :param toil.jobGraph.JobGraph jobGraph: wrapper of job with services to schedule.
         """
         # Add jobGraph to set being processed by the service manager
-        self.jobGraphsWithServicesBeingStarted.add(jobGraph)
+        self.jobStoreIDsWithServicesBeingStarted.add(jobGraph.jobStoreID)
 
         # Add number of jobs managed by ServiceManager
         self.jobsIssuedToServiceManager += sum(map(len, jobGraph.services)) + 1 # The plus one accounts for the root job
@@ -92,7 +93,7 @@ class ServiceManager( object ):
         """
         try:
             jobGraph = self._jobGraphsWithServicesThatHaveStarted.get(timeout=maxWait)
-            self.jobGraphsWithServicesBeingStarted.remove(jobGraph)
+            self.jobStoreIDsWithServicesBeingStarted.remove(jobGraph.jobStoreID)
             assert self.jobsIssuedToServiceManager >= 0
             self.jobsIssuedToServiceManager -= 1
             return jobGraph
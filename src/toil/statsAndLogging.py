@@ -92,6 +92,32 @@ class StatsAndLogging( object ):
             name = createName(path, alternateName, extension)
             os.symlink(os.path.relpath(fullName, path), name)
 
+    @staticmethod
+    def readJobRuntimes(jobStore):
+        """
+        Collects the run times reported by the workers in all the stats files in the given job
+        store, including those read already, which are only kept if --stats is set.
+
+        :param toil.jobStores.abstractJobStore.AbstractJobStore jobStore: the job store
+
+        :return: the number of runs and their total run time, per job name
+        :rtype: dict[str,(int,float)]
+        """
+        jobRuntimes = {}
+
+        def callback(fileHandle):
+            try:
+                stats = json.load(fileHandle, object_hook=Expando)
+            except ValueError:
+                logger.warn("Skipping a stats file containing corrupted json.")
+                return
+            for job in stats.get('jobs', []):
+                runs, totalTime = jobRuntimes.get(job.job_name, (0, 0.0))
+                jobRuntimes[job.job_name] = (runs + 1, totalTime + float(job.time))
+
+        jobStore.readStatsAndLogging(callback, readAll=True)
+        return jobRuntimes
+
     @classmethod
     def statsAndLoggingAggregator(cls, jobStore, stop, config):
         """
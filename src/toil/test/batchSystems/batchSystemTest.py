@@ -165,6 +165,43 @@ class hidden:
             # Make sure killBatchJobs can handle jobs that don't exist
             self.batchSystem.killBatchJobs([10])
 
+        def testGetUpdatedBatchJobs(self):
+            jobIDs = set()
+            for i in range(3):
+                jobNode = JobNode(command='true', jobName='test%i' % i, unitName=None,
+                                  jobStoreID=str(i), requirements=defaultRequirements)
+                jobIDs.add(self.batchSystem.issueBatchJob(jobNode))
+            updatedJobIDs = set()
+            # Several calls may be needed as the jobs don't necessarily finish at the same time
+            for it in range(len(jobIDs)):
+                updatedJobs = self.batchSystem.getUpdatedBatchJobs(maxWait=1000)
+                self.assertTrue(len(updatedJobs) > 0)
+                for jobID, exitStatus, wallTime in updatedJobs:
+                    self.assertEqual(exitStatus, 0)
+                    self.assertNotIn(jobID, updatedJobIDs)
+                    updatedJobIDs.add(jobID)
+                if updatedJobIDs == jobIDs:
+                    break
+            self.assertEqual(updatedJobIDs, jobIDs)
+            self.assertEqual([], self.batchSystem.getUpdatedBatchJobs(0))
+
+        def testIssueBatchJobs(self):
+            jobNodes = [JobNode(command='true', jobName='test%i' % i, unitName=None,
+                                jobStoreID=str(i), requirements=defaultRequirements)
+                        for i in range(3)]
+            jobIDs = self.batchSystem.issueBatchJobs(jobNodes)
+            self.assertEqual(len(set(jobIDs)), len(jobNodes))
+            self.assertEqual(set(self.batchSystem.getIssuedBatchJobIDs()), set(jobIDs))
+            updatedJobIDs = set()
+            while updatedJobIDs != set(jobIDs):
+                updatedJobs = self.batchSystem.getUpdatedBatchJobs(maxWait=1000, limit=1)
+                self.assertEqual(len(updatedJobs), 1)
+                jobID, exitStatus, wallTime = updatedJobs[0]
+                self.assertEqual(exitStatus, 0)
+                self.assertNotIn(jobID, updatedJobIDs)
+                updatedJobIDs.add(jobID)
+            self.assertEqual([], self.batchSystem.getUpdatedBatchJobs(0))
+
         def testSetEnv(self):
             # Parasol disobeys shell rules and stupidly splits the command at the space character
             # before exec'ing it, whether the space is quoted, escaped or not. This means that we
@@ -343,7 +380,123 @@ class SingleMachineBatchSystemTest(hidden.AbstractBatchSystemTest):
     def createBatchSystem(self):
         return SingleMachineBatchSystem(config=self.config,
                                         maxCores=numCores, maxMemory=1e9, maxDisk=2001)
-        
+
+    def testPriority(self):
+        # Replace the batch system with one that has a single worker thread, such that the
+        # queued jobs are dispatched one at a time
+        class SingleWorkerBatchSystem(SingleMachineBatchSystem):
+            minCores = 1
+
+        self.batchSystem.shutdown()
+        self.batchSystem = SingleWorkerBatchSystem(config=self.config,
+                                                   maxCores=1, maxMemory=1e9, maxDisk=2001)
+        outPath = os.path.join(self.tempDir, 'out.txt')
+        requirements = dict(defaultRequirements, memory=int(1e6))
+        jobNode = JobNode(command='sleep 2', jobName='blocker', unitName=None,
+                          jobStoreID='1', requirements=requirements)
+        jobIDs = {self.batchSystem.issueBatchJob(jobNode)}
+        self.assertEqual(len(self._waitForJobsToStart(1)), 1)
+        # While the first job is running, queue jobs of increasing priority
+        for priority in range(3):
+            jobNode = JobNode(command='echo %i >> %s' % (priority, outPath), jobName='test',
+                              unitName=None, jobStoreID=str(priority + 2),
+                              requirements=requirements)
+            jobNode.priority = priority
+            jobIDs.add(self.batchSystem.issueBatchJob(jobNode))
+        while jobIDs:
+            jobID, exitStatus, wallTime = self.batchSystem.getUpdatedBatchJob(maxWait=1000)
+            self.assertEqual(exitStatus, 0)
+            jobIDs.remove(jobID)
+        with open(outPath) as f:
+            self.assertEqual(f.read().split(), ['2', '1', '0'])
+
+    def testBackfilling(self):
+        """
+        A job that doesn't fit should be overtaken by smaller jobs issued after it, until it has
+        been pending for longer than maxBackfillDelay.
+        """
+        self.assertEqual(self._runBackfillingWorkload(maxBackfillDelay=60).index('big'), 4)
+        self.assertEqual(self._runBackfillingWorkload(maxBackfillDelay=0).index('big'), 2)
+
+    def testKillPendingJob(self):
+        """
+        A job killed before it started should no longer be issued, and should not be reported.
+        """
+        self.batchSystem.shutdown()
+        self.batchSystem = SingleMachineBatchSystem(config=self.config,
+                                                    maxCores=1, maxMemory=1e9, maxDisk=2001)
+        jobIDs = [self.batchSystem.issueBatchJob(JobNode(command='sleep 2', jobName='test',
+                                                         unitName=None, jobStoreID=str(i),
+                                                         requirements=defaultRequirements))
+                  for i in range(2)]
+        self.assertEqual(self._waitForJobsToStart(1), jobIDs[:1])
+        self.batchSystem.killBatchJobs(jobIDs[1:])
+        self.assertEqual(self.batchSystem.getIssuedBatchJobIDs(), jobIDs[:1])
+        jobID, exitStatus, wallTime = self.batchSystem.getUpdatedBatchJob(maxWait=1000)
+        self.assertEqual((jobID, exitStatus), (jobIDs[0], 0))
+        self.assertEqual(self.batchSystem.getIssuedBatchJobIDs(), [])
+        self.assertIsNone(self.batchSystem.getUpdatedBatchJob(maxWait=3))
+
+    def _runBackfillingWorkload(self, maxBackfillDelay):
+        """
+        Runs a job requiring all cores between two pairs of jobs requiring half of them.
+
+        :return: the names of the jobs in the order they were started
+        :rtype: list[str]
+        """
+        self.batchSystem.shutdown()
+        self.batchSystem = SingleMachineBatchSystem(config=self.config,
+                                                    maxCores=1, maxMemory=1e9, maxDisk=2001)
+        self.batchSystem.maxBackfillDelay = maxBackfillDelay
+        outPath = os.path.join(self.tempDir, 'out.txt')
+        open(outPath, 'w').close()
+        jobIDs = set()
+        for name, cores in [('small1', 0.5), ('small2', 0.5), ('big', 1),
+                            ('small3', 0.5), ('small4', 0.5)]:
+            jobNode = JobNode(command='echo %s >> %s && sleep 1' % (name, outPath),
+                              jobName=name, unitName=None, jobStoreID=name,
+                              requirements=dict(defaultRequirements, cores=cores))
+            jobIDs.add(self.batchSystem.issueBatchJob(jobNode))
+        while jobIDs:
+            jobID, exitStatus, wallTime = self.batchSystem.getUpdatedBatchJob(maxWait=1000)
+            self.assertEqual(exitStatus, 0)
+            jobIDs.remove(jobID)
+        with open(outPath) as f:
+            return f.read().split()
+
+    def testUtilization(self):
+        """
+        Benchmarks the utilization of cores and memory by a workload of jobs of mixed shapes.
+        """
+        maxCores, maxMemory = 1, 1000
+        self.batchSystem.shutdown()
+        self.batchSystem = SingleMachineBatchSystem(config=self.config, maxCores=maxCores,
+                                                    maxMemory=maxMemory, maxDisk=2001)
+        # The cores, memory and running time of each job
+        shapes = [(1, 100, 1), (0.1, 700, 1), (0.2, 100, 0.5), (0.5, 300, 1)]
+        jobIDs = set()
+        startTime = time.time()
+        for i in range(3):
+            for j, (cores, memory, seconds) in enumerate(shapes):
+                jobNode = JobNode(command='sleep %f' % seconds, jobName='test', unitName=None,
+                                  jobStoreID='%i-%i' % (i, j),
+                                  requirements=dict(defaultRequirements, cores=cores,
+                                                    memory=memory, disk=1))
+                jobIDs.add(self.batchSystem.issueBatchJob(jobNode))
+        while jobIDs:
+            jobID, exitStatus, wallTime = self.batchSystem.getUpdatedBatchJob(maxWait=1000)
+            self.assertEqual(exitStatus, 0)
+            jobIDs.remove(jobID)
+        makespan = time.time() - startTime
+        # The workload can't be run faster than its bottleneck resource permits
+        minMakespan = 3 * max(sum(cores * seconds for cores, _, seconds in shapes) / maxCores,
+                              sum(memory * seconds for _, memory, seconds in shapes) / maxMemory)
+        utilization = minMakespan / makespan
+        log.info('Ran mixed workload in %f seconds, utilizing %f of the bottleneck resource.',
+                 makespan, utilization)
+        self.assertGreater(utilization, 0.5)
+
+
 class MaxCoresSingleMachineBatchSystemTest(ToilTest):
     """
     This test ensures that single machine batch system doesn't exceed the configured number of
@@ -629,6 +782,132 @@ class SlurmBatchSystemTest(hidden.AbstractGridEngineBatchSystemTest):
         for f in glob('slurm-*.out'):
             os.unlink(f)
 
+class FakeSlurmBatchSystemTest(ToilTest):
+    """
+    Tests the submission of job arrays and the polling of the status of jobs by the Slurm batch
+    system against a stand-in for the Slurm commands that runs jobs locally as they are submitted.
+    """
+    fakeSlurmScript = dedent('''
+        import os, subprocess, sys
+        stateDir = os.environ['FAKE_SLURM_DIR']
+        command = os.path.basename(sys.argv[0])
+
+        def finishedJobs():
+            for taskID in os.listdir(stateDir):
+                if not taskID.endswith('.log'):
+                    with open(os.path.join(stateDir, taskID)) as f:
+                        yield taskID, f.read()
+
+        if command == 'sinfo':
+            print('1000 4')
+        elif command == 'sbatch':
+            options = dict(arg[2:].split('=', 1) for arg in sys.argv[1:] if arg.startswith('--'))
+            with open(os.path.join(stateDir, 'sbatch.log'), 'a') as f:
+                f.write(options['wrap'] + '\\n')
+            jobID = len(os.listdir(stateDir))
+            if 'array' in options:
+                first, last = map(int, options['array'].split('-'))
+                tasks = [('%i_%i' % (jobID, task), str(task)) for task in range(first, last + 1)]
+            else:
+                tasks = [(str(jobID), '')]
+            for taskID, index in tasks:
+                status = subprocess.call(options['wrap'], shell=True,
+                                         env=dict(os.environ, SLURM_ARRAY_TASK_ID=index))
+                with open(os.path.join(stateDir, taskID), 'w') as f:
+                    f.write(str(status))
+            print('Submitted batch job %i' % jobID)
+        elif command == 'sacct':
+            if 'FAKE_SLURM_NO_ACCOUNTING' in os.environ:
+                sys.exit('sacct: error: Slurm accounting storage is disabled')
+            jobIDs = sys.argv[sys.argv.index('-j') + 1]
+            with open(os.path.join(stateDir, 'sacct.log'), 'a') as f:
+                f.write(jobIDs + '\\n')
+            for taskID, status in finishedJobs():
+                if taskID in jobIDs.split(','):
+                    print('%s|COMPLETED|%s:0' % (taskID, status))
+                    print('%s.batch|COMPLETED|%s:0' % (taskID, status))
+        elif command == 'scontrol':
+            for taskID, status in finishedJobs():
+                jobID, _, task = taskID.partition('_')
+                print('JobId=%s ArrayJobId=%s ArrayTaskId=%s JobState=COMPLETED ExitCode=%s:0'
+                      % (taskID.replace('_', '0'), jobID, task or 'N/A', status))
+        ''')
+
+    def setUp(self):
+        super(FakeSlurmBatchSystemTest, self).setUp()
+        binDir = self._createTempDir('bin')
+        for command in ('sinfo', 'sbatch', 'scontrol', 'sacct', 'squeue', 'scancel'):
+            path = os.path.join(binDir, command)
+            with open(path, 'w') as f:
+                f.write('#!' + sys.executable + '\n' + self.fakeSlurmScript)
+            os.chmod(path, 0o755)
+        self.stateDir = self._createTempDir('state')
+        self.oldEnviron = dict(os.environ)
+        os.environ['PATH'] = binDir + os.pathsep + os.environ['PATH']
+        os.environ['FAKE_SLURM_DIR'] = self.stateDir
+        self.config = hidden.AbstractBatchSystemTest.createConfig()
+        self.config.jobStore = 'file:' + self._createTempDir('jobStore')
+        from toil.batchSystems.slurm import SlurmBatchSystem
+        # Enough cores for all jobs to be submitted at once
+        self.batchSystem = SlurmBatchSystem(config=self.config, maxCores=10,
+                                            maxMemory=1000e9, maxDisk=1e9)
+
+    def tearDown(self):
+        self.batchSystem.shutdown()
+        os.environ.clear()
+        os.environ.update(self.oldEnviron)
+        super(FakeSlurmBatchSystemTest, self).tearDown()
+
+    def testJobArray(self):
+        """
+        Jobs with identical requirements should be submitted as a single job array, the others
+        one by one.
+        """
+        outPath = os.path.join(self._createTempDir(), 'out')
+        self._runJobs(['echo %i >> %s' % (i, outPath) for i in range(3)] + ['exit 3', 'true'])
+        with open(outPath) as f:
+            self.assertEqual(f.read().split(), ['0', '1', '2'])
+        with open(os.path.join(self.stateDir, 'sbatch.log')) as f:
+            submissions = f.read().splitlines()
+        self.assertEqual(len(submissions), 2)
+        self.assertEqual(submissions[1], 'true')
+        # The script of the job array is deleted once all its tasks are done
+        self.assertEqual(os.listdir(self.batchSystem.jobArrayDirPath), [])
+
+    def testStatusPolling(self):
+        """
+        The status of all running jobs should be polled with a single call to sacct.
+        """
+        self._runJobs(['true', 'true', 'true', 'exit 3', 'true'])
+        with open(os.path.join(self.stateDir, 'sacct.log')) as f:
+            polls = f.read().splitlines()
+        self.assertEqual(len(polls), 1)
+        self.assertEqual(len(polls[0].split(',')), 5)
+
+    def testStatusPollingWithoutAccounting(self):
+        """
+        Without accounting, the status of jobs should be polled with scontrol instead.
+        """
+        os.environ['FAKE_SLURM_NO_ACCOUNTING'] = '1'
+        self._runJobs(['true', 'true', 'true', 'exit 3', 'true'])
+        self.assertFalse(os.path.exists(os.path.join(self.stateDir, 'sacct.log')))
+
+    def _runJobs(self, commands):
+        """
+        Issues the given commands, the first four with identical requirements, and checks their
+        exit statuses.
+        """
+        requirements = [defaultRequirements] * 4 + [dict(defaultRequirements, memory=int(200e6))]
+        jobIDs = self.batchSystem.issueBatchJobs(
+            [JobNode(command=command, jobName='test', unitName=None, jobStoreID=str(i),
+                     requirements=requirements[i])
+             for i, command in enumerate(commands)])
+        exitStatuses = {}
+        while len(exitStatuses) < len(jobIDs):
+            for jobID, exitStatus, wallTime in self.batchSystem.getUpdatedBatchJobs(maxWait=10):
+                exitStatuses[jobID] = exitStatus
+        self.assertEqual([exitStatuses[jobID] for jobID in jobIDs], [0, 0, 0, 3, 0])
+
 @needs_torque
 class TorqueBatchSystemTest(hidden.AbstractGridEngineBatchSystemTest):
     """
@@ -763,6 +1042,91 @@ class SingleMachineBatchSystemJobTest(hidden.AbstractBatchSystemJobTest):
         assert outString.endswith('sJCsJGCfJC')
 
 
+    def testPersistentWorkers(self):
+        """
+        Tests that jobs that run one after the other share a persistent worker process.
+        """
+        tempDir = self._createTempDir('testFiles')
+
+        options = Job.Runner.getDefaultOptions(self._getTestJobStorePath())
+        options.workDir = tempDir
+        options.maxCores = 1
+        options.persistentWorkers = True
+        options.batchSystem = self.batchSystemName
+
+        outFile = os.path.join(tempDir, 'pids')
+        open(outFile, 'w').close()
+
+        root = Job.wrapJobFn(_persistentWorkerTestRootFn, outFile=outFile, cores=1, memory='1M', disk='1M')
+        Job.Runner.startToil(root, options)
+        with open(outFile) as oFH:
+            pids = oFH.read().split()
+        self.assertEqual(len(pids), 3)
+        self.assertEqual(len(set(pids)), 1)
+
+    def testPersistentWorkerIsolation(self):
+        """
+        Tests that changes to the environment and working directory made by a job run in a
+        persistent worker are not seen by the jobs that run in it after it.
+        """
+        tempDir = self._createTempDir('testFiles')
+
+        options = Job.Runner.getDefaultOptions(self._getTestJobStorePath())
+        options.workDir = tempDir
+        options.maxCores = 1
+        options.persistentWorkers = True
+        options.batchSystem = self.batchSystemName
+
+        outFile = os.path.join(tempDir, 'states')
+        open(outFile, 'w').close()
+
+        root = Job.wrapJobFn(_persistentWorkerIsolationTestRootFn, outFile=outFile, cores=1,
+                             memory='1M', disk='1M')
+        Job.Runner.startToil(root, options)
+        with open(outFile) as oFH:
+            states = [line.split() for line in oFH.read().splitlines()]
+        self.assertEqual(len(states), 2)
+        # The children ran in the same process, which the root job left changed
+        self.assertEqual(states[0][0], states[1][0])
+        for _, leaked in states:
+            self.assertEqual(leaked, 'False')
+
+
+def _persistentWorkerTestRootFn(job, outFile):
+    """
+    Record the PID of the worker process and add two children that do the same. Two children are
+    needed since the worker would otherwise chain a single child to this job.
+    """
+    _persistentWorkerTestAuxFn(outFile)
+    for _ in range(2):
+        job.addChildFn(_persistentWorkerTestAuxFn, outFile=outFile, cores=1, memory='1M', disk='1M')
+
+
+def _persistentWorkerIsolationTestRootFn(job, outFile):
+    """
+    Change the environment and working directory of the worker process and add two children that
+    check whether they see the change.
+    """
+    os.environ['TOIL_TEST_LEAKED'] = '1'
+    os.chdir(os.path.dirname(outFile))
+    for _ in range(2):
+        job.addChildFn(_persistentWorkerIsolationTestAuxFn, outFile=outFile, cores=1, memory='1M',
+                       disk='1M')
+
+
+def _persistentWorkerIsolationTestAuxFn(outFile):
+    leaked = 'TOIL_TEST_LEAKED' in os.environ or os.getcwd() == os.path.dirname(outFile)
+    with open(outFile, 'a') as oFH:
+        fcntl.flock(oFH, fcntl.LOCK_EX)
+        oFH.write('%i %s\n' % (os.getpid(), leaked))
+
+
+def _persistentWorkerTestAuxFn(outFile):
+    with open(outFile, 'a') as oFH:
+        fcntl.flock(oFH, fcntl.LOCK_EX)
+        oFH.write('%i\n' % os.getpid())
+
+
 def _resourceBlockTestAuxFn(outFile, sleepTime, writeVal):
     """
     Write a value to the out file and then sleep for requested seconds.
@@ -789,6 +1153,29 @@ class MesosBatchSystemJobTest(hidden.AbstractBatchSystemJobTest, MesosTestSuppor
     def tearDown(self):
         self._stopMesos()
 
+    def testPersistentWorkers(self):
+        """
+        Tests that the executor runs jobs in its pool of persistent worker processes, such that
+        jobs that run one after the other share a process.
+        """
+        tempDir = self._createTempDir('testFiles')
+
+        options = Job.Runner.getDefaultOptions(self._getTestJobStorePath())
+        options.workDir = tempDir
+        options.persistentWorkers = True
+        options.batchSystem = self.batchSystemName
+
+        outFile = os.path.join(tempDir, 'pids')
+        open(outFile, 'w').close()
+
+        root = Job.wrapJobFn(_persistentWorkerTestRootFn, outFile=outFile, cores=1, memory='1M', disk='1M')
+        Job.Runner.startToil(root, options)
+        with open(outFile) as oFH:
+            pids = oFH.read().split()
+        self.assertEqual(len(pids), 3)
+        # The worker that ran the root job is the first to be handed one of its children
+        self.assertLess(len(set(pids)), 3)
+
 
 def measureConcurrency(filepath, sleep_time=5):
     """
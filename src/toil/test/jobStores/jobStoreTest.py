@@ -647,6 +647,27 @@ class AbstractJobStoreTest:
                     hashOut.update(buf)
             self.assertEqual(hashIn.digest(), hashOut.digest())
 
+        def testParallelRead(self):
+            dirPath = self._createTempDir()
+            filePath = os.path.join(dirPath, 'large')
+            # Make sure the file doesn't split evenly into parts
+            content = os.urandom(3 * self._partSize() + 17)
+            with open(filePath, 'w') as f:
+                f.write(content)
+            job = self.master.create(self.arbitraryJob)
+            jobStoreFileID = self.master.writeFile(filePath, job.jobStoreID)
+            emptyFileID = self.master.getEmptyFileStoreID(job.jobStoreID)
+            os.unlink(filePath)
+            for parallelism in (2, 5):
+                self.master.readFile(jobStoreFileID, filePath, parallelism=parallelism)
+                with open(filePath, 'r') as f:
+                    self.assertEqual(content, f.read())
+                os.unlink(filePath)
+                self.master.readFile(emptyFileID, filePath, parallelism=parallelism)
+                self.assertEqual(os.path.getsize(filePath), 0)
+                os.unlink(filePath)
+            self.master.delete(job.jobStoreID)
+
         def assertUrl(self, url):
             prefix, path = url.split(':', 1)
             if prefix == 'file':
@@ -713,6 +734,59 @@ class AbstractJobStoreTest:
             # on the jobs iterator for certain cloud providers
             self.assertTrue(len(allJobs) <= 3001)
 
+        def testLoadMany(self):
+            master = self.master
+            # Use more jobs than fit into a single batch on any of the job stores
+            jobs = [master.create(self.arbitraryJob) for _ in range(25)]
+            jobStoreIDs = [job.jobStoreID for job in jobs]
+            master.delete(jobStoreIDs[0])
+            loadedJobs = master.loadMany(jobStoreIDs + ['foo'])
+            self.assertEquals(set(loadedJobs.keys()), set(jobStoreIDs[1:]))
+            for job in jobs[1:]:
+                self.assertEquals(loadedJobs[job.jobStoreID], job)
+            self.assertEquals(master.loadMany([]), {})
+
+        def testCreateManyUpdateMany(self):
+            master = self.master
+            # Use more jobs than fit into a single batch on any of the job stores
+            jobs = master.createMany([self.arbitraryJob] * 150)
+            self.assertEquals(len(set(job.jobStoreID for job in jobs)), 150)
+            for job in jobs:
+                self.assertTrue(master.exists(job.jobStoreID))
+                self.assertEquals(master.load(job.jobStoreID), job)
+            for i, job in enumerate(jobs):
+                job.command = 'command%i' % i
+            master.updateMany(jobs)
+            loadedJobs = master.loadMany([job.jobStoreID for job in jobs])
+            for i, job in enumerate(jobs):
+                self.assertEquals(loadedJobs[job.jobStoreID].command, 'command%i' % i)
+            self.assertEquals(master.createMany([]), [])
+            master.updateMany([])
+
+        def testUpdateIfUnchanged(self):
+            master = self.master
+            if not master.supportsConditionalUpdates():
+                self.skipTest("%s doesn't support conditional updates" % type(master).__name__)
+            job = master.create(self.arbitraryJob)
+            command = job.command
+            # Two attempts at running the job load it, only the first one to complete wins
+            firstAttempt = master.load(job.jobStoreID)
+            secondAttempt = master.load(job.jobStoreID)
+            firstAttempt.command = None
+            self.assertTrue(master.updateIfUnchanged(firstAttempt, command))
+            secondAttempt.command = 'other'
+            self.assertFalse(master.updateIfUnchanged(secondAttempt, command))
+            self.assertEquals(master.load(job.jobStoreID).command, None)
+            # The commands of jobs stored inline are alike, a chained successor has another pickle
+            chainedJob = master.load(job.jobStoreID)
+            chainedJob.command, chainedJob.pickledJob = command, 'successor'
+            self.assertTrue(master.updateIfUnchanged(chainedJob, None))
+            self.assertFalse(master.updateIfUnchanged(secondAttempt, command))
+            self.assertFalse(master.updateIfUnchanged(secondAttempt, command, 'job'))
+            self.assertTrue(master.updateIfUnchanged(secondAttempt, command, 'successor'))
+            master.delete(job.jobStoreID)
+            self.assertFalse(master.updateIfUnchanged(secondAttempt, None))
+
         @abstractmethod
         def _corruptJobStore(self):
             """
@@ -828,6 +902,78 @@ class FileJobStoreTest(AbstractJobStoreTest.Test):
     def _cleanUpExternalStore(self, dirPath):
         shutil.rmtree(dirPath)
 
+    def testRebuildIndex(self):
+        """
+        Tests that a job store whose index was lost rebuilds it when the leader compacts it, but
+        not when a worker resumes it.
+        """
+        master = self.master
+        assert isinstance(master, FileJobStore)  # type hint
+        jobs = [master.create(self.arbitraryJob) for _ in range(3)]
+        master.delete(jobs.pop().jobStoreID)
+        master.writeStatsAndLogging('1')
+        master.writeStatsAndLogging('2')
+        stats = []
+        self.assertEquals(2, master.readStatsAndLogging(lambda f: stats.append(f.read())))
+        master.writeStatsAndLogging('3')
+        shutil.rmtree(master.indexDir)
+
+        worker = FileJobStore(master.jobStoreDir)
+        worker.resume()
+        self.assertFalse(os.path.exists(worker.indexDir))
+
+        leader = FileJobStore(master.jobStoreDir)
+        leader.resume()
+        leader.compact()
+        self.assertEquals(set(jobs), set(leader.jobs()))
+        stats = []
+        self.assertEquals(1, leader.readStatsAndLogging(lambda f: stats.append(f.read())))
+        self.assertEquals(['3'], stats)
+        stats = []
+        self.assertEquals(3, leader.readStatsAndLogging(lambda f: stats.append(f.read()),
+                                                        readAll=True))
+        self.assertEquals({'1', '2', '3'}, set(stats))
+
+    def testCompactIndex(self):
+        """
+        Tests that compacting the index drops the entries of deleted jobs and of removed stats
+        files, and that jobs created and deleted after compaction are indexed.
+        """
+        master = self.master
+        assert isinstance(master, FileJobStore)  # type hint
+        jobs = [master.create(self.arbitraryJob) for _ in range(20)]
+        for job in jobs[10:]:
+            master.delete(job.jobStoreID)
+        del jobs[10:]
+        master.writeStatsAndLogging('1')
+        master.writeStatsAndLogging('2')
+        self.assertEquals(2, master.readStatsAndLogging(lambda f: None))
+        master.writeStatsAndLogging('3')
+        # Removes the stats files that were read
+        master.readStatsAndLogging(lambda f: None, readAll=True)
+        for tempDir in master._tempDirectories():
+            for name in os.listdir(tempDir):
+                if name.startswith('stats') and name.endswith('.new'):
+                    os.unlink(os.path.join(tempDir, name))
+
+        def numEntries():
+            entries = 0
+            for name in os.listdir(master.indexDir):
+                with open(os.path.join(master.indexDir, name)) as f:
+                    entries += len(f.readlines())
+            return entries
+        self.assertEquals(numEntries(), 30 + 3)
+        leader = FileJobStore(master.jobStoreDir)
+        leader.resume()
+        leader.compact()
+        self.assertEquals(numEntries(), 10)
+        self.assertEquals(set(jobs), set(leader.jobs()))
+        # Workers that resumed the job store before compaction keep appending to the index
+        jobs.append(master.create(self.arbitraryJob))
+        master.delete(jobs.pop(0).jobStoreID)
+        self.assertEquals(set(jobs), set(leader.jobs()))
+        self.assertEquals(0, leader.readStatsAndLogging(lambda f: None))
+
 
 @experimental
 @needs_google
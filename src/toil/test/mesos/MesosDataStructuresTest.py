@@ -33,7 +33,8 @@ class DataStructuresTest(ToilTest):
                       command="do nothing",
                       userScript=None,
                       environment=None,
-                      workerCleanupInfo=None)
+                      workerCleanupInfo=None,
+                      persistentWorkers=False)
         return job
 
     def testJobQueue(self, testJobs=1000):
@@ -76,3 +77,16 @@ class DataStructuresTest(ToilTest):
         self.assertEqual(len(jobQueue.jobIDs()), testJobs)
         # Ensure FIFO
         self.assertIs(testJob, tmpJob)
+
+    def testJobQueuePriority(self):
+        from toil.batchSystems.mesos import JobQueue
+        jobQueue = JobQueue()
+        jobs = [self._getJob(cores=1) for _ in range(4)]
+        jobType = jobs[0].resources
+        # Jobs of higher priority come first, jobs of equal priority in the order of insertion
+        for job, priority in zip(jobs, [0, 2, 0, 1]):
+            jobQueue.insertJob(job, jobType, priority)
+        dequeuedJobs = []
+        while not jobQueue.typeEmpty(jobType):
+            dequeuedJobs.append(jobQueue.nextJobOfType(jobType))
+        self.assertEqual(dequeuedJobs, [jobs[1], jobs[3], jobs[0], jobs[2]])
@@ -0,0 +1,125 @@
+# Copyright (C) 2015-2017 Regents of the University of California
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import absolute_import
+import os
+import subprocess
+import sys
+
+# Python 3 compatibility imports
+from six.moves import cPickle
+
+from toil.bootstrapCache import BootstrapCache
+from toil.common import Config
+from toil.job import Job
+from toil.jobStores.fileJobStore import FileJobStore
+from toil.test import ToilTest
+
+
+class BootstrapCacheTest(ToilTest):
+    def setUp(self):
+        super(BootstrapCacheTest, self).setUp()
+        self.tempDir = self._createTempDir()
+
+    def testCache(self):
+        """
+        The config and environment should be cached per digest, which should change along with
+        either of them.
+        """
+        jobStorePath = self._getTestJobStorePath()
+        config = Config()
+        config.jobStore = 'file:' + jobStorePath
+        jobStore = FileJobStore(jobStorePath)
+        jobStore.initialize(config)
+        try:
+            environment = {'FOO': 'foo'}
+            with jobStore.writeSharedFileStream('environment.pickle') as f:
+                cPickle.dump(environment, f)
+            digest = BootstrapCache.computeDigest(jobStore)
+            cache = BootstrapCache(digest, dirPath=os.path.join(self.tempDir, 'cache'))
+            self.assertIsNone(cache.load())
+            cache.save(jobStore.config, environment)
+            cachedConfig, cachedEnvironment = cache.load()
+            self.assertEqual(cachedConfig.workflowID, config.workflowID)
+            self.assertEqual(cachedEnvironment, environment)
+
+            with jobStore.writeSharedFileStream('environment.pickle') as f:
+                cPickle.dump({'FOO': 'bar'}, f)
+            otherDigest = BootstrapCache.computeDigest(jobStore)
+            self.assertNotEqual(digest, otherDigest)
+            self.assertIsNone(BootstrapCache(otherDigest, dirPath=cache.dirPath).load())
+        finally:
+            jobStore.destroy()
+
+    def testSharedCacheIsIgnored(self):
+        """
+        A cache directory other users can write to should not be used.
+        """
+        cache = BootstrapCache('0' * 32, dirPath=os.path.join(self.tempDir, 'cache'))
+        os.mkdir(cache.dirPath)
+        os.chmod(cache.dirPath, 0o777)
+        cache.save(Config(), {})
+        self.assertFalse(os.path.exists(cache.entryPath))
+        self.assertIsNone(cache.load())
+
+    def testWorkersUseCache(self):
+        """
+        The workers of a workflow should populate the cache and share a single entry.
+        """
+        workDir = self._createTempDir()
+        options = Job.Runner.getDefaultOptions(self._getTestJobStorePath())
+        oldWorkDir = os.environ.get('TOIL_WORKDIR')
+        os.environ['TOIL_WORKDIR'] = workDir
+        try:
+            Job.Runner.startToil(Job.wrapJobFn(fanOut, 4), options)
+        finally:
+            if oldWorkDir is None:
+                del os.environ['TOIL_WORKDIR']
+            else:
+                os.environ['TOIL_WORKDIR'] = oldWorkDir
+        cacheDirPath = os.path.join(workDir, 'toil-bootstrap-cache-%i' % os.getuid())
+        self.assertEqual(len(os.listdir(cacheDirPath)), 1)
+
+    def testWorkerImports(self):
+        """
+        Starting a worker on a file job store should not import modules that are expensive to
+        import but not needed to run most jobs.
+        """
+        jobStorePath = self._getTestJobStorePath()
+        config = Config()
+        config.jobStore = 'file:' + jobStorePath
+        jobStore = FileJobStore(jobStorePath)
+        jobStore.initialize(config)
+        try:
+            expensiveModules = ['bd2k.util.retry', 'boto', 'azure', 'toil.leader',
+                                'toil.batchSystems.singleMachine', 'toil.jobStores.aws.jobStore',
+                                'toil.jobStores.azureJobStore', 'toil.jobStores.googleJobStore']
+            script = ('import sys, toil.worker; '
+                      'toil.worker.setupWorkerProcess(); '
+                      'toil.worker.Toil.resumeJobStore(%r); '
+                      'print(" ".join(m for m in %r if sys.modules.get(m) is not None))'
+                      % (config.jobStore, expensiveModules))
+            imported = subprocess.check_output([sys.executable, '-c', script]).split()
+            self.assertEqual(imported, [])
+        finally:
+            jobStore.destroy()
+
+
+def fanOut(job, numChildren):
+    for i in range(numChildren):
+        job.addChildJobFn(child)
+
+
+def child(job):
+    pass
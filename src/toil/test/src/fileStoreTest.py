@@ -17,11 +17,13 @@ from __future__ import print_function
 
 import filecmp
 from abc import abstractmethod, ABCMeta
+from hashlib import sha1
 from struct import pack, unpack
 from uuid import uuid4
 
 from toil.job import Job
-from toil.fileStore import IllegalDeletionCacheError, CachingFileStore
+from toil.fileStore import (IllegalDeletionCacheError, CachingFileStore, CachedFile,
+                            cacheEvictionPolicies)
 from toil.test import ToilTest, needs_aws, needs_azure, needs_google, experimental
 from toil.leader import FailedJobsException
 from toil.jobStores.abstractJobStore import NoSuchFileException
@@ -29,6 +31,7 @@ from toil.fileStore import CacheUnbalancedError
 
 import collections
 import inspect
+import itertools
 import os
 import random
 import signal
@@ -164,6 +167,60 @@ class hidden:
                             localFileIDs.remove(fsID)
                 i += 1
 
+        def testReadWriteGlobalFiles(self):
+            """
+            Write a batch of files to the job store, both from within and outside of the local
+            temp dir, and read them back in a batch, in a successor job as well as in the job that
+            wrote them.
+            """
+            nonLocalDir = self._createTempDir(purpose='nonLocalDir')
+            A = Job.wrapJobFn(self._writeGlobalFiles, nonLocalDir=nonLocalDir)
+            B = Job.wrapJobFn(self._readGlobalFiles, A.rv())
+            A.addChild(B)
+            Job.Runner.startToil(A, self.options)
+
+        @staticmethod
+        def _writeGlobalFiles(job, nonLocalDir, numFiles=20):
+            """
+            Aux function for testReadWriteGlobalFiles. Writes numFiles small files, half of them
+            local, reads them back and returns a dict mapping their IDs to their contents.
+            """
+            paths, contents = [], []
+            for i in xrange(numFiles):
+                content = 'file %i %s' % (i, uuid4())
+                dirPath = job.fileStore.getLocalTempDir() if i % 2 else nonLocalDir
+                path = os.path.join(dirPath, str(i))
+                with open(path, 'w') as f:
+                    f.write(content)
+                paths.append(path)
+                contents.append(content)
+            # A path that occurs more than once should only be written once
+            fsIDs = job.fileStore.writeGlobalFiles(paths + paths[:2])
+            assert len(fsIDs) == numFiles + 2
+            assert fsIDs[-2:] == fsIDs[:2]
+            assert len(set(fsIDs)) == numFiles
+            for fsID, content in zip(fsIDs, contents):
+                assert fsID.size == len(content)
+            hidden.AbstractFileStoreTest._readGlobalFiles(job, dict(zip(fsIDs, contents)))
+            return dict(zip(fsIDs, contents))
+
+        @staticmethod
+        def _readGlobalFiles(job, contents):
+            """
+            Aux function for testReadWriteGlobalFiles. Reads the given files in a batch, with
+            duplicate IDs, and checks their contents.
+            """
+            fsIDs = list(contents.keys())
+            localPaths = job.fileStore.readGlobalFiles(fsIDs + fsIDs[:2])
+            assert len(localPaths) == len(fsIDs) + 2
+            # Duplicate IDs map to the same local file
+            assert localPaths[-2:] == localPaths[:2]
+            assert len(set(localPaths)) == len(fsIDs)
+            for fsID, localPath in zip(fsIDs, localPaths):
+                assert localPath.startswith(job.fileStore.localTempDir)
+                with open(localPath) as f:
+                    assert f.read() == contents[fsID]
+
         # Tests for the various defer possibilities
         def testDeferredFunctionRunsWithMethod(self):
             """
@@ -539,6 +596,83 @@ class hidden:
                 assert cacheInfo.nlink == 0
                 assert cacheInfo.cached > 1
 
+        def testCacheIndex(self):
+            """
+            Ensure that the cache index tracks the files added to and removed from the cache, and
+            that the state of the job is kept out of the node-wide cache state.
+            """
+            A = Job.wrapJobFn(self._testCacheIndex)
+            Job.Runner.startToil(A, self.options)
+
+        @staticmethod
+        def _testCacheIndex(job):
+            fileStore = job.fileStore
+            with fileStore.cacheLock():
+                cacheInfo = fileStore._CacheState._load(fileStore.cacheStateFile)
+                assert not hasattr(cacheInfo, 'jobState')
+            assert os.path.exists(fileStore.jobStateFile)
+            fsIDs = []
+            for i in xrange(3):
+                with open(os.path.join(fileStore.getLocalTempDir(), str(i)), 'w') as f:
+                    f.write(str(i) * (i + 1))
+                fsIDs.append(fileStore.writeGlobalFile(f.name))
+            with fileStore.cacheLock():
+                cacheIndex = fileStore._readCacheIndex()
+            cachedFileNames = [os.path.basename(fileStore.encodedFileID(fsID)) for fsID in fsIDs]
+            assert list(cacheIndex.items()) == [(cachedFileName, CachedFile(i + 1, None, 0))
+                                                for i, cachedFileName in enumerate(cachedFileNames)]
+            # Reading a cached file makes it the most recently used one. Apart from returning
+            # the size of the file to the job, the cache state is left alone.
+            cacheState = vars(fileStore._CacheState._load(fileStore.cacheStateFile))
+            fileStore.readGlobalFile(fsIDs[0])
+            assert fileStore.cacheStats == dict(hits=1, misses=0, evictions=0)
+            cacheState['sigmaJob'] -= 1
+            assert vars(fileStore._CacheState._load(fileStore.cacheStateFile)) == cacheState
+            with fileStore.cacheLock():
+                cacheIndex = fileStore._readCacheIndex()
+            assert list(cacheIndex.keys()) == cachedFileNames[1:] + cachedFileNames[:1]
+            assert cacheIndex[cachedFileNames[0]].hits == 1
+            fileStore.deleteGlobalFile(fsIDs[1])
+            with fileStore.cacheLock():
+                cacheInfo = fileStore._CacheState._load(fileStore.cacheStateFile)
+                cacheIndex = fileStore._readCacheIndex()
+                assert list(cacheIndex.keys()) == [cachedFileNames[2], cachedFileNames[0]]
+                # Compacting the index drops the records of the read and the removed file
+                fileStore._writeCacheIndex(cacheInfo, cacheIndex)
+                assert cacheInfo.compactedIndexSize == os.path.getsize(fileStore.cacheIndexFile)
+                assert fileStore._readCacheIndex() == cacheIndex
+                with open(fileStore.cacheIndexFile) as f:
+                    assert len(f.readlines()) == 2
+
+        def testFileLocks(self):
+            """
+            Ensure that the lock of a cached file only excludes operations on that file.
+            """
+            A = Job.wrapJobFn(self._testFileLocks)
+            Job.Runner.startToil(A, self.options)
+
+        @staticmethod
+        def _testFileLocks(job):
+            fileStore = job.fileStore
+            with open(os.path.join(fileStore.getLocalTempDir(), 'testfile'), 'w') as f:
+                f.write('foo')
+            fsID = fileStore.writeGlobalFile(f.name)
+            lockNumber = lambda jobStoreFileID: (int(sha1(jobStoreFileID).hexdigest(), 16) %
+                                                 fileStore.numFileLocks)
+            otherID = next(str(i) for i in itertools.count()
+                           if lockNumber(str(i)) != lockNumber(fsID))
+            with fileStore.fileLock(otherID):
+                # Holding the lock of another file doesn't keep us from reading this one
+                fileStore.readGlobalFile(fsID)
+                with fileStore.fileLock(fsID, blocking=False) as lockFileHandle:
+                    assert lockFileHandle is not None
+            with fileStore.fileLock(fsID):
+                with fileStore.fileLock(fsID, blocking=False) as lockFileHandle:
+                    assert lockFileHandle is None
+                # The cache lock may be acquired while holding the lock of a file
+                with fileStore.cacheLock():
+                    pass
+
         def testCacheEvictionPartialEvict(self):
             """
             Ensure the cache eviction happens as expected.  Two files (20MB and 30MB) are written
@@ -1089,15 +1223,15 @@ class hidden:
             Assert the values for job disk and total cached file sizes tracked in the job's cache
             state file is equal to the values we expect.
             """
+            jobState = job.fileStore._JobState._load(job.fileStore.jobStateFile)
             with job.fileStore._CacheState.open(job.fileStore) as cacheInfo:
-                jobState = cacheInfo.jobState[job.fileStore.jobID]
                 # cached should have a value only if the job store is on a different file system
                 # than the cache
                 if cacheInfo.nlink != 2:
                     assert cacheInfo.cached == cached
                 else:
                     assert cacheInfo.cached == 0
-            assert jobState['jobReqs'] == jobDisk
+            assert jobState.jobReqs == jobDisk
 
         # Testing the resumability of a failed worker
         def testControlledFailedWorkerRetry(self):
@@ -1245,6 +1379,38 @@ class hidden:
                 pass
 
 
+class CacheEvictionPolicyTest(ToilTest):
+    """
+    Tests the order in which the cache eviction policies evict files.
+    """
+    def setUp(self):
+        super(CacheEvictionPolicyTest, self).setUp()
+        # Ordered from the least to the most recently used
+        self.cacheIndex = collections.OrderedDict([
+            # A large file that was downloaded quickly and read a few times
+            ('a', CachedFile(size=1000, cost=1.0, hits=2)),
+            # A small file that was written by a job and never read
+            ('b', CachedFile(size=10, cost=None, hits=0)),
+            # A small file that was slow to download and was read once
+            ('c', CachedFile(size=100, cost=10.0, hits=1)),
+            # A file that was downloaded at the average rate and never read
+            ('d', CachedFile(size=100, cost=1.0, hits=0))])
+
+    def _evictionOrder(self, policy):
+        return cacheEvictionPolicies[policy]().evictionOrder(self.cacheIndex)
+
+    def testLRU(self):
+        self.assertEqual(self._evictionOrder('lru'), ['a', 'b', 'c', 'd'])
+
+    def testLFU(self):
+        self.assertEqual(self._evictionOrder('lfu'), ['b', 'd', 'c', 'a'])
+
+    def testCostAware(self):
+        # The download rate is 1200 bytes in 12 seconds, so 'b' is estimated to take 0.1 seconds
+        # to download, saving as much time per byte as 'd'.
+        self.assertEqual(self._evictionOrder('cost'), ['a', 'b', 'd', 'c'])
+
+
 class _deleteMethods(object):
     @staticmethod
     def _deleteFileMethod(nonLocalFile, nlf=None):
@@ -14,12 +14,21 @@
 
 from __future__ import absolute_import
 import os
+import logging
+import marshal
+import time
 from argparse import ArgumentParser
+
+# Python 3 compatibility imports
+from six.moves import cPickle
+
 from toil.common import Toil
-from toil.job import Job
+from toil.job import Job, JobNode, ServiceJobNode
 from toil.test import ToilTest
 from toil.jobGraph import JobGraph
 
+logger = logging.getLogger(__name__)
+
 class JobGraphTest(ToilTest):
     
     def setUp(self):
@@ -80,3 +89,103 @@ class JobGraphTest(ToilTest):
         self.assertNotEquals(j, j2)
         
         ###TODO test other functionality
+
+    def testCopy(self):
+        """
+        Tests that modifying a copy of a job graph leaves the original intact.
+        """
+        requirements = dict(memory=2 ** 32, cores=1, disk=2 ** 32, preemptable=False)
+        j = JobGraph(command='_toil fooBar /tmp/jobStore 1', jobStoreID='a/b/jobX',
+                     remainingRetryCount=5, predecessorNumber=1, jobName='testJobGraph',
+                     unitName='noName', filesToDelete=['a/b/tmpX.tmp'],
+                     predecessorsFinished={'c/d/jobY'}, **requirements)
+        j.stack = [[JobNode(command='_toil fooBar /tmp/jobStore %i' % i,
+                            jobStoreID='a/b/job%i' % i, jobName='child', unitName=None,
+                            requirements=requirements)
+                    for i in range(3)]]
+        j2 = j.copy()
+        self.assertEquals(j, j2)
+        self.assertEquals(j2.memory, j.memory)
+        j2.stack[0].pop()
+        j2.stack.append([])
+        j2.services.append([])
+        j2.filesToDelete.append('a/b/tmpY.tmp')
+        j2.predecessorsFinished.add('e/f/jobZ')
+        j2.command = None
+        self.assertEquals(len(j.stack), 1)
+        self.assertEquals(len(j.stack[0]), 3)
+        self.assertEquals(j.services, [])
+        self.assertEquals(j.filesToDelete, ['a/b/tmpX.tmp'])
+        self.assertEquals(j.predecessorsFinished, {'c/d/jobY'})
+        self.assertEquals(j.command, '_toil fooBar /tmp/jobStore 1')
+
+    def testBinary(self):
+        """
+        Tests that job graphs survive the round trip through their binary representation, that
+        pickled job graphs can still be read and that the binary representation is smaller and
+        faster to read and write than a pickle.
+        """
+        requirements = dict(memory=2 ** 32, cores=1, disk=2 ** 32, preemptable=False)
+        j = JobGraph(command='_toil fooBar /tmp/jobStore 1', jobStoreID='a/b/jobX',
+                     remainingRetryCount=5, predecessorNumber=1, jobName='testJobGraph',
+                     unitName='noName', filesToDelete=['a/b/tmpX.tmp'],
+                     predecessorsFinished={'c/d/jobY'}, chainedJobs=['testJobGraph'],
+                     **requirements)
+        j.stack = [[JobNode(command='_toil fooBar /tmp/jobStore %i' % i,
+                            jobStoreID='a/b/job%i' % i, jobName='child', unitName=None,
+                            requirements=requirements)
+                    for i in range(100)]]
+        j.services = [[ServiceJobNode(jobStoreID='e/f/jobZ', startJobStoreID='e/f/tmpA.tmp',
+                                      terminateJobStoreID='e/f/tmpB.tmp',
+                                      errorJobStoreID='e/f/tmpC.tmp', unitName=None,
+                                      jobName='service', command='_toil service',
+                                      predecessorNumber=1, **requirements)]]
+
+        j.pickledJob = cPickle.dumps(Job(), cPickle.HIGHEST_PROTOCOL)
+
+        binary = j.toBinary()
+        j2 = JobGraph.fromBinary(binary)
+        self.assertEquals(j, j2)
+        self.assertEquals(j2.pickledJob, j.pickledJob)
+        self.assertEquals(j.stack, j2.stack)
+        self.assertEquals(j.services, j2.services)
+        self.assertEquals(type(j2.services[0][0]), ServiceJobNode)
+        self.assertEquals(j2.chainedJobs, j.chainedJobs)
+        self.assertEquals(j2.memory, j.memory)
+
+        # Job graphs persisted by older versions of Toil are pickled
+        for protocol in (0, cPickle.HIGHEST_PROTOCOL):
+            pickled = cPickle.dumps(j, protocol)
+            self.assertEquals(j, JobGraph.fromBinary(pickled))
+            self.assertTrue(len(binary) < len(pickled))
+
+        # Job graphs persisted by older versions of Toil lack some attributes
+        oldFields = JobGraph._previousJobGraphFields[1]
+        oldBinary = (JobGraph.binaryPrefix + chr(1) +
+                     marshal.dumps((JobGraph._fieldValues(j, oldFields),
+                                    [[JobGraph._jobNodeToTuple(jobNode) for jobNode in jobNodes]
+                                     for jobNodes in j.stack], []), 2))
+        j3 = JobGraph.fromBinary(oldBinary)
+        self.assertEquals(j, j3)
+        self.assertIsNone(j3.pickledJob)
+
+        def benchmark(dumps, loads):
+            # The best of several runs is the least affected by whatever else the machine is doing
+            times = []
+            for _ in range(5):
+                start = time.time()
+                for _ in range(100):
+                    loads(dumps(j))
+                times.append(time.time() - start)
+            return min(times)
+
+        pickled = cPickle.dumps(j, cPickle.HIGHEST_PROTOCOL)
+        pickleTime = benchmark(lambda x: cPickle.dumps(x, cPickle.HIGHEST_PROTOCOL), cPickle.loads)
+        binaryTime = benchmark(JobGraph.toBinary, JobGraph.fromBinary)
+        logger.info('Pickled job graph: %i bytes, %f seconds for 100 round trips. '
+                    'Binary job graph: %i bytes, %f seconds for 100 round trips.',
+                    len(pickled), pickleTime, len(binary), binaryTime)
+        # The leader loads and updates a job graph for every job it processes, so the binary
+        # representation must cost less than the pickle it replaces, measured in the same run
+        self.assertLess(len(binary), len(pickled))
+        self.assertLess(binaryTime, pickleTime)
@@ -16,6 +16,7 @@ import unittest
 import logging
 import os
 import random
+import time
 
 # Python 3 compatibility imports
 from six.moves import xrange
@@ -25,6 +26,7 @@ from toil.leader import FailedJobsException
 from toil.lib.bioio import getTempFile
 from toil.job import Job, JobGraphDeadlockException, JobFunctionWrappingJob
 from toil.test import ToilTest
+from toil.toilState import ToilState
 
 logger = logging.getLogger(__name__)
 
@@ -161,6 +163,59 @@ class JobTest(ToilTest):
             else:
                 self.fail()
 
+    def testInlinedJobs(self):
+        """
+        Runs a workflow mixing jobs small enough to be stored inline with their job graphs and
+        jobs that need a file of their own, and passes values between them using promises.
+        """
+        for maxInlinedJobSize in (0, 4 * 1024, 1024 * 1024):
+            options = Job.Runner.getDefaultOptions(self._getTestJobStorePath())
+            options.clean = 'always'
+            options.maxInlinedJobSize = maxInlinedJobSize
+            root = Job.wrapFn(returnValue, 'a')
+            # The payload makes this job too large to be inlined with the default threshold
+            large = root.addChildFn(returnValue, root.rv(), payload='x' * 8 * 1024)
+            small = large.addFollowOnFn(returnValue, large.rv())
+            root.addFollowOnFn(checkValue, small.rv(), 'a')
+            self.assertEquals(Job.Runner.startToil(root, options), 'a')
+
+    def testInlinedJobLoadedByLeader(self):
+        """
+        The leader should not hold on to the pickled job stored inline with a job graph it loads,
+        while the worker still gets to run the job.
+        """
+        options = Job.Runner.getDefaultOptions(self._getTestJobStorePath())
+        options.clean = 'never'
+        marker = os.path.join(self._createTempDir(), 'failed')
+        root = Job.wrapFn(returnValue, 'a')
+        root.addChildFn(failOnce, marker)
+        self.assertRaises(FailedJobsException, Job.Runner.startToil, root, options)
+        jobStore = Toil.resumeJobStore(options.jobStore)
+        toilState = ToilState(jobStore, jobStore.loadRootJob())
+        (jobGraph, _), = toilState.updatedJobs
+        self.assertTrue(jobGraph.command.startswith('_toil inline '))
+        self.assertIsNone(jobGraph.pickledJob)
+        self.assertIsNotNone(jobStore.load(jobGraph.jobStoreID).pickledJob)
+        options.restart = True
+        options.clean = 'always'
+        Job.Runner.startToil(root, options)
+
+    def testChaining(self):
+        """
+        Runs a chain of follow-ons passing values along using promises, which should all be run
+        by the same worker, whether the jobs are stored inline with their job graphs or not.
+        """
+        for maxInlinedJobSize in (0, 4 * 1024):
+            options = Job.Runner.getDefaultOptions(self._getTestJobStorePath())
+            options.clean = 'always'
+            options.maxInlinedJobSize = maxInlinedJobSize
+            root = Job.wrapFn(recordPid, [])
+            job = root
+            for i in range(5):
+                job = job.addFollowOnFn(recordPid, job.rv())
+            job.addFollowOnFn(checkPids, job.rv(), 6)
+            Job.Runner.startToil(root, options)
+
     def testSiblingDAGConsistency(self):
         """
         Slightly more complex case. The stranded job's predecessors are siblings instead of
@@ -273,6 +328,37 @@ class JobTest(ToilTest):
                 and (fNode, tNode) not in childEdges and (fNode, tNode) not in followOnEdges):
                 checkFollowOnEdgeCycleDetection(fNode, tNode)
 
+    def testDeadlockDetectionPerformance(self):
+        """
+        Benchmarks the deadlock detection on wide and deep synthetic job graphs with follow-ons.
+        The number of implied edges in the deep graph grows quadratically with the number of jobs.
+        """
+        for shape in ('wide', 'deep'):
+            numJobs = 50000
+            rootJob = Job()
+            firstChild = rootJob.addChild(Job())
+            if shape == 'wide':
+                # A job adding many children, each with a follow-on, and a final follow-on
+                for i in xrange(numJobs):
+                    rootJob.addChild(Job()).addFollowOn(Job())
+                lastJob = rootJob.addFollowOn(Job())
+            else:
+                # A long chain of children, each with a follow-on
+                lastJob = firstChild
+                for i in xrange(numJobs):
+                    lastJob.addFollowOn(Job())
+                    lastJob = lastJob.addChild(Job())
+            start = time.time()
+            rootJob.checkJobGraphForDeadlocks()
+            runTime = time.time() - start
+            logger.info('Checked a %s job graph of %i jobs for deadlocks in %f seconds.',
+                        shape, 2 * numJobs + 3, runTime)
+            # Far from the hours the quadratic algorithm takes, but leaving room for slow machines
+            self.assertLess(runTime, 60)
+            # Closing a cycle through a follow-on must still be detected
+            lastJob.addFollowOn(firstChild)
+            self.assertRaises(JobGraphDeadlockException, rootJob.checkJobGraphAcylic)
+
     def testNewCheckpointIsLeafVertexNonRootCase(self):
         """
         Test for issue #1465: Detection of checkpoint jobs that are not leaf vertices
@@ -621,6 +707,23 @@ class JobTest(ToilTest):
                 return False
         return True
 
+def returnValue(value, payload=None):
+    return value
+
+def failOnce(marker):
+    if not os.path.exists(marker):
+        open(marker, 'w').close()
+        raise RuntimeError('Failing the first time around')
+
+def checkValue(value, expectedValue):
+    assert value == expectedValue
+
+def recordPid(pids):
+    return pids + [os.getpid()]
+
+def checkPids(pids, numJobs):
+    assert len(pids) == numJobs and pids == [os.getpid()] * numJobs, pids
+
 def simpleJobFn(job, value):
     job.fileStore.logToMaster(value)
 
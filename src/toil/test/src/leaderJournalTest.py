@@ -0,0 +1,158 @@
+# Copyright (C) 2015-2017 Regents of the University of California
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import absolute_import
+import os
+
+from toil.common import Config
+from toil.job import Job
+from toil.jobStores.abstractJobStore import AbstractJobStore
+from toil.jobStores.fileJobStore import FileJobStore
+from toil.leader import FailedJobsException
+from toil.leaderJournal import LeaderJournal
+from toil.test import ToilTest
+
+
+class StateStub(object):
+    """
+    Stands in for the state of the leader, returning a fixed snapshot.
+    """
+    def __init__(self, snapshot):
+        self.snapshot = snapshot
+
+    def getSnapshot(self):
+        return self.snapshot
+
+
+class LeaderJournalTest(ToilTest):
+    def setUp(self):
+        super(LeaderJournalTest, self).setUp()
+        self.tempDir = self._createTempDir()
+
+    def testJournal(self):
+        """
+        The snapshot and the removed and failed jobs recorded after it should be loaded, also
+        after the loaded journal has been appended to.
+        """
+        jobStorePath = self._getTestJobStorePath()
+        config = Config()
+        config.jobStore = 'file:' + jobStorePath
+        jobStore = FileJobStore(jobStorePath)
+        jobStore.initialize(config)
+        try:
+            self.assertIsNone(LeaderJournal.load(jobStore, 0))
+            journal = LeaderJournal(jobStore, 0)
+            # Jobs removed before the first snapshot are reflected by it
+            journal.recordRemovedJob('a')
+            journal.recordFailedJob('f')
+            journal.update(StateStub({'jobs': 1}))
+            journal.recordRemovedJob('b')
+            journal.recordFailedJob('g')
+            journal.recordRemovedJob('c')
+            journal.flushInterval = 0
+            journal.snapshotInterval = 3600
+            journal.update(StateStub(None))
+            journal.recordRemovedJob('d')
+
+            journal = LeaderJournal.load(jobStore, 3600)
+            self.assertEqual(journal.popSnapshot(), ({'jobs': 1}, ['b', 'c'], ['g']))
+            journal.flushInterval = 0
+            journal.recordRemovedJob('e')
+            journal.update(StateStub(None))
+            oldFileIDs = journal.fileIDs
+
+            journal = LeaderJournal.load(jobStore, 0)
+            self.assertEqual(journal.popSnapshot(), ({'jobs': 1}, ['b', 'c', 'e'], ['g']))
+            self.assertEqual(journal.fileIDs, oldFileIDs)
+            # A new snapshot starts a new journal
+            journal.update(StateStub({'jobs': 2}))
+            for fileID in oldFileIDs:
+                self.assertFalse(jobStore.fileExists(fileID))
+            journal = LeaderJournal.load(jobStore, 0)
+            self.assertEqual(journal.popSnapshot(), ({'jobs': 2}, [], []))
+        finally:
+            jobStore.destroy()
+
+    def testRestartFromJournal(self):
+        """
+        On restart, the state of the leader should be restored from the journal instead of
+        cleaning the job store.
+        """
+        self.assertEqual(self._runWithRestart(disableJournal=False), (0, 1))
+
+    def testRestartWithoutJournal(self):
+        """
+        On restart, the job store should be cleaned if the journal is disabled.
+        """
+        self.assertEqual(self._runWithRestart(disableJournal=True), (1, 1))
+
+    def _runWithRestart(self, disableJournal, numJobs=10):
+        """
+        Runs a workflow one job of which fails in the first attempt, and restarts it.
+
+        :return: the number of times the job store was cleaned and the number of times the
+                 stats and logs left by the first attempt were discarded
+        :rtype: (int, int)
+        """
+        options = Job.Runner.getDefaultOptions(self._getTestJobStorePath())
+        options.stateSnapshotInterval = 0
+        options.disableJournal = disableJournal
+        cleanings = []
+        discardings = []
+        clean = AbstractJobStore.clean
+        discardStatsAndLogging = AbstractJobStore.discardStatsAndLogging
+
+        def countingClean(jobStore, *args, **kwargs):
+            cleanings.append(jobStore)
+            return clean(jobStore, *args, **kwargs)
+
+        def countingDiscardStatsAndLogging(jobStore):
+            discardings.append(jobStore)
+            return discardStatsAndLogging(jobStore)
+
+        AbstractJobStore.clean = countingClean
+        AbstractJobStore.discardStatsAndLogging = countingDiscardStatsAndLogging
+        try:
+            rootJob = Job.wrapJobFn(scatter, self.tempDir, numJobs)
+            self.assertRaises(FailedJobsException, Job.Runner.startToil, rootJob, options)
+            options.restart = True
+            Job.Runner.startToil(rootJob, options)
+        finally:
+            AbstractJobStore.clean = clean
+            AbstractJobStore.discardStatsAndLogging = discardStatsAndLogging
+        with open(os.path.join(self.tempDir, 'gathered')) as f:
+            self.assertEqual(f.read(), str(sum(range(numJobs))))
+        return len(cleanings), len(discardings)
+
+
+def scatter(job, tempDir, numJobs):
+    values = [job.addChildJobFn(failOnce, tempDir, i).rv() for i in range(numJobs)]
+    job.addFollowOnJobFn(gather, tempDir, values)
+
+
+def failOnce(job, tempDir, i):
+    # Only the first attempt at running the first job fails
+    if i == 0:
+        try:
+            os.close(os.open(os.path.join(tempDir, 'failed'), os.O_CREAT | os.O_EXCL))
+        except OSError:
+            pass
+        else:
+            raise RuntimeError('Failing the first attempt')
+    return i
+
+
+def gather(job, tempDir, values):
+    with open(os.path.join(tempDir, 'gathered'), 'w') as f:
+        f.write(str(sum(values)))
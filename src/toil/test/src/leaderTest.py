@@ -0,0 +1,206 @@
+# Copyright (C) 2015-2016 Regents of the University of California
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import absolute_import
+import logging
+import os
+import resource
+import subprocess
+import sys
+import time
+
+# Python 3 compatibility imports
+from six.moves import cPickle
+
+from toil.common import Config
+from toil.job import JobNode
+from toil.jobStores.fileJobStore import FileJobStore
+from toil.leader import IssuedJob, Leader
+from toil.test import ToilTest, integrative
+
+logger = logging.getLogger(__name__)
+
+
+def runFanOutRoot(jobStorePath, rootJobStoreID, fanOut):
+    """
+    Stands in for the worker running the root job of the synthetic fan-out, adding the given
+    number of successors to it.
+    """
+    jobStore = FileJobStore(jobStorePath)
+    jobStore.resume()
+    rootJob = jobStore.load(rootJobStoreID)
+    requirements = dict(memory=100, cores=1, disk=100, preemptable=False)
+    rootJob.stack.append([JobNode(requirements=requirements,
+                                  jobName='FanOutJob', unitName='',
+                                  jobStoreID='%s/successor%i' % (rootJobStoreID, i),
+                                  command='_toil %s/successor%i/stream' % (rootJobStoreID, i))
+                          for i in range(fanOut)])
+    rootJob.command = None
+    jobStore.update(rootJob)
+    with jobStore.writeSharedFileStream('rootJobReturnValue') as f:
+        cPickle.dump(None, f)
+
+
+class FanOutBatchSystem(object):
+    """
+    A stand-in for a batch system that runs the jobs of a synthetic fan-out instantly. The root
+    job is run in a separate process, like a worker would, such that the memory used to create
+    its successors is not attributed to the leader. The successors are never written to the job
+    store, so they are treated as if they had completed as soon as they were issued.
+    """
+    def __init__(self, jobStore, jobStorePath, rootJobStoreID, fanOut):
+        self.jobStore = jobStore
+        self.jobStorePath = jobStorePath
+        self.rootJobStoreID = rootJobStoreID
+        self.fanOut = fanOut
+        self.issuedJobIDs = set()
+        self.updatedJobIDs = []
+        self.numberOfJobsRun = 0
+
+    def issueBatchJob(self, jobNode):
+        jobID = self.numberOfJobsRun
+        self.numberOfJobsRun += 1
+        if jobNode.jobStoreID == self.rootJobStoreID:
+            if jobID == 0:
+                subprocess.check_call([sys.executable, '-c',
+                                       'from toil.test.src.leaderTest import runFanOutRoot; '
+                                       'runFanOutRoot(%r, %r, %i)' % (self.jobStorePath,
+                                                                     self.rootJobStoreID,
+                                                                     self.fanOut)])
+            else:
+                self.jobStore.delete(jobNode.jobStoreID)
+        self.issuedJobIDs.add(jobID)
+        self.updatedJobIDs.append(jobID)
+        return jobID
+
+    def issueBatchJobs(self, jobNodes):
+        return [self.issueBatchJob(jobNode) for jobNode in jobNodes]
+
+    def getIssuedBatchJobIDs(self):
+        return list(self.issuedJobIDs)
+
+    def getRunningBatchJobIDs(self):
+        return {}
+
+    def getUpdatedBatchJobs(self, maxWait, limit=None):
+        updatedJobIDs = self.updatedJobIDs[:limit]
+        self.issuedJobIDs.difference_update(updatedJobIDs)
+        self.updatedJobIDs = self.updatedJobIDs[len(updatedJobIDs):]
+        return [(jobID, 0, 0.0) for jobID in updatedJobIDs]
+
+
+class LeaderMemoryTest(ToilTest):
+    """
+    Benchmarks the memory consumed by the leader's bookkeeping for a wide fan-out.
+    """
+    def setUp(self):
+        super(LeaderMemoryTest, self).setUp()
+        self.jobStorePath = os.path.join(self._createTempDir(), 'jobStore')
+        self.config = Config()
+        self.config.jobStore = 'file:' + self.jobStorePath
+        self.jobStore = FileJobStore(self.jobStorePath)
+        self.jobStore.initialize(self.config)
+
+    def tearDown(self):
+        self.jobStore.destroy()
+        super(LeaderMemoryTest, self).tearDown()
+
+    def testFanOut(self):
+        self._testFanOut(fanOut=10000)
+
+    @integrative
+    def testMillionJobFanOut(self):
+        peakMemoryPerJob = self._testFanOut(fanOut=1000000)
+        # Each issued job should cost no more than a handful of small objects
+        self.assertLess(peakMemoryPerJob, 1024)
+
+    def testIssuedJobRecords(self):
+        """
+        The leader should only keep a compact record of each issued job, sharing the
+        requirements of jobs with the same requirements.
+        """
+        rootJob = self.jobStore.create(JobNode(command='_toil root',
+                                               requirements=dict(memory=100, cores=1, disk=100,
+                                                                 preemptable=False),
+                                               jobName='FanOutRoot', unitName='',
+                                               jobStoreID=None))
+        batchSystem = FanOutBatchSystem(self.jobStore, self.jobStorePath, rootJob.jobStoreID,
+                                        fanOut=0)
+        leader = Leader(config=self.config, batchSystem=batchSystem, provisioner=None,
+                        jobStore=self.jobStore, rootJob=rootJob)
+        requirements = dict(memory=100, cores=1, disk=100, preemptable=True)
+        jobNodes = [JobNode(requirements=requirements, jobName='FanOutJob', unitName='',
+                            jobStoreID='job%i' % i, command=None)
+                    for i in range(10)]
+        jobBatchSystemIDs = leader.issueJobs(jobNodes)
+        issuedJobs = [leader.jobBatchSystemIDToIssuedJob[jobBatchSystemID]
+                      for jobBatchSystemID in jobBatchSystemIDs]
+        for jobNode, issuedJob in zip(jobNodes, issuedJobs):
+            self.assertIsInstance(issuedJob, IssuedJob)
+            self.assertEqual(issuedJob.jobStoreID, jobNode.jobStoreID)
+            self.assertEqual(str(issuedJob), "'FanOutJob' %s" % jobNode.jobStoreID)
+            self.assertEqual((issuedJob.memory, issuedJob.cores, issuedJob.disk,
+                              issuedJob.preemptable), (100, 1, 100, True))
+            self.assertIs(issuedJob.requirements, issuedJobs[0].requirements)
+        self.assertEqual(leader.preemptableJobsIssued, 10)
+        self.assertEqual(leader.jobBatchSystemIDToIssuedServiceJob, {})
+        for jobBatchSystemID in jobBatchSystemIDs:
+            leader.removeJob(jobBatchSystemID)
+        self.assertEqual(leader.jobBatchSystemIDToIssuedJob, {})
+        self.assertEqual(leader.preemptableJobsIssued, 0)
+
+    def _testFanOut(self, fanOut):
+        """
+        Runs the leader on a root job with the given number of successors and returns the
+        increase in the peak memory usage of the process per successor, in bytes.
+        """
+        rootJob = self.jobStore.create(JobNode(command='_toil root',
+                                               requirements=dict(memory=100, cores=1, disk=100,
+                                                                 preemptable=False),
+                                               jobName='FanOutRoot', unitName='',
+                                               jobStoreID=None))
+        batchSystem = FanOutBatchSystem(self.jobStore, self.jobStorePath, rootJob.jobStoreID,
+                                        fanOut)
+        # Logging each issued job would dominate the run time
+        leaderLogger = logging.getLogger('toil.leader')
+        logLevel = leaderLogger.level
+        leaderLogger.setLevel(logging.WARN)
+        try:
+            leader = Leader(config=self.config, batchSystem=batchSystem, provisioner=None,
+                            jobStore=self.jobStore, rootJob=rootJob)
+            startMemory = self._getPeakMemory()
+            start = time.time()
+            self.assertIsNone(leader.run())
+            runTime = time.time() - start
+            peakMemory = self._getPeakMemory() - startMemory
+        finally:
+            leaderLogger.setLevel(logLevel)
+        # The root job is run twice, once to add its successors and once to clean it up
+        self.assertEqual(batchSystem.numberOfJobsRun, fanOut + 2)
+        self.assertFalse(self.jobStore.exists(batchSystem.rootJobStoreID))
+        self.assertEqual(leader.toilState.successorJobStoreIDToPredecessorJobs, {})
+        self.assertEqual(leader.jobBatchSystemIDToIssuedJob, {})
+        logger.info('Leader ran a fan-out of %i jobs in %f seconds, increasing the peak memory '
+                    'usage by %i bytes (%i bytes per job).', fanOut, runTime, peakMemory,
+                    peakMemory / fanOut)
+        return peakMemory / fanOut
+
+    @staticmethod
+    def _getPeakMemory():
+        """
+        Returns the peak resident set size of this process in bytes.
+        """
+        peakMemory = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        # ru_maxrss is measured in bytes on OS X and in kilobytes on Linux
+        return peakMemory if sys.platform == 'darwin' else peakMemory * 1024
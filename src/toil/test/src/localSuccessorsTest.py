@@ -0,0 +1,101 @@
+# Copyright (C) 2015-2017 Regents of the University of California
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import absolute_import
+import json
+import os
+import signal
+
+from toil.job import Job
+from toil.test import ToilTest
+
+
+class LocalSuccessorsTest(ToilTest):
+    """
+    Tests running the successors of a job within the worker of the job.
+    """
+    def setUp(self):
+        super(LocalSuccessorsTest, self).setUp()
+        self.tempDir = self._createTempDir()
+
+    def testSuccessorsRunLocally(self):
+        """
+        Children fitting within their parent should be run by the worker of the parent, as should
+        the follow-on once they are all done.
+        """
+        results = self._run(maxLocalSuccessors=3)
+        self.assertEqual(results['children'], {i: True for i in range(8)})
+        self.assertTrue(results['gather'])
+
+    def testSuccessorsLeftToLeader(self):
+        """
+        Children that do not fit within their parent should be left to the leader.
+        """
+        results = self._run(maxLocalSuccessors=3, bigChild=True)
+        self.assertEqual(results['children'], dict({i: True for i in range(8)}, **{0: False}))
+        self.assertFalse(results['gather'])
+
+    def testCrashedSuccessorLeftToLeader(self):
+        """
+        A child whose worker process dies should be left to the leader, which runs it again.
+        """
+        results = self._run(maxLocalSuccessors=3, crashingChild=True)
+        self.assertEqual(results['children'], dict({i: True for i in range(8)}, **{0: False}))
+        self.assertFalse(results['gather'])
+
+    def testDisabled(self):
+        """
+        By default, all successors of a job should be left to the leader.
+        """
+        results = self._run(maxLocalSuccessors=0)
+        self.assertEqual(results['children'], {i: False for i in range(8)})
+        self.assertFalse(results['gather'])
+
+    def _run(self, maxLocalSuccessors, bigChild=False, crashingChild=False):
+        """
+        :return: whether each job was run by the worker of the root job
+        :rtype: dict
+        """
+        options = Job.Runner.getDefaultOptions(self._getTestJobStorePath())
+        options.maxLocalSuccessors = maxLocalSuccessors
+        rootJob = Job.wrapJobFn(scatter, self.tempDir, 8, bigChild, crashingChild,
+                                memory='100M', cores=1)
+        Job.Runner.startToil(rootJob, options)
+        with open(os.path.join(self.tempDir, 'results')) as f:
+            results = json.load(f)
+        results['children'] = {int(i): local for i, local in results['children'].items()}
+        return results
+
+
+def scatter(job, tempDir, numJobs, bigChild, crashingChild):
+    # Successors run locally are run by worker processes started from this one, or by this one
+    workerPid = os.getpid()
+    crashMarker = os.path.join(tempDir, 'crashed') if crashingChild else None
+    values = [job.addChildJobFn(child, i, workerPid, crashMarker if i == 0 else None, cores=0.1,
+                                memory='200M' if bigChild and i == 0 else '10M').rv()
+              for i in range(numJobs)]
+    job.addFollowOnJobFn(gather, tempDir, values, workerPid, memory='10M', cores=0.1)
+
+
+def child(job, i, workerPid, crashMarker):
+    # Kill the worker process the first time around
+    if crashMarker is not None and not os.path.exists(crashMarker):
+        open(crashMarker, 'w').close()
+        os.kill(os.getpid(), signal.SIGKILL)
+    return i, os.getppid() == workerPid
+
+
+def gather(job, tempDir, values, workerPid):
+    with open(os.path.join(tempDir, 'results'), 'w') as f:
+        json.dump(dict(children=dict(values), gather=os.getpid() == workerPid), f)
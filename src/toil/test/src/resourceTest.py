@@ -14,9 +14,11 @@
 
 from __future__ import absolute_import
 
+import hashlib
 import importlib
 import os
 import sys
+import time
 from inspect import getsource
 from io import BytesIO
 from subprocess import check_call, Popen, PIPE
@@ -27,7 +29,10 @@ from bd2k.util.files import mkdir_p
 from mock import MagicMock, patch
 
 from toil import inVirtualEnv
-from toil.resource import ModuleDescriptor, Resource, ResourceException
+from toil.common import Config
+from toil.jobStores.abstractJobStore import NoSuchFileException
+from toil.jobStores.fileJobStore import FileJobStore
+from toil.resource import DirectoryResource, ModuleDescriptor, Resource, ResourceException
 from toil.test import ToilTest, tempFileContaining
 
 
@@ -124,13 +129,15 @@ class ResourceTest(ToilTest):
         # ... to generate a fake URL for the resource ...
         url = 'file://foo.zip'
         jobStore.getSharedPublicUrl.return_value = url
+        # ... that doesn't contain the resource yet ...
+        jobStore.readSharedFileStream.side_effect = NoSuchFileException('foo')
         # ... and save the resource to it.
         resource = module.saveAsResourceTo(jobStore)
         # Ensure that the URL generation method is actually called, ...
         jobStore.getSharedPublicUrl.assert_called_once_with(sharedFileName=resource.pathHash)
         # ... and that ensure that writeSharedFileStream is called.
-        jobStore.writeSharedFileStream.assert_called_once_with(sharedFileName=resource.pathHash,
-                                                               isProtected=False)
+        jobStore.writeSharedFileStream.assert_any_call(sharedFileName=resource.pathHash,
+                                                       isProtected=False)
         # Now it gets a bit complicated: Ensure that the context manager returned by the
         # jobStore's writeSharedFileStream() method is entered and that the file handle yielded
         # by the context manager is written to once with the zipped source tree from which
@@ -182,6 +189,68 @@ class ResourceTest(ToilTest):
         finally:
             Resource.cleanSystem()
 
+    def testUnchangedResourceIsNotSavedAgain(self):
+        """
+        A resource should only be saved to the job store again once its content changed.
+        """
+        dirPath = os.path.join(self._createTempDir(), 'foo')
+        os.mkdir(dirPath)
+        with open(os.path.join(dirPath, 'foo.py'), 'w') as f:
+            f.write('pass\n')
+        jobStorePath = self._getTestJobStorePath()
+        config = Config()
+        config.jobStore = 'file:' + jobStorePath
+        jobStore = FileJobStore(jobStorePath)
+        jobStore.initialize(config)
+        try:
+            resource = DirectoryResource.create(jobStore, dirPath)
+            with patch.object(jobStore, 'writeSharedFileStream') as writeSharedFileStream:
+                self.assertEqual(DirectoryResource.create(jobStore, dirPath), resource)
+                self.assertFalse(writeSharedFileStream.called)
+            with open(os.path.join(dirPath, 'bar.py'), 'w') as f:
+                f.write('pass\n')
+            changedResource = DirectoryResource.create(jobStore, dirPath)
+            self.assertNotEqual(changedResource.contentHash, resource.contentHash)
+            with jobStore.readSharedFileStream(resource.pathHash) as f:
+                with ZipFile(f) as zipFile:
+                    self.assertEqual(set(zipFile.namelist()), {'foo.py', 'bar.py'})
+        finally:
+            jobStore.destroy()
+
+    def testSharedDownloads(self):
+        """
+        Workers should share downloaded resources, deleting those not used for a while.
+        """
+        workDir = self._createTempDir()
+        bytesIO = DirectoryResource._load(self._createTempDir())
+        zipFile = bytesIO.read()
+        resource = DirectoryResource(name='foo', pathHash='0' * 32, url='file://foo.zip',
+                                     contentHash=hashlib.md5(zipFile).hexdigest())
+        mock_urlopen = MagicMock()
+        mock_urlopen.return_value.read.return_value = zipFile
+        with patch.dict(os.environ, TOIL_WORKDIR=workDir):
+            Resource.prepareSystem()
+            try:
+                with patch('toil.resource.urlopen', mock_urlopen):
+                    resource.download()
+                    self.assertEqual(mock_urlopen.call_count, 1)
+                    # Another worker finds the resource downloaded already
+                    resource.download()
+                    self.assertEqual(mock_urlopen.call_count, 1)
+                    self.assertTrue(resource.localDirPath.startswith(workDir))
+                    unusedTime = time.time() - Resource.maxUnusedTime - 1
+                    os.utime(resource.localDirPath, (unusedTime, unusedTime))
+                    otherResource = resource._replace(pathHash='1' * 32)
+                    otherResource.download()
+                    self.assertEqual(mock_urlopen.call_count, 2)
+                    self.assertFalse(os.path.exists(resource.localDirPath))
+                    self.assertFalse(os.path.exists(resource.localDirPath + '.lock'))
+                    localDirPath = otherResource.localDirPath
+            finally:
+                Resource.cleanSystem()
+            # Other workers may still need it
+            self.assertTrue(os.path.exists(localDirPath))
+
     def testNonPyStandAlone(self):
         """
         Asserts that Toil enforces the user script to have a .py or .pyc extension because that's
@@ -0,0 +1,109 @@
+# Copyright (C) 2015-2017 Regents of the University of California
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+
+from __future__ import absolute_import
+import os
+import time
+
+from mock import patch
+
+from toil.common import Toil
+from toil.job import Job
+from toil.jobStores.fileJobStore import FileJobStore
+from toil.test import ToilTest
+
+
+class SpeculativeExecutionTest(ToilTest):
+    def testStragglerIsSpeculated(self):
+        """
+        A job running much longer than its peers should be completed by a backup attempt.
+        """
+        markerDir = self._createTempDir()
+        options = Job.Runner.getDefaultOptions(self._getTestJobStorePath())
+        options.speculativePercentile = 50
+        options.speculationInterval = 1
+        Job.Runner.startToil(Job.wrapJobFn(scatter, markerDir, 12), options)
+        # The first attempt at running the straggler only returns once the backup attempt ran
+        self.assertTrue(os.path.exists(os.path.join(markerDir, 'backup')))
+        with open(os.path.join(markerDir, 'gathered')) as f:
+            self.assertEqual(f.read(), str(sum(range(12))))
+
+    def testSupersededAttemptDoesNotChain(self):
+        """
+        The first attempt at running the straggler must not run the successor it would chain to
+        once the backup attempt has completed the straggler.
+        """
+        markerDir = self._createTempDir()
+        options = Job.Runner.getDefaultOptions(self._getTestJobStorePath())
+        options.speculativePercentile = 50
+        options.speculationInterval = 1
+        Job.Runner.startToil(Job.wrapJobFn(scatter, markerDir, 12, chain=True), options)
+        self.assertTrue(os.path.exists(os.path.join(markerDir, 'backup')))
+        with open(os.path.join(markerDir, 'successorRuns')) as f:
+            self.assertEqual(len(f.readlines()), 1)
+
+    def testUnsupportedJobStoreIsRefused(self):
+        """
+        Toil should refuse to run jobs speculatively with a job store that can't update a job
+        conditionally.
+        """
+        options = Job.Runner.getDefaultOptions(self._getTestJobStorePath())
+        options.speculativePercentile = 50
+        with patch.object(FileJobStore, 'supportsConditionalUpdates', return_value=False):
+            with self.assertRaises(RuntimeError):
+                with Toil(options):
+                    pass
+        self.assertFalse(os.path.exists(options.jobStore))
+
+
+# The maximum number of seconds the first attempt at running the straggler waits for the backup
+# attempt
+stragglerTimeout = 60
+
+
+def scatter(job, markerDir, numJobs, chain=False):
+    values = [job.addChildJobFn(straggle, markerDir, i, chain, cores=0.1).rv()
+              for i in range(numJobs)]
+    job.addFollowOnJobFn(gather, markerDir, values)
+
+
+def straggle(job, markerDir, i, chain):
+    # Only the first attempt at running the first job is slow
+    if i == 0:
+        # The job that each attempt would chain to, it is only run by the backup attempt
+        if chain:
+            job.addFollowOnJobFn(succeed, markerDir, cores=0.1)
+        try:
+            os.close(os.open(os.path.join(markerDir, 'straggler'), os.O_CREAT | os.O_EXCL))
+        except OSError:
+            open(os.path.join(markerDir, 'backup'), 'w').close()
+        else:
+            # When chaining, wait until the backup attempt has completed the job and moved on
+            marker = os.path.join(markerDir, 'successorRuns' if chain else 'backup')
+            deadline = time.time() + stragglerTimeout
+            while time.time() < deadline and not os.path.exists(marker):
+                time.sleep(0.1)
+    return i
+
+
+def succeed(job, markerDir):
+    with open(os.path.join(markerDir, 'successorRuns'), 'a') as f:
+        f.write('ran\n')
+    # Keep the backup attempt running, so the first attempt isn't killed before it would chain
+    time.sleep(5)
+
+
+def gather(job, markerDir, values):
+    with open(os.path.join(markerDir, 'gathered'), 'w') as f:
+        f.write(str(sum(values)))
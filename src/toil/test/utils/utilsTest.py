@@ -31,6 +31,7 @@ from toil.job import Job
 from toil.lib.bioio import getTempFile, system
 from toil.test import ToilTest, needs_aws, needs_rsync3, integrative
 from toil.test.sort.sortTest import makeFileToSort
+from toil.statsAndLogging import StatsAndLogging
 from toil.utils.toilStats import getStats, processData
 from toil.common import Toil, Config
 
@@ -299,6 +300,28 @@ class UtilsTest(ToilTest):
         collatedStats = processData(jobStore.config, stats)
         self.assertTrue(len(collatedStats.job_types) == 2,
                         "Some jobs are not represented in the stats")
+        # The jobs don't read any files, but caching is enabled by default
+        self.assertEqual(collatedStats.cache.total_hits, 0)
+        self.assertEqual(collatedStats.cache.total_misses, 0)
+
+    def testJobRuntimesFromStats(self):
+        """
+        Tests that the run times the leader seeds the priorities of jobs with on restart are
+        read from the stats per job name.
+        """
+        options = Job.Runner.getDefaultOptions(self._getTestJobStorePath())
+        options.clean = 'never'
+        options.stats = True
+        Job.Runner.startToil(RunTwoJobsPerWorker(), options)
+        jobStore = Toil.resumeJobStore(options.jobStore)
+        jobRuntimes = StatsAndLogging.readJobRuntimes(jobStore)
+        self.assertEqual(sorted(jobRuntimes.keys()),
+                         ['RunTwoJobsPerWorker', 'printUnicodeCharacter'])
+        for runs, totalTime in jobRuntimes.values():
+            self.assertEqual(runs, 1)
+            self.assertGreaterEqual(totalTime, 0.0)
+        # The stats read already are read again
+        self.assertEqual(StatsAndLogging.readJobRuntimes(jobStore), jobRuntimes)
 
 def printUnicodeCharacter():
     # We want to get a unicode character to stdout but we can't print it directly because of
@@ -16,24 +16,45 @@ from __future__ import absolute_import
 
 import logging
 
+from six import iteritems
+
+from toil import internString
+from toil.jobStores.abstractJobStore import NoSuchJobException
+
 logger = logging.getLogger( __name__ )
 
 class ToilState( object ):
     """
     Represents a snapshot of the jobs in the jobStore. Used by the leader to manage the batch.
+
+    Jobs that wait for their successors or services to finish are only referenced by their
+    jobStoreIDs, which are interned such that the maps below share a single copy of each of
+    them. The leader loads the job graphs of such jobs from the job store again once they need
+    to be considered, keeping the memory footprint of the state proportional to the number of
+    jobs rather than to the size of their job graphs.
     """
-    def __init__( self, jobStore, rootJob, jobCache=None):
+    def __init__( self, jobStore, rootJob, jobCache=None, snapshot=None, removedJobStoreIDs=(),
+                  failedJobStoreIDs=()):
         """
         Loads the state from the jobStore, using the rootJob 
         as the source of the job graph.
         
         The jobCache is a map from jobStoreIDs to jobGraphs or None. Is used to
         speed up the building of the state.
+
+        If a snapshot is passed, the state is restored from it instead, see
+        _restoreToilState().
         
         :param toil.jobStores.abstractJobStore.AbstractJobStore jobStore 
         :param toil.jobWrapper.JobGraph rootJob
+        :param dict snapshot: a snapshot of the state, as returned by getSnapshot()
+        :param list[str] removedJobStoreIDs: the IDs of jobs known to have been removed from
+               the job store since the snapshot was taken
+        :param list[str] failedJobStoreIDs: the IDs of jobs known to have totally failed since
+               the snapshot was taken
         """
-        # This is a hash of jobs, referenced by jobStoreID, to their predecessor jobs.
+        # This is a hash of jobs, referenced by jobStoreID, to the jobStoreIDs of their
+        # predecessor jobs.
         self.successorJobStoreIDToPredecessorJobs = { }
         
         # Hash of jobStoreIDs to counts of numbers of successors issued.
@@ -41,7 +62,8 @@ class ToilState( object ):
         # without successors in this map.
         self.successorCounts = { }
 
-        # This is a hash of service jobs, referenced by jobStoreID, to their predecessor job
+        # This is a hash of service jobs, referenced by jobStoreID, to the jobStoreID of their
+        # predecessor job
         self.serviceJobStoreIDToPredecessorJob = { }
 
         # Hash of jobStoreIDs to maps of services issued for the job
@@ -63,43 +85,254 @@ class ToilState( object ):
         self.failedSuccessors = set()
         
         # Set of jobs that have multiple predecessors that have one or more predecessors
-        # finished, but not all of them. This acts as a cache for these jobs.
-        # Stored as hash from jobStoreIDs to job graphs
+        # finished, but not all of them. Stored as hash from jobStoreIDs to the set of
+        # jobStoreIDs of the finished predecessors.
         self.jobsToBeScheduledWithMultiplePredecessors = {}
         
-        ##Algorithm to build this information
-        logger.info("(Re)building internal scheduler state")
-        self._buildToilState(rootJob, jobStore, jobCache)
+        if snapshot is None:
+            ##Algorithm to build this information
+            logger.info("(Re)building internal scheduler state")
+            self._buildToilState(rootJob, jobStore, jobCache)
+        else:
+            logger.info("Restoring internal scheduler state from snapshot")
+            self._restoreToilState(rootJob, jobStore, snapshot, removedJobStoreIDs,
+                                   failedJobStoreIDs)
 
-    def _buildToilState(self, jobGraph, jobStore, jobCache=None):
+    def getSnapshot(self):
         """
-        Traverses tree of jobs from the root jobGraph (rootJob) building the
-        ToilState class.
+        Returns a snapshot of the jobs waiting for their successors, from which the state can be
+        restored on restart, see :class:`toil.leaderJournal.LeaderJournal`. The snapshot refers
+        to the live state, so it must be serialised before the state changes.
+
+        The state can't be restored while services are running or after jobs have failed, in
+        which case None is returned.
+
+        :rtype: dict|None
+        """
+        if (len(self.servicesIssued) > 0 or len(self.serviceJobStoreIDToPredecessorJob) > 0
+                or len(self.totalFailedJobs) > 0 or len(self.hasFailedSuccessors) > 0
+                or len(self.failedSuccessors) > 0):
+            return None
+        return dict(successorJobStoreIDToPredecessorJobs=self.successorJobStoreIDToPredecessorJobs,
+                    successorCounts=self.successorCounts,
+                    jobsToBeScheduledWithMultiplePredecessors=self.jobsToBeScheduledWithMultiplePredecessors)
+
+    def _buildToilState(self, rootJobGraph, jobStore, jobCache=None):
+        """
+        Traverses the graph of jobs from the root jobGraph (rootJob) building the ToilState
+        class.
+
+        The graph is traversed breadth-first. The successors of all jobs in the current frontier
+        are loaded from the job store with a single call to
+        :meth:`toil.jobStores.abstractJobStore.AbstractJobStore.loadMany`, allowing job stores
+        to fetch them in bulk.
 
         If jobCache is passed, it must be a dict from job ID to JobGraph
         object. Jobs will be loaded from the cache (which can be downloaded from
-        the jobStore in a batch) instead of piecemeal when recursed into.
+        the jobStore in a batch) instead of from the jobStore.
+        """
+        # The job graphs of successors with multiple predecessors that have been loaded but are
+        # not yet ready to be considered, as not all of their predecessors have been seen yet
+        pendingJobGraphs = {}
+        frontier = [rootJobGraph]
+        while len(frontier) > 0:
+            # Load the successors of the frontier that have not been seen before
+            successorJobStoreIDs = set()
+            for jobGraph in frontier:
+                if not self._isReadyToBeProcessed(jobGraph):
+                    for successorJobNode in jobGraph.stack[-1]:
+                        if successorJobNode.jobStoreID not in self.successorJobStoreIDToPredecessorJobs:
+                            successorJobStoreIDs.add(successorJobNode.jobStoreID)
+            successorJobGraphs = self._loadJobs(successorJobStoreIDs, jobStore, jobCache)
+
+            nextFrontier = []
+            for jobGraph in frontier:
+                self._processJobGraph(jobGraph, successorJobGraphs, pendingJobGraphs,
+                                      nextFrontier)
+            frontier = nextFrontier
+
+    def _restoreToilState(self, rootJobGraph, jobStore, snapshot, removedJobStoreIDs,
+                          failedJobStoreIDs):
+        """
+        Restores the state from a snapshot taken by the leader of a previous attempt at running
+        the workflow.
+
+        Jobs waiting for their successors are only changed by the leader once their successors
+        are done, so only the other jobs in the snapshot are loaded from the job store again. Jobs
+        removed since the snapshot was taken are accounted for like the leader does, which may in
+        turn cause their predecessors to be loaded. Jobs that failed since are loaded again, unless
+        they wait for their successors, such that they are retried like after cleaning the job
+        store. Every loaded job is repaired like
+        :meth:`toil.jobStores.abstractJobStore.AbstractJobStore.clean` would and the graph of its
+        successors is traversed like in _buildToilState(). Jobs that are orphaned are not found,
+        they are left in the job store until it is cleaned or destroyed.
+        """
+        for jobStoreID, predecessorJobStoreIDs in iteritems(
+                snapshot['successorJobStoreIDToPredecessorJobs']):
+            self.successorJobStoreIDToPredecessorJobs[jobStoreID] = [
+                internString(predecessorJobStoreID) for predecessorJobStoreID in predecessorJobStoreIDs]
+        for jobStoreID, successorCount in iteritems(snapshot['successorCounts']):
+            self.successorCounts[internString(jobStoreID)] = successorCount
+        for jobStoreID, predecessorsFinished in iteritems(
+                snapshot['jobsToBeScheduledWithMultiplePredecessors']):
+            self.jobsToBeScheduledWithMultiplePredecessors[jobStoreID] = set(
+                internString(predecessorJobStoreID) for predecessorJobStoreID in predecessorsFinished)
+
+        jobStoreIDsToLoad = set()
+        for jobStoreID in removedJobStoreIDs:
+            self._processRemovedJob(jobStoreID, jobStoreIDsToLoad)
+        # Failed jobs the snapshot knows of are retried. Those that were added after it was taken
+        # are found again by traversing the successors of their predecessors.
+        jobStoreIDsToLoad.update(jobStoreID for jobStoreID in failedJobStoreIDs
+                                 if jobStoreID in self.successorJobStoreIDToPredecessorJobs
+                                 and jobStoreID not in self.successorCounts)
+        # Any job not waiting for its successors may have been run since the snapshot was taken
+        jobStoreIDsToLoad.update(jobStoreID for jobStoreID in self.successorJobStoreIDToPredecessorJobs
+                                 if jobStoreID not in self.successorCounts)
+        if rootJobGraph.jobStoreID not in self.successorCounts:
+            jobStoreIDsToLoad.add(rootJobGraph.jobStoreID)
+
+        # The loaded successors with multiple predecessors that are not yet ready to be
+        # considered, see _buildToilState()
+        pendingJobGraphs = {}
+        # The IDs of all jobs found to be removed
+        allRemovedJobStoreIDs = set()
+        frontier = []
+        while len(frontier) > 0 or len(jobStoreIDsToLoad) > 0:
+            # Load the successors of the frontier that have not been seen before, along with the
+            # jobs to be considered again
+            successorJobStoreIDs = set()
+            for jobGraph in frontier:
+                if not self._isReadyToBeProcessed(jobGraph):
+                    for successorJobNode in jobGraph.stack[-1]:
+                        if successorJobNode.jobStoreID not in self.successorJobStoreIDToPredecessorJobs:
+                            successorJobStoreIDs.add(successorJobNode.jobStoreID)
+            jobGraphs, removedJobStoreIDs = self._loadDirtyJobs(
+                successorJobStoreIDs.union(jobStoreIDsToLoad), jobStore)
+            allRemovedJobStoreIDs.update(removedJobStoreIDs)
+
+            nextFrontier = []
+            for jobStoreID in jobStoreIDsToLoad:
+                if jobStoreID in jobGraphs:
+                    if jobStoreID in self.jobsToBeScheduledWithMultiplePredecessors:
+                        pendingJobGraphs[jobStoreID] = jobGraphs[jobStoreID]
+                    else:
+                        nextFrontier.append(jobGraphs[jobStoreID])
+            jobStoreIDsToLoad = set()
+            for jobStoreID in removedJobStoreIDs:
+                pendingJobGraphs.pop(jobStoreID, None)
+                self._processRemovedJob(jobStoreID, jobStoreIDsToLoad)
+
+            for jobGraph in frontier:
+                if jobGraph.jobStoreID in removedJobStoreIDs:
+                    continue
+                if not self._isReadyToBeProcessed(jobGraph) and any(
+                        successorJobNode.jobStoreID in removedJobStoreIDs
+                        for successorJobNode in jobGraph.stack[-1]):
+                    # Successors were deleted by a checkpointed job after this job was repaired,
+                    # so consider it again once its remaining successors are loaded
+                    jobGraph.stack = [[jobNode for jobNode in jobNodes
+                                       if jobNode.jobStoreID not in removedJobStoreIDs]
+                                      for jobNodes in jobGraph.stack]
+                    jobGraph.stack = [jobNodes for jobNodes in jobGraph.stack if len(jobNodes) > 0]
+                    jobStore.update(jobGraph)
+                    nextFrontier.append(jobGraph)
+                else:
+                    self._processJobGraph(jobGraph, jobGraphs, pendingJobGraphs, nextFrontier)
+            frontier = nextFrontier
+
+        if len(allRemovedJobStoreIDs) > 0:
+            self.updatedJobs = set((jobGraph, resultStatus)
+                                   for jobGraph, resultStatus in self.updatedJobs
+                                   if jobGraph.jobStoreID not in allRemovedJobStoreIDs)
+
+    def _processRemovedJob(self, jobStoreID, readyJobStoreIDs):
+        """
+        Accounts for the removal of the given job from the job store. The IDs of predecessors
+        that are left without successors to wait for are added to readyJobStoreIDs.
+        """
+        self.jobsToBeScheduledWithMultiplePredecessors.pop(jobStoreID, None)
+        for predecessorJobStoreID in self.successorJobStoreIDToPredecessorJobs.pop(jobStoreID, []):
+            self.successorCounts[predecessorJobStoreID] -= 1
+            if self.successorCounts[predecessorJobStoreID] == 0:
+                self.successorCounts.pop(predecessorJobStoreID)
+                readyJobStoreIDs.add(predecessorJobStoreID)
+
+    @staticmethod
+    def _loadDirtyJobs(jobStoreIDs, jobStore):
         """
+        Loads the given jobs from the job store, restarting checkpointed jobs and repairing the
+        others like :meth:`toil.jobStores.abstractJobStore.AbstractJobStore.clean` would.
 
-        def getJob(jobId):
-            if jobCache is not None:
+        :return: a dict from the IDs of the loaded jobs to the jobs, and the set of IDs of the
+                 given jobs that do not exist along with those of the jobs deleted by restarting
+                 checkpointed jobs
+        :rtype: (dict[str,toil.jobGraph.JobGraph], set[str])
+        """
+        jobGraphs = jobStore.loadMany(list(jobStoreIDs)) if len(jobStoreIDs) > 0 else {}
+        removedJobStoreIDs = set(jobStoreID for jobStoreID in jobStoreIDs
+                                 if jobStoreID not in jobGraphs)
+        for jobGraph in jobGraphs.values():
+            if jobGraph.checkpoint is not None and jobGraph.jobStoreID not in removedJobStoreIDs:
+                logger.info("Restarting checkpointed job %s" % jobGraph)
+                removedJobStoreIDs.update(jobGraph.restartCheckpoint(jobStore))
+        for jobStoreID in removedJobStoreIDs:
+            jobGraphs.pop(jobStoreID, None)
+        for jobGraph in jobGraphs.values():
+            jobStore.cleanJob(jobGraph)
+        return jobGraphs, removedJobStoreIDs
+
+    @staticmethod
+    def _loadJobs(jobStoreIDs, jobStore, jobCache=None):
+        """
+        Returns a dict from the given job IDs to the corresponding JobGraph objects, taking jobs
+        from the jobCache if present and loading the remainder in bulk from the jobStore.
+        """
+        jobs = {}
+        if jobCache is not None:
+            for jobStoreID in jobStoreIDs:
                 try:
-                    return jobCache[jobId]
-                except ValueError:
-                    return jobStore.load(jobId)
-            else:
-                return jobStore.load(jobId)
-
-        # If the jobGraph has a command, is a checkpoint, has services or is ready to be
-        # deleted it is ready to be processed
-        if (jobGraph.command is not None
-            or jobGraph.checkpoint is not None
-            or len(jobGraph.services) > 0
-            or len(jobGraph.stack) == 0):
+                    jobs[jobStoreID] = jobCache[jobStoreID]
+                except KeyError:
+                    pass
+        missingJobStoreIDs = [jobStoreID for jobStoreID in jobStoreIDs if jobStoreID not in jobs]
+        if len(missingJobStoreIDs) > 0:
+            jobs.update(jobStore.loadMany(missingJobStoreIDs))
+            for jobStoreID in missingJobStoreIDs:
+                if jobStoreID not in jobs:
+                    raise NoSuchJobException(jobStoreID)
+        return jobs
+
+    @staticmethod
+    def _isReadyToBeProcessed(jobGraph):
+        """
+        If the jobGraph has a command, is a checkpoint, has services or is ready to be
+        deleted it is ready to be processed.
+        """
+        return (jobGraph.command is not None
+                or jobGraph.checkpoint is not None
+                or len(jobGraph.services) > 0
+                or len(jobGraph.stack) == 0)
+
+    def _processJobGraph(self, jobGraph, successorJobGraphs, pendingJobGraphs, nextFrontier):
+        """
+        Adds the given jobGraph to the state. Successors that become ready to be considered are
+        appended to nextFrontier.
+
+        :param dict[str,toil.jobGraph.JobGraph] successorJobGraphs: the loaded successors of
+               the current frontier that had not been seen before
+
+        :param dict[str,toil.jobGraph.JobGraph] pendingJobGraphs: the loaded successors with
+               multiple predecessors that are waiting for some of their predecessors to be seen
+        """
+        if self._isReadyToBeProcessed(jobGraph):
             logger.debug('Found job to run: %s, with command: %s, with checkpoint: %s, '
                          'with  services: %s, with stack: %s', jobGraph.jobStoreID,
                          jobGraph.command is not None, jobGraph.checkpoint is not None,
                          len(jobGraph.services) > 0, len(jobGraph.stack) == 0)
+            # Only the worker needs the pickled job stored inline with the job graph, the leader
+            # doesn't hold on to it while the job waits to be issued
+            jobGraph.pickledJob = None
             self.updatedJobs.add((jobGraph, 0))
 
             if jobGraph.checkpoint is not None:
@@ -109,24 +342,23 @@ class ToilState( object ):
             logger.debug("Adding job: %s to the state with %s successors" % (jobGraph.jobStoreID, len(jobGraph.stack[-1])))
             
             # Record the number of successors
-            self.successorCounts[jobGraph.jobStoreID] = len(jobGraph.stack[-1])
+            jobStoreID = internString(jobGraph.jobStoreID)
+            self.successorCounts[jobStoreID] = len(jobGraph.stack[-1])
             
-            def processSuccessorWithMultiplePredecessors(successorJobGraph):
-                # If jobGraph is not reported as complete by the successor
-                if jobGraph.jobStoreID not in successorJobGraph.predecessorsFinished:
-                    
-                    # Update the sucessor's status to mark the predecessor complete
-                    successorJobGraph.predecessorsFinished.add(jobGraph.jobStoreID)
+            def processSuccessorWithMultiplePredecessors(successorJobNode):
+                # Mark the predecessor complete
+                predecessorsFinished = self.jobsToBeScheduledWithMultiplePredecessors[successorJobStoreID]
+                predecessorsFinished.add(jobStoreID)
             
                 # If the successor has no predecessors to finish
-                assert len(successorJobGraph.predecessorsFinished) <= successorJobGraph.predecessorNumber
-                if len(successorJobGraph.predecessorsFinished) == successorJobGraph.predecessorNumber:
+                assert len(predecessorsFinished) <= successorJobNode.predecessorNumber
+                if len(predecessorsFinished) == successorJobNode.predecessorNumber:
                     
                     # It is ready to be run, so remove it from the cache
                     self.jobsToBeScheduledWithMultiplePredecessors.pop(successorJobStoreID)
                     
-                    # Recursively consider the successor
-                    self._buildToilState(successorJobGraph, jobStore, jobCache=jobCache)
+                    # Consider the successor in the next round
+                    nextFrontier.append(pendingJobGraphs.pop(successorJobStoreID))
             
             # For each successor
             for successorJobNode in jobGraph.stack[-1]:
@@ -137,38 +369,34 @@ class ToilState( object ):
                 if successorJobStoreID not in self.successorJobStoreIDToPredecessorJobs:
 
                     # Add the job as a predecessor
-                    self.successorJobStoreIDToPredecessorJobs[successorJobStoreID] = [jobGraph]
+                    self.successorJobStoreIDToPredecessorJobs[successorJobStoreID] = [jobStoreID]
                     
                     # If predecessor number > 1 then the successor has multiple predecessors
                     if successorJobNode.predecessorNumber > 1:
                         
-                        # We load the successor job
-                        successorJobGraph =  getJob(successorJobStoreID)
-                        
-                        # We put the successor job in the cache of successor jobs with multiple predecessors
+                        # We hold on to the loaded successor job until all its predecessors
+                        # have been seen
                         assert successorJobStoreID not in self.jobsToBeScheduledWithMultiplePredecessors
-                        self.jobsToBeScheduledWithMultiplePredecessors[successorJobStoreID] = successorJobGraph
+                        self.jobsToBeScheduledWithMultiplePredecessors[successorJobStoreID] = set()
+                        pendingJobGraphs[successorJobStoreID] = successorJobGraphs[successorJobStoreID]
                         
                         # Process successor
-                        processSuccessorWithMultiplePredecessors(successorJobGraph)
+                        processSuccessorWithMultiplePredecessors(successorJobNode)
                             
                     else:
                         # The successor has only the jobGraph as a predecessor so
-                        # recursively consider the successor
-                        self._buildToilState(getJob(successorJobStoreID), jobStore, jobCache=jobCache)
+                        # consider the successor in the next round
+                        nextFrontier.append(successorJobGraphs[successorJobStoreID])
                 
                 else:
                     # We've already seen the successor
                     
                     # Add the job as a predecessor
-                    assert jobGraph not in self.successorJobStoreIDToPredecessorJobs[successorJobStoreID]
-                    self.successorJobStoreIDToPredecessorJobs[successorJobStoreID].append(jobGraph)
+                    assert jobStoreID not in self.successorJobStoreIDToPredecessorJobs[successorJobStoreID]
+                    self.successorJobStoreIDToPredecessorJobs[successorJobStoreID].append(jobStoreID)
                     
                     # If the successor has multiple predecessors
                     if successorJobStoreID in self.jobsToBeScheduledWithMultiplePredecessors:
                         
-                        # Get the successor from cache
-                        successorJobGraph = self.jobsToBeScheduledWithMultiplePredecessors[successorJobStoreID]
-                        
                         # Process successor
-                        processSuccessorWithMultiplePredecessors(successorJobGraph)
\ No newline at end of file
+                        processSuccessorWithMultiplePredecessors(successorJobNode)
@@ -0,0 +1,42 @@
+# Copyright (C) 2015-2016 Regents of the University of California
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     http://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Rebuild the index of a file job store used by a Toil workflow that is not running
+"""
+from __future__ import absolute_import
+import logging
+import sys
+
+from toil.lib.bioio import getBasicOptionParser
+from toil.lib.bioio import parseBasicOptions
+from toil.common import Toil, jobStoreLocatorHelp, Config
+from toil.jobStores.fileJobStore import FileJobStore
+from toil.version import version
+
+logger = logging.getLogger( __name__ )
+
+def main():
+    parser = getBasicOptionParser()
+    parser.add_argument("jobStore", type=str,
+                        help="The location of the job store to reindex. " + jobStoreLocatorHelp)
+    parser.add_argument("--version", action='version', version=version)
+    config = Config()
+    config.setOptions(parseBasicOptions(parser))
+    jobStore = Toil.getJobStore(config.jobStore)
+    if not isinstance(jobStore, FileJobStore):
+        logger.error("Only file job stores keep an index.")
+        sys.exit(1)
+    logger.info("Attempting to rebuild the index of the job store")
+    jobStore.rebuildIndex()
+    logger.info("Successfully rebuilt the index of the job store")
@@ -396,6 +396,13 @@ def reportPrettyData(root, worker, job, job_types, options):
         reportTime(get(root, "total_clock"), options),
         reportTime(get(root, "total_run_time"), options),
         ))
+    if "cache" in root:
+        out_str += ("Cache Hits: %s  Misses: %s  Evictions: %s  Hit Rate: %s\n" % (
+            reportNumber(root.cache.total_hits, options),
+            reportNumber(root.cache.total_misses, options),
+            reportNumber(root.cache.total_evictions, options),
+            reportNumber(root.cache.hit_rate, options),
+            ))
     job_types = sortJobs(job_types, options)
     columnWidths = computeColumnWidths(job_types, worker, job, options)
     out_str += "Worker\n"
@@ -498,6 +505,24 @@ def buildElement(element, items, itemName):
     )
     return element[itemName]
 
+def buildCacheElement(element, caches):
+    """ Create an element for the file store cache counters reported by the workers, summed up
+        per node and over all nodes.
+    """
+    counters = ("hits", "misses", "evictions")
+    nodes = Expando()
+    for cache in caches:
+        node = nodes.setdefault(cache["node"], Expando(dict.fromkeys(counters, 0)))
+        for counter in counters:
+            node[counter] += cache[counter]
+    element["cache"] = Expando(nodes=nodes, name="cache")
+    for counter in counters:
+        element["cache"]["total_%s" % counter] = sum(node[counter] for node in nodes.values())
+    reads = element["cache"].total_hits + element["cache"].total_misses
+    element["cache"].hit_rate = float(element["cache"].total_hits) / reads if reads else 0.0
+    return element["cache"]
+
+
 def createSummary(element, containingItems, containingItemName, getFn):
     itemCounts = [len(getFn(containingItem)) for
                   containingItem in containingItems]
@@ -561,6 +586,10 @@ def processData(config, stats):
             return []
 
     buildElement(collatedStatsTag, worker, "worker")
+    # The workers only report cache counters if caching is enabled
+    caches = filter(None, stats.get("cache", []))
+    if caches:
+        buildCacheElement(collatedStatsTag, caches)
     createSummary(buildElement(collatedStatsTag, jobs, "jobs"),
                   stats.workers, "worker", fn4)
     # Get info for each job
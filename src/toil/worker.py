@@ -15,7 +15,6 @@
 from __future__ import absolute_import, print_function
 import os
 import sys
-import copy
 import random
 import json
 
@@ -25,15 +24,18 @@ import time
 import socket
 import logging
 import shutil
-from threading import Thread
+import fcntl
+from multiprocessing import cpu_count
+from threading import Condition, Thread, current_thread, enumerate as enumerateThreads
 
 # Python 3 compatibility imports
 from six.moves import cPickle
 
 from bd2k.util.expando import Expando, MagicExpando
+from toil.bootstrapCache import BootstrapCache
 from toil.common import Toil
 from toil.fileStore import FileStore
-from toil import logProcessContext
+from toil import logProcessContext, resolveEntryPoint
 import signal
 
 logger = logging.getLogger( __name__ )
@@ -61,7 +63,11 @@ class AsyncJobStoreWrite:
     def blockUntilSync(self):
         pass
 
-def main():
+def setupWorkerProcess():
+    """
+    Prepares the current process for running workers. This only needs to happen once per process,
+    no matter how many jobs the process goes on to run.
+    """
     logging.basicConfig()
 
     ##########################################
@@ -72,37 +78,379 @@ def main():
     sourcePath = os.path.dirname(os.path.dirname(__file__))
     if sourcePath not in sys.path:
         sys.path.append(sourcePath)
-    
-    #Now we can import all the necessary functions
-    from toil.lib.bioio import setLogLevel
-    from toil.lib.bioio import getTotalCpuTime
-    from toil.lib.bioio import getTotalCpuTimeAndMemoryUsage
-    from toil.job import Job
-    try:
-        import boto
-    except ImportError:
-        pass
-    else:
-        # boto is installed, monkey patch it now
-        from bd2k.util.ec2.credentials import enable_metadata_credential_caching
-        enable_metadata_credential_caching()
+
+    # Importing boto takes tens of milliseconds, so it is left to Toil.getJobStore(), which
+    # enables the caching of the credentials from the EC2 metadata server when the job store is
+    # in AWS
+
+
+def loadEnvironment(jobStore):
+    """
+    Returns the environment the workflow was started with, as saved in the given job store.
+
+    :rtype: dict[str,str]
+    """
+    with jobStore.readSharedFileStream("environment.pickle") as fileHandle:
+        return cPickle.load(fileHandle)
+
+
+def applyEnvironment(environment):
+    """
+    Applies the given workflow environment, as returned by :func:`loadEnvironment`, to the current
+    process.
+    """
+    for i in environment:
+        if i not in ("TMPDIR", "TMP", "HOSTNAME", "HOSTTYPE"):
+            os.environ[i] = environment[i]
+    # sys.path is used by __import__ to find modules
+    if "PYTHONPATH" in environment:
+        for e in environment["PYTHONPATH"].split(':'):
+            if e != '' and e not in sys.path:
+                sys.path.append(e)
+
+
+def main():
+    setupWorkerProcess()
+
+    if sys.argv[1:] == ['--persistent']:
+        persistentWorker()
+        return
+
     ##########################################
     #Input args
     ##########################################
     
     jobStoreLocator = sys.argv[1]
     jobStoreID = sys.argv[2]
-    # we really want a list of job names but the ID will suffice if the job graph can't
-    # be loaded. If we can discover the name, we will replace this initial entry
-    listOfJobs = [jobStoreID]
+    # The digest of the config and the environment, passed by the leader if they may be cached
+    bootstrapCache = BootstrapCache(sys.argv[3]) if len(sys.argv) > 3 else None
     
     ##########################################
-    #Load the jobStore/config file
+    #Load the jobStore/config file and the environment for the jobGraph
     ##########################################
     
-    jobStore = Toil.resumeJobStore(jobStoreLocator)
+    cached = None if bootstrapCache is None else bootstrapCache.load()
+    if cached is None:
+        jobStore = Toil.resumeJobStore(jobStoreLocator)
+        environment = loadEnvironment(jobStore)
+        if bootstrapCache is not None:
+            bootstrapCache.save(jobStore.config, environment)
+    else:
+        config, environment = cached
+        jobStore = Toil.resumeJobStore(jobStoreLocator, config)
     config = jobStore.config
-    
+    applyEnvironment(environment)
+
+    return workerScript(jobStore, config, jobStoreID)
+
+
+def persistentWorker():
+    """
+    Runs jobs in the current process until told to stop, keeping modules, job stores and their
+    configs loaded between jobs. This is the counterpart of the persistent worker pool in
+    :class:`toil.batchSystems.singleMachine.SingleMachineBatchSystem`.
+
+    Requests are read from standard input, each one a pickled tuple of a job store locator, a job
+    store ID and a dictionary of environment variables to set before running the job. After each
+    job, its exit status and whether the process is about to exit are pickled to standard output.
+    The process exits when standard input is closed, or after a job that failed, as a failed job
+    may leave behind state that the next job must not see. An exception escaping from a job
+    terminates the process with a non-zero exit status, just like it would for a worker that only
+    runs a single job.
+
+    The environment variables, the working directory and sys.path are restored after each job.
+    Other changes a job makes to the state of the process, like to that of imported modules, do
+    carry over to the next job.
+    """
+    # Move the request and reply streams out of the way so neither the jobs we run nor any
+    # processes they spawn can read from or write to them.
+    requests = os.fdopen(os.dup(0), 'rb')
+    replies = os.fdopen(os.dup(1), 'wb')
+    for stream in requests, replies:
+        flags = fcntl.fcntl(stream.fileno(), fcntl.F_GETFD)
+        fcntl.fcntl(stream.fileno(), fcntl.F_SETFD, flags | fcntl.FD_CLOEXEC)
+    devNull = os.open(os.devnull, os.O_RDONLY)
+    os.dup2(devNull, 0)
+    os.close(devNull)
+    os.dup2(2, 1)
+
+    # Maps job store locators to job store and workflow environment
+    jobStores = {}
+    while True:
+        try:
+            jobStoreLocator, jobStoreID, environment = cPickle.load(requests)
+        except EOFError:
+            break
+        savedEnviron = dict(os.environ)
+        savedCwd = os.getcwd()
+        savedPath = list(sys.path)
+        os.environ.update(environment)
+        try:
+            jobStore, workflowEnvironment = jobStores[jobStoreLocator]
+        except KeyError:
+            jobStore = Toil.resumeJobStore(jobStoreLocator)
+            workflowEnvironment = loadEnvironment(jobStore)
+            jobStores[jobStoreLocator] = jobStore, workflowEnvironment
+        applyEnvironment(workflowEnvironment)
+        # A failure of the previous job must not spill over into this one
+        FileStore._terminateEvent.clear()
+        FileStore._supersededEvent.clear()
+        exitStatus = workerScript(jobStore, jobStore.config, jobStoreID)
+        failed = FileStore._terminateEvent.isSet()
+        if failed:
+            # The threads of a failed job only exit once they notice the flag
+            for thread in enumerateThreads():
+                if thread is not current_thread() and not thread.daemon:
+                    thread.join()
+        # Replace rather than update the environment, such that variables set by the job are
+        # dropped, too
+        os.environ.clear()
+        os.environ.update(savedEnviron)
+        os.chdir(savedCwd)
+        sys.path[:] = savedPath
+        cPickle.dump((exitStatus, failed), replies, cPickle.HIGHEST_PROTOCOL)
+        replies.flush()
+        if failed:
+            logger.debug("Exiting the persistent worker after a failed job.")
+            break
+
+# The persistent worker processes that ran successors within this worker and are now idle, kept
+# for later calls to runSuccessorsLocally()
+idleLocalWorkers = []
+
+
+def runSuccessorsLocally(jobStore, config, jobGraph, blockFn):
+    """
+    Runs the successors of the given job that are to be run in parallel within this worker instead
+    of returning the job to the leader. Each successor is run by a persistent worker process, just
+    like the leader would run it, including any successors chained to it. The persistent workers
+    are kept for the successors of later jobs run by this worker. As many successors run at a time
+    as fit within the cores, memory and disk of the job, up to --maxLocalSuccessors and the number
+    of cores of the node. One set of parallel successors is run after the other, for as long as
+    every successor in a set completes.
+
+    :param toil.jobStores.abstractJobStore.AbstractJobStore jobStore: the job store holding the job
+
+    :param toil.common.Config config: the workflow's configuration
+
+    :param toil.jobGraph.JobGraph jobGraph: the job whose successors to run, its stack is updated
+           in place and in the job store as its successors complete
+
+    :param blockFn: a function that blocks until the job has been updated in the job store
+
+    :return: The next set of successors of the job, if all sets before it completed and it consists
+             of a single successor, which may be chained. None if the remaining successors are left
+             to the leader.
+    :rtype: list[toil.job.JobNode]|None
+    """
+    from toil.persistentWorker import PersistentWorker
+
+    def fitsWithinJob(jobNode):
+        # Successors of other jobs too are tracked by the leader
+        return (jobNode.predecessorNumber == 1
+                and jobNode.preemptable == jobGraph.preemptable
+                and jobNode.memory <= jobGraph.memory
+                and jobNode.cores <= jobGraph.cores
+                and jobNode.disk <= jobGraph.disk)
+
+    workerCommand = resolveEntryPoint('_toil_worker')
+    maxRunning = min(config.maxLocalSuccessors, cpu_count())
+    # The resources of the job not used by the successors currently running and the number of
+    # those, guarded by the condition
+    available = Expando(memory=jobGraph.memory, cores=jobGraph.cores, disk=jobGraph.disk,
+                        running=0)
+    condition = Condition()
+    # The exit status of the worker that ran each successor, by job store ID
+    exitStatuses = {}
+
+    def canStart(jobNode):
+        # A successor is started regardless of the resources if none is running, so that rounding
+        # errors cannot keep it from ever running
+        return available.running == 0 or (available.running < maxRunning
+                                       and jobNode.memory <= available.memory
+                                       and jobNode.cores <= available.cores
+                                       and jobNode.disk <= available.disk)
+
+    def runJob(persistentWorker, jobNode):
+        exitStatus = None
+        try:
+            exitStatus = persistentWorker.runJob(config.jobStore, jobNode.jobStoreID, {})
+        finally:
+            with condition:
+                exitStatuses[jobNode.jobStoreID] = exitStatus
+                available.memory += jobNode.memory
+                available.cores += jobNode.cores
+                available.disk += jobNode.disk
+                available.running -= 1
+                if persistentWorker.popen.poll() is None:
+                    if len(idleLocalWorkers) < maxRunning:
+                        idleLocalWorkers.append(persistentWorker)
+                    else:
+                        persistentWorker.shutdown()
+                condition.notifyAll()
+
+    def hasCompleted(jobNode):
+        exitStatus = exitStatuses.get(jobNode.jobStoreID)
+        if exitStatus is None:
+            # The successor was not run or we lost track of its worker
+            return False
+        if exitStatus != 0:
+            # The worker died without recording the outcome of the successor, so its retry count
+            # is reduced like the leader would for a failed worker before it is left to the leader
+            logger.warn("The worker running successor %s exited with %i", jobNode, exitStatus)
+            if jobStore.exists(jobNode.jobStoreID):
+                failedJobGraph = jobStore.load(jobNode.jobStoreID)
+                failedJobGraph.setupJobAfterFailure(config)
+                jobStore.update(failedJobGraph)
+            return False
+        # A successor that failed or has successors of its own is left in the job store
+        return not jobStore.exists(jobNode.jobStoreID)
+
+    # The successors must be in the job store before they can be run
+    blockFn()
+    while len(jobGraph.stack) > 0:
+        jobNodes = jobGraph.stack[-1]
+        if len(jobNodes) < 2:
+            return jobNodes
+        if FileStore._terminateEvent.isSet() or FileStore._supersededEvent.isSet():
+            return None
+        localJobNodes = filter(fitsWithinJob, jobNodes)
+        if len(localJobNodes) == 0:
+            return None
+        logger.debug("Running %i of %i successors in parallel within this worker",
+                     len(localJobNodes), len(jobNodes))
+        exitStatuses.clear()
+        threads = []
+        try:
+            for jobNode in localJobNodes:
+                with condition:
+                    while not canStart(jobNode):
+                        condition.wait()
+                    available.memory -= jobNode.memory
+                    available.cores -= jobNode.cores
+                    available.disk -= jobNode.disk
+                    available.running += 1
+                    persistentWorker = idleLocalWorkers.pop() if idleLocalWorkers else None
+                if persistentWorker is None:
+                    persistentWorker = PersistentWorker(workerCommand, env=dict(os.environ))
+                thread = Thread(target=runJob, args=(persistentWorker, jobNode))
+                thread.start()
+                threads.append(thread)
+        finally:
+            for thread in threads:
+                thread.join()
+        remainingJobNodes = [jobNode for jobNode in jobNodes if not hasCompleted(jobNode)]
+        if len(remainingJobNodes) < len(jobNodes):
+            # Drop the completed successors, such that the leader does not run them again
+            jobGraph.stack.pop()
+            if len(remainingJobNodes) > 0:
+                jobGraph.stack.append(remainingJobNodes)
+            jobStore.update(jobGraph)
+        if len(remainingJobNodes) > 0:
+            logger.debug("Leaving %i successors to the leader", len(remainingJobNodes))
+            return None
+    # All successors completed
+    return None
+
+
+def getExpectedSuccessor(jobGraph):
+    """
+    Returns the successor that the given job, which is about to run, will be chained to, provided
+    the job adds no successors or services when it runs.
+
+    :param toil.jobGraph.JobGraph jobGraph: the job about to run
+    :rtype: toil.job.JobNode|None
+    """
+    if len(jobGraph.services) > 0 or jobGraph.checkpoint is not None:
+        return None
+    # The job's stack ends with its (possibly empty) follow-ons and children, and empty sets of
+    # successors are dropped once the job has run
+    jobNodes = next((jobNodes for jobNodes in reversed(jobGraph.stack) if jobNodes), None)
+    if jobNodes is None or len(jobNodes) != 1:
+        return None
+    successorJobNode = jobNodes[0]
+    if (successorJobNode.memory > jobGraph.memory
+            or successorJobNode.cores > jobGraph.cores
+            or successorJobNode.disk > jobGraph.disk
+            or successorJobNode.preemptable != jobGraph.preemptable
+            or successorJobNode.predecessorNumber > 1):
+        return None
+    return successorJobNode
+
+
+class JobPrefetcher(Thread):
+    """
+    Loads a job graph and reads the pickled job it references from the job store in the
+    background, such that the worker need not wait for the job store when chaining to the job.
+    The job is not unpickled, as that resolves the promises it holds, which the job running in the
+    meantime may have yet to fulfill.
+    """
+
+    def __init__(self, jobStore, jobStoreID):
+        """
+        :param toil.jobStores.abstractJobStore.AbstractJobStore jobStore: the job store holding
+               the job
+
+        :param str jobStoreID: the ID of the job to load
+        """
+        super(JobPrefetcher, self).__init__()
+        # The worker may end up not chaining to the job, and must not wait for it then
+        self.daemon = True
+        self.jobStore = jobStore
+        self.jobStoreID = jobStoreID
+        self.jobGraph = None
+        self.pickledJob = None
+
+    def run(self):
+        from toil.job import Job
+        try:
+            jobGraph = self.jobStore.load(self.jobStoreID)
+            if jobGraph.command is not None and jobGraph.command.startswith("_toil "):
+                self.pickledJob = Job._readPickledJob(jobGraph.command, self.jobStore,
+                                                      jobGraph.pickledJob)
+            self.jobGraph = jobGraph
+        except:
+            # The worker loads the job again, dealing with the failure
+            logger.debug("Failed to prefetch job %s", self.jobStoreID, exc_info=True)
+
+    def get(self):
+        """
+        Waits for the job to be loaded.
+
+        :return: the job graph and the pickled job, or None if the job could not be loaded
+        :rtype: (toil.jobGraph.JobGraph,str)|None
+        """
+        self.join()
+        if self.jobGraph is None:
+            return None
+        return self.jobGraph, self.pickledJob
+
+
+def workerScript(jobStore, config, jobStoreID):
+    """
+    Runs the job with the given ID and as many of its successors as can be chained to it.
+
+    :param toil.jobStores.abstractJobStore.AbstractJobStore jobStore: the job store holding the job
+
+    :param toil.common.Config config: the workflow's configuration
+
+    :param str jobStoreID: the ID of the job to run
+
+    :return: The exit status of the worker. A failing job is not reflected in it, the failure is
+             recorded in the job store instead. It is non-zero if another attempt at running the
+             job completed it first.
+    :rtype: int
+    """
+    #Now we can import all the necessary functions
+    from toil.lib.bioio import setLogLevel
+    from toil.lib.bioio import getTotalCpuTime
+    from toil.lib.bioio import getTotalCpuTimeAndMemoryUsage
+    from toil.job import Job
+
+    # we really want a list of job names but the ID will suffice if the job graph can't
+    # be loaded. If we can discover the name, we will replace this initial entry
+    listOfJobs = [jobStoreID]
+
     ##########################################
     #Create the worker killer, if requested
     ##########################################
@@ -126,22 +474,6 @@ def main():
         # daemon
         t.start()
 
-    ##########################################
-    #Load the environment for the jobGraph
-    ##########################################
-    
-    #First load the environment for the jobGraph.
-    with jobStore.readSharedFileStream("environment.pickle") as fileHandle:
-        environment = cPickle.load(fileHandle)
-    for i in environment:
-        if i not in ("TMPDIR", "TMP", "HOSTNAME", "HOSTTYPE"):
-            os.environ[i] = environment[i]
-    # sys.path is used by __import__ to find modules
-    if "PYTHONPATH" in environment:
-        for e in environment["PYTHONPATH"].split(':'):
-            if e != '':
-                sys.path.append(e)
-
     setLogLevel(config.logLevel)
 
     toilWorkflowDir = Toil.getWorkflowDir(config.workflowID, config.workDir)
@@ -199,6 +531,7 @@ def main():
     ##########################################
 
     workerFailed = False
+    workerSuperseded = False
     statsDict = MagicExpando()
     statsDict.jobs = []
     statsDict.workers.logsToMaster = []
@@ -276,10 +609,20 @@ def main():
         if config.stats:
             startTime = time.time()
             startClock = getTotalCpuTime()
+            if not config.disableCaching:
+                # The cache counters of the jobs run by this worker, per node
+                statsDict.cache = Expando(node=socket.gethostname(), hits=0, misses=0, evictions=0)
 
         #Make a temporary file directory for the jobGraph
         #localTempDir = makePublicDir(os.path.join(localWorkerTempDir, "localTempDir"))
 
+        #The job to run, if it was loaded when chaining to it
+        job = None
+
+        #Whether the leader may have started another attempt at running the job that could still
+        #complete it first, see FileStore._completeJob()
+        mayBeSuperseded = None
+
         startTime = time.time()
         while True:
             ##########################################
@@ -289,15 +632,26 @@ def main():
             if jobGraph.command is not None:
                 assert jobGraph.command.startswith( "_toil " )
                 logger.debug("Got a command to run: %s" % jobGraph.command)
-                #Load the job
-                job = Job._loadJob(jobGraph.command, jobStore)
+                #Load the job, unless it was loaded when chaining to it
+                if job is None:
+                    job = Job._loadJob(jobGraph.command, jobStore, jobGraph.pickledJob)
                 # If it is a checkpoint job, save the command
                 if job.checkpoint:
                     jobGraph.checkpoint = jobGraph.command
 
+                #Load the successor that will likely be chained to the job while the job runs
+                expectedSuccessorJobNode = getExpectedSuccessor(jobGraph)
+                if expectedSuccessorJobNode is None:
+                    prefetcher = None
+                else:
+                    prefetcher = JobPrefetcher(jobStore, expectedSuccessorJobNode.jobStoreID)
+                    prefetcher.start()
+
                 # Create a fileStore object for the job
                 fileStore = FileStore.createFileStore(jobStore, jobGraph, localWorkerTempDir, blockFn,
                                                       caching=not config.disableCaching)
+                if mayBeSuperseded is None:
+                    mayBeSuperseded = fileStore.jobCommand is not None
                 with job._executor(jobGraph=jobGraph,
                                    stats=statsDict if config.stats else None,
                                    fileStore=fileStore):
@@ -306,9 +660,13 @@ def main():
                         blockFn = fileStore._blockFn
 
                         job._runner(jobGraph=jobGraph, jobStore=jobStore, fileStore=fileStore)
+                job = None
 
                 # Accumulate messages from this job & any subsequent chained jobs
                 statsDict.workers.logsToMaster += fileStore.loggingMessages
+                if config.stats and not config.disableCaching:
+                    for counter, count in fileStore.cacheStats.items():
+                        statsDict.cache[counter] += count
 
             else:
                 #The command may be none, in which case
@@ -328,11 +686,27 @@ def main():
                 logger.debug("Stopping running chain of jobs: length of stack: %s, services: %s, checkpoint: %s",
                              len(jobGraph.stack), len(jobGraph.services), jobGraph.checkpoint != None)
                 break
+
+            #Successors must not be run by an attempt that another attempt has superseded. Only the
+            #first attempt to persist the job graph updated by the job owns the chain, so wait for
+            #this attempt's update to find out.
+            if mayBeSuperseded:
+                blockFn()
+                if FileStore._supersededEvent.isSet():
+                    logger.debug("Another attempt has completed the job first, so finishing")
+                    break
+                mayBeSuperseded = False
             
             #Get the next set of jobs to run
             jobs = jobGraph.stack[-1]
             assert len(jobs) > 0
             
+            #If there are 2 or more jobs to run in parallel, try to run them within this worker
+            if len(jobs) >= 2 and config.maxLocalSuccessors > 0:
+                jobs = runSuccessorsLocally(jobStore, config, jobGraph, blockFn)
+                if jobs is None:
+                    break
+
             #If there are 2 or more jobs to run in parallel we quit
             if len(jobs) >= 2:
                 logger.debug("No more jobs can run in series by this worker,"
@@ -358,17 +732,26 @@ def main():
                 logger.debug("The jobGraph has multiple predecessors, we must return to the leader.")
                 break
 
-            # Load the successor jobGraph
-            successorJobGraph = jobStore.load(successorJobNode.jobStoreID)
+            # Load the successor jobGraph, unless it was loaded while the job ran
+            prefetched = None
+            if prefetcher is not None and prefetcher.jobStoreID == successorJobNode.jobStoreID:
+                prefetched = prefetcher.get()
+            if prefetched is None:
+                successorJobGraph = jobStore.load(successorJobNode.jobStoreID)
+                pickledSuccessorJob = successorJobGraph.pickledJob
+            else:
+                successorJobGraph, pickledSuccessorJob = prefetched
 
             # add the successor to the list of jobs run
             listOfJobs.append(str(successorJobGraph))
 
             # Somewhat ugly, but check if job is a checkpoint job and quit if
             # so
+            successorJob = None
             if successorJobGraph.command.startswith( "_toil " ):
                 #Load the job
-                successorJob = Job._loadJob(successorJobGraph.command, jobStore)
+                successorJob = Job._loadJob(successorJobGraph.command, jobStore,
+                                            pickledSuccessorJob)
 
                 # Check it is not a checkpoint
                 if successorJob.checkpoint:
@@ -385,7 +768,7 @@ def main():
             ##########################################
             
             #Clone the jobGraph and its stack
-            jobGraph = copy.deepcopy(jobGraph)
+            jobGraph = jobGraph.copy()
             
             #Remove the successor jobGraph
             jobGraph.stack.pop()
@@ -400,6 +783,7 @@ def main():
 
             #Transplant the command and stack to the current jobGraph
             jobGraph.command = successorJobGraph.command
+            jobGraph.pickledJob = successorJobGraph.pickledJob
             jobGraph.stack += successorJobGraph.stack
             # include some attributes for better identification of chained jobs in
             # logging output
@@ -417,13 +801,19 @@ def main():
 
             #Add successorJobGraph to those to be deleted
             fileStore.jobsToDelete.add(successorJobGraph.jobStoreID)
+
+            #The job graph was last updated by this worker, when the previous job completed
+            fileStore.jobCommand = None
             
             #This will update the job once the previous job is done
             fileStore._updateJobWhenDone()            
             
             #Clone the jobGraph and its stack again, so that updates to it do
             #not interfere with this update
-            jobGraph = copy.deepcopy(jobGraph)
+            jobGraph = jobGraph.copy()
+
+            #The successor job has been loaded already
+            job = successorJob
             
             logger.debug("Starting the next job")
         
@@ -459,7 +849,12 @@ def main():
     #so safe to test if they completed okay
     ########################################## 
     
-    if FileStore._terminateEvent.isSet():
+    if FileStore._supersededEvent.isSet():
+        # Leave the job graph to the attempt that completed the job
+        logger.warn("Another attempt at running job %s has completed it first, discarding the "
+                    "results of this attempt", jobStoreID)
+        workerSuperseded = True
+    elif FileStore._terminateEvent.isSet():
         jobGraph = jobStore.load(jobStoreID)
         jobGraph.setupJobAfterFailure(config)
         workerFailed = True
@@ -517,7 +912,7 @@ def main():
         statsDict.logs.names = listOfJobs
         statsDict.logs.messages = logMessages
 
-    if (debugging or config.stats or statsDict.workers.logsToMaster) and not workerFailed:  # We have stats/logging to report back
+    if (debugging or config.stats or statsDict.workers.logsToMaster) and not (workerFailed or workerSuperseded):  # We have stats/logging to report back
         jobStore.writeStatsAndLogging(json.dumps(statsDict))
 
     #Remove the temp dir
@@ -525,7 +920,11 @@ def main():
     if cleanUp == 'always' or (cleanUp == 'onSuccess' and not workerFailed) or (cleanUp == 'onError' and workerFailed):
         shutil.rmtree(localWorkerTempDir)
     
+    if workerSuperseded:
+        return 1
+
     #This must happen after the log file is done with, else there is no place to put the log
     if (not workerFailed) and jobGraph.command == None and len(jobGraph.stack) == 0 and len(jobGraph.services) == 0:
         # We can now safely get rid of the jobGraph
         jobStore.delete(jobGraph.jobStoreID)
+    return 0